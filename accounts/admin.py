@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from citas.eliminacion import eliminar_usuario
 
 # Desregistrar el admin por defecto y registrar el personalizado
 admin.site.unregister(User)
@@ -29,3 +30,16 @@ class CustomUserAdmin(UserAdmin):
             'fields': ('username', 'password1', 'password2', 'email', 'first_name', 'last_name'),
         }),
     )
+    
+    # Los datos del usuario se borran en segundo plano (ver citas.eliminacion):
+    # la confirmación no recorre el CASCADE y el borrado solo lo programa
+    def get_deleted_objects(self, objs, request):
+        usuarios = [str(obj) for obj in objs]
+        return usuarios, {User._meta.verbose_name_plural: len(usuarios)}, set(), []
+    
+    def delete_model(self, request, obj):
+        eliminar_usuario(obj, solicitada_por=request.user)
+    
+    def delete_queryset(self, request, queryset):
+        for usuario in queryset:
+            eliminar_usuario(usuario, solicitada_por=request.user)
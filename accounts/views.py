@@ -1,11 +1,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
-from django.contrib.auth import login, authenticate
+from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LogoutView
 from django.views import View
 from django.urls import reverse_lazy
+from citas.eliminacion import eliminar_usuario
 from .forms import RegisterForm, CustomLoginForm
 import logging
 
@@ -124,8 +125,9 @@ def profile(request):
 @login_required
 def user_delete(request):
     if request.method == "POST":
-        user = request.user
-        user.delete()
+        # La cuenta queda inactiva al instante; sus datos se borran en segundo plano
+        eliminar_usuario(request.user, solicitada_por=request.user)
+        logout(request)
         messages.success(request, "Tu cuenta ha sido eliminada.")
         return redirect("core:index")
     
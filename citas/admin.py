@@ -1,30 +1,188 @@
 from django.contrib import admin
-from .models import Reserva, HistorialMedico, Cobro
+from .busqueda import filtrar
+from .listados import ListadoEscalable, MedicoFiltro
+from .models import (
+    Reserva, HistorialMedico, Cobro, SerieReserva, SolicitudEspera, CupoLiberado, OfertaCupo, ReservaExpirada,
+    ReservaArchivada, CobroArchivado, SolicitudPago, TransicionReserva, EstadoReserva, OrigenTransicion,
+    Eliminacion, EstadoEliminacion
+)
+from .eliminacion import eliminar_reservas, despertar_eliminador
+from .transiciones import transicionar_en_lote
 
 @admin.register(Reserva)
-class ReservaAdmin(admin.ModelAdmin):
+class ReservaAdmin(ListadoEscalable):
     list_display = ('id', 'paciente', 'medico', 'fecha', 'hora_inicio', 'estado')
-    list_filter = ('estado', 'fecha', 'medico')
+    list_filter = ('estado', 'fecha', MedicoFiltro)
+    list_select_related = ('paciente__user', 'medico__user')
+    raw_id_fields = ('paciente', 'medico', 'serie')
     search_fields = ('paciente__user__username', 'medico__user__username', 'motivo')
     date_hierarchy = 'fecha'
-    actions = ['eliminar_reservas_seleccionadas']
+    actions = [
+        'confirmar_reservas', 'completar_reservas', 'cancelar_reservas', 'eliminar_reservas_seleccionadas'
+    ]
+    
+    def get_readonly_fields(self, request, obj=None):
+        """El estado de una reserva existente solo cambia con las acciones (ver citas.transiciones)."""
+        if obj is not None:
+            return ('estado',)
+        return ()
+    
+    def _transicionar(self, request, queryset, hacia):
+        filas = transicionar_en_lote(queryset, hacia, OrigenTransicion.ADMIN, usuario=request.user)
+        # Sin contar la selección: con "seleccionar todas" sería un COUNT sobre la tabla entera
+        self.message_user(
+            request,
+            f'{len(filas)} reserva(s) pasaron a {EstadoReserva(hacia).label.lower()}; '
+            'las que no podían hacerlo por su estado se omitieron.'
+        )
+    
+    @admin.action(description="Confirmar reservas seleccionadas")
+    def confirmar_reservas(self, request, queryset):
+        self._transicionar(request, queryset, EstadoReserva.CONFIRMADA)
+    
+    @admin.action(description="Completar reservas seleccionadas")
+    def completar_reservas(self, request, queryset):
+        self._transicionar(request, queryset, EstadoReserva.COMPLETADA)
+    
+    @admin.action(description="Cancelar reservas seleccionadas")
+    def cancelar_reservas(self, request, queryset):
+        self._transicionar(request, queryset, EstadoReserva.CANCELADA)
+    
+    def get_actions(self, request):
+        # La acción por defecto borraría en la solicitud con todo su CASCADE
+        actions = super().get_actions(request)
+        actions.pop('delete_selected', None)
+        return actions
     
     def eliminar_reservas_seleccionadas(self, request, queryset):
-        """Acción personalizada para eliminar reservas"""
-        count = queryset.count()
-        queryset.delete()
-        self.message_user(request, f'{count} reserva(s) eliminada(s) exitosamente.')
+        """Acción personalizada para eliminar reservas, en segundo plano (ver citas.eliminacion)"""
+        eliminar_reservas(queryset, solicitada_por=request.user)
+        self.message_user(
+            request, 'Las reservas seleccionadas se eliminarán en segundo plano; el avance está en Eliminaciones.'
+        )
     eliminar_reservas_seleccionadas.short_description = "Eliminar reservas seleccionadas"
 
 @admin.register(HistorialMedico)
-class HistorialMedicoAdmin(admin.ModelAdmin):
+class HistorialMedicoAdmin(ListadoEscalable):
     list_display = ('id', 'paciente', 'medico', 'fecha')
-    list_filter = ('fecha', 'medico')
-    search_fields = ('paciente__user__username', 'medico__user__username', 'diagnostico', 'tratamiento')
+    list_filter = ('fecha', MedicoFiltro)
+    list_select_related = ('paciente__user', 'medico__user')
+    raw_id_fields = ('paciente', 'medico', 'reserva', 'reserva_archivada')
+    search_fields = ('paciente__user__username', 'medico__user__username')
     date_hierarchy = 'fecha'
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Usuarios por nombre; diagnóstico y tratamiento con el índice de texto completo."""
+        por_usuario, duplicados = super().get_search_results(request, queryset, search_term)
+        if not search_term:
+            return por_usuario, duplicados
+        return por_usuario | filtrar(queryset, search_term), duplicados
 
 @admin.register(Cobro)
-class CobroAdmin(admin.ModelAdmin):
+class CobroAdmin(ListadoEscalable):
     list_display = ('id', 'reserva', 'monto', 'pagado', 'fecha_pago')
     list_filter = ('pagado', 'fecha_pago')
-    search_fields = ('reserva__paciente__user__username', 'reserva__medico__user__username')
\ No newline at end of file
+    list_select_related = ('reserva__paciente__user', 'reserva__medico__user')
+    raw_id_fields = ('reserva',)
+    search_fields = ('reserva__paciente__user__username', 'reserva__medico__user__username')
+
+@admin.register(SolicitudPago)
+class SolicitudPagoAdmin(admin.ModelAdmin):
+    list_display = ('clave', 'cobro', 'usuario', 'resultado', 'fecha_pago', 'fecha_creacion')
+    list_filter = ('resultado',)
+    search_fields = ('clave',)
+    raw_id_fields = ('cobro', 'cobro_archivado', 'usuario')
+
+@admin.register(SerieReserva)
+class SerieReservaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'paciente', 'medico', 'frecuencia', 'intervalo', 'fecha_inicio', 'fecha_fin', 'activa')
+    list_filter = ('frecuencia', 'activa')
+    search_fields = ('paciente__user__username', 'medico__user__username', 'motivo')
+
+
+@admin.register(SolicitudEspera)
+class SolicitudEsperaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'paciente', 'medico', 'especialidad', 'fecha_desde', 'fecha_hasta', 'prioridad', 'estado')
+    list_filter = ('estado', 'especialidad')
+    search_fields = ('paciente__user__username', 'medico__user__username', 'motivo')
+    list_editable = ('prioridad',)
+
+@admin.register(CupoLiberado)
+class CupoLiberadoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'medico', 'fecha', 'hora_inicio', 'hora_fin', 'estado', 'fecha_creacion')
+    list_filter = ('estado',)
+    date_hierarchy = 'fecha'
+
+@admin.register(OfertaCupo)
+class OfertaCupoAdmin(admin.ModelAdmin):
+    list_display = ('id', 'cupo', 'solicitud', 'estado', 'vence_en', 'fecha_respuesta')
+    list_filter = ('estado',)
+
+@admin.register(ReservaExpirada)
+class ReservaExpiradaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'reserva', 'fecha_expiracion', 'notificada')
+    list_filter = ('fecha_expiracion',)
+    raw_id_fields = ('reserva', 'reserva_archivada')
+
+class ArchivoSoloLecturaAdmin(ListadoEscalable):
+    """El archivo solo se escribe desde citas.archivo."""
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ReservaArchivada)
+class ReservaArchivadaAdmin(ArchivoSoloLecturaAdmin):
+    list_display = ('id', 'paciente', 'medico', 'fecha', 'hora_inicio', 'estado', 'fecha_archivado')
+    list_filter = ('estado', MedicoFiltro)
+    list_select_related = ('paciente__user', 'medico__user')
+    search_fields = ('paciente__user__username', 'medico__user__username', 'motivo')
+    date_hierarchy = 'fecha'
+
+@admin.register(CobroArchivado)
+class CobroArchivadoAdmin(ArchivoSoloLecturaAdmin):
+    list_display = ('id', 'reserva', 'monto', 'pagado', 'fecha_pago')
+    list_filter = ('pagado',)
+    list_select_related = ('reserva__paciente__user', 'reserva__medico__user')
+
+@admin.register(TransicionReserva)
+class TransicionReservaAdmin(ArchivoSoloLecturaAdmin):
+    """El registro solo se escribe desde citas.transiciones."""
+    list_display = ('id', 'reserva_id', 'estado_anterior', 'estado_nuevo', 'origen', 'usuario', 'fecha')
+    list_filter = ('origen', 'estado_nuevo')
+    list_select_related = ('usuario',)
+    raw_id_fields = ('usuario',)
+    date_hierarchy = 'fecha'
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(Eliminacion)
+class EliminacionAdmin(admin.ModelAdmin):
+    """Avance de las eliminaciones en segundo plano; solo se crean desde citas.eliminacion."""
+    list_display = ('id', 'tipo', 'descripcion', 'estado', 'progreso', 'paso', 'solicitada_por', 'fecha_creacion', 'fecha_fin')
+    list_filter = ('estado', 'tipo')
+    list_select_related = ('solicitada_por',)
+    exclude = ('consulta',)
+    actions = ['reintentar']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    @admin.display(description='Avance')
+    def progreso(self, obj):
+        if obj.total is None:
+            return '-'
+        return f'{obj.avance} / {obj.total} ({obj.porcentaje}%)'
+    
+    @admin.action(description="Reintentar eliminaciones fallidas")
+    def reintentar(self, request, queryset):
+        cantidad = queryset.filter(estado=EstadoEliminacion.FALLIDA).update(estado=EstadoEliminacion.PENDIENTE)
+        if cantidad:
+            despertar_eliminador()
+        self.message_user(request, f'{cantidad} eliminación(es) vuelven a la cola.')
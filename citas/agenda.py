@@ -0,0 +1,139 @@
+"""
+Agenda del día por médico, cacheada con claves versionadas.
+
+Cada (médico, fecha) tiene un número de versión en la cache. La agenda se
+guarda bajo una clave que incluye esa versión, e invalidarla consiste en
+incrementar la versión: las entradas viejas quedan inalcanzables y expiran
+solas. Las señales de citas.signals invalidan la agenda al guardar o borrar
+reservas, cobros e historiales.
+"""
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Reserva, EstadoReserva
+
+# Límite de seguridad: aunque falle una invalidación la agenda se reconstruye
+AGENDA_TTL = 60 * 10
+CLAVE_HITS = 'agenda:stats:hits'
+CLAVE_MISSES = 'agenda:stats:misses'
+
+
+def _clave_version(medico_id, fecha):
+    return f'agenda:v:{medico_id}:{fecha}'
+
+
+def _clave_agenda(medico_id, fecha, version):
+    return f'agenda:{medico_id}:{fecha}:{version}'
+
+
+def _incrementar(clave):
+    """Incremento atómico que crea el contador si no existe."""
+    cache.add(clave, 0, timeout=None)
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        # La clave expiró o fue desalojada entre add e incr
+        cache.set(clave, 1, timeout=None)
+        return 1
+
+
+def construir_agenda(medico_id, fecha):
+    """Arma la agenda del día con una sola consulta sobre Reserva, Cobro e Historial."""
+    filas = (
+        Reserva.objects
+        .filter(medico_id=medico_id, fecha=fecha)
+        .order_by('hora_inicio', 'id')
+        .values(
+            'id', 'hora_inicio', 'hora_fin', 'estado', 'motivo',
+            'paciente_id', 'paciente__user__first_name', 'paciente__user__last_name',
+            'paciente__user__username', 'cobro__monto', 'cobro__pagado', 'historial__id',
+        )
+    )
+
+    reservas = []
+    por_estado = {estado: 0 for estado in EstadoReserva.values}
+    monto_total = Decimal('0')
+    monto_pagado = Decimal('0')
+    for fila in filas:
+        nombre = f"{fila['paciente__user__first_name']} {fila['paciente__user__last_name']}".strip()
+        monto = fila['cobro__monto'] or Decimal('0')
+        reservas.append({
+            'id': fila['id'],
+            'hora_inicio': fila['hora_inicio'],
+            'hora_fin': fila['hora_fin'],
+            'estado': fila['estado'],
+            'estado_display': EstadoReserva(fila['estado']).label,
+            'motivo': fila['motivo'],
+            'paciente_id': fila['paciente_id'],
+            'paciente': nombre or fila['paciente__user__username'],
+            'monto': monto,
+            'pagado': bool(fila['cobro__pagado']),
+            'tiene_historial': fila['historial__id'] is not None,
+        })
+        por_estado[fila['estado']] += 1
+        if fila['estado'] != EstadoReserva.CANCELADA:
+            monto_total += monto
+            if fila['cobro__pagado']:
+                monto_pagado += monto
+
+    return {
+        'medico_id': medico_id,
+        'fecha': fecha,
+        'reservas': reservas,
+        'por_estado': por_estado,
+        'monto_total': monto_total,
+        'monto_pagado': monto_pagado,
+        'generada': timezone.now(),
+    }
+
+
+def obtener_agenda(medico_id, fecha):
+    """Retorna la agenda del día desde la cache, construyéndola si no está."""
+    clave_version = _clave_version(medico_id, fecha)
+    cache.add(clave_version, 1, timeout=None)
+    # La versión se lee antes de consultar la base: si una escritura la
+    # incrementa mientras se construye, la agenda queda bajo la versión vieja
+    version = cache.get(clave_version, 1)
+    clave = _clave_agenda(medico_id, fecha, version)
+
+    agenda = cache.get(clave)
+    if agenda is not None:
+        _incrementar(CLAVE_HITS)
+        return agenda
+
+    _incrementar(CLAVE_MISSES)
+    agenda = construir_agenda(medico_id, fecha)
+    cache.set(clave, agenda, AGENDA_TTL)
+    return agenda
+
+
+def invalidar_agenda(medico_id, fecha):
+    """Descarta la agenda cacheada de un (médico, fecha)."""
+    if medico_id is None or fecha is None:
+        return
+    _incrementar(_clave_version(medico_id, fecha))
+
+
+def invalidar_agendas(pares):
+    """Invalida varias agendas, p. ej. tras operaciones masivas sin señales."""
+    for medico_id, fecha in set(pares):
+        invalidar_agenda(medico_id, fecha)
+
+
+def estadisticas_cache():
+    """Contadores de aciertos y fallos de la cache de agendas."""
+    valores = cache.get_many([CLAVE_HITS, CLAVE_MISSES])
+    hits = valores.get(CLAVE_HITS, 0)
+    misses = valores.get(CLAVE_MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'ratio_aciertos': round(hits / total, 4) if total else None,
+    }
+
+
+def reiniciar_estadisticas():
+    cache.delete_many([CLAVE_HITS, CLAVE_MISSES])
@@ -0,0 +1,19 @@
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .api_views import (
+    ReservaViewSet, SerieReservaViewSet, CobroViewSet, IngresosViewSet, OcupacionViewSet, ExportacionViewSet,
+    BusquedaHistorialViewSet
+)
+
+router = DefaultRouter()
+router.register(r'reservas', ReservaViewSet, basename='reserva')
+router.register(r'series', SerieReservaViewSet, basename='serie')
+router.register(r'cobros', CobroViewSet, basename='cobro')
+router.register(r'ingresos', IngresosViewSet, basename='ingresos')
+router.register(r'ocupacion', OcupacionViewSet, basename='ocupacion')
+router.register(r'exportar', ExportacionViewSet, basename='exportar')
+router.register(r'historial/buscar', BusquedaHistorialViewSet, basename='historial-buscar')
+
+urlpatterns = [
+    path('api/', include(router.urls)),
+]
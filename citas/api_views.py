@@ -0,0 +1,344 @@
+from rest_framework import viewsets, mixins, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from django.db.models import Q
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import PermissionDenied
+from .models import Reserva, Cobro, SerieReserva, ReservaArchivada, ResultadoPago, OrigenTransicion
+from .serializers import (
+    ReservaSerializer, ReservaArchivadaSerializer, ReservaLoteSerializer, ReservaTransicionSerializer,
+    SerieReservaSerializer,
+    SerieModificacionSerializer, SerieCancelacionSerializer, IngresosFiltroSerializer, OcupacionFiltroSerializer,
+    CobroSerializer, PagoSerializer, SolicitudPagoSerializer, ExportacionFiltroSerializer,
+    BusquedaHistorialFiltroSerializer, HistorialBusquedaSerializer
+)
+from .busqueda import buscar
+from .exportacion import generar, FORMATOS
+from .comprobantes import datos_comprobante, obtener_comprobante, respuesta_comprobante
+from .ingresos import resumen_ingresos
+from .ocupacion import resumen_ocupacion
+from .services import crear_reservas_lote, pagar_cobro, ConflictoAgenda, ClaveReutilizada
+from .series import crear_serie, modificar_desde, cancelar_desde
+from .transiciones import transicionar_en_lote
+
+class ReservaViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet de solo lectura para reservas.
+    El personal ve todas las reservas; médicos y pacientes solo las propias.
+    """
+    serializer_class = ReservaSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+    
+    def get_queryset(self):
+        return self._filtrar(Reserva.objects.all())
+    
+    def _filtrar(self, queryset):
+        """Alcance por usuario y filtros opcionales, comunes a reservas y archivo."""
+        queryset = queryset.select_related('medico__user', 'paciente__user')
+        user = self.request.user
+        
+        if not user.is_staff:
+            queryset = queryset.filter(Q(medico__user=user) | Q(paciente__user=user))
+        
+        # Filtros opcionales
+        medico = self.request.query_params.get('medico', None)
+        estado = self.request.query_params.get('estado', None)
+        
+        if medico:
+            queryset = queryset.filter(medico_id=medico)
+        
+        if estado:
+            queryset = queryset.filter(estado=estado)
+        
+        return queryset.order_by('fecha', 'hora_inicio', 'id')
+    
+    def retrieve(self, request, *args, **kwargs):
+        """Si la reserva ya fue archivada se responde desde el archivo."""
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            archivada = get_object_or_404(self._filtrar(ReservaArchivada.objects.all()), pk=kwargs['pk'])
+            return Response(ReservaArchivadaSerializer(archivada).data)
+    
+    @action(detail=False)
+    def archivadas(self, request):
+        """Reservas antiguas ya movidas al archivo, con los mismos filtros."""
+        queryset = self._filtrar(ReservaArchivada.objects.all())
+        pagina = self.paginate_queryset(queryset)
+        if pagina is not None:
+            return self.get_paginated_response(ReservaArchivadaSerializer(pagina, many=True).data)
+        return Response(ReservaArchivadaSerializer(queryset, many=True).data)
+    
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def lote(self, request):
+        """
+        Endpoint para crear reservas de forma masiva (call center, integraciones).
+        Recibe {"reservas": [...]} y retorna el resultado de cada ítem.
+        """
+        serializer = ReservaLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        resultados = crear_reservas_lote(serializer.validated_data['reservas'])
+        creadas = sum(1 for resultado in resultados if resultado['creada'])
+        
+        if creadas == len(resultados):
+            codigo = status.HTTP_201_CREATED
+        elif creadas:
+            codigo = status.HTTP_207_MULTI_STATUS
+        else:
+            codigo = status.HTTP_400_BAD_REQUEST
+        
+        return Response({
+            'total': len(resultados),
+            'creadas': creadas,
+            'rechazadas': len(resultados) - creadas,
+            'resultados': resultados
+        }, status=codigo)
+
+    @action(detail=False, methods=['post'])
+    def transicion(self, request):
+        """
+        Cambia de estado las reservas de un día de un médico, por ejemplo
+        confirmar todas las de mañana. El personal indica el médico; un
+        médico solo puede hacerlo sobre su propia agenda.
+        """
+        serializer = ReservaTransicionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        datos = serializer.validated_data
+        
+        if request.user.is_staff:
+            medico_id = datos.get('medico')
+            if medico_id is None:
+                return Response({'medico': ['Este campo es requerido.']}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            medico = getattr(request.user, 'medico', None)
+            if medico is None or datos.get('medico', medico.id) != medico.id:
+                raise PermissionDenied('Solo el médico puede cambiar el estado de su agenda.')
+            medico_id = medico.id
+        
+        queryset = Reserva.objects.filter(medico_id=medico_id, fecha=datos['fecha'])
+        if 'ids' in datos:
+            queryset = queryset.filter(id__in=datos['ids'])
+        filas = transicionar_en_lote(queryset, datos['estado'], OrigenTransicion.API, usuario=request.user)
+        
+        return Response({
+            'estado': datos['estado'],
+            'actualizadas': len(filas),
+            'reservas': [fila[0] for fila in filas]
+        })
+
+class SerieReservaViewSet(mixins.CreateModelMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet para series de reservas recurrentes.
+    Crear una serie materializa todas sus ocurrencias; las fechas que chocan
+    con otras reservas del médico se omiten y se informan en la respuesta.
+    """
+    serializer_class = SerieReservaSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+    
+    def get_queryset(self):
+        queryset = SerieReserva.objects.select_related('medico__user', 'paciente__user')
+        user = self.request.user
+        
+        if not user.is_staff:
+            queryset = queryset.filter(Q(medico__user=user) | Q(paciente__user=user))
+        
+        return queryset.order_by('-fecha_creacion', '-id')
+    
+    def _verificar_medico(self, medico):
+        # Solo el personal o el médico tratante administran la serie
+        if not self.request.user.is_staff and medico.user_id != self.request.user.id:
+            raise PermissionDenied('Solo el médico de la serie puede modificarla.')
+    
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        self._verificar_medico(serializer.validated_data['medico'])
+        
+        serie, reservas, conflictos = crear_serie(**serializer.validated_data)
+        
+        return Response({
+            'serie': self.get_serializer(serie).data,
+            'creadas': len(reservas),
+            'conflictos': conflictos
+        }, status=status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['post'])
+    def modificar(self, request, pk=None):
+        """Cambia el horario de la fecha indicada y las siguientes."""
+        serie = self.get_object()
+        self._verificar_medico(serie.medico)
+        serializer = SerieModificacionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            serie, actualizadas = modificar_desde(serie, **serializer.validated_data)
+        except ConflictoAgenda as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
+        
+        return Response({
+            'serie': self.get_serializer(serie).data,
+            'actualizadas': actualizadas
+        })
+    
+    @action(detail=True, methods=['post'])
+    def cancelar(self, request, pk=None):
+        """Cancela la fecha indicada y las siguientes. También puede hacerlo el paciente."""
+        serie = self.get_object()
+        serializer = SerieCancelacionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        canceladas = cancelar_desde(serie, serializer.validated_data['desde'], usuario=request.user)
+        serie.refresh_from_db()
+        
+        return Response({
+            'serie': self.get_serializer(serie).data,
+            'canceladas': canceladas
+        })
+
+
+class CobroViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet de solo lectura para cobros, con el pago como acción.
+    El personal ve todos los cobros; médicos y pacientes los de sus reservas.
+    """
+    serializer_class = CobroSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+    
+    def get_queryset(self):
+        queryset = Cobro.objects.select_related('reserva__paciente')
+        user = self.request.user
+        
+        if not user.is_staff:
+            queryset = queryset.filter(Q(reserva__medico__user=user) | Q(reserva__paciente__user=user))
+        
+        return queryset.order_by('-id')
+    
+    @action(detail=True, methods=['post'])
+    def pagar(self, request, pk=None):
+        """
+        Paga el cobro (solo el paciente o el personal). Con el encabezado
+        Idempotency-Key los reintentos reciben el resultado original sin
+        volver a pagar; la respuesta repetida lleva Idempotent-Replayed: true.
+        """
+        cobro = self.get_object()
+        if not request.user.is_staff and cobro.reserva.paciente.user_id != request.user.id:
+            raise PermissionDenied('Solo el paciente de la reserva puede pagar el cobro.')
+        
+        clave = request.headers.get('Idempotency-Key') or None
+        if clave and len(clave) > 100:
+            return Response({'error': 'Idempotency-Key admite hasta 100 caracteres.'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = PagoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        
+        try:
+            solicitud, repetida = pagar_cobro(
+                cobro, serializer.validated_data['metodo_pago'], clave=clave, usuario=request.user
+            )
+        except ClaveReutilizada as e:
+            return Response({'error': str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        codigo = status.HTTP_200_OK if solicitud.resultado == ResultadoPago.PAGADO else status.HTTP_409_CONFLICT
+        response = Response(SolicitudPagoSerializer(solicitud).data, status=codigo)
+        if repetida:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+    
+    @action(detail=True)
+    def comprobante(self, request, pk=None):
+        """PDF del cobro. Mientras se genera responde 202 con Retry-After."""
+        cobro = self.get_object()
+        datos = datos_comprobante(cobro.pk)
+        ruta = obtener_comprobante(datos)
+        if ruta is None:
+            return Response({'estado': 'generando'}, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '2'})
+        return respuesta_comprobante(request, datos, ruta)
+
+
+class IngresosViewSet(viewsets.ViewSet):
+    """
+    Análisis de ingresos cobrados por médico, especialidad y mes (solo personal).
+    Parámetros opcionales `desde` y `hasta` en formato AAAA-MM; por defecto
+    los últimos doce meses.
+    """
+    permission_classes = [IsAdminUser]
+    authentication_classes = [JWTAuthentication]
+    
+    def list(self, request):
+        serializer = IngresosFiltroSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(resumen_ingresos(**serializer.validated_data))
+
+
+class OcupacionViewSet(viewsets.ViewSet):
+    """
+    Ocupación de la agenda por médico, día de la semana y hora (solo
+    personal). Parámetros opcionales `desde`, `hasta` (AAAA-MM-DD; por
+    defecto las últimas cuatro semanas), `medico` y `especialidad`.
+    """
+    permission_classes = [IsAdminUser]
+    authentication_classes = [JWTAuthentication]
+    
+    def list(self, request):
+        serializer = OcupacionFiltroSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(resumen_ocupacion(**serializer.validated_data))
+
+
+class ExportacionViewSet(viewsets.ViewSet):
+    """
+    Exportación completa de reservas y cobros, incluido el archivo, en CSV o
+    NDJSON (solo personal). La respuesta se transmite por fragmentos en orden
+    de id; una descarga interrumpida se retoma con `despues=<último id>`.
+    """
+    permission_classes = [IsAdminUser]
+    authentication_classes = [JWTAuthentication]
+    
+    def _exportar(self, request, tipo):
+        serializer = ExportacionFiltroSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filtros = dict(serializer.validated_data)
+        formato = filtros.pop('formato')
+        
+        response = StreamingHttpResponse(
+            generar(tipo, formato, encabezado='despues' not in filtros, **filtros),
+            content_type=FORMATOS[formato]
+        )
+        response['Content-Disposition'] = f'attachment; filename="{tipo}.{formato}"'
+        return response
+    
+    @action(detail=False)
+    def reservas(self, request):
+        return self._exportar(request, 'reservas')
+    
+    @action(detail=False)
+    def cobros(self, request):
+        return self._exportar(request, 'cobros')
+
+
+class BusquedaHistorialViewSet(viewsets.ViewSet):
+    """
+    Búsqueda de texto completo en el historial médico, ordenada por
+    relevancia (`q`, `limite`). Solo para médicos y solo sobre las consultas
+    que ellos mismos registraron.
+    """
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+    
+    def list(self, request):
+        medico = getattr(request.user, 'medico', None)
+        if medico is None:
+            raise PermissionDenied('Solo los médicos pueden buscar en el historial.')
+        serializer = BusquedaHistorialFiltroSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        
+        historiales = buscar(
+            serializer.validated_data['q'], medico_id=medico.id, limite=serializer.validated_data['limite']
+        )
+        return Response(HistorialBusquedaSerializer(historiales, many=True).data)
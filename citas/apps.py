@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _asegurar_busqueda(sender, using, **kwargs):
+    from .busqueda import asegurar_indice_sqlite
+    asegurar_indice_sqlite(using)
 
 
 class CitasConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'citas'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        # Tabla FTS5 del historial en SQLite (ver citas.busqueda)
+        post_migrate.connect(_asegurar_busqueda, sender=self)
@@ -0,0 +1,122 @@
+"""
+Archivo frío de reservas cerradas.
+
+Las reservas completadas o canceladas con más de ARCHIVO_RESERVAS_DIAS de
+antigüedad se mueven, junto a su cobro, a ReservaArchivada y CobroArchivado
+en lotes, cada uno en su propia transacción. Los historiales médicos, las
+expiraciones y las solicitudes de pago quedan en su tabla y pasan a apuntar
+a la reserva o al cobro archivado, que conservan el id original. Las
+reservas expiradas cuyo aviso aún no se envía esperan a que se envíe. Así las consultas de agenda y listados sobre la tabla de reservas
+solo recorren la historia reciente, y las lecturas de historia consultan
+también el archivo.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.utils import timezone
+
+from .agenda import invalidar_agendas
+from .models import (
+    Reserva, Cobro, HistorialMedico, ReservaArchivada, CobroArchivado, ReservaExpirada, SolicitudPago, EstadoReserva
+)
+from .signals import sin_invalidacion
+
+ESTADOS_CERRADOS = [EstadoReserva.COMPLETADA, EstadoReserva.CANCELADA]
+TAMANO_LOTE = 1000
+
+CAMPOS_RESERVA = (
+    'id', 'paciente_id', 'medico_id', 'serie_id', 'fecha', 'hora_inicio', 'hora_fin',
+    'motivo', 'estado', 'fecha_creacion', 'fecha_modificacion',
+)
+CAMPOS_COBRO = ('id', 'reserva_id', 'monto', 'pagado', 'fecha_pago', 'metodo_pago')
+
+
+@dataclass
+class ResumenArchivo:
+    archivadas: int = 0
+    lotes: int = 0
+    inicio: float = field(default_factory=time.perf_counter)
+
+    @property
+    def segundos(self):
+        return time.perf_counter() - self.inicio
+
+
+def fecha_corte(dias=None):
+    """Las reservas cerradas anteriores a esta fecha van al archivo."""
+    if dias is None:
+        dias = getattr(settings, 'ARCHIVO_RESERVAS_DIAS', 365)
+    return timezone.localdate() - timedelta(days=dias)
+
+
+def archivables(corte):
+    # El aviso de expiración lee la reserva viva: se archiva después de enviarlo
+    aviso_pendiente = ReservaExpirada.objects.filter(reserva=OuterRef('pk'), notificada__isnull=True)
+    return Reserva.objects.filter(estado__in=ESTADOS_CERRADOS, fecha__lt=corte).exclude(Exists(aviso_pendiente))
+
+
+def _archivar_lote(corte, tamano_lote):
+    """Mueve un lote al archivo en una transacción. Retorna la cantidad movida."""
+    with transaction.atomic():
+        filas = list(
+            archivables(corte)
+            .select_for_update()
+            .order_by('id')
+            .values(*CAMPOS_RESERVA)[:tamano_lote]
+        )
+        if not filas:
+            return 0
+        ids = [fila['id'] for fila in filas]
+        ahora = timezone.now()
+
+        ReservaArchivada.objects.bulk_create(
+            [ReservaArchivada(fecha_archivado=ahora, **fila) for fila in filas]
+        )
+        cobros = list(Cobro.objects.filter(reserva_id__in=ids).values(*CAMPOS_COBRO))
+        CobroArchivado.objects.bulk_create([CobroArchivado(**cobro) for cobro in cobros])
+        # Lo que depende de la reserva o del cobro se desvincula antes del DELETE, que
+        # de otro modo lo borraría en cascada
+        HistorialMedico.objects.filter(reserva_id__in=ids).update(
+            reserva_archivada_id=F('reserva_id'), reserva=None
+        )
+        ReservaExpirada.objects.filter(reserva_id__in=ids).update(
+            reserva_archivada_id=F('reserva_id'), reserva=None
+        )
+        SolicitudPago.objects.filter(cobro_id__in=[cobro['id'] for cobro in cobros]).update(
+            cobro_archivado_id=F('cobro_id'), cobro=None
+        )
+        # Las agendas afectadas se invalidan una vez por lote, no fila a fila
+        with sin_invalidacion():
+            Reserva.objects.filter(id__in=ids).delete()
+
+        agendas = {(fila['medico_id'], fila['fecha']) for fila in filas}
+        transaction.on_commit(lambda: invalidar_agendas(agendas))
+        return len(filas)
+
+
+def archivar(dias=None, tamano_lote=TAMANO_LOTE, al_terminar_lote=None):
+    """Archiva todas las reservas cerradas anteriores al corte. Retorna un ResumenArchivo."""
+    corte = fecha_corte(dias)
+    resumen = ResumenArchivo()
+    while True:
+        movidas = _archivar_lote(corte, tamano_lote)
+        if not movidas:
+            return resumen
+        resumen.archivadas += movidas
+        resumen.lotes += 1
+        if al_terminar_lote:
+            al_terminar_lote(resumen)
+
+
+def reserva_archivada(pk):
+    """Reserva archivada con médico, paciente, cobro e historial, o None."""
+    return (
+        ReservaArchivada.objects
+        .select_related('medico__user', 'paciente__user', 'cobro', 'historial')
+        .filter(pk=pk)
+        .first()
+    )
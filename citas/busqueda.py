@@ -0,0 +1,188 @@
+"""
+Búsqueda de texto completo en el historial médico (diagnóstico, tratamiento
+y observaciones).
+
+En PostgreSQL la tabla tiene una columna tsvector generada (se mantiene sola
+en cada escritura, también con bulk_create y QuerySet.update) con un índice
+GIN, creada por la migración 0011. Usa la configuración citas_es: raíces en
+español y sin acentos (unaccent). En SQLite, para desarrollo, una tabla FTS5
+de contenido externo hace de índice y se mantiene con triggers. El
+tokenizador quita los acentos y, como FTS5 no trae raíces en español, cada
+término de la consulta se reduce a una raíz aproximada y se busca como
+prefijo. La tabla y los triggers se aseguran después de cada migrate,
+porque SQLite vuelve a crear la tabla (y pierde los triggers) al alterarla.
+
+Los resultados se ordenan por relevancia; el diagnóstico pesa más que el
+tratamiento y este más que las observaciones.
+"""
+import re
+import unicodedata
+
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+
+from .models import HistorialMedico
+
+TABLA = HistorialMedico._meta.db_table
+TABLA_FTS = 'citas_historial_fts'
+LIMITE_POR_DEFECTO = 20
+LIMITE_MAXIMO = 100
+
+# Pesos de bm25 por columna (diagnóstico, tratamiento, observaciones)
+PESOS_SQLITE = (3.0, 2.0, 1.0)
+PALABRAS_VACIAS = frozenset(
+    'a al con de del el en la las lo los para por sin su sus un una unos unas y o e u que se'.split()
+)
+# De mayor a menor longitud: se quita el primer sufijo que deje una raíz de
+# al menos MIN_RAIZ letras
+SUFIJOS = sorted(
+    (
+        'amientos imientos aciones uciones amiento imiento mente acion ucion idades idad '
+        'ismos ismo ables ibles able ible istas ista osos osas oso osa ivos ivas ivo iva '
+        'icos icas ico ica ales sion cion ion al es os as s o a e'
+    ).split(),
+    key=len, reverse=True,
+)
+MIN_RAIZ = 4
+
+_DDL_SQLITE = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5(
+        diagnostico, tratamiento, observaciones,
+        content='{TABLA}', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ai AFTER INSERT ON {TABLA} BEGIN
+        INSERT INTO {TABLA_FTS}(rowid, diagnostico, tratamiento, observaciones)
+        VALUES (new.id, new.diagnostico, new.tratamiento, new.observaciones);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_ad AFTER DELETE ON {TABLA} BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, diagnostico, tratamiento, observaciones)
+        VALUES ('delete', old.id, old.diagnostico, old.tratamiento, old.observaciones);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {TABLA_FTS}_au AFTER UPDATE OF diagnostico, tratamiento, observaciones
+    ON {TABLA} BEGIN
+        INSERT INTO {TABLA_FTS}({TABLA_FTS}, rowid, diagnostico, tratamiento, observaciones)
+        VALUES ('delete', old.id, old.diagnostico, old.tratamiento, old.observaciones);
+        INSERT INTO {TABLA_FTS}(rowid, diagnostico, tratamiento, observaciones)
+        VALUES (new.id, new.diagnostico, new.tratamiento, new.observaciones);
+    END
+    """,
+]
+
+
+def asegurar_indice_sqlite(using='default'):
+    """
+    Crea la tabla FTS5 y sus triggers si faltan. Si faltaba alguno, el
+    índice puede estar desactualizado y se reconstruye desde la tabla.
+    """
+    conexion = connections[using]
+    if conexion.vendor != 'sqlite':
+        return False
+    with conexion.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE name IN (%s, %s, %s, %s)",
+            [TABLA_FTS, f'{TABLA_FTS}_ai', f'{TABLA_FTS}_ad', f'{TABLA_FTS}_au'],
+        )
+        if cursor.fetchone()[0] == 4:
+            return False
+        for sentencia in _DDL_SQLITE:
+            cursor.execute(sentencia)
+        cursor.execute(f"INSERT INTO {TABLA_FTS}({TABLA_FTS}) VALUES ('rebuild')")
+    return True
+
+
+def _sin_acentos(texto):
+    return ''.join(
+        caracter for caracter in unicodedata.normalize('NFKD', texto) if not unicodedata.combining(caracter)
+    )
+
+
+def raiz(palabra):
+    """Raíz aproximada de una palabra en español, ya en minúsculas y sin acentos."""
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= MIN_RAIZ:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def consulta_fts5(texto):
+    """
+    Expresión MATCH de FTS5 para el texto del usuario: todos los términos
+    (sin palabras vacías) como prefijos de su raíz. Cadena vacía si no queda
+    ningún término.
+    """
+    palabras = re.findall(r'\w+', _sin_acentos(texto).lower())
+    return ' '.join(f'"{raiz(palabra)}"*' for palabra in palabras if palabra not in PALABRAS_VACIAS)
+
+
+def _ids_postgresql(texto, medico_id, limite):
+    filtro_medico = 'AND h.medico_id = %s' if medico_id else ''
+    sql = f"""
+        SELECT h.id, ts_rank_cd(h.busqueda, q) AS rango
+        FROM {TABLA} h, websearch_to_tsquery('citas_es', %s) q
+        WHERE h.busqueda @@ q {filtro_medico}
+        ORDER BY rango DESC, h.id DESC
+        LIMIT %s
+    """
+    parametros = [texto, medico_id, limite] if medico_id else [texto, limite]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
+
+
+def _ids_sqlite(texto, medico_id, limite):
+    expresion = consulta_fts5(texto)
+    if not expresion:
+        return []
+    filtro_medico = 'AND h.medico_id = %s' if medico_id else ''
+    pesos = ', '.join(str(peso) for peso in PESOS_SQLITE)
+    # bm25 es menor cuanto más relevante: se invierte para que el rango crezca
+    sql = f"""
+        SELECT h.id, -bm25({TABLA_FTS}, {pesos}) AS rango
+        FROM {TABLA_FTS} JOIN {TABLA} h ON h.id = {TABLA_FTS}.rowid
+        WHERE {TABLA_FTS} MATCH %s {filtro_medico}
+        ORDER BY rango DESC, h.id DESC
+        LIMIT %s
+    """
+    parametros = [expresion, medico_id, limite] if medico_id else [expresion, limite]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
+
+
+def buscar(texto, medico_id=None, limite=LIMITE_POR_DEFECTO):
+    """
+    Historiales que coinciden con `texto`, del más al menos relevante, cada
+    uno con su `rango`. Con `medico_id` solo los escritos por ese médico.
+    """
+    if connection.vendor == 'postgresql':
+        filas = _ids_postgresql(texto, medico_id, limite)
+    else:
+        filas = _ids_sqlite(texto, medico_id, limite)
+    if not filas:
+        return []
+
+    historiales = HistorialMedico.objects.select_related('paciente__user').in_bulk([fila[0] for fila in filas])
+    resultado = []
+    for historial_id, rango in filas:
+        historial = historiales[historial_id]
+        historial.rango = float(rango)
+        resultado.append(historial)
+    return resultado
+
+
+def filtrar(queryset, texto):
+    """Restringe un queryset de historiales a los que coinciden con `texto`, sin ordenar por relevancia."""
+    if connection.vendor == 'postgresql':
+        subconsulta = RawSQL(f"SELECT id FROM {TABLA} WHERE busqueda @@ websearch_to_tsquery('citas_es', %s)", [texto])
+        return queryset.filter(id__in=subconsulta)
+    expresion = consulta_fts5(texto)
+    if not expresion:
+        return queryset.none()
+    return queryset.filter(id__in=RawSQL(f'SELECT rowid FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', [expresion]))
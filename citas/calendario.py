@@ -0,0 +1,122 @@
+"""
+Generación de feeds iCalendar (RFC 5545) con las reservas de un médico o de
+un paciente.
+
+El feed se produce como un generador de líneas sobre un iterador por bloques
+de la base de datos, para que la respuesta pueda transmitirse sin cargar toda
+la agenda en memoria.
+"""
+import hashlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import Reserva, EstadoReserva
+
+# Reservas pasadas que se siguen publicando en el feed
+VENTANA_PASADO_DIAS = 180
+TAMANO_BLOQUE = 500
+
+ESTADOS_ICS = {
+    EstadoReserva.PENDIENTE: 'TENTATIVE',
+    EstadoReserva.CONFIRMADA: 'CONFIRMED',
+    EstadoReserva.COMPLETADA: 'CONFIRMED',
+    EstadoReserva.CANCELADA: 'CANCELLED',
+}
+
+
+def reservas_del_feed(suscripcion):
+    """Reservas publicadas en el feed de la suscripción."""
+    desde = date.today() - timedelta(days=VENTANA_PASADO_DIAS)
+    reservas = Reserva.objects.filter(fecha__gte=desde)
+    if suscripcion.medico_id:
+        return reservas.filter(medico_id=suscripcion.medico_id)
+    return reservas.filter(paciente_id=suscripcion.paciente_id)
+
+
+def version_del_feed(suscripcion):
+    """
+    Retorna (etag, ultima_modificacion) del feed con una sola consulta de
+    agregación. El conteo cubre las reservas eliminadas, que no cambian el
+    máximo de fecha_modificacion.
+    """
+    datos = reservas_del_feed(suscripcion).aggregate(total=Count('id'), ultima=Max('fecha_modificacion'))
+    ultima = datos['ultima'] or suscripcion.fecha_creacion
+    firma = f"{suscripcion.token}:{datos['total']}:{ultima.isoformat()}"
+    return hashlib.sha256(firma.encode()).hexdigest()[:32], ultima
+
+
+def escapar(texto):
+    """Escapa un valor de texto según RFC 5545."""
+    return (
+        texto.replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+
+def plegar(linea):
+    """Pliega una línea de contenido en segmentos de 75 octetos."""
+    crudo = linea.encode('utf-8')
+    if len(crudo) <= 75:
+        return linea + '\r\n'
+    partes = []
+    while crudo:
+        limite = 75 if not partes else 74
+        # No cortar en medio de un carácter multibyte
+        while limite < len(crudo) and (crudo[limite] & 0xC0) == 0x80:
+            limite -= 1
+        partes.append(crudo[:limite].decode('utf-8'))
+        crudo = crudo[limite:]
+    return '\r\n '.join(partes) + '\r\n'
+
+
+def _nombre(nombre, apellido, username):
+    return f"{nombre} {apellido}".strip() or username
+
+
+def _fecha_hora(fecha, hora):
+    return datetime.combine(fecha, hora).strftime('%Y%m%dT%H%M%S')
+
+
+def generar_feed(suscripcion):
+    """Genera el calendario línea a línea."""
+    es_medico = bool(suscripcion.medico_id)
+    contraparte = 'paciente__user' if es_medico else 'medico__user'
+    filas = (
+        reservas_del_feed(suscripcion)
+        .order_by('fecha', 'hora_inicio', 'id')
+        .values_list(
+            'id', 'fecha', 'hora_inicio', 'hora_fin', 'motivo', 'estado', 'fecha_modificacion',
+            f'{contraparte}__first_name', f'{contraparte}__last_name', f'{contraparte}__username',
+        )
+        .iterator(chunk_size=TAMANO_BLOQUE)
+    )
+    zona = settings.TIME_ZONE
+
+    yield plegar('BEGIN:VCALENDAR')
+    yield plegar('VERSION:2.0')
+    yield plegar('PRODID:-//Mediconecta//Agenda//ES')
+    yield plegar('CALSCALE:GREGORIAN')
+    yield plegar('METHOD:PUBLISH')
+    yield plegar('X-WR-CALNAME:Mediconecta')
+    for id, fecha, hora_inicio, hora_fin, motivo, estado, modificada, nombre, apellido, username in filas:
+        persona = _nombre(nombre, apellido, username)
+        resumen = f"Cita con {persona}" if es_medico else f"Cita con Dr. {persona}"
+        sello = modificada.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        yield ''.join([
+            plegar('BEGIN:VEVENT'),
+            plegar(f'UID:reserva-{id}@mediconecta'),
+            plegar(f'DTSTAMP:{sello}'),
+            plegar(f'LAST-MODIFIED:{sello}'),
+            plegar(f'DTSTART;TZID={zona}:{_fecha_hora(fecha, hora_inicio)}'),
+            plegar(f'DTEND;TZID={zona}:{_fecha_hora(fecha, hora_fin)}'),
+            plegar(f'SUMMARY:{escapar(resumen)}'),
+            plegar(f'DESCRIPTION:{escapar(motivo)}'),
+            plegar(f'STATUS:{ESTADOS_ICS.get(estado, "CONFIRMED")}'),
+            plegar('END:VEVENT'),
+        ])
+    yield plegar('END:VCALENDAR')
@@ -0,0 +1,227 @@
+"""
+Comprobantes de pago y detalles de cobro en PDF.
+
+Cada PDF se guarda en MEDIA_ROOT/comprobantes/<cobro_id>/<huella>.pdf, donde
+la huella resume los datos impresos. Mientras el cobro no cambie, las
+descargas sirven el archivo ya generado; si cambia (por ejemplo al pagarse)
+la huella nueva apunta a otro archivo. Los PDF se generan en un pool de
+hilos fuera de la solicitud, y el comando generar_comprobantes renderiza
+los de un mes completo en paralelo en varios procesos.
+"""
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import django
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfgen import canvas
+
+from .correo import nombre_de
+from .generados import Cola, escribir_atomico, respuesta_archivo
+from .models import Cobro, CobroArchivado
+
+CAMPOS = (
+    'id', 'monto', 'pagado', 'fecha_pago', 'metodo_pago', 'reserva_id',
+    'reserva__fecha', 'reserva__hora_inicio', 'reserva__hora_fin', 'reserva__motivo',
+    'reserva__paciente__user__first_name', 'reserva__paciente__user__last_name',
+    'reserva__paciente__user__username', 'reserva__paciente__user__email',
+    'reserva__medico__user__first_name', 'reserva__medico__user__last_name',
+    'reserva__medico__user__username', 'reserva__medico__especialidad__nombre',
+)
+TAMANO_BLOQUE = 200
+
+_cola = Cola('comprobantes', 'COMPROBANTES_HILOS')
+
+
+@dataclass
+class ResumenComprobantes:
+    generados: int = 0
+    existentes: int = 0
+    inicio: float = field(default_factory=time.perf_counter)
+
+    @property
+    def segundos(self):
+        return time.perf_counter() - self.inicio
+
+
+def _normalizar(fila):
+    """Datos impresos en el PDF, como texto para que la huella sea estable."""
+    fecha_pago = fila['fecha_pago']
+    return {
+        'cobro_id': fila['id'],
+        'reserva_id': fila['reserva_id'],
+        'monto': str(fila['monto']),
+        'pagado': fila['pagado'],
+        'fecha_pago': f'{timezone.localtime(fecha_pago):%d/%m/%Y %H:%M}' if fecha_pago else '',
+        'metodo_pago': fila['metodo_pago'],
+        'fecha': f"{fila['reserva__fecha']:%d/%m/%Y}",
+        'horario': f"{fila['reserva__hora_inicio']:%H:%M} - {fila['reserva__hora_fin']:%H:%M}",
+        'motivo': fila['reserva__motivo'],
+        'paciente': nombre_de(fila, 'reserva__paciente__user'),
+        'email': fila['reserva__paciente__user__email'],
+        'medico': nombre_de(fila, 'reserva__medico__user'),
+        'especialidad': fila['reserva__medico__especialidad__nombre'] or '',
+    }
+
+
+def datos_comprobante(cobro_id):
+    """Datos del comprobante de un cobro, también si ya está archivado. None si no existe."""
+    for modelo in (Cobro, CobroArchivado):
+        fila = modelo.objects.filter(pk=cobro_id).values(*CAMPOS).first()
+        if fila:
+            return _normalizar(fila)
+    return None
+
+
+def huella(datos):
+    # Con la SECRET_KEY el nombre del archivo no se puede deducir de los datos
+    contenido = json.dumps(datos, sort_keys=True).encode()
+    return hmac.new(settings.SECRET_KEY.encode(), contenido, hashlib.sha256).hexdigest()[:24]
+
+
+def ruta_comprobante(datos):
+    return Path(settings.MEDIA_ROOT) / 'comprobantes' / str(datos['cobro_id']) / f'{huella(datos)}.pdf'
+
+
+def _dibujar(pdf, datos):
+    ancho, alto = A4
+    y = alto - 2.5 * cm
+    pdf.setFont('Helvetica-Bold', 18)
+    pdf.drawString(2 * cm, y, 'Mediconecta')
+    pdf.setFont('Helvetica', 10)
+    pdf.drawRightString(ancho - 2 * cm, y, f"N° {datos['cobro_id']:08d}")
+
+    y -= 1.5 * cm
+    pdf.setFont('Helvetica-Bold', 14)
+    pdf.drawString(2 * cm, y, 'Comprobante de pago' if datos['pagado'] else 'Detalle de cobro pendiente')
+
+    filas = [
+        ('Paciente', datos['paciente']),
+        ('Correo', datos['email']),
+        ('Médico', datos['medico']),
+        ('Especialidad', datos['especialidad']),
+        ('Fecha de la cita', datos['fecha']),
+        ('Horario', datos['horario']),
+        ('Motivo', datos['motivo'][:90]),
+        ('Reserva', f"#{datos['reserva_id']}"),
+    ]
+    if datos['pagado']:
+        filas += [('Fecha de pago', datos['fecha_pago']), ('Método de pago', datos['metodo_pago'])]
+
+    y -= 1.2 * cm
+    for etiqueta, valor in filas:
+        pdf.setFont('Helvetica-Bold', 10)
+        pdf.drawString(2 * cm, y, etiqueta)
+        pdf.setFont('Helvetica', 10)
+        pdf.drawString(6 * cm, y, str(valor))
+        y -= 0.7 * cm
+
+    y -= 0.5 * cm
+    pdf.line(2 * cm, y, ancho - 2 * cm, y)
+    y -= 0.9 * cm
+    pdf.setFont('Helvetica-Bold', 13)
+    pdf.drawString(2 * cm, y, 'Total pagado' if datos['pagado'] else 'Total a pagar')
+    pdf.drawRightString(ancho - 2 * cm, y, f"${datos['monto']}")
+
+
+def renderizar(datos, ruta=None):
+    """
+    Genera el PDF si aún no existe y retorna (ruta, generado). No usa la
+    base de datos: puede ejecutarse en otro proceso.
+    """
+    def escribir(archivo):
+        pdf = canvas.Canvas(archivo, pagesize=A4)
+        pdf.setTitle(f"Mediconecta - Cobro {datos['cobro_id']}")
+        _dibujar(pdf, datos)
+        pdf.showPage()
+        pdf.save()
+
+    return escribir_atomico(ruta or ruta_comprobante(datos), escribir)
+
+
+def encolar(datos):
+    """Encola la generación del PDF en el pool de fondo, una sola vez por archivo."""
+    ruta = ruta_comprobante(datos)
+    _cola.encolar(ruta, renderizar, datos, ruta)
+
+
+def encolar_cobro(cobro_id):
+    """Encola el comprobante de un cobro recién pagado (desde transaction.on_commit)."""
+    if not getattr(settings, 'COMPROBANTES_EN_SEGUNDO_PLANO', True):
+        return
+    datos = datos_comprobante(cobro_id)
+    if datos:
+        encolar(datos)
+
+
+def obtener_comprobante(datos):
+    """
+    Ruta del PDF si ya está generado. Si no, lo encola y retorna None; sin
+    generación en segundo plano lo renderiza en la misma solicitud.
+    """
+    ruta = ruta_comprobante(datos)
+    if ruta.exists():
+        return ruta
+    if getattr(settings, 'COMPROBANTES_EN_SEGUNDO_PLANO', True):
+        encolar(datos)
+        return None
+    return renderizar(datos)[0]
+
+
+def respuesta_comprobante(request, datos, ruta):
+    return respuesta_archivo(request, ruta, f"comprobante-{datos['cobro_id']}.pdf", 'application/pdf')
+
+
+def cobros_del_mes(mes):
+    """Datos de los comprobantes de las reservas del mes (pagados o no), por bloques."""
+    filas = (
+        Cobro.objects
+        .filter(reserva__fecha__gte=mes, reserva__fecha__lt=mes + relativedelta(months=1))
+        .order_by('id')
+        .values(*CAMPOS)
+        .iterator(chunk_size=TAMANO_BLOQUE)
+    )
+    for fila in filas:
+        yield _normalizar(fila)
+
+
+def generar_mes(mes, procesos=None, al_avanzar=None):
+    """
+    Renderiza los comprobantes del mes en un pool de procesos (uno por
+    núcleo por defecto). Los datos se leen en este proceso y los workers
+    solo dibujan: se inician con spawn para no heredar la conexión a la base
+    de datos.
+    """
+    resumen = ResumenComprobantes()
+    pendientes, rutas = [], []
+    for datos in cobros_del_mes(mes):
+        ruta = ruta_comprobante(datos)
+        if ruta.exists():
+            resumen.existentes += 1
+        else:
+            pendientes.append(datos)
+            rutas.append(ruta)
+
+    if pendientes:
+        ejecutor = ProcessPoolExecutor(
+            max_workers=procesos or os.cpu_count(),
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+        with ejecutor:
+            for _, generado in ejecutor.map(renderizar, pendientes, rutas, chunksize=TAMANO_BLOQUE // 4):
+                resumen.generados += generado
+                resumen.existentes += not generado
+                if al_avanzar and resumen.generados % TAMANO_BLOQUE == 0:
+                    al_avanzar(resumen)
+    return resumen
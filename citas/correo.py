@@ -0,0 +1,49 @@
+"""
+Utilidades para los correos masivos de citas (recordatorios, avisos).
+"""
+import logging
+
+from django.core.mail import EmailMultiAlternatives
+from django.template.loader import get_template
+
+logger = logging.getLogger(__name__)
+
+
+def nombre_de(fila, prefijo):
+    """Nombre completo (o username) de un usuario en una fila de values()."""
+    nombre = f"{fila[f'{prefijo}__first_name']} {fila[f'{prefijo}__last_name']}".strip()
+    return nombre or fila[f'{prefijo}__username']
+
+
+class PlantillasCorreo:
+    """
+    Plantillas de asunto, texto y HTML de un correo, compiladas una vez y
+    reutilizadas para cada mensaje. `base` es la ruta sin sufijo, p. ej.
+    'citas/email/recordatorio' carga recordatorio_asunto.txt,
+    recordatorio.txt y recordatorio.html.
+    """
+
+    def __init__(self, base):
+        self.asunto = get_template(f'{base}_asunto.txt')
+        self.texto = get_template(f'{base}.txt')
+        self.html = get_template(f'{base}.html')
+
+    def mensaje(self, contexto, destinatario, conexion):
+        asunto = ' '.join(self.asunto.render(contexto).split())
+        mensaje = EmailMultiAlternatives(
+            asunto, self.texto.render(contexto), to=[destinatario], connection=conexion,
+        )
+        mensaje.attach_alternative(self.html.render(contexto), 'text/html')
+        return mensaje
+
+
+def enviar(conexion, mensaje):
+    """
+    Envía un mensaje por una conexión ya abierta. Se envía de a uno para
+    saber exactamente cuáles salieron si el servidor rechaza alguno.
+    """
+    try:
+        return bool(conexion.send_messages([mensaje]))
+    except Exception:
+        logger.exception('No se pudo enviar el correo a %s', ', '.join(mensaje.to))
+        return False
@@ -0,0 +1,165 @@
+"""
+Motor de disponibilidad de agendas médicas.
+
+Construye, para un conjunto de médicos y un rango de fechas, un índice de
+intervalos ocupados a partir de las reservas vigentes (una sola consulta) y
+calcula los bloques libres con un barrido en memoria sobre el horario de
+atención de cada médico.
+"""
+from collections import defaultdict
+from datetime import date, time, timedelta
+
+from django.utils import timezone
+
+from medicos.models import Medico
+from .models import Reserva, ESTADOS_VIGENTES
+from .services import cupos_retenidos
+
+# Límites para acotar el costo de una consulta de disponibilidad
+DURACION_POR_DEFECTO = 30
+DURACION_MINIMA = 5
+DURACION_MAXIMA = 480
+MAX_DIAS_RANGO = 62
+
+
+def a_minutos(valor):
+    """Convierte un objeto time en minutos desde medianoche."""
+    return valor.hour * 60 + valor.minute
+
+
+def a_hora(minutos):
+    """Convierte minutos desde medianoche en un objeto time."""
+    return time(minutos // 60, minutos % 60)
+
+
+def construir_indice(medico_ids, desde, hasta):
+    """
+    Devuelve {medico_id: {fecha: [(inicio, fin), ...]}} con los intervalos
+    ocupados (en minutos) por reservas vigentes y por cupos retenidos por la
+    lista de espera, ordenados por hora de inicio.
+    """
+    indice = defaultdict(lambda: defaultdict(list))
+    ocupados = (
+        Reserva.objects
+        .filter(
+            medico_id__in=medico_ids,
+            fecha__range=(desde, hasta),
+            estado__in=ESTADOS_VIGENTES,
+        )
+        .order_by('medico_id', 'fecha', 'hora_inicio')
+        .values_list('medico_id', 'fecha', 'hora_inicio', 'hora_fin')
+    )
+    for medico_id, fecha, hora_inicio, hora_fin in ocupados:
+        indice[medico_id][fecha].append((a_minutos(hora_inicio), a_minutos(hora_fin)))
+
+    retenidos = cupos_retenidos(
+        medico_id__in=medico_ids, fecha__range=(desde, hasta),
+    ).values_list('medico_id', 'fecha', 'hora_inicio', 'hora_fin')
+    for medico_id, fecha, hora_inicio, hora_fin in retenidos:
+        intervalos = indice[medico_id][fecha]
+        intervalos.append((a_minutos(hora_inicio), a_minutos(hora_fin)))
+        intervalos.sort()
+    return indice
+
+
+def bloques_libres(jornada_inicio, jornada_fin, ocupados, duracion):
+    """
+    Barrido sobre los intervalos ocupados (ordenados por inicio) que produce
+    los bloques libres de `duracion` minutos dentro de la jornada.
+    """
+    bloques = []
+    cursor = jornada_inicio
+    for inicio, fin in ocupados:
+        if fin <= cursor:
+            continue
+        limite = min(inicio, jornada_fin)
+        while cursor + duracion <= limite:
+            bloques.append((cursor, cursor + duracion))
+            cursor += duracion
+        cursor = max(cursor, fin)
+        if cursor >= jornada_fin:
+            return bloques
+    while cursor + duracion <= jornada_fin:
+        bloques.append((cursor, cursor + duracion))
+        cursor += duracion
+    return bloques
+
+
+def calcular_disponibilidad(medicos, desde, hasta, duracion=DURACION_POR_DEFECTO, ahora=None):
+    """
+    Calcula los bloques libres de cada médico entre `desde` y `hasta`
+    (ambos inclusive). Los días anteriores a hoy no tienen bloques, y de hoy
+    solo se informan los que aún no empezaron (según `ahora`, por defecto la
+    hora local).
+
+    `medicos` puede ser un queryset o una lista de Medico. Los médicos no
+    disponibles o sin horario configurado no tienen bloques libres.
+    Retorna {medico_id: {fecha: [(hora_inicio, hora_fin), ...]}}.
+    """
+    if isinstance(medicos, Medico):
+        medicos = [medicos]
+    jornadas = {}
+    for medico in medicos:
+        if medico.disponible and medico.horario_inicio and medico.horario_fin:
+            jornadas[medico.id] = (a_minutos(medico.horario_inicio), a_minutos(medico.horario_fin))
+
+    resultado = {}
+    if not jornadas:
+        return resultado
+
+    ahora = ahora or timezone.localtime()
+    indice = construir_indice(list(jornadas), desde, hasta)
+    dias = [desde + timedelta(days=n) for n in range((hasta - desde).days + 1)]
+
+    for medico_id, (jornada_inicio, jornada_fin) in jornadas.items():
+        ocupados_medico = indice.get(medico_id, {})
+        agenda = {}
+        for dia in dias:
+            libres = bloques_libres(jornada_inicio, jornada_fin, ocupados_medico.get(dia, ()), duracion)
+            agenda[dia] = [
+                (a_hora(inicio), a_hora(fin)) for inicio, fin in libres
+                if dia > ahora.date() or (dia == ahora.date() and a_hora(inicio) > ahora.time())
+            ]
+        resultado[medico_id] = agenda
+    return resultado
+
+
+def parsear_parametros(params, hoy=None):
+    """
+    Valida los parámetros `desde`, `hasta` y `duracion` de una consulta de
+    disponibilidad. Lanza ValueError con un mensaje legible si son inválidos.
+    """
+    hoy = hoy or timezone.localdate()
+    try:
+        desde = date.fromisoformat(params['desde']) if params.get('desde') else hoy
+        hasta = date.fromisoformat(params['hasta']) if params.get('hasta') else desde + timedelta(days=6)
+    except ValueError:
+        raise ValueError('Las fechas deben tener formato AAAA-MM-DD')
+    try:
+        duracion = int(params.get('duracion') or DURACION_POR_DEFECTO)
+    except ValueError:
+        raise ValueError('La duración debe ser un número entero de minutos')
+
+    if desde < hoy:
+        raise ValueError('La fecha "desde" no puede ser anterior a hoy')
+    if hasta < desde:
+        raise ValueError('La fecha "hasta" debe ser posterior o igual a "desde"')
+    if (hasta - desde).days + 1 > MAX_DIAS_RANGO:
+        raise ValueError(f'El rango no puede superar {MAX_DIAS_RANGO} días')
+    if not DURACION_MINIMA <= duracion <= DURACION_MAXIMA:
+        raise ValueError(f'La duración debe estar entre {DURACION_MINIMA} y {DURACION_MAXIMA} minutos')
+    return desde, hasta, duracion
+
+
+def serializar_agenda(agenda):
+    """Convierte la agenda de un médico a una estructura apta para JSON."""
+    return [
+        {
+            'fecha': dia.isoformat(),
+            'bloques': [
+                {'hora_inicio': inicio.strftime('%H:%M'), 'hora_fin': fin.strftime('%H:%M')}
+                for inicio, fin in bloques
+            ],
+        }
+        for dia, bloques in agenda.items()
+    ]
@@ -0,0 +1,341 @@
+"""
+Eliminación en segundo plano de cuentas y de selecciones grandes de reservas.
+
+Borrar un usuario en la solicitud arrastra por CASCADE sus reservas, cobros,
+historial y archivo; para un médico con años de historia eso bloquea las
+tablas más allá del tiempo límite del servidor. En su lugar se registra una
+Eliminacion y el objetivo queda marcado de inmediato (la cuenta inactiva, el
+médico no disponible). Un hilo de fondo tras el commit, o el comando
+`procesar_eliminaciones`, borra después las filas dependientes por pasos, en
+lotes de TAMANO_LOTE que confirman cada uno por separado, y al final el
+usuario, cuyo CASCADE restante ya es pequeño. Cada lote actualiza el avance,
+visible en el admin.
+
+Varios procesos pueden buscar trabajo a la vez (el hilo de cada worker y el
+comando): cada eliminación se toma con un UPDATE condicional que deja la
+marca del proceso y un plazo (ARRIENDO). Cada lote renueva el plazo en su
+propia transacción y se revierte si la marca ya no es la suya; si el proceso
+muere, otro la retoma cuando el plazo vence.
+
+Una selección de reservas del admin (que puede ser "todas" sobre millones de
+filas) no se lee en la solicitud: se guarda su consulta y la mayor id
+existente, y cada lote toma las siguientes por id desde `ultimo_id`.
+
+Los borrados por lote no pasan por las señales fila a fila: cada lote
+invalida una sola vez las agendas y los meses de ingresos afectados. Si el
+proceso se interrumpe, la siguiente pasada retoma desde lo que falte.
+"""
+import logging
+import pickle
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F, Model, Q, QuerySet
+from django.utils import timezone
+
+from medicos.models import Medico
+from pacientes.models import Paciente
+from .agenda import invalidar_agendas
+from .ingresos import invalidar_mes, mes_de
+from .models import (
+    Reserva, Cobro, HistorialMedico, ReservaArchivada, CobroArchivado, SerieReserva, SolicitudEspera,
+    CupoLiberado, AgendaDia, SolicitudPago, TransicionReserva, Eliminacion, TipoEliminacion, EstadoEliminacion,
+)
+from .signals import sin_invalidacion
+
+logger = logging.getLogger(__name__)
+
+TAMANO_LOTE = 500
+ACTIVAS = [EstadoEliminacion.PENDIENTE, EstadoEliminacion.EN_CURSO]
+# Plazo sin renovar tras el cual se da por muerto al proceso que la ejecutaba
+ARRIENDO = timedelta(minutes=5)
+
+_ejecutor = None
+
+
+class ArriendoPerdido(Exception):
+    """Otro proceso tomó la eliminación porque venció el plazo de este."""
+
+
+def _invalidar_reservas(ids):
+    agendas = set(Reserva.objects.filter(id__in=ids).values_list('medico_id', 'fecha'))
+    meses = {
+        mes_de(fecha_pago) for fecha_pago in
+        Cobro.objects.filter(reserva_id__in=ids, fecha_pago__isnull=False).values_list('fecha_pago', flat=True)
+    }
+
+    def invalidar():
+        invalidar_agendas(agendas)
+        for mes in meses:
+            invalidar_mes(mes)
+    return invalidar
+
+
+def _invalidar_archivadas(ids):
+    meses = {
+        mes_de(fecha_pago) for fecha_pago in
+        CobroArchivado.objects.filter(reserva_id__in=ids, fecha_pago__isnull=False)
+        .values_list('fecha_pago', flat=True)
+    }
+
+    def invalidar():
+        for mes in meses:
+            invalidar_mes(mes)
+    return invalidar
+
+
+@dataclass
+class Paso:
+    """
+    Filas a borrar (o a desvincular, si se indica `desvincular`) de un modelo.
+    `filtro` las selecciona por consulta; `consulta` es en cambio un queryset
+    que se recorre en orden de id, avanzando tras cada lote.
+    `invalidaciones(ids)` retorna lo que hay que invalidar tras el commit del
+    lote.
+    """
+    nombre: str
+    modelo: type[Model]
+    filtro: dict = None
+    consulta: QuerySet = None
+    desvincular: str = None
+    invalidaciones: Callable = None
+
+    @property
+    def por_id(self):
+        return self.consulta is not None
+
+    def pendientes(self):
+        if self.por_id:
+            return self.consulta
+        queryset = self.modelo.objects.filter(**self.filtro)
+        if self.desvincular:
+            queryset = queryset.filter(**{f'{self.desvincular}__isnull': False})
+        return queryset
+
+    def contar(self):
+        return self.pendientes().count()
+
+    def lote(self, tamano):
+        if self.por_id:
+            lote = list(self.consulta.order_by('pk').values_list('pk', flat=True)[:tamano])
+            if lote:
+                self.consulta = self.consulta.filter(pk__gt=lote[-1])
+            return lote
+        # Sin orden: cada lote toma cualquier fila restante por el índice del filtro
+        return list(self.pendientes().order_by().values_list('pk', flat=True)[:tamano])
+
+    def aplicar(self, ids):
+        queryset = self.modelo.objects.filter(pk__in=ids)
+        if self.desvincular:
+            return queryset.update(**{self.desvincular: None})
+        with sin_invalidacion():
+            return queryset.delete()[1].get(self.modelo._meta.label, 0)
+
+
+def _pasos_usuario(usuario_id):
+    pasos = []
+    for campo, perfil in (('paciente', Paciente), ('medico', Medico)):
+        perfil_id = perfil.objects.filter(user_id=usuario_id).values_list('id', flat=True).first()
+        if perfil_id is None:
+            continue
+        filtro = {f'{campo}_id': perfil_id}
+        pasos += [
+            Paso(f'reservas ({campo})', Reserva, filtro, invalidaciones=_invalidar_reservas),
+            Paso(f'reservas archivadas ({campo})', ReservaArchivada, filtro, invalidaciones=_invalidar_archivadas),
+            Paso(f'historial ({campo})', HistorialMedico, filtro),
+            Paso(f'lista de espera ({campo})', SolicitudEspera, filtro),
+            Paso(f'series ({campo})', SerieReserva, filtro),
+        ]
+        if campo == 'medico':
+            pasos += [
+                Paso('cupos liberados', CupoLiberado, filtro),
+                Paso('agendas', AgendaDia, filtro),
+            ]
+    # Registros que conservan la fila pero pierden la referencia al usuario
+    pasos += [
+        Paso('transiciones', TransicionReserva, {'usuario_id': usuario_id}, desvincular='usuario'),
+        Paso('pagos', SolicitudPago, {'usuario_id': usuario_id}, desvincular='usuario'),
+    ]
+    return pasos
+
+
+def pasos(eliminacion):
+    """Pasos que le quedan a una eliminación, en orden."""
+    if eliminacion.tipo == TipoEliminacion.RESERVAS:
+        seleccion = Reserva.objects.all()
+        seleccion.query = pickle.loads(eliminacion.consulta)
+        # Se recorre por id: se retoma después de la última procesada
+        restantes = seleccion.filter(pk__gt=eliminacion.ultimo_id, pk__lte=eliminacion.hasta_id or 0)
+        return [Paso('reservas', Reserva, consulta=restantes, invalidaciones=_invalidar_reservas)]
+    return _pasos_usuario(eliminacion.usuario_id)
+
+
+def _libre(ahora):
+    return Q(reclamada_hasta__isnull=True) | Q(reclamada_hasta__lt=ahora)
+
+
+def _reclamar(eliminacion):
+    """
+    Toma la eliminación si sigue activa y nadie la tiene (o su plazo venció).
+    Retorna la marca del proceso, o None si la tiene otro.
+    """
+    marca = uuid.uuid4().hex
+    ahora = timezone.now()
+    tomada = Eliminacion.objects.filter(_libre(ahora), pk=eliminacion.pk, estado__in=ACTIVAS).update(
+        estado=EstadoEliminacion.EN_CURSO, error='', reclamada_por=marca, reclamada_hasta=ahora + ARRIENDO,
+    )
+    eliminacion.refresh_from_db()
+    return marca if tomada else None
+
+
+def _renovar(eliminacion, marca, **campos):
+    """Renueva el plazo (y guarda `campos`) solo si la eliminación sigue siendo de este proceso."""
+    if not Eliminacion.objects.filter(pk=eliminacion.pk, reclamada_por=marca).update(
+        reclamada_hasta=timezone.now() + ARRIENDO, **campos
+    ):
+        raise ArriendoPerdido(f'La eliminación {eliminacion.pk} la tomó otro proceso.')
+
+
+def _procesar_lote(eliminacion, paso, tamano_lote, marca):
+    """Aplica un lote del paso en su propia transacción. Retorna las filas del lote."""
+    with transaction.atomic():
+        ids = paso.lote(tamano_lote)
+        if not ids:
+            return 0
+        # Primero la marca: si otro proceso la tomó, el lote no se aplica
+        _renovar(eliminacion, marca, paso=paso.nombre)
+        if paso.invalidaciones:
+            transaction.on_commit(paso.invalidaciones(ids))
+        aplicadas = paso.aplicar(ids)
+        campos = {'avance': F('avance') + aplicadas}
+        if paso.por_id:
+            campos['ultimo_id'] = ids[-1]
+        Eliminacion.objects.filter(pk=eliminacion.pk).update(**campos)
+    eliminacion.avance += aplicadas
+    eliminacion.paso = paso.nombre
+    if paso.por_id:
+        eliminacion.ultimo_id = ids[-1]
+    return len(ids)
+
+
+def _finalizar(eliminacion, marca):
+    with transaction.atomic():
+        eliminacion.estado = EstadoEliminacion.COMPLETADA
+        eliminacion.fecha_fin = timezone.now()
+        eliminacion.paso = ''
+        if not Eliminacion.objects.filter(pk=eliminacion.pk, reclamada_por=marca).update(
+            estado=eliminacion.estado, fecha_fin=eliminacion.fecha_fin, paso='', reclamada_por='', reclamada_hasta=None,
+        ):
+            raise ArriendoPerdido(f'La eliminación {eliminacion.pk} la tomó otro proceso.')
+        if eliminacion.tipo == TipoEliminacion.USUARIO:
+            User.objects.filter(pk=eliminacion.usuario_id).delete()
+
+
+def procesar(eliminacion, tamano_lote=TAMANO_LOTE, al_terminar_lote=None):
+    """
+    Ejecuta una eliminación hasta el final. Los errores quedan en la fila
+    como FALLIDA. Si otro proceso la tiene, retorna la fila sin tocarla.
+    """
+    marca = _reclamar(eliminacion)
+    if marca is None:
+        return eliminacion
+    try:
+        pendientes = pasos(eliminacion)
+        if eliminacion.total is None:
+            eliminacion.total = sum(paso.contar() for paso in pendientes)
+            _renovar(eliminacion, marca, total=eliminacion.total)
+        for paso in pendientes:
+            while _procesar_lote(eliminacion, paso, tamano_lote, marca):
+                if al_terminar_lote:
+                    al_terminar_lote(eliminacion)
+        _finalizar(eliminacion, marca)
+    except ArriendoPerdido:
+        logger.warning('La eliminación %s pasó a otro proceso', eliminacion.pk)
+        eliminacion.refresh_from_db()
+    except Exception as e:
+        logger.exception('Error en la eliminación %s', eliminacion.pk)
+        Eliminacion.objects.filter(pk=eliminacion.pk, reclamada_por=marca).update(
+            estado=EstadoEliminacion.FALLIDA, error=str(e), reclamada_por='', reclamada_hasta=None,
+        )
+        eliminacion.refresh_from_db()
+    return eliminacion
+
+
+def procesar_pendientes(tamano_lote=TAMANO_LOTE, al_terminar_lote=None):
+    """
+    Procesa las eliminaciones pendientes y las interrumpidas cuyo plazo
+    venció. Retorna cuántas terminó.
+    """
+    completadas = 0
+    libres = Eliminacion.objects.filter(_libre(timezone.now()), estado__in=ACTIVAS).order_by('id')
+    for eliminacion in libres:
+        if procesar(eliminacion, tamano_lote, al_terminar_lote).estado == EstadoEliminacion.COMPLETADA:
+            completadas += 1
+    return completadas
+
+
+def despertar_eliminador():
+    """Encola una pasada del eliminador en el hilo de fondo."""
+    global _ejecutor
+    if not getattr(settings, 'ELIMINACIONES_EN_SEGUNDO_PLANO', True):
+        return
+    if _ejecutor is None:
+        # Un solo hilo: las eliminaciones no compiten entre sí por las mismas tablas
+        _ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='eliminaciones')
+    _ejecutor.submit(_procesar_en_segundo_plano)
+
+
+def _procesar_en_segundo_plano():
+    try:
+        procesar_pendientes()
+    except Exception:
+        logger.exception('Error procesando eliminaciones')
+    finally:
+        connection.close()
+
+
+def eliminar_usuario(usuario, solicitada_por=None, despertar=True):
+    """
+    Desactiva la cuenta de inmediato y programa el borrado de sus datos.
+    Si ya hay una eliminación activa para el usuario la retorna. Con
+    despertar=False no se encola en el hilo de fondo (quien llama la procesa).
+    """
+    with transaction.atomic():
+        existente = Eliminacion.objects.filter(
+            tipo=TipoEliminacion.USUARIO, usuario_id=usuario.pk, estado__in=ACTIVAS
+        ).first()
+        if existente:
+            return existente
+        User.objects.filter(pk=usuario.pk).update(is_active=False)
+        Medico.objects.filter(user_id=usuario.pk).update(disponible=False)
+        eliminacion = Eliminacion.objects.create(
+            tipo=TipoEliminacion.USUARIO, usuario_id=usuario.pk,
+            descripcion=f'usuario {usuario.username}', solicitada_por=solicitada_por,
+        )
+        if despertar:
+            transaction.on_commit(despertar_eliminador)
+    return eliminacion
+
+
+def eliminar_reservas(queryset, solicitada_por=None, descripcion='reservas seleccionadas'):
+    """
+    Programa el borrado de las reservas del queryset (p. ej. una acción del
+    admin). No lee la selección: guarda su consulta, y el total lo cuenta el
+    proceso de fondo.
+    """
+    # La consulta la serializa y la lee solo este módulo (ver QuerySet.query en la documentación de Django)
+    consulta = pickle.dumps(queryset.order_by().query)
+    hasta_id = Reserva.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+    with transaction.atomic():
+        eliminacion = Eliminacion.objects.create(
+            tipo=TipoEliminacion.RESERVAS, consulta=consulta, hasta_id=hasta_id,
+            descripcion=descripcion, solicitada_por=solicitada_por,
+        )
+        transaction.on_commit(despertar_eliminador)
+    return eliminacion
@@ -0,0 +1,149 @@
+"""
+Vencimiento automático de reservas pendientes que nadie confirmó.
+
+Las reservas vencidas se cancelan con UPDATE por conjunto en lotes acotados
+(nunca con Reserva.save() fila a fila) a través de citas.transiciones, que
+registra cada cambio, invalida las agendas cacheadas afectadas y, si el
+bloque aún no ocurre, lo ofrece a la lista de espera. Cada lote registra
+además qué filas cambió en ReservaExpirada, que luego sirve de cola para
+avisar a los pacientes.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .correo import PlantillasCorreo, enviar, nombre_de
+from .models import Reserva, ReservaExpirada, EstadoReserva, OrigenTransicion
+from .paginacion import recorrer_keyset
+from .transiciones import transicionar_en_lote
+
+TAMANO_LOTE = 1000
+
+
+@dataclass
+class ResumenExpiracion:
+    expiradas: int = 0
+    avisadas: int = 0
+    lotes: int = 0
+    inicio: float = field(default_factory=time.perf_counter)
+
+    @property
+    def segundos(self):
+        return time.perf_counter() - self.inicio
+
+
+def limite_expiracion(ahora=None):
+    """
+    Fecha y hora local antes de la cual una reserva pendiente vence.
+
+    Por defecto vencen las que siguen pendientes RESERVA_PENDIENTE_VENCE_HORAS
+    después de su hora de inicio. Si se define
+    RESERVA_PENDIENTE_CONFIRMAR_HORAS_ANTES, vencen también las que no se
+    confirmaron esas horas antes de la cita, liberando el bloque.
+    """
+    ahora = timezone.localtime(ahora)
+    antes = getattr(settings, 'RESERVA_PENDIENTE_CONFIRMAR_HORAS_ANTES', None)
+    if antes is not None:
+        limite = ahora + timedelta(hours=antes)
+    else:
+        limite = ahora - timedelta(hours=getattr(settings, 'RESERVA_PENDIENTE_VENCE_HORAS', 24))
+    return limite.replace(tzinfo=None)
+
+
+def pendientes_vencidas(limite):
+    """Reservas pendientes cuyo inicio es anterior a `limite` (datetime local sin zona)."""
+    return Reserva.objects.filter(
+        Q(fecha__lt=limite.date()) | Q(fecha=limite.date(), hora_inicio__lt=limite.time()),
+        estado=EstadoReserva.PENDIENTE,
+    )
+
+
+def _expirar_lote(limite, tamano_lote):
+    """Vence un lote dentro de una transacción. Retorna las filas cambiadas."""
+    with transaction.atomic():
+        ids = list(
+            pendientes_vencidas(limite)
+            .order_by('id')
+            .values_list('id', flat=True)[:tamano_lote]
+        )
+        if not ids:
+            return None
+
+        # Solo las que siguen pendientes y vencidas al momento del UPDATE
+        filas = transicionar_en_lote(
+            pendientes_vencidas(limite).filter(id__in=ids), EstadoReserva.CANCELADA, OrigenTransicion.EXPIRACION
+        )
+        marca = timezone.now()
+        ReservaExpirada.objects.bulk_create(
+            [ReservaExpirada(reserva_id=fila[0], fecha_expiracion=marca) for fila in filas],
+            batch_size=TAMANO_LOTE,
+        )
+        return filas
+
+
+def expirar_pendientes(limite=None, tamano_lote=TAMANO_LOTE, al_terminar_lote=None):
+    """
+    Cancela todas las reservas pendientes vencidas, un lote por transacción
+    para no retener bloqueos largos. Retorna un ResumenExpiracion.
+    """
+    limite = limite or limite_expiracion()
+    resumen = ResumenExpiracion()
+    while True:
+        filas = _expirar_lote(limite, tamano_lote)
+        if filas is None:
+            return resumen
+        resumen.expiradas += len(filas)
+        resumen.lotes += 1
+        if al_terminar_lote:
+            al_terminar_lote(resumen)
+
+
+def avisar_expiradas(tamano_lote=TAMANO_LOTE, resumen=None):
+    """
+    Envía un correo por cada reserva expirada sin aviso, por una misma
+    conexión, y marca cada lote con un único UPDATE. Las de pacientes sin
+    correo se marcan sin enviar.
+    """
+    resumen = resumen or ResumenExpiracion()
+    filas_pendientes = (
+        ReservaExpirada.objects
+        .filter(notificada__isnull=True)
+        .values(
+            'id', 'reserva__fecha', 'reserva__hora_inicio', 'reserva__hora_fin', 'reserva__motivo',
+            'reserva__paciente__user__email', 'reserva__paciente__user__first_name',
+            'reserva__paciente__user__last_name', 'reserva__paciente__user__username',
+            'reserva__medico__user__first_name', 'reserva__medico__user__last_name',
+            'reserva__medico__user__username',
+        )
+    )
+    plantillas = PlantillasCorreo('citas/email/expiracion')
+    conexion = get_connection()
+    conexion.open()
+    try:
+        for filas in recorrer_keyset(filas_pendientes, ('id',), tamano_lote):
+            procesadas = []
+            for fila in filas:
+                correo = fila['reserva__paciente__user__email']
+                if correo:
+                    contexto = {
+                        'paciente': nombre_de(fila, 'reserva__paciente__user'),
+                        'medico': nombre_de(fila, 'reserva__medico__user'),
+                        'fecha': fila['reserva__fecha'],
+                        'hora_inicio': fila['reserva__hora_inicio'],
+                        'hora_fin': fila['reserva__hora_fin'],
+                        'motivo': fila['reserva__motivo'],
+                    }
+                    if not enviar(conexion, plantillas.mensaje(contexto, correo, conexion)):
+                        continue
+                    resumen.avisadas += 1
+                procesadas.append(fila['id'])
+            ReservaExpirada.objects.filter(id__in=procesadas).update(notificada=timezone.now())
+    finally:
+        conexion.close()
+    return resumen
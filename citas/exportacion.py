@@ -0,0 +1,139 @@
+"""
+Exportación completa de reservas y cobros en CSV o NDJSON.
+
+Las filas se leen con values_list().iterator() en bloques, ordenadas por id,
+y se escriben a medida que llegan: ni la consulta ni la salida se cargan
+completas en memoria. La tabla principal y la de archivo se recorren por
+separado y se mezclan por id (los ids del archivo son los originales), de
+modo que la exportación cubre toda la historia. Como el orden es por id,
+una exportación interrumpida se retoma pidiendo las filas posteriores al
+último id recibido.
+"""
+import csv
+import heapq
+import json
+from itertools import islice
+from operator import itemgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Reserva, Cobro, ReservaArchivada, CobroArchivado
+
+TAMANO_BLOQUE = 2000
+# Filas por fragmento escrito en la respuesta
+FILAS_POR_FRAGMENTO = 500
+FORMATOS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Exportacion:
+    """Columnas y tablas (principal y archivo) de un tipo de exportación."""
+
+    def __init__(self, modelos, columnas, campo_fecha, campo_medico):
+        self.modelos = modelos
+        # (nombre de la columna, campo de values_list); la primera es el id
+        self.columnas = [columna for columna, _ in columnas] + ['archivada']
+        self.campos = [campo for _, campo in columnas]
+        self.campo_fecha = campo_fecha
+        self.campo_medico = campo_medico
+
+    def queryset(self, modelo, desde=None, hasta=None, medico=None, despues=None):
+        filtros = {}
+        if desde:
+            filtros[f'{self.campo_fecha}__gte'] = desde
+        if hasta:
+            filtros[f'{self.campo_fecha}__lte'] = hasta
+        if medico:
+            filtros[self.campo_medico] = medico
+        if despues:
+            filtros['id__gt'] = despues
+        return modelo.objects.filter(**filtros).order_by('id').values_list(*self.campos)
+
+    def _filas_de(self, modelo, archivada, filtros):
+        for fila in self.queryset(modelo, **filtros).iterator(chunk_size=TAMANO_BLOQUE):
+            yield (*fila, archivada)
+
+    def filas(self, **filtros):
+        """Filas de ambas tablas mezcladas por id, con la marca de archivada al final."""
+        principal, archivo = self.modelos
+        return heapq.merge(
+            self._filas_de(principal, False, filtros),
+            self._filas_de(archivo, True, filtros),
+            key=itemgetter(0),
+        )
+
+
+EXPORTACIONES = {
+    'reservas': Exportacion(
+        (Reserva, ReservaArchivada),
+        [
+            ('id', 'id'), ('fecha', 'fecha'), ('hora_inicio', 'hora_inicio'), ('hora_fin', 'hora_fin'),
+            ('estado', 'estado'), ('medico_id', 'medico_id'), ('paciente_id', 'paciente_id'),
+            ('serie_id', 'serie_id'), ('motivo', 'motivo'), ('fecha_creacion', 'fecha_creacion'),
+            ('fecha_modificacion', 'fecha_modificacion'),
+        ],
+        campo_fecha='fecha', campo_medico='medico_id',
+    ),
+    'cobros': Exportacion(
+        (Cobro, CobroArchivado),
+        [
+            ('id', 'id'), ('reserva_id', 'reserva_id'), ('fecha', 'reserva__fecha'),
+            ('medico_id', 'reserva__medico_id'), ('paciente_id', 'reserva__paciente_id'),
+            ('monto', 'monto'), ('pagado', 'pagado'), ('fecha_pago', 'fecha_pago'),
+            ('metodo_pago', 'metodo_pago'),
+        ],
+        campo_fecha='reserva__fecha', campo_medico='reserva__medico_id',
+    ),
+}
+
+
+class _Eco:
+    """Pseudo-archivo para csv.writer: write() devuelve la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def _lineas_csv(columnas, filas, encabezado):
+    escritor = csv.writer(_Eco())
+    if encabezado:
+        yield escritor.writerow(columnas)
+    for fila in filas:
+        yield escritor.writerow(fila)
+
+
+def _lineas_ndjson(columnas, filas):
+    codificador = DjangoJSONEncoder(ensure_ascii=False)
+    for fila in filas:
+        yield codificador.encode(dict(zip(columnas, fila))) + '\n'
+
+
+def generar(tipo, formato='csv', encabezado=True, **filtros):
+    """
+    Genera la exportación como fragmentos de texto de FILAS_POR_FRAGMENTO
+    filas. `filtros` acepta desde, hasta (fecha de la reserva), medico y
+    despues (id de la última fila ya exportada).
+    """
+    exportacion = EXPORTACIONES[tipo]
+    filas = exportacion.filas(**filtros)
+    if formato == 'csv':
+        lineas = _lineas_csv(exportacion.columnas, filas, encabezado)
+    else:
+        lineas = _lineas_ndjson(exportacion.columnas, filas)
+    while True:
+        fragmento = ''.join(islice(lineas, FILAS_POR_FRAGMENTO))
+        if not fragmento:
+            return
+        yield fragmento
+
+
+def ultimo_id(linea, formato):
+    """Id de una línea ya exportada, para retomar desde ella. None si no es una fila."""
+    try:
+        if formato == 'csv':
+            return int(next(csv.reader([linea]))[0])
+        return int(json.loads(linea)['id'])
+    except (ValueError, KeyError, IndexError, StopIteration, TypeError):
+        return None
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Reserva, HistorialMedico, Cobro
+from .models import Reserva, HistorialMedico, Cobro, EstadoReserva, SolicitudEspera
 
 class ReservaForm(forms.ModelForm):
     class Meta:
@@ -50,3 +50,54 @@ class CobroForm(forms.ModelForm):
     class Meta:
         model = Cobro
         fields = ['monto']
+
+class FiltroReservasForm(forms.Form):
+    estado = forms.ChoiceField(
+        choices=[('', 'Todos los estados')] + EstadoReserva.choices,
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-select'})
+    )
+    desde = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    hasta = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'})
+    )
+    archivadas = forms.BooleanField(
+        required=False,
+        label='Incluir citas archivadas',
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'})
+    )
+
+class SolicitudEsperaForm(forms.ModelForm):
+    class Meta:
+        model = SolicitudEspera
+        fields = ['medico', 'especialidad', 'fecha_desde', 'fecha_hasta', 'motivo']
+        widgets = {
+            'medico': forms.Select(attrs={'class': 'form-control'}),
+            'especialidad': forms.Select(attrs={'class': 'form-control'}),
+            'fecha_desde': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'fecha_hasta': forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+            'motivo': forms.Textarea(attrs={
+                'rows': 3,
+                'class': 'form-control',
+                'placeholder': 'Describe el motivo de tu consulta'
+            }),
+        }
+        labels = {
+            'medico': 'Médico (opcional)',
+            'especialidad': 'O cualquier médico de la especialidad',
+            'fecha_desde': 'Desde',
+            'fecha_hasta': 'Hasta',
+            'motivo': 'Motivo de la consulta',
+        }
+    
+    def clean(self):
+        datos = super().clean()
+        if not datos.get('medico') and not datos.get('especialidad'):
+            raise forms.ValidationError("Indica un médico o una especialidad.")
+        if datos.get('fecha_desde') and datos.get('fecha_hasta') and datos['fecha_hasta'] < datos['fecha_desde']:
+            self.add_error('fecha_hasta', "La fecha final no puede ser anterior a la inicial.")
+        return datos
@@ -0,0 +1,92 @@
+"""
+Archivos generados fuera de la solicitud (comprobantes PDF, resúmenes
+clínicos DOCX).
+
+Cada archivo vive en una ruta que depende de una huella de su contenido:
+mientras los datos no cambien se sirve el mismo archivo, y cuando cambian
+la ruta nueva todavía no existe y se genera. La generación corre en un pool
+de hilos, una sola vez por ruta aunque se pida varias veces, y se escribe en
+un temporal que se renombra al terminar, de modo que nunca se sirve un
+archivo a medias.
+"""
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+
+logger = logging.getLogger(__name__)
+
+
+class Cola:
+    """Pool de hilos que genera cada ruta una sola vez a la vez."""
+
+    def __init__(self, nombre, ajuste_hilos):
+        self.nombre = nombre
+        self.ajuste_hilos = ajuste_hilos
+        self._ejecutor = None
+        self._en_curso = set()
+        self._cerrojo = threading.Lock()
+
+    def _ejecutar(self, ruta, funcion, args):
+        try:
+            funcion(*args)
+        except Exception:
+            logger.exception('Error generando %s', ruta)
+        finally:
+            # Los hilos del pool no pasan por el ciclo de la solicitud
+            close_old_connections()
+            with self._cerrojo:
+                self._en_curso.discard(ruta)
+
+    def encolar(self, ruta, funcion, *args):
+        """Encola funcion(*args), que debe generar `ruta`, salvo que ya esté en curso."""
+        with self._cerrojo:
+            if ruta in self._en_curso:
+                return
+            self._en_curso.add(ruta)
+            if self._ejecutor is None:
+                self._ejecutor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, self.ajuste_hilos, 2), thread_name_prefix=self.nombre
+                )
+        self._ejecutor.submit(self._ejecutar, ruta, funcion, args)
+
+
+def escribir_atomico(ruta, escribir):
+    """
+    Llama a escribir(archivo) sobre un temporal junto a `ruta` y lo renombra
+    al terminar. Retorna (ruta, generado); si la ruta ya existe no hace nada.
+    """
+    if ruta.exists():
+        return ruta, False
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporal = tempfile.mkstemp(dir=ruta.parent, suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            escribir(archivo)
+        os.replace(temporal, ruta)
+    except BaseException:
+        os.unlink(temporal)
+        raise
+    return ruta, True
+
+
+def respuesta_archivo(request, ruta, nombre, content_type):
+    """
+    Sirve un archivo ya generado; el contenido nunca cambia bajo la misma
+    huella, pero la URL es estable y su contenido sí, así que el navegador
+    revalida siempre con el ETag.
+    """
+    etag = quote_etag(ruta.stem)
+    respuesta = get_conditional_response(request, etag=etag)
+    if respuesta is None:
+        respuesta = FileResponse(open(ruta, 'rb'), as_attachment=True, filename=nombre, content_type=content_type)
+    respuesta['ETag'] = etag
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
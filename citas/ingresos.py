@@ -0,0 +1,187 @@
+"""
+Ingresos por médico, especialidad y mes.
+
+La agregación se hace en la base de datos: una consulta agrupada por mes y
+médico sobre los cobros pagados (y otra igual sobre el archivo) devuelve a
+lo sumo médicos × meses filas, sin importar cuántos cobros haya. Cada mes
+se guarda en la cache como una instantánea independiente: los meses
+cerrados casi no cambian y se reutilizan entre consultas, por lo que pedir
+un año solo consulta la base por los meses que faltan. pandas arma los
+totales y la tabla médico × mes a partir de esas filas.
+"""
+from datetime import datetime, time
+from decimal import Decimal
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from medicos.models import Medico, Especialidad
+from .models import Cobro, CobroArchivado
+
+# Las señales invalidan el mes de cada cobro guardado; el TTL corto del mes
+# en curso cubre los pagos registrados con QuerySet.update
+MES_ABIERTO_TTL = 60 * 5
+MES_CERRADO_TTL = 60 * 60 * 24 * 7
+MAX_MESES = 36
+COLUMNAS = ['mes', 'medico_id', 'especialidad_id', 'centavos', 'cobros']
+
+
+def _clave_mes(mes):
+    return f'ingresos:mes:{mes:%Y-%m}'
+
+
+def mes_de(fecha_pago):
+    """Primer día del mes local de un pago."""
+    return timezone.localtime(fecha_pago).date().replace(day=1)
+
+
+def invalidar_mes(mes):
+    cache.delete(_clave_mes(mes))
+
+
+def meses_entre(desde, hasta):
+    """Primer día de cada mes entre ambas fechas, inclusive."""
+    mes, meses = desde.replace(day=1), []
+    while mes <= hasta:
+        meses.append(mes)
+        mes += relativedelta(months=1)
+    return meses
+
+
+def _inicio(mes):
+    return timezone.make_aware(datetime.combine(mes, time.min))
+
+
+def _agregar(modelo, desde, hasta):
+    """Monto y cantidad de cobros pagados por (mes, médico) entre ambos meses."""
+    return (
+        modelo.objects
+        .filter(
+            pagado=True,
+            fecha_pago__gte=_inicio(desde),
+            fecha_pago__lt=_inicio(hasta + relativedelta(months=1)),
+        )
+        .annotate(mes=TruncMonth('fecha_pago', output_field=DateField()))
+        .values('mes', medico_id=F('reserva__medico_id'), especialidad_id=F('reserva__medico__especialidad_id'))
+        .annotate(monto=Sum('monto'), cobros=Count('id'))
+        .order_by()
+    )
+
+
+def _instantaneas(meses):
+    """Filas agregadas de cada mes, desde la cache o con una consulta por tabla para los que faltan."""
+    en_cache = cache.get_many([_clave_mes(mes) for mes in meses])
+    instantaneas = {mes: en_cache[_clave_mes(mes)] for mes in meses if _clave_mes(mes) in en_cache}
+    faltantes = [mes for mes in meses if mes not in instantaneas]
+    if not faltantes:
+        return instantaneas
+
+    nuevas = {mes: [] for mes in faltantes}
+    for modelo in (Cobro, CobroArchivado):
+        for fila in _agregar(modelo, faltantes[0], faltantes[-1]):
+            if fila['mes'] in nuevas:
+                nuevas[fila['mes']].append((
+                    fila['medico_id'], fila['especialidad_id'],
+                    int(fila['monto'] * 100), fila['cobros'],
+                ))
+
+    mes_actual = timezone.localdate().replace(day=1)
+    for mes, filas in nuevas.items():
+        cache.set(_clave_mes(mes), filas, MES_ABIERTO_TTL if mes >= mes_actual else MES_CERRADO_TTL)
+    instantaneas.update(nuevas)
+    return instantaneas
+
+
+def _monto(centavos):
+    return Decimal(int(centavos)).scaleb(-2)
+
+
+def _nombres_medicos(ids):
+    nombres = {}
+    for fila in Medico.objects.filter(id__in=ids).values(
+        'id', 'user__first_name', 'user__last_name', 'user__username'
+    ):
+        nombre = f"{fila['user__first_name']} {fila['user__last_name']}".strip()
+        nombres[fila['id']] = nombre or fila['user__username']
+    return nombres
+
+
+def resumen_ingresos(desde, hasta):
+    """
+    Ingresos cobrados entre el mes de `desde` y el de `hasta`: total, por
+    mes, por médico, por especialidad y la tabla médico × mes.
+    """
+    meses = meses_entre(desde, hasta)
+    instantaneas = _instantaneas(meses)
+    df = pd.DataFrame(
+        [(mes, *fila) for mes in meses for fila in instantaneas[mes]], columns=COLUMNAS
+    )
+    # 0 representa "sin especialidad" para poder agrupar con enteros
+    df['especialidad_id'] = df['especialidad_id'].fillna(0).astype(int)
+
+    por_mes = df.groupby('mes')[['centavos', 'cobros']].sum().reindex(meses, fill_value=0)
+    por_medico = (
+        df.groupby('medico_id')
+        .agg(centavos=('centavos', 'sum'), cobros=('cobros', 'sum'), especialidad_id=('especialidad_id', 'last'))
+        .sort_values('centavos', ascending=False)
+    )
+    por_especialidad = (
+        df.groupby('especialidad_id')[['centavos', 'cobros']].sum()
+        .sort_values('centavos', ascending=False)
+    )
+    tabla = (
+        df.pivot_table(index='medico_id', columns='mes', values='centavos', aggfunc='sum', fill_value=0)
+        .reindex(index=por_medico.index, columns=meses, fill_value=0)
+    )
+
+    medicos = _nombres_medicos(por_medico.index.tolist())
+    especialidades = dict(
+        Especialidad.objects.filter(id__in=por_especialidad.index.tolist()).values_list('id', 'nombre')
+    )
+    etiquetas = [f'{mes:%Y-%m}' for mes in meses]
+
+    return {
+        'desde': etiquetas[0],
+        'hasta': etiquetas[-1],
+        'total': {'monto': _monto(df['centavos'].sum()), 'cobros': int(df['cobros'].sum())},
+        'por_mes': [
+            {'mes': etiqueta, 'monto': _monto(fila.centavos), 'cobros': int(fila.cobros)}
+            for etiqueta, fila in zip(etiquetas, por_mes.itertuples())
+        ],
+        'por_medico': [
+            {
+                'medico_id': int(medico_id),
+                'medico': medicos.get(medico_id, ''),
+                'especialidad': especialidades.get(fila.especialidad_id),
+                'monto': _monto(fila.centavos),
+                'cobros': int(fila.cobros),
+            }
+            for medico_id, fila in por_medico.iterrows()
+        ],
+        'por_especialidad': [
+            {
+                'especialidad_id': int(especialidad_id) or None,
+                'especialidad': especialidades.get(especialidad_id, 'Sin especialidad'),
+                'monto': _monto(fila.centavos),
+                'cobros': int(fila.cobros),
+            }
+            for especialidad_id, fila in por_especialidad.iterrows()
+        ],
+        'medico_por_mes': {
+            'meses': etiquetas,
+            'filas': [
+                {'medico_id': int(medico_id), 'montos': [_monto(centavos) for centavos in montos]}
+                for medico_id, montos in zip(tabla.index, tabla.to_numpy())
+            ],
+        },
+    }
+
+
+def periodo_por_defecto():
+    """Los últimos doce meses, incluido el actual."""
+    hoy = timezone.localdate()
+    return hoy.replace(day=1) - relativedelta(months=11), hoy
@@ -0,0 +1,160 @@
+"""
+Línea de tiempo clínica de un paciente: reservas, consultas del historial y
+pagos, de la más reciente a la más antigua, paginada por cursor.
+
+Cada fuente (reservas, reservas archivadas, historial, cobros y cobros
+archivados) se consulta por separado, ya ordenada por su propia fecha y
+limitada al tamaño de la página, con sus relaciones en la misma consulta.
+Las listas se mezclan con heapq.merge: una página cuesta una consulta por
+fuente sin importar cuánta historia tenga el paciente. El cursor es el
+(momento, tipo, id) del último evento entregado, y cada fuente retoma
+estrictamente después de él.
+"""
+import heapq
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
+from typing import Any
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Reserva, ReservaArchivada, HistorialMedico, Cobro, CobroArchivado
+from .paginacion import codificar_cursor, decodificar_cursor, filtro_keyset
+
+TAMANO_POR_DEFECTO = 20
+TAMANO_MAXIMO = 100
+# Desempate entre eventos del mismo momento
+TIPOS = ('reserva', 'historial', 'cobro')
+
+
+@dataclass
+class Evento:
+    momento: datetime
+    tipo: str
+    id: int
+    objeto: Any
+    archivada: bool = False
+
+    @property
+    def clave(self):
+        return self.momento, TIPOS.index(self.tipo), self.id
+
+
+@dataclass
+class PaginaLineaTiempo:
+    eventos: list
+    siguiente: str = None
+
+
+class Fuente:
+    """
+    Tabla que aporta eventos de un tipo. `campos` son las columnas del
+    momento del evento: un DateTimeField, o fecha y hora por separado.
+    """
+
+    def __init__(self, tipo, modelo, campos, campo_paciente, campo_medico, relacionados, archivada=False, **filtros):
+        self.tipo = tipo
+        self.modelo = modelo
+        self.campos = list(campos)
+        self.campo_paciente = campo_paciente
+        self.campo_medico = campo_medico
+        self.relacionados = relacionados
+        self.archivada = archivada
+        self.filtros = filtros
+
+    def momento(self, objeto):
+        if len(self.campos) == 1:
+            return getattr(objeto, self.campos[0])
+        fecha, hora = (getattr(objeto, campo) for campo in self.campos)
+        return timezone.make_aware(datetime.combine(fecha, hora))
+
+    def _valores(self, momento):
+        if len(self.campos) == 1:
+            return [momento]
+        local = timezone.localtime(momento)
+        return [local.date(), local.time()]
+
+    def _anteriores(self, momento, tipo, id):
+        """Filtro de los eventos que van después del cursor (más antiguos) en el orden descendente."""
+        valores = self._valores(momento)
+        orden, orden_cursor = TIPOS.index(self.tipo), TIPOS.index(tipo)
+        if orden == orden_cursor:
+            return filtro_keyset(self.campos + ['id'], valores + [id], 'lt')
+        filtro = filtro_keyset(self.campos, valores, 'lt')
+        if orden < orden_cursor:
+            filtro |= Q(**dict(zip(self.campos, valores)))
+        return filtro
+
+    def eventos(self, paciente_id, limite, medico_id=None, cursor=None):
+        queryset = self.modelo.objects.filter(**{self.campo_paciente: paciente_id}, **self.filtros)
+        if medico_id:
+            queryset = queryset.filter(**{self.campo_medico: medico_id})
+        if cursor:
+            queryset = queryset.filter(self._anteriores(*cursor))
+        queryset = (
+            queryset.select_related(*self.relacionados)
+            .order_by(*[f'-{campo}' for campo in self.campos], '-id')[:limite]
+        )
+        return [
+            Evento(self.momento(objeto), self.tipo, objeto.id, objeto, self.archivada)
+            for objeto in queryset
+        ]
+
+
+FUENTES = [
+    Fuente(
+        'reserva', Reserva, ['fecha', 'hora_inicio'], 'paciente_id', 'medico_id',
+        ['medico__user', 'paciente__user'],
+    ),
+    Fuente(
+        'reserva', ReservaArchivada, ['fecha', 'hora_inicio'], 'paciente_id', 'medico_id',
+        ['medico__user', 'paciente__user'], archivada=True,
+    ),
+    Fuente(
+        'historial', HistorialMedico, ['fecha'], 'paciente_id', 'medico_id',
+        ['medico__user', 'paciente__user'],
+    ),
+    Fuente(
+        'cobro', Cobro, ['fecha_pago'], 'reserva__paciente_id', 'reserva__medico_id',
+        [], pagado=True, fecha_pago__isnull=False,
+    ),
+    Fuente(
+        'cobro', CobroArchivado, ['fecha_pago'], 'reserva__paciente_id', 'reserva__medico_id',
+        [], archivada=True, pagado=True, fecha_pago__isnull=False,
+    ),
+]
+
+
+def decodificar(cursor):
+    """(momento, tipo, id) de un cursor de la línea de tiempo. Lanza ValueError si no es válido."""
+    momento, tipo, id = decodificar_cursor(cursor, ('momento', 'tipo', 'id'))
+    if tipo not in TIPOS:
+        raise ValueError('Cursor inválido')
+    try:
+        momento, id = datetime.fromisoformat(momento), int(id)
+    except TypeError:
+        raise ValueError('Cursor inválido')
+    # Los cursores emitidos siempre llevan zona horaria
+    if timezone.is_naive(momento):
+        raise ValueError('Cursor inválido')
+    return momento, tipo, id
+
+
+def linea_tiempo(paciente_id, tamano=TAMANO_POR_DEFECTO, medico_id=None, despues=None):
+    """
+    Página de eventos del paciente, del más reciente al más antiguo. Con
+    `medico_id` solo los de ese médico; `despues` es el cursor `siguiente`
+    de la página anterior.
+    """
+    cursor = decodificar(despues) if despues else None
+    listas = [fuente.eventos(paciente_id, tamano + 1, medico_id, cursor) for fuente in FUENTES]
+    mezcla = heapq.merge(*listas, key=lambda evento: evento.clave, reverse=True)
+    eventos = list(islice(mezcla, tamano + 1))
+
+    siguiente = None
+    if len(eventos) > tamano:
+        eventos = eventos[:tamano]
+        ultimo = eventos[-1]
+        siguiente = codificar_cursor([ultimo.momento.isoformat(), ultimo.tipo, ultimo.id])
+    return PaginaLineaTiempo(eventos=eventos, siguiente=siguiente)
@@ -0,0 +1,253 @@
+"""
+Lista de espera y reasignación de cupos liberados por cancelaciones.
+
+Cancelar una reserva solo inserta un CupoLiberado. El procesamiento (vencer
+ofertas, buscar el mejor paciente en espera y ofrecerle el cupo) ocurre fuera
+de la solicitud: en un hilo de fondo que se despierta tras el commit y en el
+comando `procesar_lista_espera`, que también recupera lo que el hilo no
+alcanzó a procesar si el proceso se reinicia.
+
+Las transiciones se hacen con UPDATE condicionales sobre el estado, de modo
+que varios procesadores pueden correr a la vez: solo uno reclama cada cupo,
+un paciente no recibe dos ofertas simultáneas y la restricción única parcial
+de OfertaCupo impide dos ofertas pendientes para el mismo cupo.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import connection, transaction, IntegrityError
+from django.utils import timezone
+
+from .models import (
+    Reserva, Cobro, SolicitudEspera, CupoLiberado, OfertaCupo,
+    EstadoEspera, EstadoCupo, EstadoOferta
+)
+from .services import ConflictoAgenda, bloquear_agenda, hay_solapamiento, _con_reintentos
+
+logger = logging.getLogger(__name__)
+
+# Candidatos evaluados por cupo antes de descartarlo
+CANDIDATOS_POR_CUPO = 5
+TAMANO_LOTE = 100
+
+_ejecutor = None
+
+
+class OfertaNoDisponible(Exception):
+    """La oferta venció, ya fue respondida o el horario fue tomado."""
+
+
+def duracion_oferta():
+    return timedelta(minutes=getattr(settings, 'LISTA_ESPERA_OFERTA_MINUTOS', 30))
+
+
+def liberar_cupos(medico_id, filas):
+    """
+    Registra los bloques de reservas canceladas, filas (reserva_id, fecha,
+    hora_inicio, hora_fin), para ofrecerlos a la lista de espera.
+    """
+    hoy = timezone.localdate()
+    CupoLiberado.objects.bulk_create([
+        CupoLiberado(
+            medico_id=medico_id, fecha=fecha, hora_inicio=hora_inicio,
+            hora_fin=hora_fin, reserva_cancelada_id=reserva_id,
+        )
+        for reserva_id, fecha, hora_inicio, hora_fin in filas if fecha >= hoy
+    ], batch_size=TAMANO_LOTE)
+    transaction.on_commit(despertar_procesador)
+
+
+def despertar_procesador():
+    """Encola una pasada del procesador en el hilo de fondo."""
+    global _ejecutor
+    if not getattr(settings, 'LISTA_ESPERA_EN_SEGUNDO_PLANO', True):
+        return
+    if _ejecutor is None:
+        # Un solo hilo: las pasadas se serializan y cada una drena todo lo pendiente
+        _ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='lista-espera')
+    _ejecutor.submit(_procesar_en_segundo_plano)
+
+
+def _procesar_en_segundo_plano():
+    try:
+        procesar_pendientes()
+    except Exception:
+        logger.exception('Error procesando la lista de espera')
+    finally:
+        connection.close()
+
+
+def candidatos(cupo, limite=CANDIDATOS_POR_CUPO):
+    """
+    Pacientes en espera que aceptan el cupo, en orden de asignación. Se
+    consultan por separado las solicitudes del médico y las de su
+    especialidad para que cada consulta recorra su índice parcial en orden.
+    """
+    base = (
+        SolicitudEspera.objects
+        .filter(estado=EstadoEspera.ESPERANDO, fecha_desde__lte=cupo.fecha, fecha_hasta__gte=cupo.fecha)
+        .exclude(ofertas__cupo=cupo)
+        .order_by('-prioridad', 'fecha_creacion')
+    )
+    encontrados = list(base.filter(medico_id=cupo.medico_id)[:limite])
+    if cupo.medico.especialidad_id:
+        encontrados += base.filter(medico__isnull=True, especialidad_id=cupo.medico.especialidad_id)[:limite]
+    encontrados.sort(key=lambda solicitud: (-solicitud.prioridad, solicitud.fecha_creacion))
+    return encontrados[:limite]
+
+
+def ofrecer_cupo(cupo):
+    """
+    Reclama el cupo y lo ofrece al mejor candidato disponible. Retorna la
+    oferta creada o None si el cupo se descartó o lo tomó otro procesador.
+    El reclamo y la oferta van en la misma transacción: si algo falla en
+    medio, el cupo vuelve a quedar pendiente en lugar de ofrecido sin oferta.
+    """
+    with transaction.atomic():
+        # Reclamo atómico: entre procesadores concurrentes solo uno avanza
+        if not CupoLiberado.objects.filter(pk=cupo.pk, estado=EstadoCupo.PENDIENTE).update(estado=EstadoCupo.OFRECIDO):
+            return None
+
+        # Un bloque de hoy que ya empezó tampoco puede ofrecerse
+        vigente = timezone.make_aware(datetime.combine(cupo.fecha, cupo.hora_inicio)) > timezone.localtime()
+        if vigente:
+            # La oferta retiene el bloque: se serializa con las reservas del mismo día
+            bloquear_agenda(cupo.medico_id, cupo.fecha)
+        if vigente and not hay_solapamiento(cupo.medico_id, cupo.fecha, cupo.hora_inicio, cupo.hora_fin):
+            for solicitud in candidatos(cupo):
+                try:
+                    with transaction.atomic():
+                        # El paciente solo puede tener una oferta pendiente a la vez
+                        if not SolicitudEspera.objects.filter(
+                            pk=solicitud.pk, estado=EstadoEspera.ESPERANDO
+                        ).update(estado=EstadoEspera.OFRECIDA):
+                            continue
+                        return OfertaCupo.objects.create(
+                            cupo=cupo, solicitud=solicitud, vence_en=timezone.now() + duracion_oferta()
+                        )
+                except IntegrityError:
+                    # Ya existe una oferta pendiente para este cupo
+                    return None
+
+        CupoLiberado.objects.filter(pk=cupo.pk).update(estado=EstadoCupo.DESCARTADO)
+        return None
+
+
+def vencer_ofertas():
+    """
+    Libera las ofertas cuyo plazo terminó: el paciente vuelve a la espera y
+    el cupo queda pendiente para el siguiente candidato.
+    Retorna la cantidad de ofertas vencidas.
+    """
+    total = 0
+    while True:
+        ids = list(
+            OfertaCupo.objects
+            .filter(estado=EstadoOferta.PENDIENTE, vence_en__lte=timezone.now())
+            .order_by('vence_en')
+            .values_list('id', flat=True)[:TAMANO_LOTE]
+        )
+        if not ids:
+            return total
+        with transaction.atomic():
+            OfertaCupo.objects.filter(id__in=ids, estado=EstadoOferta.PENDIENTE).update(
+                estado=EstadoOferta.VENCIDA, fecha_respuesta=timezone.now()
+            )
+            # Solo las que vencimos aquí: una aceptación concurrente ya no está pendiente
+            vencidas = OfertaCupo.objects.filter(id__in=ids, estado=EstadoOferta.VENCIDA)
+            SolicitudEspera.objects.filter(
+                id__in=vencidas.values('solicitud_id'), estado=EstadoEspera.OFRECIDA
+            ).update(estado=EstadoEspera.ESPERANDO)
+            CupoLiberado.objects.filter(
+                id__in=vencidas.values('cupo_id'), estado=EstadoCupo.OFRECIDO
+            ).update(estado=EstadoCupo.PENDIENTE)
+        total += len(ids)
+
+
+def procesar_pendientes():
+    """
+    Una pasada completa: vence ofertas y ofrece los cupos pendientes.
+    Retorna un resumen con las cantidades procesadas.
+    """
+    resumen = {'vencidas': vencer_ofertas(), 'ofrecidas': 0, 'descartados': 0}
+    ultimo_id = 0
+    while True:
+        cupos = list(
+            CupoLiberado.objects
+            .filter(estado=EstadoCupo.PENDIENTE, id__gt=ultimo_id)
+            .select_related('medico')
+            .order_by('id')[:TAMANO_LOTE]
+        )
+        if not cupos:
+            return resumen
+        for cupo in cupos:
+            if ofrecer_cupo(cupo):
+                resumen['ofrecidas'] += 1
+            elif CupoLiberado.objects.filter(pk=cupo.pk, estado=EstadoCupo.DESCARTADO).exists():
+                resumen['descartados'] += 1
+        ultimo_id = cupos[-1].id
+
+
+def aceptar_oferta(oferta):
+    """
+    Convierte la oferta en una reserva. Lanza OfertaNoDisponible si venció,
+    ya fue respondida o el bloque se ocupó por otra vía.
+    """
+    cupo = oferta.cupo
+    solicitud = oferta.solicitud
+
+    def operacion():
+        with transaction.atomic():
+            ahora = timezone.now()
+            tomada = OfertaCupo.objects.filter(
+                pk=oferta.pk, estado=EstadoOferta.PENDIENTE, vence_en__gt=ahora
+            ).update(estado=EstadoOferta.ACEPTADA, fecha_respuesta=ahora)
+            if not tomada:
+                raise OfertaNoDisponible('La oferta venció o ya fue respondida.')
+
+            bloquear_agenda(cupo.medico_id, cupo.fecha)
+            if hay_solapamiento(cupo.medico_id, cupo.fecha, cupo.hora_inicio, cupo.hora_fin, excluir_cupo=cupo.pk):
+                raise ConflictoAgenda('El horario ya fue tomado.')
+
+            reserva = Reserva.objects.create(
+                paciente_id=solicitud.paciente_id, medico_id=cupo.medico_id, fecha=cupo.fecha,
+                hora_inicio=cupo.hora_inicio, hora_fin=cupo.hora_fin, motivo=solicitud.motivo,
+            )
+            Cobro.objects.create(reserva=reserva, monto=0)
+            OfertaCupo.objects.filter(pk=oferta.pk).update(reserva=reserva)
+            SolicitudEspera.objects.filter(pk=solicitud.pk).update(estado=EstadoEspera.ASIGNADA)
+            CupoLiberado.objects.filter(pk=cupo.pk).update(estado=EstadoCupo.ASIGNADO)
+            return reserva
+
+    try:
+        return _con_reintentos(operacion)
+    except ConflictoAgenda:
+        # El bloque se reservó por otra vía mientras la oferta estaba vigente
+        with transaction.atomic():
+            OfertaCupo.objects.filter(pk=oferta.pk, estado=EstadoOferta.PENDIENTE).update(
+                estado=EstadoOferta.VENCIDA, fecha_respuesta=timezone.now()
+            )
+            SolicitudEspera.objects.filter(pk=solicitud.pk, estado=EstadoEspera.OFRECIDA).update(
+                estado=EstadoEspera.ESPERANDO
+            )
+            CupoLiberado.objects.filter(pk=cupo.pk).update(estado=EstadoCupo.DESCARTADO)
+        raise OfertaNoDisponible('El horario ya fue tomado.')
+
+
+def rechazar_oferta(oferta):
+    """Rechaza la oferta: el paciente sigue en espera y el cupo pasa al siguiente candidato."""
+    with transaction.atomic():
+        rechazada = OfertaCupo.objects.filter(pk=oferta.pk, estado=EstadoOferta.PENDIENTE).update(
+            estado=EstadoOferta.RECHAZADA, fecha_respuesta=timezone.now()
+        )
+        if not rechazada:
+            raise OfertaNoDisponible('La oferta venció o ya fue respondida.')
+        SolicitudEspera.objects.filter(pk=oferta.solicitud_id, estado=EstadoEspera.OFRECIDA).update(
+            estado=EstadoEspera.ESPERANDO
+        )
+        CupoLiberado.objects.filter(pk=oferta.cupo_id, estado=EstadoCupo.OFRECIDO).update(
+            estado=EstadoCupo.PENDIENTE
+        )
+        transaction.on_commit(despertar_procesador)
@@ -0,0 +1,178 @@
+"""
+Listados del admin sobre tablas grandes (reservas, cobros, historial y sus
+archivos).
+
+El changelist por defecto ejecuta en cada página un COUNT(*) exacto (dos si
+hay filtros), arma la jerarquía de fechas con un SELECT DISTINCT sobre toda
+la tabla y carga el filtro de médicos con una consulta por médico. Aquí:
+
+- PaginadorEstimado usa las estadísticas del motor (EXPLAIN en PostgreSQL,
+  sqlite_stat1 en SQLite tras ANALYZE) cuando pasan de CONTEO_EXACTO_HASTA
+  filas, y cuenta exacto por debajo de eso.
+- QuerySetListado.dates()/datetimes() saltan de un período con datos al
+  siguiente con una búsqueda ordenada por el índice de la fecha: una
+  consulta por año, mes o día con datos en lugar de recorrer la tabla.
+- MedicoFiltro lee las opciones de la caché.
+"""
+import json
+from datetime import date, datetime, time, timedelta
+
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from medicos.models import Medico
+from .correo import nombre_de
+
+# Bajo este número de filas estimadas se cuenta exacto
+CONTEO_EXACTO_HASTA = 10000
+# Sin estadísticas (SQLite con filtros) se cuenta hasta este tope
+CONTEO_MAXIMO = 100000
+CLAVE_MEDICOS = 'admin:filtro_medicos'
+FILTRO_MEDICOS_SEGUNDOS = 300
+
+
+def _estimacion_postgresql(queryset):
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def _estimacion_sqlite(queryset):
+    # sqlite_stat1 solo existe tras ANALYZE y solo describe la tabla completa
+    if queryset.query.where:
+        return None
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if cursor.fetchone() is None:
+            return None
+        # La primera cifra de cada fila es el total de filas del índice; los
+        # índices parciales tienen menos, por eso el máximo
+        cursor.execute(
+            'SELECT MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 WHERE tbl = %s',
+            [queryset.model._meta.db_table],
+        )
+        return cursor.fetchone()[0]
+
+
+def conteo_estimado(queryset, exacto_hasta=CONTEO_EXACTO_HASTA, maximo=CONTEO_MAXIMO):
+    """
+    Cantidad de filas del queryset: la estimación del motor si supera
+    `exacto_hasta`, y si no un COUNT acotado a `maximo`.
+    """
+    vendor = connections[queryset.db].vendor
+    estimado = None
+    if vendor == 'postgresql':
+        estimado = _estimacion_postgresql(queryset)
+    elif vendor == 'sqlite':
+        estimado = _estimacion_sqlite(queryset)
+    if estimado is not None and estimado > exacto_hasta:
+        return estimado
+    return queryset.order_by()[:maximo].count()
+
+
+class PaginadorEstimado(Paginator):
+    @cached_property
+    def count(self):
+        return conteo_estimado(self.object_list)
+
+
+def _truncar(valor, tipo):
+    if tipo == 'year':
+        return date(valor.year, 1, 1)
+    if tipo == 'month':
+        return date(valor.year, valor.month, 1)
+    return valor
+
+
+def _siguiente(inicio, tipo):
+    if tipo == 'year':
+        return date(inicio.year + 1, 1, 1)
+    if tipo == 'month':
+        return date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+    return inicio + timedelta(days=1)
+
+
+class QuerySetListado(QuerySet):
+    """
+    dates() y datetimes() por año, mes o día como un recorrido por saltos
+    del índice de la fecha. Retornan una lista, no un QuerySet.
+    """
+
+    def _periodos(self, campo, tipo, orden, con_hora):
+        fechas = self.filter(**{f'{campo}__isnull': False}).order_by(campo).values_list(campo, flat=True)
+        periodos = []
+        desde = None
+        while True:
+            valor = (fechas.filter(**{f'{campo}__gte': desde}) if desde else fechas).first()
+            if valor is None:
+                break
+            if isinstance(valor, datetime):
+                valor = timezone.localtime(valor).date()
+            inicio = _truncar(valor, tipo)
+            siguiente = _siguiente(inicio, tipo)
+            if con_hora:
+                periodos.append(timezone.make_aware(datetime.combine(inicio, time())))
+                desde = timezone.make_aware(datetime.combine(siguiente, time()))
+            else:
+                periodos.append(inicio)
+                desde = siguiente
+        return periodos[::-1] if orden == 'DESC' else periodos
+
+    def _es_fecha_hora(self, campo):
+        return self.model._meta.get_field(campo).get_internal_type() == 'DateTimeField'
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day') or '__' in field_name or self._es_fecha_hora(field_name):
+            return super().dates(field_name, kind, order)
+        return self._periodos(field_name, kind, order, con_hora=False)
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day') or '__' in field_name or tzinfo is not None:
+            return super().datetimes(field_name, kind, order, tzinfo)
+        return self._periodos(field_name, kind, order, con_hora=True)
+
+
+def opciones_medicos():
+    """(id, nombre) de todos los médicos, cacheado."""
+    def cargar():
+        filas = Medico.objects.values('id', 'user__first_name', 'user__last_name', 'user__username')
+        return sorted(((fila['id'], nombre_de(fila, 'user')) for fila in filas), key=lambda opcion: opcion[1])
+    return cache.get_or_set(CLAVE_MEDICOS, cargar, FILTRO_MEDICOS_SEGUNDOS)
+
+
+def invalidar_medicos():
+    cache.delete(CLAVE_MEDICOS)
+
+
+class MedicoFiltro(admin.SimpleListFilter):
+    """Filtro por médico con las opciones en caché; `campo` es la ruta al médico."""
+    title = 'médico'
+    parameter_name = 'medico__id__exact'
+    campo = 'medico'
+
+    def lookups(self, request, model_admin):
+        return opciones_medicos()
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f'{self.campo}_id': self.value()})
+        return queryset
+
+
+class ListadoEscalable(admin.ModelAdmin):
+    """Base de los admins de tablas grandes. Conviene sumar list_select_related y raw_id_fields."""
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return QuerySetListado(self.model, query=queryset.query, using=queryset._db, hints=queryset._hints)
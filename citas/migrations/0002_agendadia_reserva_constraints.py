@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0001_initial'),
+        ('medicos', '0001_initial'),
+        ('pacientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgendaDia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('version', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Agenda del día',
+                'verbose_name_plural': 'Agendas del día',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='reserva',
+            constraint=models.CheckConstraint(condition=models.Q(('hora_fin__gt', models.F('hora_inicio'))), name='reserva_hora_fin_posterior_inicio', violation_error_message='La hora de fin debe ser posterior a la hora de inicio.'),
+        ),
+        migrations.AddField(
+            model_name='agendadia',
+            name='medico',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='agendas', to='medicos.medico'),
+        ),
+        migrations.AddConstraint(
+            model_name='agendadia',
+            constraint=models.UniqueConstraint(fields=('medico', 'fecha'), name='agenda_dia_unica'),
+        ),
+    ]
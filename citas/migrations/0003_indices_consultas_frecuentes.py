@@ -0,0 +1,47 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0002_agendadia_reserva_constraints'),
+        ('medicos', '0001_initial'),
+        ('pacientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cobro',
+            index=models.Index(fields=['pagado', 'fecha_pago'], name='cobro_pagado_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cobro',
+            index=models.Index(condition=models.Q(('pagado', False)), fields=['reserva'], name='cobro_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialmedico',
+            index=models.Index(fields=['paciente', '-fecha'], name='historial_paciente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialmedico',
+            index=models.Index(fields=['medico', '-fecha'], name='historial_medico_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['medico', 'fecha', 'hora_inicio'], name='reserva_medico_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['paciente', 'fecha', 'hora_inicio'], name='reserva_paciente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(fields=['fecha', 'hora_inicio'], name='reserva_fecha_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(condition=models.Q(('estado__in', ['pendiente', 'confirmada'])), fields=['medico', 'fecha', 'hora_inicio', 'hora_fin'], name='reserva_vigente_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:26
+
+import citas.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0003_indices_consultas_frecuentes'),
+        ('medicos', '0001_initial'),
+        ('pacientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuscripcionCalendario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(default=citas.models.generar_token_calendario, max_length=64, unique=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('medico', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='suscripcion_calendario', to='medicos.medico')),
+                ('paciente', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='suscripcion_calendario', to='pacientes.paciente')),
+            ],
+            options={
+                'verbose_name': 'Suscripción de calendario',
+                'verbose_name_plural': 'Suscripciones de calendario',
+                'constraints': [models.CheckConstraint(condition=models.Q(models.Q(('medico__isnull', False), ('paciente__isnull', True)), models.Q(('medico__isnull', True), ('paciente__isnull', False)), _connector='OR'), name='suscripcion_calendario_un_titular')],
+            },
+        ),
+    ]
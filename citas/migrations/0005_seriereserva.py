@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0004_suscripcioncalendario'),
+        ('medicos', '0001_initial'),
+        ('pacientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerieReserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frecuencia', models.CharField(choices=[('semanal', 'Semanal'), ('mensual', 'Mensual')], default='semanal', max_length=10)),
+                ('intervalo', models.PositiveSmallIntegerField(default=1, help_text='Cada cuántas semanas o meses se repite')),
+                ('fecha_inicio', models.DateField()),
+                ('fecha_fin', models.DateField()),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('motivo', models.TextField()),
+                ('monto', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('activa', models.BooleanField(default=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='medicos.medico')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to='pacientes.paciente')),
+            ],
+            options={
+                'verbose_name': 'Serie de reservas',
+                'verbose_name_plural': 'Series de reservas',
+                'ordering': ['-fecha_creacion'],
+            },
+        ),
+        migrations.AddField(
+            model_name='reserva',
+            name='serie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reservas', to='citas.seriereserva'),
+        ),
+        migrations.AddConstraint(
+            model_name='seriereserva',
+            constraint=models.CheckConstraint(condition=models.Q(('hora_fin__gt', models.F('hora_inicio'))), name='serie_hora_fin_posterior_inicio', violation_error_message='La hora de fin debe ser posterior a la hora de inicio.'),
+        ),
+        migrations.AddConstraint(
+            model_name='seriereserva',
+            constraint=models.CheckConstraint(condition=models.Q(('fecha_fin__gte', models.F('fecha_inicio'))), name='serie_fecha_fin_posterior_inicio', violation_error_message='La fecha de término no puede ser anterior a la de inicio.'),
+        ),
+    ]
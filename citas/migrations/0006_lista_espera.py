@@ -0,0 +1,98 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0005_seriereserva'),
+        ('medicos', '0001_initial'),
+        ('pacientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CupoLiberado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('ofrecido', 'Ofrecido'), ('asignado', 'Asignado'), ('descartado', 'Descartado')], default='pendiente', max_length=20)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cupos_liberados', to='medicos.medico')),
+                ('reserva_cancelada', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='citas.reserva')),
+            ],
+            options={
+                'verbose_name': 'Cupo liberado',
+                'verbose_name_plural': 'Cupos liberados',
+            },
+        ),
+        migrations.CreateModel(
+            name='SolicitudEspera',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_desde', models.DateField()),
+                ('fecha_hasta', models.DateField()),
+                ('motivo', models.TextField()),
+                ('prioridad', models.PositiveSmallIntegerField(default=0, help_text='Mayor prioridad recibe primero las ofertas')),
+                ('estado', models.CharField(choices=[('esperando', 'Esperando'), ('ofrecida', 'Con oferta'), ('asignada', 'Asignada'), ('retirada', 'Retirada')], default='esperando', max_length=20)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('especialidad', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='solicitudes_espera', to='medicos.especialidad')),
+                ('medico', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='solicitudes_espera', to='medicos.medico')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solicitudes_espera', to='pacientes.paciente')),
+            ],
+            options={
+                'verbose_name': 'Solicitud en lista de espera',
+                'verbose_name_plural': 'Lista de espera',
+                'ordering': ['-prioridad', 'fecha_creacion'],
+            },
+        ),
+        migrations.CreateModel(
+            name='OfertaCupo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('aceptada', 'Aceptada'), ('rechazada', 'Rechazada'), ('vencida', 'Vencida')], default='pendiente', max_length=20)),
+                ('vence_en', models.DateTimeField()),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_respuesta', models.DateTimeField(blank=True, null=True)),
+                ('cupo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ofertas', to='citas.cupoliberado')),
+                ('reserva', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='oferta_espera', to='citas.reserva')),
+                ('solicitud', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ofertas', to='citas.solicitudespera')),
+            ],
+            options={
+                'verbose_name': 'Oferta de cupo',
+                'verbose_name_plural': 'Ofertas de cupos',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='cupoliberado',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['id'], name='cupo_pendiente_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solicitudespera',
+            index=models.Index(models.F('medico'), models.OrderBy(models.F('prioridad'), descending=True), models.F('fecha_creacion'), condition=models.Q(('estado', 'esperando')), name='espera_medico_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='solicitudespera',
+            index=models.Index(models.F('especialidad'), models.OrderBy(models.F('prioridad'), descending=True), models.F('fecha_creacion'), condition=models.Q(('estado', 'esperando'), ('medico__isnull', True)), name='espera_especialidad_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='solicitudespera',
+            constraint=models.CheckConstraint(condition=models.Q(('medico__isnull', False), ('especialidad__isnull', False), _connector='OR'), name='espera_medico_o_especialidad', violation_error_message='Indica un médico o una especialidad.'),
+        ),
+        migrations.AddConstraint(
+            model_name='solicitudespera',
+            constraint=models.CheckConstraint(condition=models.Q(('fecha_hasta__gte', models.F('fecha_desde'))), name='espera_rango_valido', violation_error_message='La fecha final no puede ser anterior a la inicial.'),
+        ),
+        migrations.AddIndex(
+            model_name='ofertacupo',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['vence_en'], name='oferta_pendiente_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ofertacupo',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'pendiente')), fields=('cupo',), name='oferta_pendiente_por_cupo'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0007_reserva_recordatorio'),
+        ('medicos', '0001_initial'),
+        ('pacientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaExpirada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha_expiracion', models.DateTimeField()),
+                ('notificada', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Reserva expirada',
+                'verbose_name_plural': 'Reservas expiradas',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(condition=models.Q(('estado', 'pendiente')), fields=['fecha', 'hora_inicio'], name='reserva_pendiente_idx'),
+        ),
+        migrations.AddField(
+            model_name='reservaexpirada',
+            name='reserva',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='expiracion', to='citas.reserva'),
+        ),
+        migrations.AddIndex(
+            model_name='reservaexpirada',
+            index=models.Index(condition=models.Q(('notificada__isnull', True)), fields=['id'], name='expirada_sin_aviso_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0008_reserva_expirada'),
+        ('medicos', '0001_initial'),
+        ('pacientes', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaArchivada',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('serie_id', models.BigIntegerField(blank=True, null=True)),
+                ('fecha', models.DateField()),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('motivo', models.TextField()),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('confirmada', 'Confirmada'), ('completada', 'Completada'), ('cancelada', 'Cancelada')], max_length=20)),
+                ('fecha_creacion', models.DateTimeField()),
+                ('fecha_modificacion', models.DateTimeField()),
+                ('fecha_archivado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_archivadas', to='medicos.medico')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas_archivadas', to='pacientes.paciente')),
+            ],
+            options={
+                'verbose_name': 'Reserva archivada',
+                'verbose_name_plural': 'Reservas archivadas',
+                'ordering': ['fecha', 'hora_inicio'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CobroArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('monto', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('pagado', models.BooleanField(default=False)),
+                ('fecha_pago', models.DateTimeField(blank=True, null=True)),
+                ('metodo_pago', models.CharField(blank=True, max_length=50)),
+                ('reserva', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='cobro', to='citas.reservaarchivada')),
+            ],
+            options={
+                'verbose_name': 'Cobro archivado',
+                'verbose_name_plural': 'Cobros archivados',
+            },
+        ),
+        migrations.AddField(
+            model_name='historialmedico',
+            name='reserva_archivada',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='historial', to='citas.reservaarchivada'),
+        ),
+        migrations.AddIndex(
+            model_name='reservaarchivada',
+            index=models.Index(fields=['medico', 'fecha', 'hora_inicio'], name='archivada_medico_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservaarchivada',
+            index=models.Index(fields=['paciente', 'fecha', 'hora_inicio'], name='archivada_paciente_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cobroarchivado',
+            index=models.Index(fields=['pagado', 'fecha_pago'], name='cobro_archivado_pago_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0009_archivo_reservas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SolicitudPago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=100, unique=True)),
+                ('resultado', models.CharField(choices=[('pagado', 'Pagado'), ('ya_pagado', 'Ya estaba pagado')], max_length=20)),
+                ('fecha_pago', models.DateTimeField(blank=True, null=True)),
+                ('metodo_pago', models.CharField(blank=True, max_length=50)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('cobro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='solicitudes_pago', to='citas.cobro')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Solicitud de pago',
+                'verbose_name_plural': 'Solicitudes de pago',
+            },
+        ),
+    ]
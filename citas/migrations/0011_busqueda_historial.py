@@ -0,0 +1,59 @@
+"""
+Índice de texto completo del historial médico en PostgreSQL: configuración
+citas_es (raíces en español + unaccent), columna tsvector generada y su
+índice GIN. La columna no es un campo del modelo; ver citas.busqueda.
+
+En SQLite la tabla FTS5 equivalente se crea después de cada migrate
+(citas.busqueda.asegurar_indice_sqlite), por lo que esta migración no hace
+nada allí.
+"""
+from django.db import migrations
+
+CREAR = [
+    'CREATE EXTENSION IF NOT EXISTS unaccent',
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'citas_es') THEN
+            CREATE TEXT SEARCH CONFIGURATION citas_es (COPY = pg_catalog.spanish);
+            ALTER TEXT SEARCH CONFIGURATION citas_es
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem;
+        END IF;
+    END
+    $$
+    """,
+    """
+    ALTER TABLE citas_historialmedico ADD COLUMN busqueda tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('citas_es'::regconfig, coalesce(diagnostico, '')), 'A')
+        || setweight(to_tsvector('citas_es'::regconfig, coalesce(tratamiento, '')), 'B')
+        || setweight(to_tsvector('citas_es'::regconfig, coalesce(observaciones, '')), 'C')
+    ) STORED
+    """,
+    'CREATE INDEX historial_busqueda_gin ON citas_historialmedico USING gin (busqueda)',
+]
+
+ELIMINAR = [
+    'DROP INDEX IF EXISTS historial_busqueda_gin',
+    'ALTER TABLE citas_historialmedico DROP COLUMN IF EXISTS busqueda',
+    'DROP TEXT SEARCH CONFIGURATION IF EXISTS citas_es',
+]
+
+
+def _ejecutar(sentencias):
+    def operacion(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sentencia in sentencias:
+            schema_editor.execute(sentencia)
+    return operacion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0010_solicitud_pago'),
+    ]
+
+    operations = [
+        migrations.RunPython(_ejecutar(CREAR), _ejecutar(ELIMINAR)),
+    ]
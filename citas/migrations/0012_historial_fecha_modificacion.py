@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0011_busqueda_historial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historialmedico',
+            name='fecha_modificacion',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
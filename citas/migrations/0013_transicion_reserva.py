@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:22
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0012_historial_fecha_modificacion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransicionReserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado_anterior', models.CharField(choices=[('pendiente', 'Pendiente'), ('confirmada', 'Confirmada'), ('completada', 'Completada'), ('cancelada', 'Cancelada')], max_length=20)),
+                ('estado_nuevo', models.CharField(choices=[('pendiente', 'Pendiente'), ('confirmada', 'Confirmada'), ('completada', 'Completada'), ('cancelada', 'Cancelada')], max_length=20)),
+                ('origen', models.CharField(choices=[('web', 'Sitio web'), ('api', 'API'), ('admin', 'Administración'), ('expiracion', 'Vencimiento automático'), ('serie', 'Serie recurrente')], max_length=20)),
+                ('fecha', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reserva', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='transiciones', to='citas.reserva')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Transición de reserva',
+                'verbose_name_plural': 'Transiciones de reservas',
+                'ordering': ['fecha', 'id'],
+                'indexes': [models.Index(fields=['reserva', 'fecha'], name='transicion_reserva_fecha_idx')],
+            },
+        ),
+    ]
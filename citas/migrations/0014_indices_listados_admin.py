@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0013_transicion_reserva'),
+        ('medicos', '0001_initial'),
+        ('pacientes', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='historialmedico',
+            index=models.Index(fields=['fecha'], name='historial_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservaarchivada',
+            index=models.Index(fields=['fecha', 'hora_inicio'], name='archivada_fecha_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transicionreserva',
+            index=models.Index(fields=['fecha', 'id'], name='transicion_fecha_idx'),
+        ),
+    ]
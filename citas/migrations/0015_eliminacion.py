@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-18 14:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0014_indices_listados_admin'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Eliminacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('usuario', 'Cuenta de usuario'), ('reservas', 'Reservas seleccionadas')], max_length=20)),
+                ('usuario_id', models.IntegerField(blank=True, null=True)),
+                ('reservas', models.JSONField(blank=True, default=list)),
+                ('descripcion', models.CharField(max_length=200)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('completada', 'Completada'), ('fallida', 'Fallida')], default='pendiente', max_length=20)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('avance', models.PositiveIntegerField(default=0)),
+                ('paso', models.CharField(blank=True, max_length=50)),
+                ('error', models.TextField(blank=True)),
+                ('fecha_creacion', models.DateTimeField(auto_now_add=True)),
+                ('fecha_fin', models.DateTimeField(blank=True, null=True)),
+                ('solicitada_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Eliminación',
+                'verbose_name_plural': 'Eliminaciones',
+                'ordering': ['-fecha_creacion'],
+                'indexes': [models.Index(condition=models.Q(('estado__in', ['pendiente', 'en_curso'])), fields=['id'], name='eliminacion_activa_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0015_eliminacion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eliminacion',
+            name='reclamada_hasta',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eliminacion',
+            name='reclamada_por',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='eliminacion',
+            name='ultimo_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0016_eliminacion_reclamo'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='solicitudpago',
+            name='cobro',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='solicitudes_pago', to='citas.cobro'),
+        ),
+    ]
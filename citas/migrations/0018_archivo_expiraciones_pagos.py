@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 15:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0017_solicitud_pago_conservada'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservaexpirada',
+            name='reserva_archivada',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='expiracion', to='citas.reservaarchivada'),
+        ),
+        migrations.AddField(
+            model_name='solicitudpago',
+            name='cobro_archivado',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='solicitudes_pago', to='citas.cobroarchivado'),
+        ),
+        migrations.AlterField(
+            model_name='reservaexpirada',
+            name='reserva',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='expiracion', to='citas.reserva'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+"""
+Las eliminaciones de reservas guardan la consulta de la selección en lugar de
+la lista de ids. Las que siguen activas se convierten a una consulta por esos
+mismos ids.
+"""
+import pickle
+
+from django.db import migrations, models
+
+
+def convertir_selecciones(apps, schema_editor):
+    # La consulta se lee con el modelo real (citas.eliminacion.pasos), no el histórico
+    from citas.models import Reserva
+
+    Eliminacion = apps.get_model('citas', 'Eliminacion')
+    activas = Eliminacion.objects.filter(tipo='reservas', estado__in=['pendiente', 'en_curso', 'fallida'])
+    for eliminacion in activas:
+        ids = eliminacion.reservas or []
+        eliminacion.consulta = pickle.dumps(Reserva.objects.filter(pk__in=ids).query)
+        eliminacion.hasta_id = max(ids, default=0)
+        eliminacion.save(update_fields=['consulta', 'hasta_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('citas', '0018_archivo_expiraciones_pagos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eliminacion',
+            name='consulta',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='eliminacion',
+            name='hasta_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(convertir_selecciones, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='eliminacion',
+            name='reservas',
+        ),
+    ]
@@ -1,6 +1,8 @@
+import secrets
+from django.contrib.auth.models import User
 from django.db import models
 from django.utils import timezone
-from medicos.models import Medico
+from medicos.models import Medico, Especialidad
 from pacientes.models import Paciente
 
 class EstadoReserva(models.TextChoices):
@@ -9,6 +11,51 @@ class EstadoReserva(models.TextChoices):
     COMPLETADA = 'completada', 'Completada'
     CANCELADA = 'cancelada', 'Cancelada'
 
+# Estados que ocupan un bloque en la agenda del médico
+ESTADOS_VIGENTES = [EstadoReserva.PENDIENTE, EstadoReserva.CONFIRMADA]
+
+class FrecuenciaSerie(models.TextChoices):
+    SEMANAL = 'semanal', 'Semanal'
+    MENSUAL = 'mensual', 'Mensual'
+
+class SerieReserva(models.Model):
+    """
+    Regla de recurrencia para pacientes crónicos (diálisis, kinesiología,
+    controles). Sus ocurrencias se materializan como Reserva normales.
+    """
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='series')
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='series')
+    frecuencia = models.CharField(max_length=10, choices=FrecuenciaSerie.choices, default=FrecuenciaSerie.SEMANAL)
+    intervalo = models.PositiveSmallIntegerField(default=1, help_text="Cada cuántas semanas o meses se repite")
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    motivo = models.TextField()
+    monto = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    activa = models.BooleanField(default=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-fecha_creacion']
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(hora_fin__gt=models.F('hora_inicio')),
+                name='serie_hora_fin_posterior_inicio',
+                violation_error_message='La hora de fin debe ser posterior a la hora de inicio.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(fecha_fin__gte=models.F('fecha_inicio')),
+                name='serie_fecha_fin_posterior_inicio',
+                violation_error_message='La fecha de término no puede ser anterior a la de inicio.',
+            ),
+        ]
+        verbose_name = "Serie de reservas"
+        verbose_name_plural = "Series de reservas"
+    
+    def __str__(self):
+        return f"Serie {self.get_frecuencia_display().lower()} de {self.paciente} con Dr. {self.medico}"
+
 class Reserva(models.Model):
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='reservas')
     medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='reservas')
@@ -21,32 +68,313 @@ class Reserva(models.Model):
         choices=EstadoReserva.choices,
         default=EstadoReserva.PENDIENTE
     )
+    serie = models.ForeignKey(SerieReserva, on_delete=models.SET_NULL, null=True, blank=True, related_name='reservas')
+    recordatorio_enviado = models.DateTimeField(null=True, blank=True, editable=False)
     fecha_creacion = models.DateTimeField(auto_now_add=True)
     fecha_modificacion = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['fecha', 'hora_inicio']
+        indexes = [
+            # Agenda del médico y listado del paciente, en el orden de la agenda
+            models.Index(fields=['medico', 'fecha', 'hora_inicio'], name='reserva_medico_fecha_idx'),
+            models.Index(fields=['paciente', 'fecha', 'hora_inicio'], name='reserva_paciente_fecha_idx'),
+            models.Index(fields=['fecha', 'hora_inicio'], name='reserva_fecha_hora_idx'),
+            # Solo las reservas que ocupan agenda (disponibilidad, solapamientos)
+            models.Index(
+                fields=['medico', 'fecha', 'hora_inicio', 'hora_fin'],
+                name='reserva_vigente_idx',
+                condition=models.Q(estado__in=ESTADOS_VIGENTES),
+            ),
+            # Pendientes por fecha, para el vencimiento de las no confirmadas
+            models.Index(
+                fields=['fecha', 'hora_inicio'],
+                name='reserva_pendiente_idx',
+                condition=models.Q(estado=EstadoReserva.PENDIENTE),
+            ),
+            # Reservas vigentes a las que aún no se les envía recordatorio
+            models.Index(
+                fields=['fecha', 'hora_inicio', 'id'],
+                name='reserva_recordatorio_idx',
+                condition=models.Q(estado__in=ESTADOS_VIGENTES, recordatorio_enviado__isnull=True),
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(hora_fin__gt=models.F('hora_inicio')),
+                name='reserva_hora_fin_posterior_inicio',
+                violation_error_message='La hora de fin debe ser posterior a la hora de inicio.',
+            ),
+        ]
         
     def __str__(self):
         return f"Reserva {self.paciente} con Dr. {self.medico} - {self.fecha} {self.hora_inicio}"
     
+    # Las reservas archivadas (ReservaArchivada) responden True
+    archivada = False
+    
     def esta_vigente(self):
-        return self.estado in [EstadoReserva.PENDIENTE, EstadoReserva.CONFIRMADA]
+        return self.estado in ESTADOS_VIGENTES
     
     def puede_cancelar(self):
-        return self.estado in [EstadoReserva.PENDIENTE, EstadoReserva.CONFIRMADA]
+        return self.estado in ESTADOS_VIGENTES
+
+class ReservaExpirada(models.Model):
+    """
+    Reserva pendiente cancelada automáticamente por no confirmarse a tiempo
+    (ver citas.expiracion). Sirve de cola para avisar al paciente.
+    """
+    reserva = models.OneToOneField(Reserva, on_delete=models.CASCADE, null=True, blank=True, related_name='expiracion')
+    # Reserva de origen una vez que pasó al archivo (ver citas.archivo)
+    reserva_archivada = models.OneToOneField(
+        'ReservaArchivada', on_delete=models.CASCADE, null=True, blank=True, related_name='expiracion'
+    )
+    fecha_expiracion = models.DateTimeField()
+    notificada = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], name='expirada_sin_aviso_idx', condition=models.Q(notificada__isnull=True)),
+        ]
+        verbose_name = "Reserva expirada"
+        verbose_name_plural = "Reservas expiradas"
+    
+    def __str__(self):
+        return f"Expiración de {self.reserva or self.reserva_archivada}"
+
+class OrigenTransicion(models.TextChoices):
+    WEB = 'web', 'Sitio web'
+    API = 'api', 'API'
+    ADMIN = 'admin', 'Administración'
+    EXPIRACION = 'expiracion', 'Vencimiento automático'
+    SERIE = 'serie', 'Serie recurrente'
+
+class TransicionReserva(models.Model):
+    """
+    Registro de solo inserción de cada cambio de estado de una reserva (ver
+    citas.transiciones). Sin restricción de clave foránea: el registro se
+    conserva cuando la reserva pasa al archivo con el mismo id.
+    """
+    reserva = models.ForeignKey(
+        Reserva, on_delete=models.DO_NOTHING, db_constraint=False, related_name='transiciones'
+    )
+    estado_anterior = models.CharField(max_length=20, choices=EstadoReserva.choices)
+    estado_nuevo = models.CharField(max_length=20, choices=EstadoReserva.choices)
+    origen = models.CharField(max_length=20, choices=OrigenTransicion.choices)
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    fecha = models.DateTimeField(default=timezone.now)
+    
+    class Meta:
+        ordering = ['fecha', 'id']
+        indexes = [
+            models.Index(fields=['reserva', 'fecha'], name='transicion_reserva_fecha_idx'),
+            models.Index(fields=['fecha', 'id'], name='transicion_fecha_idx'),
+        ]
+        verbose_name = "Transición de reserva"
+        verbose_name_plural = "Transiciones de reservas"
+    
+    def __str__(self):
+        return f"Reserva {self.reserva_id}: {self.estado_anterior} → {self.estado_nuevo}"
+
+class EstadoEspera(models.TextChoices):
+    ESPERANDO = 'esperando', 'Esperando'
+    OFRECIDA = 'ofrecida', 'Con oferta'
+    ASIGNADA = 'asignada', 'Asignada'
+    RETIRADA = 'retirada', 'Retirada'
+
+class SolicitudEspera(models.Model):
+    """
+    Paciente en lista de espera para un médico o, si no tiene preferencia,
+    para cualquier médico de una especialidad dentro de un rango de fechas.
+    """
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='solicitudes_espera')
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, null=True, blank=True, related_name='solicitudes_espera')
+    especialidad = models.ForeignKey(Especialidad, on_delete=models.CASCADE, null=True, blank=True, related_name='solicitudes_espera')
+    fecha_desde = models.DateField()
+    fecha_hasta = models.DateField()
+    motivo = models.TextField()
+    prioridad = models.PositiveSmallIntegerField(default=0, help_text="Mayor prioridad recibe primero las ofertas")
+    estado = models.CharField(max_length=20, choices=EstadoEspera.choices, default=EstadoEspera.ESPERANDO)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-prioridad', 'fecha_creacion']
+        indexes = [
+            # Mejor candidato en espera para un cupo, en el orden de asignación
+            models.Index(
+                'medico', models.F('prioridad').desc(), 'fecha_creacion',
+                name='espera_medico_idx',
+                condition=models.Q(estado=EstadoEspera.ESPERANDO),
+            ),
+            models.Index(
+                'especialidad', models.F('prioridad').desc(), 'fecha_creacion',
+                name='espera_especialidad_idx',
+                condition=models.Q(estado=EstadoEspera.ESPERANDO, medico__isnull=True),
+            ),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(medico__isnull=False) | models.Q(especialidad__isnull=False),
+                name='espera_medico_o_especialidad',
+                violation_error_message='Indica un médico o una especialidad.',
+            ),
+            models.CheckConstraint(
+                condition=models.Q(fecha_hasta__gte=models.F('fecha_desde')),
+                name='espera_rango_valido',
+                violation_error_message='La fecha final no puede ser anterior a la inicial.',
+            ),
+        ]
+        verbose_name = "Solicitud en lista de espera"
+        verbose_name_plural = "Lista de espera"
+    
+    def __str__(self):
+        destino = f"Dr. {self.medico}" if self.medico_id else self.especialidad
+        return f"{self.paciente} espera a {destino} ({self.fecha_desde} - {self.fecha_hasta})"
+
+class EstadoCupo(models.TextChoices):
+    PENDIENTE = 'pendiente', 'Pendiente'
+    OFRECIDO = 'ofrecido', 'Ofrecido'
+    ASIGNADO = 'asignado', 'Asignado'
+    DESCARTADO = 'descartado', 'Descartado'
+
+class CupoLiberado(models.Model):
+    """
+    Bloque liberado por una cancelación. Cancelar solo inserta esta fila; la
+    búsqueda de candidatos y las ofertas se procesan fuera de la solicitud
+    (ver citas.lista_espera).
+    """
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='cupos_liberados')
+    fecha = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    reserva_cancelada = models.ForeignKey(Reserva, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    estado = models.CharField(max_length=20, choices=EstadoCupo.choices, default=EstadoCupo.PENDIENTE)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], name='cupo_pendiente_idx', condition=models.Q(estado=EstadoCupo.PENDIENTE)),
+        ]
+        verbose_name = "Cupo liberado"
+        verbose_name_plural = "Cupos liberados"
+    
+    def __str__(self):
+        return f"Cupo de Dr. {self.medico} - {self.fecha} {self.hora_inicio}"
+
+class EstadoOferta(models.TextChoices):
+    PENDIENTE = 'pendiente', 'Pendiente'
+    ACEPTADA = 'aceptada', 'Aceptada'
+    RECHAZADA = 'rechazada', 'Rechazada'
+    VENCIDA = 'vencida', 'Vencida'
+
+class OfertaCupo(models.Model):
+    """
+    Oferta de un cupo a un paciente en espera, retenida hasta `vence_en`.
+    La restricción única parcial garantiza una sola oferta pendiente por cupo.
+    """
+    cupo = models.ForeignKey(CupoLiberado, on_delete=models.CASCADE, related_name='ofertas')
+    solicitud = models.ForeignKey(SolicitudEspera, on_delete=models.CASCADE, related_name='ofertas')
+    estado = models.CharField(max_length=20, choices=EstadoOferta.choices, default=EstadoOferta.PENDIENTE)
+    vence_en = models.DateTimeField()
+    reserva = models.OneToOneField(Reserva, on_delete=models.SET_NULL, null=True, blank=True, related_name='oferta_espera')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_respuesta = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['vence_en'], name='oferta_pendiente_idx', condition=models.Q(estado=EstadoOferta.PENDIENTE)),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['cupo'], name='oferta_pendiente_por_cupo',
+                condition=models.Q(estado=EstadoOferta.PENDIENTE),
+            ),
+        ]
+        verbose_name = "Oferta de cupo"
+        verbose_name_plural = "Ofertas de cupos"
+    
+    def __str__(self):
+        return f"Oferta de {self.cupo} a {self.solicitud.paciente}"
+    
+    def esta_vigente(self):
+        return self.estado == EstadoOferta.PENDIENTE and self.vence_en > timezone.now()
+
+class AgendaDia(models.Model):
+    """
+    Fila de control por (médico, fecha). Las reservas sobre un mismo día de
+    un médico la actualizan dentro de su transacción, lo que serializa solo
+    a los pacientes que compiten por esa agenda.
+    """
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='agendas')
+    fecha = models.DateField()
+    version = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['medico', 'fecha'], name='agenda_dia_unica'),
+        ]
+        verbose_name = "Agenda del día"
+        verbose_name_plural = "Agendas del día"
+    
+    def __str__(self):
+        return f"Agenda de Dr. {self.medico} - {self.fecha}"
+
+def generar_token_calendario():
+    return secrets.token_urlsafe(32)
+
+class SuscripcionCalendario(models.Model):
+    """
+    Token secreto para el feed iCalendar de un médico o de un paciente.
+    Los clientes de calendario no inician sesión: el token de la URL es la
+    credencial, por lo que puede regenerarse si se filtra.
+    """
+    token = models.CharField(max_length=64, unique=True, default=generar_token_calendario)
+    medico = models.OneToOneField(Medico, on_delete=models.CASCADE, null=True, blank=True, related_name='suscripcion_calendario')
+    paciente = models.OneToOneField(Paciente, on_delete=models.CASCADE, null=True, blank=True, related_name='suscripcion_calendario')
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(medico__isnull=False, paciente__isnull=True) | models.Q(medico__isnull=True, paciente__isnull=False),
+                name='suscripcion_calendario_un_titular',
+            ),
+        ]
+        verbose_name = "Suscripción de calendario"
+        verbose_name_plural = "Suscripciones de calendario"
+    
+    def __str__(self):
+        return f"Calendario de {self.medico or self.paciente}"
+    
+    def regenerar_token(self):
+        self.token = generar_token_calendario()
+        self.save(update_fields=['token'])
 
 class HistorialMedico(models.Model):
     paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='historial')
     medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='consultas')
     reserva = models.OneToOneField(Reserva, on_delete=models.SET_NULL, null=True, blank=True, related_name='historial')
+    # Reserva de origen una vez que pasó al archivo (ver citas.archivo)
+    reserva_archivada = models.OneToOneField(
+        'ReservaArchivada', on_delete=models.SET_NULL, null=True, blank=True, related_name='historial'
+    )
     fecha = models.DateTimeField(default=timezone.now)
     diagnostico = models.TextField()
     tratamiento = models.TextField()
     observaciones = models.TextField(blank=True)
+    # Cambia con cada edición: forma parte de la huella del resumen clínico
+    fecha_modificacion = models.DateTimeField(auto_now=True)
+    # El índice de texto completo sobre diagnóstico, tratamiento y
+    # observaciones vive fuera del modelo (ver citas.busqueda)
     
     class Meta:
         ordering = ['-fecha']
+        indexes = [
+            models.Index(fields=['paciente', '-fecha'], name='historial_paciente_fecha_idx'),
+            models.Index(fields=['medico', '-fecha'], name='historial_medico_fecha_idx'),
+            # Orden y jerarquía de fechas del admin (ver citas.listados)
+            models.Index(fields=['fecha'], name='historial_fecha_idx'),
+        ]
         verbose_name_plural = "Historiales médicos"
     
     def __str__(self):
@@ -59,12 +387,173 @@ class Cobro(models.Model):
     fecha_pago = models.DateTimeField(null=True, blank=True)
     metodo_pago = models.CharField(max_length=50, blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['pagado', 'fecha_pago'], name='cobro_pagado_fecha_idx'),
+            # Cobros pendientes: una fracción pequeña de la tabla
+            models.Index(fields=['reserva'], name='cobro_pendiente_idx', condition=models.Q(pagado=False)),
+        ]
+    
     def __str__(self):
         estado = "Pagado" if self.pagado else "Pendiente"
         return f"Cobro {self.id} - ${self.monto} - {estado}"
     
     def marcar_como_pagado(self, metodo):
+        """Escribe solo los campos del pago. Para pagos concurrentes ver citas.services.pagar_cobro."""
         self.pagado = True
         self.fecha_pago = timezone.now()
         self.metodo_pago = metodo
-        self.save()
\ No newline at end of file
+        self.save(update_fields=['pagado', 'fecha_pago', 'metodo_pago'])
+
+class ResultadoPago(models.TextChoices):
+    PAGADO = 'pagado', 'Pagado'
+    YA_PAGADO = 'ya_pagado', 'Ya estaba pagado'
+
+class SolicitudPago(models.Model):
+    """
+    Resultado de un intento de pago enviado con clave de idempotencia. Los
+    reintentos con la misma clave reciben este resultado sin volver a pagar.
+    """
+    clave = models.CharField(max_length=100, unique=True)
+    # Se conserva aunque el cobro se borre (la clave sigue usada); ver citas.eliminacion
+    cobro = models.ForeignKey(
+        Cobro, on_delete=models.SET_NULL, null=True, blank=True, related_name='solicitudes_pago'
+    )
+    # Cobro de origen una vez que pasó al archivo (ver citas.archivo)
+    cobro_archivado = models.ForeignKey(
+        'CobroArchivado', on_delete=models.SET_NULL, null=True, blank=True, related_name='solicitudes_pago'
+    )
+    usuario = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    resultado = models.CharField(max_length=20, choices=ResultadoPago.choices)
+    fecha_pago = models.DateTimeField(null=True, blank=True)
+    metodo_pago = models.CharField(max_length=50, blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = "Solicitud de pago"
+        verbose_name_plural = "Solicitudes de pago"
+    
+    def __str__(self):
+        return f"Pago {self.clave} - Cobro {self.cobro_id} - {self.get_resultado_display()}"
+
+class ReservaArchivada(models.Model):
+    """
+    Reserva cerrada (completada o cancelada) antigua, movida fuera de la
+    tabla de reservas para que las consultas de agenda no recorran años de
+    historia. Conserva el id original, por lo que los enlaces siguen siendo
+    válidos. Ver citas.archivo.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    paciente = models.ForeignKey(Paciente, on_delete=models.CASCADE, related_name='reservas_archivadas')
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='reservas_archivadas')
+    serie_id = models.BigIntegerField(null=True, blank=True)
+    fecha = models.DateField()
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    motivo = models.TextField()
+    estado = models.CharField(max_length=20, choices=EstadoReserva.choices)
+    fecha_creacion = models.DateTimeField()
+    fecha_modificacion = models.DateTimeField()
+    fecha_archivado = models.DateTimeField(default=timezone.now)
+    
+    archivada = True
+    
+    class Meta:
+        ordering = ['fecha', 'hora_inicio']
+        indexes = [
+            models.Index(fields=['medico', 'fecha', 'hora_inicio'], name='archivada_medico_fecha_idx'),
+            models.Index(fields=['paciente', 'fecha', 'hora_inicio'], name='archivada_paciente_fecha_idx'),
+            models.Index(fields=['fecha', 'hora_inicio'], name='archivada_fecha_hora_idx'),
+        ]
+        verbose_name = "Reserva archivada"
+        verbose_name_plural = "Reservas archivadas"
+    
+    def __str__(self):
+        return f"Reserva {self.paciente} con Dr. {self.medico} - {self.fecha} {self.hora_inicio}"
+    
+    def esta_vigente(self):
+        return False
+    
+    def puede_cancelar(self):
+        return False
+
+class CobroArchivado(models.Model):
+    """Cobro de una reserva archivada, con su id original."""
+    id = models.BigIntegerField(primary_key=True)
+    reserva = models.OneToOneField(ReservaArchivada, on_delete=models.CASCADE, related_name='cobro')
+    monto = models.DecimalField(max_digits=10, decimal_places=2)
+    pagado = models.BooleanField(default=False)
+    fecha_pago = models.DateTimeField(null=True, blank=True)
+    metodo_pago = models.CharField(max_length=50, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['pagado', 'fecha_pago'], name='cobro_archivado_pago_idx'),
+        ]
+        verbose_name = "Cobro archivado"
+        verbose_name_plural = "Cobros archivados"
+    
+    def __str__(self):
+        estado = "Pagado" if self.pagado else "Pendiente"
+        return f"Cobro {self.id} - ${self.monto} - {estado}"
+
+class TipoEliminacion(models.TextChoices):
+    USUARIO = 'usuario', 'Cuenta de usuario'
+    RESERVAS = 'reservas', 'Reservas seleccionadas'
+
+class EstadoEliminacion(models.TextChoices):
+    PENDIENTE = 'pendiente', 'Pendiente'
+    EN_CURSO = 'en_curso', 'En curso'
+    COMPLETADA = 'completada', 'Completada'
+    FALLIDA = 'fallida', 'Fallida'
+
+class Eliminacion(models.Model):
+    """
+    Borrado diferido de una cuenta o de una selección de reservas, que un
+    proceso de fondo ejecuta en lotes pequeños (ver citas.eliminacion).
+    """
+    tipo = models.CharField(max_length=20, choices=TipoEliminacion.choices)
+    # Sin clave foránea: la fila se conserva cuando el usuario ya no existe
+    usuario_id = models.IntegerField(null=True, blank=True)
+    # Selección de reservas: la consulta (Query serializada con pickle) y la
+    # mayor id existente al pedirla, para no alcanzar reservas creadas después
+    consulta = models.BinaryField(null=True, blank=True)
+    hasta_id = models.BigIntegerField(null=True, blank=True)
+    descripcion = models.CharField(max_length=200)
+    solicitada_por = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    estado = models.CharField(max_length=20, choices=EstadoEliminacion.choices, default=EstadoEliminacion.PENDIENTE)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    # Filas efectivamente borradas o desvinculadas
+    avance = models.PositiveIntegerField(default=0)
+    # Última reserva procesada de la selección: se retoma desde la siguiente
+    ultimo_id = models.BigIntegerField(default=0)
+    paso = models.CharField(max_length=50, blank=True)
+    # Proceso que la ejecuta y hasta cuándo; vencido el plazo otro puede tomarla
+    reclamada_por = models.CharField(max_length=32, blank=True)
+    reclamada_hasta = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    fecha_creacion = models.DateTimeField(auto_now_add=True)
+    fecha_fin = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-fecha_creacion']
+        indexes = [
+            models.Index(
+                fields=['id'], name='eliminacion_activa_idx',
+                condition=models.Q(estado__in=[EstadoEliminacion.PENDIENTE, EstadoEliminacion.EN_CURSO]),
+            ),
+        ]
+        verbose_name = "Eliminación"
+        verbose_name_plural = "Eliminaciones"
+    
+    def __str__(self):
+        return f"Eliminación de {self.descripcion} ({self.get_estado_display().lower()})"
+    
+    @property
+    def porcentaje(self):
+        # Filas que ya no existían al llegar su lote no suman avance
+        if self.estado == EstadoEliminacion.COMPLETADA:
+            return 100
+        if not self.total:
+            return 0
+        return min(100, round(100 * self.avance / self.total))
@@ -0,0 +1,228 @@
+"""
+Ocupación de la agenda de cada médico por día de la semana y hora.
+
+Las reservas del período (vigentes y completadas, también las archivadas)
+se leen con values_list, con el día de la semana y las horas en minutos ya
+calculados por la base y agrupadas por médico, día y bloque, y se convierten
+en arreglos de NumPy de a TAMANO_BLOQUE filas. Los minutos de cada bloque
+que caen en cada hora del día se obtienen para todo el arreglo a la vez y se
+acumulan con bincount en un tensor médico × día × hora: el costo en Python
+es por arreglo y por hora, no por reserva. Ese tensor se guarda en la cache
+por período.
+
+La capacidad sale del horario de atención de cada médico (el mismo todos los
+días, como en citas.disponibilidad) por la cantidad de lunes, martes, etc.
+del período, y se calcula en cada consulta porque el horario puede cambiar.
+"""
+from datetime import timedelta
+from itertools import islice
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Func, IntegerField
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, ExtractMinute
+from django.utils import timezone
+
+from medicos.models import Medico
+from .correo import nombre_de
+from .disponibilidad import a_minutos
+from .models import Reserva, ReservaArchivada, EstadoReserva, ESTADOS_VIGENTES
+
+DIAS = ['lunes', 'martes', 'miércoles', 'jueves', 'viernes', 'sábado', 'domingo']
+HORAS = 24
+# Límites de cada hora del día en minutos: 0, 60, ..., 1440
+BORDES = np.arange(HORAS + 1) * 60
+TAMANO_BLOQUE = 10000
+MAX_DIAS = 366
+DIAS_POR_DEFECTO = 28
+# Celdas con ocupación igual o mayor (o menor) a estos valores se informan aparte
+UMBRAL_ALTO = 0.9
+UMBRAL_BAJO = 0.3
+PERIODO_ABIERTO_TTL = 60 * 5
+PERIODO_CERRADO_TTL = 60 * 60 * 24
+FUENTES = [
+    (Reserva, ESTADOS_VIGENTES + [EstadoReserva.COMPLETADA]),
+    (ReservaArchivada, [EstadoReserva.COMPLETADA]),
+]
+
+
+def periodo_por_defecto():
+    """Las últimas cuatro semanas, hasta hoy."""
+    hasta = timezone.localdate()
+    return hasta - timedelta(days=DIAS_POR_DEFECTO - 1), hasta
+
+
+def minutos_por_hora(inicio, fin):
+    """Matriz (n, 24) con los minutos de cada intervalo [inicio, fin) en cada hora del día."""
+    return np.clip(
+        np.minimum(fin[:, None], BORDES[None, 1:]) - np.maximum(inicio[:, None], BORDES[None, :-1]), 0, None
+    )
+
+
+def dias_de_la_semana(desde, hasta):
+    """Cuántos lunes, martes, ... domingos tiene el período."""
+    # El ordinal 1 (1 de enero del año 1) fue lunes
+    ordinales = np.arange(desde.toordinal(), hasta.toordinal() + 1)
+    return np.bincount((ordinales - 1) % 7, minlength=7)
+
+
+# En SQLite las funciones Extract de Django son funciones Python llamadas
+# fila a fila; strftime es nativo y varias veces más rápido.
+class DiaSemana(ExtractIsoWeekDay):
+    def as_sqlite(self, compiler, connection):
+        sql, params = compiler.compile(self.lhs)
+        # %w cuenta desde el domingo (0); ISO, desde el lunes (1)
+        return f"((CAST(strftime('%%w', {sql}) AS INTEGER) + 6) %% 7 + 1)", params
+
+
+class Minutos(Func):
+    """Minutos desde la medianoche de un campo de hora."""
+    output_field = IntegerField()
+
+    def as_sql(self, compiler, connection, **extra):
+        campo = self.source_expressions[0]
+        return compiler.compile((ExtractHour(campo) * 60 + ExtractMinute(campo)).resolve_expression(compiler.query))
+
+    def as_sqlite(self, compiler, connection, **extra):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return f"(CAST(strftime('%%H', {sql}) AS INTEGER) * 60 + CAST(strftime('%%M', {sql}) AS INTEGER))", params
+
+
+def _lotes(desde, hasta):
+    """
+    Arreglos (medico_id, día 1-7, inicio, fin, cantidad) de las reservas del
+    período, de a TAMANO_BLOQUE filas. Las reservas con el mismo bloque el
+    mismo día de la semana se agrupan en la base, así que una agenda por
+    bloques fijos devuelve del orden de médicos × 7 × bloques filas, sin
+    importar el largo del período.
+    """
+    for modelo, estados in FUENTES:
+        filas = (
+            modelo.objects
+            .filter(fecha__range=(desde, hasta), estado__in=estados)
+            .annotate(dia=DiaSemana('fecha'), inicio=Minutos('hora_inicio'), fin=Minutos('hora_fin'))
+            .order_by()
+            .values_list('medico_id', 'dia', 'inicio', 'fin')
+            .annotate(cantidad=Count('*'))
+            .iterator(chunk_size=TAMANO_BLOQUE)
+        )
+        while bloque := list(islice(filas, TAMANO_BLOQUE)):
+            yield np.array(bloque, dtype=np.int64)
+
+
+def _posiciones(ids, buscados):
+    """Posición de cada id buscado en `ids` (ordenado) y máscara de los que están."""
+    posicion = np.searchsorted(ids, buscados)
+    encontrado = posicion < len(ids)
+    encontrado[encontrado] = ids[posicion[encontrado]] == buscados[encontrado]
+    return posicion, encontrado
+
+
+def minutos_reservados(desde, hasta):
+    """Ids de los médicos (ordenados) y tensor médico × día × hora de minutos reservados."""
+    ids = np.fromiter(Medico.objects.order_by('id').values_list('id', flat=True), dtype=np.int64)
+    celdas = len(ids) * 7
+    plano = np.zeros((celdas, HORAS))
+    for lote in _lotes(desde, hasta):
+        # Se descartan los médicos creados después de leer los ids
+        posicion, encontrado = _posiciones(ids, lote[:, 0])
+        lote, posicion = lote[encontrado], posicion[encontrado]
+
+        celda = posicion * 7 + lote[:, 1] - 1
+        minutos = minutos_por_hora(lote[:, 2], lote[:, 3]) * lote[:, 4:5]
+        for hora in np.flatnonzero(minutos.any(axis=0)):
+            plano[:, hora] += np.bincount(celda, weights=minutos[:, hora], minlength=celdas)
+    return ids, plano.reshape(len(ids), 7, HORAS)
+
+
+def _clave(desde, hasta):
+    return f'ocupacion:{desde:%Y-%m-%d}:{hasta:%Y-%m-%d}'
+
+
+def reservados_en_cache(desde, hasta):
+    """minutos_reservados del período desde la cache, o calculados y guardados."""
+    clave = _clave(desde, hasta)
+    valor = cache.get(clave)
+    if valor is None:
+        valor = minutos_reservados(desde, hasta)
+        ttl = PERIODO_CERRADO_TTL if hasta < timezone.localdate() else PERIODO_ABIERTO_TTL
+        cache.set(clave, valor, ttl)
+    return valor
+
+
+def _celdas(ocupacion, condicion):
+    return [
+        {'dia': DIAS[dia], 'hora': int(hora), 'ocupacion': round(float(ocupacion[dia, hora]), 3)}
+        for dia, hora in np.argwhere(condicion)
+    ]
+
+
+def _tabla(ocupacion):
+    """Matriz 7 × 24 como listas, con None donde no hay horario de atención."""
+    return np.where(np.isnan(ocupacion), None, np.round(ocupacion, 3)).tolist()
+
+
+def _ocupacion(reservado, disponible):
+    return np.divide(reservado, disponible, out=np.full(reservado.shape, np.nan), where=disponible > 0)
+
+
+def resumen_ocupacion(desde, hasta, medico=None, especialidad=None):
+    """
+    Ocupación (minutos reservados / minutos de atención) por médico, día de
+    la semana y hora, con las celdas sobre UMBRAL_ALTO y bajo UMBRAL_BAJO y
+    el total de los médicos incluidos.
+    """
+    ids, reservado = reservados_en_cache(desde, hasta)
+
+    medicos = Medico.objects.order_by('id')
+    if medico:
+        medicos = medicos.filter(id=medico)
+    if especialidad:
+        medicos = medicos.filter(especialidad_id=especialidad)
+    filas = list(medicos.values(
+        'id', 'horario_inicio', 'horario_fin', 'especialidad__nombre',
+        'user__first_name', 'user__last_name', 'user__username',
+    ))
+
+    # Un médico creado después de calcular el período no tiene reservas en él
+    posicion, encontrado = _posiciones(ids, np.array([fila['id'] for fila in filas], dtype=np.int64))
+    reservado_medicos = np.zeros((len(filas), 7, HORAS))
+    reservado_medicos[encontrado] = reservado[posicion[encontrado]]
+    reservado = reservado_medicos
+
+    horario = np.array([
+        (a_minutos(fila['horario_inicio']), a_minutos(fila['horario_fin']))
+        if fila['horario_inicio'] and fila['horario_fin'] else (0, 0)
+        for fila in filas
+    ], dtype=np.int64).reshape(-1, 2)
+    disponible = (
+        minutos_por_hora(horario[:, 0], horario[:, 1])[:, None, :]
+        * dias_de_la_semana(desde, hasta)[None, :, None]
+    )
+    ocupacion = _ocupacion(reservado, disponible)
+
+    resultado = []
+    for n, fila in enumerate(filas):
+        total_disponible = float(disponible[n].sum())
+        total_reservado = float(reservado[n].sum())
+        resultado.append({
+            'id': fila['id'],
+            'nombre': nombre_de(fila, 'user'),
+            'especialidad': fila['especialidad__nombre'],
+            'minutos_reservados': int(total_reservado),
+            'minutos_disponibles': int(total_disponible),
+            'minutos_fuera_de_horario': int(reservado[n][disponible[n] == 0].sum()),
+            'ocupacion': round(total_reservado / total_disponible, 3) if total_disponible else None,
+            'tabla': _tabla(ocupacion[n]),
+            'sobrecargadas': _celdas(ocupacion[n], ocupacion[n] >= UMBRAL_ALTO),
+            'subutilizadas': _celdas(ocupacion[n], ocupacion[n] <= UMBRAL_BAJO),
+        })
+
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'dias': DIAS,
+        'horas': list(range(HORAS)),
+        'total': _tabla(_ocupacion(reservado.sum(axis=0), disponible.sum(axis=0))),
+        'medicos': resultado,
+    }
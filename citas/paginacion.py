@@ -0,0 +1,152 @@
+"""
+Paginación por cursor (keyset) para listados ordenados por varias columnas.
+
+En vez de OFFSET, cada página filtra a partir de los valores de la última
+fila vista, de modo que el costo de una página no depende de cuántas filas
+hay antes de ella.
+"""
+import base64
+import heapq
+import json
+from dataclasses import dataclass
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+@dataclass
+class PaginaKeyset:
+    items: list
+    siguiente: str = None
+    anterior: str = None
+
+    @property
+    def tiene_siguiente(self):
+        return self.siguiente is not None
+
+    @property
+    def tiene_anterior(self):
+        return self.anterior is not None
+
+
+def codificar_cursor(valores):
+    """Codifica una tupla de valores de orden como token opaco para la URL."""
+    crudo = json.dumps([str(valor) for valor in valores])
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, campos, modelo=None):
+    """
+    Decodifica un token de cursor. Con `modelo`, cada valor se convierte al
+    tipo de su campo. Lanza ValueError si no es válido.
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+    if not isinstance(valores, list) or len(valores) != len(campos):
+        raise ValueError('Cursor inválido')
+    if modelo is not None:
+        # Un token manipulado no debe llegar al ORM como valor de otro tipo
+        try:
+            valores = [modelo._meta.get_field(campo).to_python(valor) for campo, valor in zip(campos, valores)]
+        except (ValidationError, TypeError, ValueError):
+            raise ValueError('Cursor inválido')
+        if None in valores:
+            raise ValueError('Cursor inválido')
+    return valores
+
+
+def filtro_keyset(campos, valores, operador):
+    """
+    Expande (a, b, c) > (x, y, z) como
+    a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z).
+    """
+    filtro = Q()
+    for n, campo in enumerate(campos):
+        condicion = {f'{campo}__{operador}': valores[n]}
+        condicion.update({campos[m]: valores[m] for m in range(n)})
+        filtro |= Q(**condicion)
+    return filtro
+
+
+def valores_de(objeto, campos):
+    """Valores de orden de un objeto o de una fila de values()."""
+    if isinstance(objeto, dict):
+        return [objeto[campo] for campo in campos]
+    return [getattr(objeto, campo) for campo in campos]
+
+
+def _consultar(querysets, campos, filtro, limite, descendente=False):
+    """
+    Primeras `limite` filas de uno o varios querysets en el orden de
+    `campos`. Con varios, cada uno se consulta por separado (usando su
+    índice) y los resultados se mezclan ya ordenados.
+    """
+    orden = [f'-{campo}' for campo in campos] if descendente else list(campos)
+    resultados = [
+        list((queryset.filter(filtro) if filtro is not None else queryset).order_by(*orden)[:limite])
+        for queryset in querysets
+    ]
+    if len(resultados) == 1:
+        return resultados[0]
+    mezcla = heapq.merge(*resultados, key=lambda fila: valores_de(fila, campos), reverse=descendente)
+    return list(islice(mezcla, limite))
+
+
+def paginar_keyset(queryset, campos, tamano, despues=None, antes=None):
+    """
+    Retorna una PaginaKeyset de `tamano` filas de `queryset` ordenadas de
+    forma ascendente por `campos` (el último debe ser único, p. ej. 'id').
+    `queryset` puede ser una lista de querysets con los mismos campos de
+    orden (p. ej. reservas y reservas archivadas), que se paginan como uno.
+
+    `despues` y `antes` son cursores devueltos por una página previa; si se
+    entrega `antes` se retrocede una página.
+    """
+    querysets = queryset if isinstance(queryset, (list, tuple)) else [queryset]
+    modelo = querysets[0].model
+    if antes:
+        valores = decodificar_cursor(antes, campos, modelo)
+        filas = _consultar(querysets, campos, filtro_keyset(campos, valores, 'lt'), tamano + 1, descendente=True)
+        hay_mas = len(filas) > tamano
+        items = filas[:tamano][::-1]
+        return PaginaKeyset(
+            items=items,
+            anterior=codificar_cursor(valores_de(items[0], campos)) if hay_mas else None,
+            siguiente=codificar_cursor(valores_de(items[-1], campos)) if items else None,
+        )
+
+    filtro = None
+    if despues:
+        valores = decodificar_cursor(despues, campos, modelo)
+        filtro = filtro_keyset(campos, valores, 'gt')
+    filas = _consultar(querysets, campos, filtro, tamano + 1)
+    hay_mas = len(filas) > tamano
+    items = filas[:tamano]
+    return PaginaKeyset(
+        items=items,
+        siguiente=codificar_cursor(valores_de(items[-1], campos)) if hay_mas else None,
+        anterior=codificar_cursor(valores_de(items[0], campos)) if despues and items else None,
+    )
+
+
+def recorrer_keyset(queryset, campos, tamano):
+    """
+    Recorre todo el queryset en lotes de `tamano` filas ordenadas por
+    `campos`, retomando cada lote desde la última fila del anterior. Sirve
+    para procesos masivos: la memoria queda acotada al tamaño del lote y el
+    costo de cada lote no crece con lo ya recorrido.
+    """
+    valores = None
+    while True:
+        lote = queryset if valores is None else queryset.filter(filtro_keyset(campos, valores, 'gt'))
+        filas = list(lote.order_by(*campos)[:tamano])
+        if not filas:
+            return
+        yield filas
+        if len(filas) < tamano:
+            return
+        valores = valores_de(filas[-1], campos)
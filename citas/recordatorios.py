@@ -0,0 +1,98 @@
+"""
+Recordatorios por correo de las próximas reservas.
+
+Las reservas se recorren por lotes con paginación keyset, las plantillas se
+cargan una sola vez por ejecución y todos los correos salen por una misma
+conexión SMTP. Cada lote se marca como enviado con un único UPDATE, por lo
+que volver a ejecutar el proceso no repite recordatorios.
+"""
+import time
+from dataclasses import dataclass, field
+
+from django.core.mail import get_connection
+from django.utils import timezone
+
+from .correo import PlantillasCorreo, enviar, nombre_de
+from .models import Reserva, ESTADOS_VIGENTES
+from .paginacion import recorrer_keyset
+
+TAMANO_LOTE = 500
+ORDEN = ('fecha', 'hora_inicio', 'id')
+
+
+@dataclass
+class ResumenEnvio:
+    enviados: int = 0
+    fallidos: int = 0
+    lotes: int = 0
+    inicio: float = field(default_factory=time.perf_counter)
+
+    @property
+    def segundos(self):
+        return time.perf_counter() - self.inicio
+
+    @property
+    def por_segundo(self):
+        return self.enviados / self.segundos if self.segundos else 0
+
+
+def reservas_por_recordar(desde, hasta):
+    """Filas de las reservas vigentes entre ambas fechas que aún no tienen recordatorio."""
+    return (
+        Reserva.objects
+        .filter(
+            estado__in=ESTADOS_VIGENTES,
+            recordatorio_enviado__isnull=True,
+            fecha__range=(desde, hasta),
+        )
+        .exclude(paciente__user__email='')
+        .values(
+            'id', 'fecha', 'hora_inicio', 'hora_fin', 'motivo',
+            'paciente__user__email', 'paciente__user__first_name',
+            'paciente__user__last_name', 'paciente__user__username',
+            'medico__user__first_name', 'medico__user__last_name', 'medico__user__username',
+        )
+    )
+
+
+def _contexto(fila):
+    return {
+        'paciente': nombre_de(fila, 'paciente__user'),
+        'medico': nombre_de(fila, 'medico__user'),
+        'fecha': fila['fecha'],
+        'hora_inicio': fila['hora_inicio'],
+        'hora_fin': fila['hora_fin'],
+        'motivo': fila['motivo'],
+    }
+
+
+def enviar_recordatorios(desde, hasta, tamano_lote=TAMANO_LOTE, simular=False, al_terminar_lote=None):
+    """
+    Envía los recordatorios pendientes entre `desde` y `hasta`. Con
+    `simular` solo arma los mensajes. `al_terminar_lote` recibe el
+    ResumenEnvio acumulado después de cada lote.
+    """
+    resumen = ResumenEnvio()
+    plantillas = PlantillasCorreo('citas/email/recordatorio')
+    conexion = get_connection()
+    conexion.open()
+    try:
+        for filas in recorrer_keyset(reservas_por_recordar(desde, hasta), ORDEN, tamano_lote):
+            enviados = []
+            for fila in filas:
+                mensaje = plantillas.mensaje(_contexto(fila), fila['paciente__user__email'], conexion)
+                if simular or enviar(conexion, mensaje):
+                    enviados.append(fila['id'])
+                else:
+                    resumen.fallidos += 1
+
+            if enviados and not simular:
+                # Sin fecha_modificacion: el recordatorio no cambia la agenda
+                Reserva.objects.filter(id__in=enviados).update(recordatorio_enviado=timezone.now())
+            resumen.enviados += len(enviados)
+            resumen.lotes += 1
+            if al_terminar_lote:
+                al_terminar_lote(resumen)
+    finally:
+        conexion.close()
+    return resumen
@@ -0,0 +1,126 @@
+"""
+Resumen clínico del paciente en DOCX, para traslados a otro prestador.
+
+El documento incluye los datos del paciente y todas sus consultas del
+historial, con médico y especialidad, de la más antigua a la más reciente.
+Se guarda en MEDIA_ROOT/resumenes/<paciente_id>/<huella>.docx. La huella
+resume los datos del paciente y el estado del historial (cantidad, último id
+y última modificación), que se obtiene con una sola consulta agregada: el
+documento se reutiliza hasta que el historial cambia. Se genera en un hilo
+de fondo (ver citas.generados) y al terminar se borran las versiones
+anteriores del mismo paciente.
+"""
+import hashlib
+import hmac
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils import timezone
+from docx import Document
+
+from .correo import nombre_de
+from .generados import Cola, escribir_atomico
+from .models import HistorialMedico
+
+CONTENT_TYPE_DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+TAMANO_BLOQUE = 500
+CAMPOS = (
+    'id', 'fecha', 'diagnostico', 'tratamiento', 'observaciones',
+    'medico__user__first_name', 'medico__user__last_name', 'medico__user__username',
+    'medico__especialidad__nombre',
+)
+
+_cola = Cola('resumenes', 'RESUMENES_HILOS')
+
+
+def datos_paciente(paciente):
+    """Datos impresos en el encabezado, como texto para que la huella sea estable."""
+    return {
+        'paciente_id': paciente.id,
+        'nombre': str(paciente),
+        'rut': paciente.rut,
+        'fecha_nacimiento': f'{paciente.fecha_nacimiento:%d/%m/%Y}' if paciente.fecha_nacimiento else '',
+        'grupo_sanguineo': paciente.grupo_sanguineo,
+        'alergias': paciente.alergias,
+    }
+
+
+def huella(paciente):
+    estado = HistorialMedico.objects.filter(paciente=paciente).aggregate(
+        total=Count('id'), ultimo=Max('id'), modificado=Max('fecha_modificacion')
+    )
+    contenido = json.dumps({**datos_paciente(paciente), **estado}, sort_keys=True, default=str).encode()
+    return hmac.new(settings.SECRET_KEY.encode(), contenido, hashlib.sha256).hexdigest()[:24]
+
+
+def ruta_resumen(paciente):
+    return Path(settings.MEDIA_ROOT) / 'resumenes' / str(paciente.id) / f'{huella(paciente)}.docx'
+
+
+def _documento(paciente):
+    datos = datos_paciente(paciente)
+    documento = Document()
+    documento.core_properties.title = f"Resumen clínico - {datos['nombre']}"
+    documento.add_heading('Mediconecta - Resumen clínico', level=0)
+    documento.add_paragraph(f'Emitido el {timezone.localtime():%d/%m/%Y %H:%M}')
+
+    tabla = documento.add_table(rows=0, cols=2)
+    tabla.style = 'Light Grid Accent 1'
+    for etiqueta, valor in [
+        ('Paciente', datos['nombre']), ('RUT', datos['rut']), ('Fecha de nacimiento', datos['fecha_nacimiento']),
+        ('Grupo sanguíneo', datos['grupo_sanguineo']), ('Alergias', datos['alergias']),
+    ]:
+        celdas = tabla.add_row().cells
+        celdas[0].text = etiqueta
+        celdas[1].text = valor or '—'
+
+    documento.add_heading('Consultas', level=1)
+    consultas = (
+        HistorialMedico.objects.filter(paciente=paciente)
+        .order_by('fecha', 'id')
+        .values(*CAMPOS)
+        .iterator(chunk_size=TAMANO_BLOQUE)
+    )
+    total = 0
+    for fila in consultas:
+        total += 1
+        especialidad = fila['medico__especialidad__nombre']
+        medico = nombre_de(fila, 'medico__user') + (f' ({especialidad})' if especialidad else '')
+        documento.add_heading(f"{timezone.localtime(fila['fecha']):%d/%m/%Y} - Dr. {medico}", level=2)
+        for etiqueta, campo in (
+            ('Diagnóstico', 'diagnostico'), ('Tratamiento', 'tratamiento'), ('Observaciones', 'observaciones')
+        ):
+            if fila[campo]:
+                parrafo = documento.add_paragraph()
+                parrafo.add_run(f'{etiqueta}: ').bold = True
+                parrafo.add_run(fila[campo])
+    if not total:
+        documento.add_paragraph('El paciente no tiene consultas registradas.')
+    return documento
+
+
+def renderizar(paciente, ruta=None):
+    """Genera el DOCX si aún no existe, borra las versiones anteriores y retorna (ruta, generado)."""
+    ruta = ruta or ruta_resumen(paciente)
+    ruta, generado = escribir_atomico(ruta, lambda archivo: _documento(paciente).save(archivo))
+    for anterior in ruta.parent.glob('*.docx'):
+        if anterior != ruta:
+            anterior.unlink(missing_ok=True)
+    return ruta, generado
+
+
+def obtener_resumen(paciente):
+    """
+    Ruta del DOCX si ya está generado para el historial actual. Si no, lo
+    encola y retorna None; sin generación en segundo plano lo renderiza en
+    la misma solicitud.
+    """
+    ruta = ruta_resumen(paciente)
+    if ruta.exists():
+        return ruta
+    if getattr(settings, 'RESUMENES_EN_SEGUNDO_PLANO', True):
+        _cola.encolar(ruta, renderizar, paciente, ruta)
+        return None
+    return renderizar(paciente, ruta)[0]
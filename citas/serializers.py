@@ -0,0 +1,237 @@
+from rest_framework import serializers
+from .busqueda import LIMITE_POR_DEFECTO, LIMITE_MAXIMO
+from .exportacion import FORMATOS
+from .ingresos import meses_entre, periodo_por_defecto, MAX_MESES
+from . import linea_tiempo
+from . import ocupacion
+from .series import ocurrencias, MAX_OCURRENCIAS
+from .models import (
+    Reserva, Cobro, SerieReserva, ReservaArchivada, SolicitudPago, HistorialMedico, EstadoReserva, FrecuenciaSerie
+)
+
+# Máximo de reservas aceptadas en una sola solicitud masiva
+MAX_RESERVAS_LOTE = 10000
+# Horizonte máximo de una serie recurrente
+MAX_DIAS_SERIE = 2 * 366
+
+class CobroSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Cobro
+        fields = ['id', 'reserva', 'monto', 'pagado', 'fecha_pago', 'metodo_pago']
+        read_only_fields = fields
+
+class PagoSerializer(serializers.Serializer):
+    metodo_pago = serializers.CharField(max_length=50, default='Tarjeta de crédito')
+
+class SolicitudPagoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SolicitudPago
+        fields = ['clave', 'cobro', 'resultado', 'fecha_pago', 'metodo_pago', 'fecha_creacion']
+        read_only_fields = fields
+
+class ReservaSerializer(serializers.ModelSerializer):
+    paciente_nombre = serializers.CharField(source='paciente.__str__', read_only=True)
+    medico_nombre = serializers.CharField(source='medico.__str__', read_only=True)
+    estado_display = serializers.CharField(source='get_estado_display', read_only=True)
+    
+    class Meta:
+        model = Reserva
+        fields = [
+            'id', 'paciente', 'paciente_nombre', 'medico', 'medico_nombre',
+            'fecha', 'hora_inicio', 'hora_fin', 'motivo', 'estado',
+            'estado_display', 'fecha_creacion', 'fecha_modificacion'
+        ]
+        read_only_fields = fields
+
+class ReservaArchivadaSerializer(ReservaSerializer):
+    """Misma representación que ReservaSerializer para reservas del archivo."""
+    
+    class Meta:
+        model = ReservaArchivada
+        fields = ReservaSerializer.Meta.fields + ['fecha_archivado']
+        read_only_fields = fields
+
+class ReservaLoteItemSerializer(serializers.Serializer):
+    """
+    Ítem de una carga masiva de reservas. Las referencias a médico y paciente
+    se reciben como ids y se validan en bloque en el servicio, no con una
+    consulta por ítem.
+    """
+    paciente = serializers.IntegerField(min_value=1)
+    medico = serializers.IntegerField(min_value=1)
+    fecha = serializers.DateField()
+    hora_inicio = serializers.TimeField()
+    hora_fin = serializers.TimeField()
+    motivo = serializers.CharField()
+    monto = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, default=0)
+    
+    def validate(self, data):
+        if data['hora_fin'] <= data['hora_inicio']:
+            raise serializers.ValidationError({'hora_fin': 'La hora de fin debe ser posterior a la hora de inicio.'})
+        return data
+
+class ReservaLoteSerializer(serializers.Serializer):
+    reservas = serializers.ListField(
+        child=ReservaLoteItemSerializer(),
+        allow_empty=False,
+        max_length=MAX_RESERVAS_LOTE
+    )
+
+class ReservaTransicionSerializer(serializers.Serializer):
+    """
+    Cambio de estado por conjunto: las reservas del día y médico indicados,
+    opcionalmente acotadas a `ids`. Las que no pueden pasar al estado se omiten.
+    """
+    estado = serializers.ChoiceField(choices=[
+        EstadoReserva.CONFIRMADA, EstadoReserva.COMPLETADA, EstadoReserva.CANCELADA
+    ])
+    fecha = serializers.DateField()
+    medico = serializers.IntegerField(min_value=1, required=False)
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=MAX_RESERVAS_LOTE
+    )
+
+class SerieReservaSerializer(serializers.ModelSerializer):
+    paciente_nombre = serializers.CharField(source='paciente.__str__', read_only=True)
+    medico_nombre = serializers.CharField(source='medico.__str__', read_only=True)
+    
+    class Meta:
+        model = SerieReserva
+        fields = [
+            'id', 'paciente', 'paciente_nombre', 'medico', 'medico_nombre',
+            'frecuencia', 'intervalo', 'fecha_inicio', 'fecha_fin',
+            'hora_inicio', 'hora_fin', 'motivo', 'monto', 'activa', 'fecha_creacion'
+        ]
+        read_only_fields = ['activa', 'fecha_creacion']
+        extra_kwargs = {'intervalo': {'min_value': 1, 'max_value': 12}}
+    
+    def validate(self, data):
+        if data['hora_fin'] <= data['hora_inicio']:
+            raise serializers.ValidationError({'hora_fin': 'La hora de fin debe ser posterior a la hora de inicio.'})
+        if data['fecha_fin'] < data['fecha_inicio']:
+            raise serializers.ValidationError({'fecha_fin': 'La fecha de fin no puede ser anterior a la de inicio.'})
+        if (data['fecha_fin'] - data['fecha_inicio']).days > MAX_DIAS_SERIE:
+            raise serializers.ValidationError({'fecha_fin': 'La serie no puede abarcar más de dos años.'})
+        serie = SerieReserva(
+            frecuencia=data.get('frecuencia', FrecuenciaSerie.SEMANAL), intervalo=data.get('intervalo', 1),
+            fecha_inicio=data['fecha_inicio'], fecha_fin=data['fecha_fin'],
+        )
+        # Dos años semanales pueden dar una ocurrencia más que el tope: se rechaza en vez de descartarla
+        if len(ocurrencias(serie, limite=MAX_OCURRENCIAS + 1)) > MAX_OCURRENCIAS:
+            raise serializers.ValidationError(
+                {'fecha_fin': f'La serie no puede tener más de {MAX_OCURRENCIAS} ocurrencias.'}
+            )
+        return data
+
+class SerieModificacionSerializer(serializers.Serializer):
+    """Cambio de horario aplicado a una fecha y las siguientes de la serie."""
+    desde = serializers.DateField()
+    hora_inicio = serializers.TimeField()
+    hora_fin = serializers.TimeField()
+    motivo = serializers.CharField(required=False)
+    
+    def validate(self, data):
+        if data['hora_fin'] <= data['hora_inicio']:
+            raise serializers.ValidationError({'hora_fin': 'La hora de fin debe ser posterior a la hora de inicio.'})
+        return data
+
+class SerieCancelacionSerializer(serializers.Serializer):
+    desde = serializers.DateField()
+
+class IngresosFiltroSerializer(serializers.Serializer):
+    """Período del análisis de ingresos, en meses (AAAA-MM). Por defecto los últimos doce."""
+    desde = serializers.DateField(input_formats=['%Y-%m'], required=False)
+    hasta = serializers.DateField(input_formats=['%Y-%m'], required=False)
+    
+    def validate(self, data):
+        desde, hasta = periodo_por_defecto()
+        data.setdefault('desde', desde)
+        data.setdefault('hasta', hasta)
+        if data['hasta'] < data['desde']:
+            raise serializers.ValidationError({'hasta': 'Debe ser igual o posterior a desde.'})
+        if len(meses_entre(data['desde'], data['hasta'])) > MAX_MESES:
+            raise serializers.ValidationError({'hasta': f'El período no puede superar {MAX_MESES} meses.'})
+        return data
+
+class OcupacionFiltroSerializer(serializers.Serializer):
+    """Período (por defecto las últimas cuatro semanas) y filtros del mapa de ocupación."""
+    desde = serializers.DateField(required=False)
+    hasta = serializers.DateField(required=False)
+    medico = serializers.IntegerField(min_value=1, required=False)
+    especialidad = serializers.IntegerField(min_value=1, required=False)
+    
+    def validate(self, data):
+        desde, hasta = ocupacion.periodo_por_defecto()
+        data.setdefault('desde', desde)
+        data.setdefault('hasta', hasta)
+        if data['hasta'] < data['desde']:
+            raise serializers.ValidationError({'hasta': 'Debe ser igual o posterior a desde.'})
+        if (data['hasta'] - data['desde']).days + 1 > ocupacion.MAX_DIAS:
+            raise serializers.ValidationError({'hasta': f'El período no puede superar {ocupacion.MAX_DIAS} días.'})
+        return data
+
+class ExportacionFiltroSerializer(serializers.Serializer):
+    """Filtros de la exportación; `despues` retoma desde el último id recibido."""
+    formato = serializers.ChoiceField(choices=list(FORMATOS), default='csv')
+    desde = serializers.DateField(required=False)
+    hasta = serializers.DateField(required=False)
+    medico = serializers.IntegerField(min_value=1, required=False)
+    despues = serializers.IntegerField(min_value=0, required=False)
+
+class BusquedaHistorialFiltroSerializer(serializers.Serializer):
+    """Texto a buscar en el historial y cantidad máxima de resultados."""
+    q = serializers.CharField(min_length=2, max_length=200)
+    limite = serializers.IntegerField(min_value=1, max_value=LIMITE_MAXIMO, default=LIMITE_POR_DEFECTO)
+
+class HistorialMedicoSerializer(serializers.ModelSerializer):
+    paciente_nombre = serializers.CharField(source='paciente.__str__', read_only=True)
+    medico_nombre = serializers.CharField(source='medico.__str__', read_only=True)
+    
+    class Meta:
+        model = HistorialMedico
+        fields = [
+            'id', 'paciente', 'paciente_nombre', 'medico', 'medico_nombre', 'reserva',
+            'reserva_archivada', 'fecha', 'diagnostico', 'tratamiento', 'observaciones'
+        ]
+        read_only_fields = fields
+
+class HistorialBusquedaSerializer(HistorialMedicoSerializer):
+    rango = serializers.FloatField(read_only=True)
+    
+    class Meta(HistorialMedicoSerializer.Meta):
+        fields = HistorialMedicoSerializer.Meta.fields + ['rango']
+        read_only_fields = fields
+
+class LineaTiempoFiltroSerializer(serializers.Serializer):
+    """Página de la línea de tiempo: `despues` es el cursor `siguiente` de la página anterior."""
+    despues = serializers.CharField(required=False)
+    tamano = serializers.IntegerField(
+        min_value=1, max_value=linea_tiempo.TAMANO_MAXIMO, default=linea_tiempo.TAMANO_POR_DEFECTO
+    )
+    
+    def validate_despues(self, valor):
+        try:
+            linea_tiempo.decodificar(valor)
+        except ValueError:
+            raise serializers.ValidationError('Cursor inválido.')
+        return valor
+
+class EventoSerializer(serializers.Serializer):
+    """Evento de la línea de tiempo con los datos de su reserva, consulta o pago."""
+    tipo = serializers.CharField()
+    momento = serializers.DateTimeField()
+    id = serializers.IntegerField()
+    archivada = serializers.BooleanField()
+    datos = serializers.SerializerMethodField()
+    
+    def get_datos(self, evento):
+        if evento.tipo == 'reserva':
+            serializer = ReservaArchivadaSerializer if evento.archivada else ReservaSerializer
+        elif evento.tipo == 'historial':
+            serializer = HistorialMedicoSerializer
+        else:
+            serializer = CobroSerializer
+        return serializer(evento.objeto).data
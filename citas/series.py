@@ -0,0 +1,212 @@
+"""
+Series de reservas recurrentes.
+
+Las ocurrencias de una SerieReserva se materializan como Reserva normales
+con INSERT masivos, y los cambios sobre "esta y las siguientes" se aplican
+con un UPDATE por conjunto en vez de guardar reserva por reserva.
+"""
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.db import transaction
+from django.utils import timezone
+
+from .agenda import invalidar_agendas
+from .models import (
+    Reserva, Cobro, SerieReserva, FrecuenciaSerie, EstadoReserva, ESTADOS_VIGENTES, OrigenTransicion
+)
+from .services import ConflictoAgenda, bloquear_agendas, cupos_retenidos, _con_reintentos, TAMANO_LOTE
+from .transiciones import transicionar_en_lote
+
+# Tope de ocurrencias por serie (dos años de sesiones semanales)
+MAX_OCURRENCIAS = 104
+
+
+def ocurrencias(serie, desde=None, limite=MAX_OCURRENCIAS):
+    """
+    Fechas de la serie hasta fecha_fin, como máximo `limite`. Cada fecha se
+    calcula desde fecha_inicio (no acumulando pasos) para que las series
+    mensuales que parten el 31 no se corran al 28 después de febrero.
+    """
+    if serie.frecuencia == FrecuenciaSerie.MENSUAL:
+        paso = relativedelta(months=serie.intervalo)
+    else:
+        paso = relativedelta(weeks=serie.intervalo)
+
+    fechas = []
+    n = 0
+    while len(fechas) < limite:
+        fecha = serie.fecha_inicio + paso * n
+        if fecha > serie.fecha_fin:
+            break
+        if desde is None or fecha >= desde:
+            fechas.append(fecha)
+        n += 1
+    return fechas
+
+
+def fechas_en_conflicto(medico_id, fechas, hora_inicio, hora_fin, excluir_serie=None):
+    """
+    Fechas en que el bloque se cruza con otra reserva vigente del médico o
+    con un cupo retenido por la lista de espera, resuelto con una consulta
+    por rango para toda la serie.
+    """
+    if not fechas:
+        return set()
+    ocupadas = Reserva.objects.filter(
+        medico_id=medico_id,
+        fecha__range=(min(fechas), max(fechas)),
+        estado__in=ESTADOS_VIGENTES,
+        hora_inicio__lt=hora_fin,
+        hora_fin__gt=hora_inicio,
+    )
+    if excluir_serie is not None:
+        ocupadas = ocupadas.exclude(serie=excluir_serie)
+    retenidas = cupos_retenidos(
+        medico_id=medico_id, fecha__range=(min(fechas), max(fechas)),
+        hora_inicio__lt=hora_fin, hora_fin__gt=hora_inicio,
+    )
+    pedidas = set(fechas)
+    filas = ocupadas.order_by().values_list('fecha', flat=True).union(
+        retenidas.order_by().values_list('fecha', flat=True)
+    )
+    return {fecha for fecha in filas if fecha in pedidas}
+
+
+def _invalidar_al_confirmar(medico_id, fechas):
+    agendas = {(medico_id, fecha) for fecha in fechas}
+    transaction.on_commit(lambda: invalidar_agendas(agendas))
+
+
+def materializar_serie(serie, omitir_conflictos=True):
+    """
+    Crea las reservas y cobros de las ocurrencias de la serie que aún no
+    existen. Si omitir_conflictos es False y alguna fecha choca con otra
+    reserva, no se crea nada y se lanza ConflictoAgenda.
+    Retorna (reservas_creadas, fechas_en_conflicto).
+    """
+    def operacion():
+        with transaction.atomic():
+            existentes = set(serie.reservas.order_by().values_list('fecha', flat=True))
+            fechas = [fecha for fecha in ocurrencias(serie) if fecha not in existentes]
+            if not fechas:
+                return [], []
+
+            bloquear_agendas({(serie.medico_id, fecha) for fecha in fechas})
+            conflictos = fechas_en_conflicto(serie.medico_id, fechas, serie.hora_inicio, serie.hora_fin)
+            if conflictos and not omitir_conflictos:
+                raise ConflictoAgenda(
+                    'El médico ya tiene reservas en ese horario: '
+                    + ', '.join(fecha.strftime('%d/%m/%Y') for fecha in sorted(conflictos))
+                )
+
+            reservas = Reserva.objects.bulk_create(
+                [
+                    Reserva(
+                        serie=serie, paciente_id=serie.paciente_id, medico_id=serie.medico_id,
+                        fecha=fecha, hora_inicio=serie.hora_inicio, hora_fin=serie.hora_fin,
+                        motivo=serie.motivo,
+                    )
+                    for fecha in fechas if fecha not in conflictos
+                ],
+                batch_size=TAMANO_LOTE,
+            )
+            Cobro.objects.bulk_create(
+                [Cobro(reserva_id=reserva.id, monto=serie.monto) for reserva in reservas],
+                batch_size=TAMANO_LOTE,
+            )
+            _invalidar_al_confirmar(serie.medico_id, [reserva.fecha for reserva in reservas])
+            return reservas, sorted(conflictos)
+
+    return _con_reintentos(operacion)
+
+
+def crear_serie(omitir_conflictos=True, **datos):
+    """Crea la serie y materializa sus ocurrencias en una sola transacción."""
+    with transaction.atomic():
+        serie = SerieReserva.objects.create(**datos)
+        reservas, conflictos = materializar_serie(serie, omitir_conflictos=omitir_conflictos)
+    return serie, reservas, conflictos
+
+
+def _partir_serie(serie, desde, primera_fecha, **cambios):
+    """
+    Cierra la serie el día anterior a `desde` y crea una nueva con los
+    cambios a partir de la primera ocurrencia afectada, para que las
+    reservas previas conserven la regla original.
+    """
+    if desde <= serie.fecha_inicio:
+        for campo, valor in cambios.items():
+            setattr(serie, campo, valor)
+        serie.save()
+        return serie
+
+    nueva = SerieReserva.objects.get(pk=serie.pk)
+    nueva.pk = None
+    nueva.fecha_inicio = primera_fecha
+    for campo, valor in cambios.items():
+        setattr(nueva, campo, valor)
+    nueva.save()
+
+    serie.fecha_fin = desde - timedelta(days=1)
+    serie.save(update_fields=['fecha_fin'])
+    return nueva
+
+
+def modificar_desde(serie, desde, hora_inicio, hora_fin, motivo=None):
+    """
+    Cambia el horario (y opcionalmente el motivo) de esta y las siguientes
+    reservas vigentes de la serie con un único UPDATE.
+    Lanza ConflictoAgenda si el nuevo horario choca con otras reservas.
+    Retorna (serie_resultante, reservas_actualizadas).
+    """
+    cambios = {'hora_inicio': hora_inicio, 'hora_fin': hora_fin}
+    if motivo is not None:
+        cambios['motivo'] = motivo
+
+    def operacion():
+        with transaction.atomic():
+            afectadas = Reserva.objects.filter(serie=serie, fecha__gte=desde, estado__in=ESTADOS_VIGENTES)
+            fechas = sorted(afectadas.values_list('fecha', flat=True))
+            if not fechas:
+                return serie, 0
+
+            bloquear_agendas({(serie.medico_id, fecha) for fecha in fechas})
+            conflictos = fechas_en_conflicto(serie.medico_id, fechas, hora_inicio, hora_fin, excluir_serie=serie)
+            if conflictos:
+                raise ConflictoAgenda(
+                    'El nuevo horario choca con otras reservas: '
+                    + ', '.join(fecha.strftime('%d/%m/%Y') for fecha in sorted(conflictos))
+                )
+
+            resultante = _partir_serie(serie, desde, fechas[0], **cambios)
+            # El recordatorio enviado tenía el horario anterior
+            actualizadas = afectadas.update(
+                serie=resultante, recordatorio_enviado=None, fecha_modificacion=timezone.now(), **cambios
+            )
+            _invalidar_al_confirmar(serie.medico_id, fechas)
+            return resultante, actualizadas
+
+    return _con_reintentos(operacion)
+
+
+def cancelar_desde(serie, desde, usuario=None):
+    """
+    Cancela esta y las siguientes reservas vigentes de la serie con un UPDATE
+    por estado de origen y acorta la serie. Retorna la cantidad de reservas
+    canceladas.
+    """
+    with transaction.atomic():
+        afectadas = Reserva.objects.filter(serie=serie, fecha__gte=desde, estado__in=ESTADOS_VIGENTES)
+        # Registra cada cambio y ofrece los bloques liberados a la lista de espera
+        canceladas = len(transicionar_en_lote(
+            afectadas, EstadoReserva.CANCELADA, OrigenTransicion.SERIE, usuario=usuario
+        ))
+
+        if desde <= serie.fecha_inicio:
+            serie.activa = False
+            serie.save(update_fields=['activa'])
+        else:
+            serie.fecha_fin = min(serie.fecha_fin, desde - timedelta(days=1))
+            serie.save(update_fields=['fecha_fin'])
+    return canceladas
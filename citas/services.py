@@ -0,0 +1,300 @@
+"""
+Servicios de dominio para reservas y cobros.
+"""
+import random
+import time
+import logging
+
+from collections import defaultdict
+
+from django.db import connection, transaction, IntegrityError, OperationalError
+from django.db.models import F
+from django.utils import timezone
+
+from medicos.models import Medico
+from pacientes.models import Paciente
+from .models import (
+    Reserva, Cobro, AgendaDia, SolicitudPago, ResultadoPago, CupoLiberado, EstadoOferta, ESTADOS_VIGENTES
+)
+from .agenda import invalidar_agendas
+from .ingresos import invalidar_mes, mes_de
+from .comprobantes import encolar_cobro
+
+logger = logging.getLogger(__name__)
+
+# Tamaño de lote para los INSERT masivos
+TAMANO_LOTE = 1000
+
+# SQLite serializa las escrituras a nivel de base de datos: bajo contención
+# una transacción puede fallar con "database is locked" y se reintenta.
+REINTENTOS_SQLITE = 8
+
+
+class ConflictoAgenda(Exception):
+    """El bloque solicitado se solapa con otra reserva vigente del médico."""
+
+
+class ClaveReutilizada(Exception):
+    """La clave de idempotencia ya se usó para pagar otro cobro."""
+
+
+def bloquear_agenda(medico_id, fecha):
+    """
+    Toma el bloqueo de la agenda (médico, fecha) dentro de la transacción
+    actual. La primera sentencia es un UPDATE, de modo que en PostgreSQL queda
+    un bloqueo de fila hasta el commit y en SQLite se adquiere el bloqueo de
+    escritura antes de leer las reservas existentes.
+    """
+    bloqueadas = AgendaDia.objects.filter(medico_id=medico_id, fecha=fecha).update(version=F('version') + 1)
+    if not bloqueadas:
+        AgendaDia.objects.get_or_create(medico_id=medico_id, fecha=fecha)
+        AgendaDia.objects.filter(medico_id=medico_id, fecha=fecha).update(version=F('version') + 1)
+
+
+def cupos_retenidos(**filtros):
+    """
+    Cupos liberados con una oferta de la lista de espera pendiente y sin
+    vencer: quedan reservados para el paciente al que se ofrecieron hasta que
+    responda o venza el plazo, y ocupan la agenda igual que una reserva.
+    """
+    return CupoLiberado.objects.filter(
+        ofertas__estado=EstadoOferta.PENDIENTE, ofertas__vence_en__gt=timezone.now(), **filtros
+    )
+
+
+def hay_solapamiento(medico_id, fecha, hora_inicio, hora_fin, excluir_id=None, excluir_cupo=None):
+    """
+    Indica si el bloque se cruza con alguna reserva vigente del médico o con
+    un cupo retenido por una oferta de la lista de espera.
+    """
+    solapadas = Reserva.objects.filter(
+        medico_id=medico_id,
+        fecha=fecha,
+        estado__in=ESTADOS_VIGENTES,
+        hora_inicio__lt=hora_fin,
+        hora_fin__gt=hora_inicio,
+    )
+    if excluir_id is not None:
+        solapadas = solapadas.exclude(pk=excluir_id)
+    if solapadas.exists():
+        return True
+    retenidos = cupos_retenidos(
+        medico_id=medico_id, fecha=fecha, hora_inicio__lt=hora_fin, hora_fin__gt=hora_inicio
+    )
+    if excluir_cupo is not None:
+        retenidos = retenidos.exclude(pk=excluir_cupo)
+    return retenidos.exists()
+
+
+def _con_reintentos(operacion):
+    """Ejecuta la operación reintentando los bloqueos transitorios de SQLite."""
+    if connection.vendor != 'sqlite':
+        return operacion()
+    for intento in range(REINTENTOS_SQLITE):
+        try:
+            return operacion()
+        except OperationalError as e:
+            if 'locked' not in str(e) or intento == REINTENTOS_SQLITE - 1:
+                raise
+            time.sleep(random.uniform(0, 0.01 * 2 ** intento))
+
+
+def crear_reserva(reserva, monto=0):
+    """
+    Guarda una reserva nueva (aún sin guardar) junto a su cobro, garantizando
+    que no se solape con otra reserva vigente del mismo médico y día.
+    Lanza ConflictoAgenda si el bloque ya está ocupado.
+    """
+    def operacion():
+        # Un intento revertido pudo haber asignado pk a la instancia
+        reserva.pk = None
+        with transaction.atomic():
+            bloquear_agenda(reserva.medico_id, reserva.fecha)
+            if hay_solapamiento(reserva.medico_id, reserva.fecha, reserva.hora_inicio, reserva.hora_fin):
+                raise ConflictoAgenda('El médico ya tiene una reserva en ese horario.')
+            reserva.save()
+            Cobro.objects.create(reserva=reserva, monto=monto)
+        return reserva
+
+    return _con_reintentos(operacion)
+
+
+def bloquear_agendas(pares):
+    """
+    Variante masiva de bloquear_agenda para un conjunto de pares
+    (medico_id, fecha). Crea las filas faltantes y las bloquea en orden
+    determinista para evitar interbloqueos entre lotes concurrentes.
+    """
+    medico_ids = {medico_id for medico_id, _ in pares}
+    fechas = [fecha for _, fecha in pares]
+    AgendaDia.objects.bulk_create(
+        [AgendaDia(medico_id=medico_id, fecha=fecha) for medico_id, fecha in sorted(pares)],
+        ignore_conflicts=True,
+        batch_size=TAMANO_LOTE,
+    )
+    # Se bloquean los días de los médicos involucrados dentro del rango: un
+    # superconjunto de los pares pedidos que no necesita miles de OR
+    ids = list(
+        AgendaDia.objects.select_for_update()
+        .filter(medico_id__in=medico_ids, fecha__range=(min(fechas), max(fechas)))
+        .order_by('medico_id', 'fecha')
+        .values_list('id', flat=True)
+    )
+    AgendaDia.objects.filter(id__in=ids).update(version=F('version') + 1)
+
+
+def _validar_lote(items, medicos_existentes):
+    """
+    Valida referencias y solapamientos de un lote completo. Retorna una lista
+    con None para los ítems válidos o un dict de errores para los rechazados.
+    """
+    medico_ids = {item['medico'] for item in items}
+    paciente_ids = {item['paciente'] for item in items}
+    pacientes_existentes = set(Paciente.objects.filter(id__in=paciente_ids).values_list('id', flat=True))
+
+    # Índice de bloques ocupados por (médico, fecha) con las reservas vigentes
+    ocupados = defaultdict(list)
+    fechas = [item['fecha'] for item in items]
+    existentes = Reserva.objects.filter(
+        medico_id__in=medico_ids,
+        fecha__range=(min(fechas), max(fechas)),
+        estado__in=ESTADOS_VIGENTES,
+    ).values_list('medico_id', 'fecha', 'hora_inicio', 'hora_fin')
+    retenidos = cupos_retenidos(
+        medico_id__in=medico_ids, fecha__range=(min(fechas), max(fechas)),
+    ).values_list('medico_id', 'fecha', 'hora_inicio', 'hora_fin')
+    for medico_id, fecha, hora_inicio, hora_fin in [*existentes, *retenidos]:
+        ocupados[(medico_id, fecha)].append((hora_inicio, hora_fin))
+
+    errores = []
+    for item in items:
+        error = {}
+        if item['medico'] not in medicos_existentes:
+            error['medico'] = 'El médico no existe.'
+        if item['paciente'] not in pacientes_existentes:
+            error['paciente'] = 'El paciente no existe.'
+        if not error:
+            bloques = ocupados[(item['medico'], item['fecha'])]
+            if any(inicio < item['hora_fin'] and fin > item['hora_inicio'] for inicio, fin in bloques):
+                error['horario'] = 'El médico ya tiene una reserva en ese horario.'
+            else:
+                # Los ítems aceptados también ocupan la agenda del resto del lote
+                bloques.append((item['hora_inicio'], item['hora_fin']))
+        errores.append(error or None)
+    return errores
+
+
+def crear_reservas_lote(items):
+    """
+    Crea un lote de reservas (dicts ya validados por el serializer) con sus
+    cobros usando INSERT masivos dentro de una sola transacción.
+
+    Los ítems que no pasan la validación se informan y no se crean; el resto
+    se inserta igualmente. Retorna una lista de resultados por ítem con
+    `indice`, `creada` y `id` o `errores`.
+    """
+    if not items:
+        return []
+    
+    def operacion():
+        medico_ids = {item['medico'] for item in items}
+        medicos_existentes = set(Medico.objects.filter(id__in=medico_ids).values_list('id', flat=True))
+        with transaction.atomic():
+            pares = {(item['medico'], item['fecha']) for item in items if item['medico'] in medicos_existentes}
+            if pares:
+                bloquear_agendas(pares)
+            errores = _validar_lote(items, medicos_existentes)
+
+            validos = [i for i, error in enumerate(errores) if error is None]
+            reservas = Reserva.objects.bulk_create(
+                [
+                    Reserva(
+                        medico_id=items[i]['medico'],
+                        paciente_id=items[i]['paciente'],
+                        fecha=items[i]['fecha'],
+                        hora_inicio=items[i]['hora_inicio'],
+                        hora_fin=items[i]['hora_fin'],
+                        motivo=items[i]['motivo'],
+                    )
+                    for i in validos
+                ],
+                batch_size=TAMANO_LOTE,
+            )
+            Cobro.objects.bulk_create(
+                [
+                    Cobro(reserva_id=reserva.id, monto=items[i].get('monto', 0))
+                    for i, reserva in zip(validos, reservas)
+                ],
+                batch_size=TAMANO_LOTE,
+            )
+            # bulk_create no emite señales: se invalidan las agendas a mano
+            agendas = {(reserva.medico_id, reserva.fecha) for reserva in reservas}
+            transaction.on_commit(lambda: invalidar_agendas(agendas))
+
+        ids = dict(zip(validos, (reserva.id for reserva in reservas)))
+        return [
+            {'indice': i, 'creada': True, 'id': ids[i]} if error is None
+            else {'indice': i, 'creada': False, 'errores': error}
+            for i, error in enumerate(errores)
+        ]
+
+    return _con_reintentos(operacion)
+
+
+def _repetir_pago(solicitud, cobro):
+    if solicitud.cobro_id != cobro.pk:
+        raise ClaveReutilizada('La clave de idempotencia ya se usó para otro cobro.')
+    return solicitud, True
+
+
+def pagar_cobro(cobro, metodo_pago, clave=None, usuario=None):
+    """
+    Marca el cobro como pagado con un UPDATE condicional sobre pagado=False,
+    por lo que de varias solicitudes simultáneas solo una lo paga. Con
+    `clave` el resultado se registra en SolicitudPago y los reintentos con
+    la misma clave reciben ese resultado sin volver a pagar.
+
+    Retorna (solicitud, repetida); la solicitud queda sin guardar si no hubo
+    clave. Lanza ClaveReutilizada si la clave pertenece a otro cobro.
+    """
+    if clave:
+        previa = SolicitudPago.objects.filter(clave=clave).first()
+        if previa is not None:
+            return _repetir_pago(previa, cobro)
+
+    def operacion():
+        with transaction.atomic():
+            ahora = timezone.now()
+            pagado = Cobro.objects.filter(pk=cobro.pk, pagado=False).update(
+                pagado=True, fecha_pago=ahora, metodo_pago=metodo_pago
+            )
+            if pagado:
+                solicitud = SolicitudPago(
+                    resultado=ResultadoPago.PAGADO, fecha_pago=ahora, metodo_pago=metodo_pago
+                )
+                # QuerySet.update no emite señales: se invalidan agenda e ingresos a mano
+                agenda = (cobro.reserva.medico_id, cobro.reserva.fecha)
+                mes = mes_de(ahora)
+                transaction.on_commit(lambda: (invalidar_agendas([agenda]), invalidar_mes(mes)))
+                transaction.on_commit(lambda: encolar_cobro(cobro.pk))
+            else:
+                fecha_pago, metodo = Cobro.objects.filter(pk=cobro.pk).values_list('fecha_pago', 'metodo_pago').get()
+                solicitud = SolicitudPago(
+                    resultado=ResultadoPago.YA_PAGADO, fecha_pago=fecha_pago, metodo_pago=metodo
+                )
+            solicitud.cobro = cobro
+            solicitud.clave = clave
+            solicitud.usuario = usuario
+            if clave:
+                solicitud.save()
+        return solicitud
+
+    try:
+        solicitud = _con_reintentos(operacion)
+    except IntegrityError:
+        # Un reintento simultáneo con la misma clave se registró primero y
+        # este intento se revirtió completo: se responde el resultado de aquel
+        return _repetir_pago(SolicitudPago.objects.get(clave=clave), cobro)
+
+    cobro.pagado, cobro.fecha_pago, cobro.metodo_pago = True, solicitud.fecha_pago, solicitud.metodo_pago
+    return solicitud, False
@@ -0,0 +1,106 @@
+"""
+Invalidación de la agenda del día cacheada (ver citas.agenda), de las
+instantáneas mensuales de ingresos (ver citas.ingresos) y del filtro de
+médicos del admin (ver citas.listados).
+
+Las operaciones masivas (bulk_create, QuerySet.update) no emiten estas
+señales: quien las use debe llamar a invalidar_agendas explícitamente. Los
+borrados masivos sí las emiten fila a fila; pueden suspenderse con
+sin_invalidacion() si el proceso invalida por su cuenta.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+
+from .agenda import invalidar_agendas
+from .ingresos import invalidar_mes, mes_de
+from .listados import invalidar_medicos
+from .models import Reserva, Cobro, HistorialMedico
+from medicos.models import Medico
+
+
+_estado = threading.local()
+
+
+@contextmanager
+def sin_invalidacion():
+    """Suspende la invalidación por señales en el hilo actual."""
+    anterior = getattr(_estado, 'suspendida', False)
+    _estado.suspendida = True
+    try:
+        yield
+    finally:
+        _estado.suspendida = anterior
+
+
+def _suspendida():
+    return getattr(_estado, 'suspendida', False)
+
+
+def _invalidar_al_confirmar(*pares):
+    # Invalidar antes del commit permitiría que otro proceso reconstruya la
+    # agenda sin ver el cambio y la guarde bajo la versión nueva
+    pares = [par for par in pares if None not in par]
+    if pares:
+        transaction.on_commit(lambda: invalidar_agendas(pares))
+
+
+def _agenda_de_reserva(reserva_id):
+    """(medico_id, fecha) de una reserva, o (None, None) si no existe."""
+    if reserva_id is None:
+        return None, None
+    par = Reserva.objects.filter(pk=reserva_id).values_list('medico_id', 'fecha').first()
+    return par or (None, None)
+
+
+def _agenda_relacionada(instancia):
+    # Si la reserva ya está cargada en la instancia se evita la consulta
+    reserva = instancia._state.fields_cache.get('reserva')
+    if reserva is not None:
+        return reserva.medico_id, reserva.fecha
+    return _agenda_de_reserva(instancia.reserva_id)
+
+
+@receiver(post_init, sender=Reserva)
+def recordar_agenda_original(sender, instance, **kwargs):
+    # Permite invalidar también el día anterior si la reserva se reprograma
+    instance._agenda_original = (instance.__dict__.get('medico_id'), instance.__dict__.get('fecha'))
+
+
+@receiver(post_save, sender=Reserva)
+@receiver(post_delete, sender=Reserva)
+def invalidar_por_reserva(sender, instance, **kwargs):
+    if _suspendida():
+        return
+    actual = (instance.medico_id, instance.fecha)
+    original = getattr(instance, '_agenda_original', None) or actual
+    _invalidar_al_confirmar(actual, original)
+    instance._agenda_original = actual
+
+
+@receiver(post_save, sender=Cobro)
+@receiver(post_delete, sender=Cobro)
+@receiver(post_save, sender=HistorialMedico)
+@receiver(post_delete, sender=HistorialMedico)
+def invalidar_por_relacionado(sender, instance, **kwargs):
+    if _suspendida():
+        return
+    _invalidar_al_confirmar(_agenda_relacionada(instance))
+
+
+@receiver(post_save, sender=Cobro)
+@receiver(post_delete, sender=Cobro)
+def invalidar_ingresos(sender, instance, **kwargs):
+    if _suspendida() or instance.fecha_pago is None:
+        return
+    mes = mes_de(instance.fecha_pago)
+    transaction.on_commit(lambda: invalidar_mes(mes))
+
+
+@receiver(post_save, sender=Medico)
+@receiver(post_delete, sender=Medico)
+def invalidar_filtro_medicos(sender, instance, **kwargs):
+    transaction.on_commit(invalidar_medicos)
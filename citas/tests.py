@@ -1,3 +1,1958 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import logging
+import os
+import random
+import tempfile
+from io import BytesIO, StringIO
+import time as reloj
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db import IntegrityError
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from docx import Document
+from rest_framework.test import APIClient
+
+from medicos.models import Medico, Especialidad
+from pacientes.models import Paciente
+from .models import (
+    Reserva, Cobro, EstadoReserva, ESTADOS_VIGENTES, SuscripcionCalendario,
+    SerieReserva, FrecuenciaSerie, SolicitudEspera, CupoLiberado, OfertaCupo,
+    EstadoEspera, EstadoCupo, EstadoOferta, ReservaExpirada, HistorialMedico,
+    ReservaArchivada, CobroArchivado, SolicitudPago, ResultadoPago, TransicionReserva, OrigenTransicion,
+    Eliminacion, EstadoEliminacion
+)
+from .services import crear_reserva, crear_reservas_lote, pagar_cobro, ConflictoAgenda, ClaveReutilizada
+from .agenda import obtener_agenda, estadisticas_cache
+from .disponibilidad import bloques_libres, calcular_disponibilidad, parsear_parametros, MAX_DIAS_RANGO
+from .series import ocurrencias, crear_serie, modificar_desde, cancelar_desde
+from .expiracion import expirar_pendientes, limite_expiracion
+from .lista_espera import procesar_pendientes, ofrecer_cupo, aceptar_oferta, rechazar_oferta, OfertaNoDisponible
+from .archivo import archivar
+from .comprobantes import datos_comprobante, ruta_comprobante
+from .transiciones import transicionar, transicionar_en_lote, TransicionInvalida
+from .listados import QuerySetListado, conteo_estimado, opciones_medicos
+from .ocupacion import minutos_por_hora, dias_de_la_semana
+from .eliminacion import (
+    eliminar_reservas, eliminar_usuario, procesar as procesar_eliminacion, procesar_pendientes as procesar_eliminaciones
+)
+
+logger = logging.getLogger(__name__)
+
+
+def crear_medico(username='medico', inicio=time(8, 0), fin=time(18, 0)):
+    user = User.objects.create_user(username=username)
+    return Medico.objects.create(user=user, horario_inicio=inicio, horario_fin=fin)
+
+
+def crear_paciente(username='paciente'):
+    user = User.objects.create_user(username=username)
+    return Paciente.objects.create(user=user)
+
+
+def solapamientos(medico):
+    """Pares de reservas vigentes del médico que se cruzan en el mismo día."""
+    reservas = list(
+        Reserva.objects.filter(medico=medico, estado__in=ESTADOS_VIGENTES)
+        .order_by('fecha', 'hora_inicio')
+        .values_list('fecha', 'hora_inicio', 'hora_fin')
+    )
+    return [
+        (a, b) for a, b in zip(reservas, reservas[1:])
+        if a[0] == b[0] and b[1] < a[2]
+    ]
+
+
+class CrearReservaTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.fecha = date.today() + timedelta(days=1)
+
+    def nueva_reserva(self, inicio, fin):
+        return Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=self.fecha,
+            hora_inicio=inicio, hora_fin=fin, motivo='Control'
+        )
+
+    def test_crea_reserva_y_cobro(self):
+        reserva = crear_reserva(self.nueva_reserva(time(9, 0), time(9, 30)))
+        self.assertTrue(Cobro.objects.filter(reserva=reserva).exists())
+
+    def test_rechaza_solapamiento(self):
+        crear_reserva(self.nueva_reserva(time(9, 0), time(9, 30)))
+        with self.assertRaises(ConflictoAgenda):
+            crear_reserva(self.nueva_reserva(time(9, 15), time(9, 45)))
+        self.assertEqual(Reserva.objects.count(), 1)
+
+    def test_bloques_contiguos_y_canceladas_no_chocan(self):
+        crear_reserva(self.nueva_reserva(time(9, 0), time(9, 30)))
+        crear_reserva(self.nueva_reserva(time(9, 30), time(10, 0)))
+        Reserva.objects.filter(hora_inicio=time(9, 0)).update(estado=EstadoReserva.CANCELADA)
+        crear_reserva(self.nueva_reserva(time(9, 0), time(9, 30)))
+        self.assertEqual(Reserva.objects.filter(estado__in=ESTADOS_VIGENTES).count(), 2)
+
+
+class ReservaListaTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.inicio = date.today()
+        self.client.force_login(self.medico.user)
+
+    def crear_reservas(self, cantidad):
+        pacientes = [crear_paciente(f'p{Reserva.objects.count()}_{n}') for n in range(3)]
+        Reserva.objects.bulk_create([
+            Reserva(
+                paciente=pacientes[n % 3], medico=self.medico,
+                fecha=self.inicio + timedelta(days=n // 10),
+                hora_inicio=time(8 + n % 10, 0), hora_fin=time(8 + n % 10, 30),
+                motivo='Control'
+            )
+            for n in range(cantidad)
+        ])
+
+    def consultas_pagina(self):
+        with CaptureQueriesContext(connection) as contexto:
+            response = self.client.get(reverse('citas:reserva_lista'))
+        self.assertEqual(response.status_code, 200)
+        return len(contexto.captured_queries)
+
+    def test_cantidad_de_consultas_constante(self):
+        self.crear_reservas(5)
+        pocas = self.consultas_pagina()
+        self.crear_reservas(60)
+        self.assertEqual(self.consultas_pagina(), pocas)
+
+    def test_recorre_todas_las_paginas_sin_repetir(self):
+        self.crear_reservas(45)
+        vistas, cursor = [], None
+        while True:
+            response = self.client.get(reverse('citas:reserva_lista'), {'despues': cursor} if cursor else {})
+            vistas.extend(reserva.id for reserva in response.context['reservas'])
+            cursor = response.context['pagina'].siguiente
+            if not cursor:
+                break
+        esperadas = list(Reserva.objects.order_by('fecha', 'hora_inicio', 'id').values_list('id', flat=True))
+        self.assertEqual(vistas, esperadas)
+
+        anterior = response.context['pagina'].anterior
+        response = self.client.get(reverse('citas:reserva_lista'), {'antes': anterior})
+        self.assertEqual([r.id for r in response.context['reservas']], esperadas[20:40])
+
+    def test_retroceder_y_avanzar_no_salta_filas(self):
+        self.crear_reservas(45)
+        esperadas = list(Reserva.objects.order_by('fecha', 'hora_inicio', 'id').values_list('id', flat=True))
+        url = reverse('citas:reserva_lista')
+        segunda = self.client.get(url, {'despues': self.client.get(url).context['pagina'].siguiente})
+        tercera = self.client.get(url, {'despues': segunda.context['pagina'].siguiente})
+
+        # De la tercera a la segunda y otra vez adelante
+        atras = self.client.get(url, {'antes': tercera.context['pagina'].anterior})
+        self.assertEqual([r.id for r in atras.context['reservas']], esperadas[20:40])
+        adelante = self.client.get(url, {'despues': atras.context['pagina'].siguiente})
+        self.assertEqual([r.id for r in adelante.context['reservas']], esperadas[40:])
+
+    def test_cursor_con_valores_invalidos(self):
+        self.crear_reservas(5)
+        for valores in (['x', 'y', 'z'], ['2024-01-01', '25:00:00', 1], ['2024-01-01', '09:00:00', None]):
+            cursor = base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+            response = self.client.get(reverse('citas:reserva_lista'), {'despues': cursor})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.context['reservas']), 5)
+            self.assertContains(response, 'El enlace de paginación no es válido.')
+
+    def test_filtra_por_estado_y_rango(self):
+        self.crear_reservas(30)
+        Reserva.objects.filter(fecha=self.inicio).update(estado=EstadoReserva.CONFIRMADA)
+        response = self.client.get(reverse('citas:reserva_lista'), {
+            'estado': 'confirmada', 'desde': self.inicio.isoformat(), 'hasta': self.inicio.isoformat()
+        })
+        self.assertEqual(len(response.context['reservas']), 10)
+
+
+class ReservaDetalleTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.reserva = crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=date.today(),
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+        ))
+        self.url = reverse('citas:reserva_detalle', args=[self.reserva.pk])
+
+    def test_una_consulta_de_datos_por_rol(self):
+        for user in (self.paciente.user, self.medico.user):
+            self.client.force_login(user)
+            # Sesión, usuario y la reserva con todas sus relaciones
+            with self.assertNumQueries(3):
+                response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['cobro'].reserva_id, self.reserva.pk)
+
+    def test_rechaza_usuario_ajeno(self):
+        self.client.force_login(crear_paciente('otro').user)
+        response = self.client.get(self.url)
+        self.assertRedirects(response, reverse('citas:reserva_lista'))
+
+
+class CalendarioFeedTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.reserva = crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=date.today(),
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control; presión, arterial'
+        ))
+        self.suscripcion = SuscripcionCalendario.objects.create(medico=self.medico)
+        self.url = reverse('citas:calendario_feed', args=[self.suscripcion.token])
+
+    def test_feed_y_304_condicional(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        contenido = b''.join(response.streaming_content).decode()
+        self.assertIn(f'UID:reserva-{self.reserva.pk}@mediconecta', contenido)
+        self.assertIn('DESCRIPTION:Control\\; presión\\, arterial', contenido)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_cambia_con_la_agenda(self):
+        etag = self.client.get(self.url)['ETag']
+        Reserva.objects.filter(pk=self.reserva.pk).delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_invalido(self):
+        response = self.client.get(reverse('citas:calendario_feed', args=['no-existe']))
+        self.assertEqual(response.status_code, 404)
+
+
+class AgendaCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.fecha = date.today()
+        self.reserva = crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=self.fecha,
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+        ), monto=20000)
+
+    def test_segunda_lectura_sin_consultas(self):
+        with self.assertNumQueries(1):
+            obtener_agenda(self.medico.id, self.fecha)
+        with self.assertNumQueries(0):
+            agenda = obtener_agenda(self.medico.id, self.fecha)
+        self.assertEqual(agenda['monto_total'], 20000)
+        self.assertEqual(estadisticas_cache(), {'hits': 1, 'misses': 1, 'ratio_aciertos': 0.5})
+
+    def test_senales_invalidan_la_agenda(self):
+        obtener_agenda(self.medico.id, self.fecha)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reserva.cobro.marcar_como_pagado('Efectivo')
+        self.assertTrue(obtener_agenda(self.medico.id, self.fecha)['reservas'][0]['pagado'])
+
+        self.reserva.estado = EstadoReserva.CANCELADA
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reserva.save()
+        agenda = obtener_agenda(self.medico.id, self.fecha)
+        self.assertEqual(agenda['por_estado']['cancelada'], 1)
+        self.assertEqual(agenda['monto_total'], 0)
+
+        # Reprogramar invalida también el día original
+        self.reserva.fecha = self.fecha + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reserva.save()
+        self.assertEqual(obtener_agenda(self.medico.id, self.fecha)['reservas'], [])
+
+    def test_carga_masiva_invalida_la_agenda(self):
+        obtener_agenda(self.medico.id, self.fecha)
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_reservas_lote([{
+                'medico': self.medico.id, 'paciente': self.paciente.id, 'fecha': self.fecha,
+                'hora_inicio': time(10, 0), 'hora_fin': time(10, 30), 'motivo': 'Control', 'monto': 0
+            }])
+        self.assertEqual(len(obtener_agenda(self.medico.id, self.fecha)['reservas']), 2)
+
+
+class ReservaLoteApiTests(TestCase):
+    url = '/citas/api/reservas/lote/'
+
+    def setUp(self):
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.fecha = date.today() + timedelta(days=1)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def item(self, inicio, fin, **extra):
+        return {
+            'paciente': self.paciente.id, 'medico': self.medico.id,
+            'fecha': self.fecha.isoformat(), 'hora_inicio': inicio,
+            'hora_fin': fin, 'motivo': 'Control', **extra
+        }
+
+    def test_crea_lote_con_cobros(self):
+        response = self.client.post(self.url, {'reservas': [
+            self.item('09:00', '09:30', monto='15000.00'),
+            self.item('09:30', '10:00'),
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['creadas'], 2)
+        self.assertEqual(Cobro.objects.filter(monto=15000).count(), 1)
+
+    def test_informa_solapamientos_por_item(self):
+        crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=self.fecha,
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Existente'
+        ))
+        response = self.client.post(self.url, {'reservas': [
+            self.item('09:15', '09:45'),
+            self.item('10:00', '10:30'),
+            self.item('10:15', '10:45'),
+            self.item('11:00', '11:30', medico=999),
+        ]}, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([r['creada'] for r in response.data['resultados']], [False, True, False, False])
+        self.assertIn('medico', response.data['resultados'][3]['errores'])
+        self.assertEqual(solapamientos(self.medico), [])
+
+    def test_solo_personal(self):
+        self.client.force_authenticate(self.paciente.user)
+        response = self.client.post(self.url, {'reservas': [self.item('09:00', '09:30')]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class SerieReservaTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.inicio = date.today() + timedelta(days=7)
+
+    def datos(self, **extra):
+        return {
+            'paciente': self.paciente, 'medico': self.medico,
+            'frecuencia': FrecuenciaSerie.SEMANAL, 'intervalo': 1,
+            'fecha_inicio': self.inicio, 'fecha_fin': self.inicio + timedelta(weeks=9),
+            'hora_inicio': time(9, 0), 'hora_fin': time(9, 45), 'motivo': 'Kinesiología',
+            'monto': 20000, **extra
+        }
+
+    def test_ocurrencias_mensuales_sin_corrimiento(self):
+        serie = SerieReserva(
+            frecuencia=FrecuenciaSerie.MENSUAL, intervalo=1,
+            fecha_inicio=date(2027, 1, 31), fecha_fin=date(2027, 5, 31)
+        )
+        self.assertEqual(ocurrencias(serie), [
+            date(2027, 1, 31), date(2027, 2, 28), date(2027, 3, 31), date(2027, 4, 30), date(2027, 5, 31)
+        ])
+
+    def test_materializa_en_bloque_omitiendo_conflictos(self):
+        crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=self.inicio + timedelta(weeks=2),
+            hora_inicio=time(9, 30), hora_fin=time(10, 0), motivo='Existente'
+        ))
+        # Serie, agendas, conflicto e INSERT masivos: sin consultas por ocurrencia
+        with self.assertNumQueries(12):
+            serie, reservas, conflictos = crear_serie(**self.datos())
+        self.assertEqual(len(reservas), 9)
+        self.assertEqual(conflictos, [self.inicio + timedelta(weeks=2)])
+        self.assertEqual(Cobro.objects.filter(reserva__serie=serie, monto=20000).count(), 9)
+        self.assertEqual(solapamientos(self.medico), [])
+
+    def test_modificar_desde_parte_la_serie(self):
+        serie, _, _ = crear_serie(**self.datos())
+        desde = self.inicio + timedelta(weeks=5)
+        nueva, actualizadas = modificar_desde(serie, desde, time(15, 0), time(15, 45))
+
+        self.assertEqual(actualizadas, 5)
+        self.assertNotEqual(nueva.pk, serie.pk)
+        serie.refresh_from_db()
+        self.assertEqual(serie.fecha_fin, desde - timedelta(days=1))
+        self.assertEqual(serie.reservas.filter(hora_inicio=time(9, 0)).count(), 5)
+        self.assertEqual(nueva.reservas.filter(hora_inicio=time(15, 0)).count(), 5)
+
+    def test_modificar_desde_rechaza_conflictos(self):
+        serie, _, _ = crear_serie(**self.datos())
+        crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=self.inicio + timedelta(weeks=8),
+            hora_inicio=time(15, 0), hora_fin=time(15, 30), motivo='Existente'
+        ))
+        with self.assertRaises(ConflictoAgenda):
+            modificar_desde(serie, self.inicio, time(15, 0), time(15, 45))
+        self.assertFalse(serie.reservas.filter(hora_inicio=time(15, 0)).exists())
+
+    def test_cancelar_desde(self):
+        serie, _, _ = crear_serie(**self.datos())
+        canceladas = cancelar_desde(serie, self.inicio + timedelta(weeks=7))
+        self.assertEqual(canceladas, 3)
+        self.assertEqual(serie.reservas.filter(estado=EstadoReserva.CANCELADA).count(), 3)
+        self.assertEqual(serie.fecha_fin, self.inicio + timedelta(weeks=7, days=-1))
+
+    def test_api_crea_y_cancela(self):
+        client = APIClient()
+        client.force_authenticate(self.medico.user)
+        response = client.post('/citas/api/series/', {
+            'paciente': self.paciente.id, 'medico': self.medico.id, 'frecuencia': 'semanal',
+            'intervalo': 2, 'fecha_inicio': self.inicio.isoformat(),
+            'fecha_fin': (self.inicio + timedelta(weeks=8)).isoformat(),
+            'hora_inicio': '09:00', 'hora_fin': '09:45', 'motivo': 'Control', 'monto': '0'
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['creadas'], 5)
+
+        serie_id = response.data['serie']['id']
+        client.force_authenticate(self.paciente.user)
+        response = client.post(f'/citas/api/series/{serie_id}/cancelar/', {
+            'desde': self.inicio.isoformat()
+        }, format='json')
+        self.assertEqual(response.data['canceladas'], 5)
+        self.assertFalse(response.data['serie']['activa'])
+
+    def test_api_rechaza_series_sobre_el_tope(self):
+        client = APIClient()
+        client.force_authenticate(self.medico.user)
+        datos = {
+            'paciente': self.paciente.id, 'medico': self.medico.id, 'frecuencia': 'semanal',
+            'intervalo': 1, 'fecha_inicio': self.inicio.isoformat(),
+            'hora_inicio': '09:00', 'hora_fin': '09:45', 'motivo': 'Control', 'monto': '0'
+        }
+        # 104 semanas después del inicio es la ocurrencia 105
+        response = client.post('/citas/api/series/', {
+            **datos, 'fecha_fin': (self.inicio + timedelta(weeks=104)).isoformat()
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fecha_fin', response.data)
+        self.assertFalse(SerieReserva.objects.exists())
+
+        response = client.post('/citas/api/series/', {
+            **datos, 'fecha_fin': (self.inicio + timedelta(weeks=103)).isoformat()
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['creadas'], 104)
+
+    def test_api_solo_el_medico_crea(self):
+        client = APIClient()
+        client.force_authenticate(self.paciente.user)
+        datos = self.datos(paciente=self.paciente.id, medico=self.medico.id)
+        response = client.post('/citas/api/series/', datos, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(LISTA_ESPERA_EN_SEGUNDO_PLANO=False)
+class ListaEsperaTests(TestCase):
+    def setUp(self):
+        self.especialidad = Especialidad.objects.create(nombre='Kinesiología')
+        self.medico = crear_medico()
+        self.medico.especialidad = self.especialidad
+        self.medico.save()
+        self.fecha = date.today() + timedelta(days=3)
+        self.reserva = crear_reserva(Reserva(
+            paciente=crear_paciente('titular'), medico=self.medico, fecha=self.fecha,
+            hora_inicio=time(10, 0), hora_fin=time(10, 30), motivo='Control'
+        ))
+
+    def esperar(self, username, **extra):
+        datos = {
+            'paciente': crear_paciente(username), 'medico': self.medico,
+            'fecha_desde': self.fecha - timedelta(days=1), 'fecha_hasta': self.fecha + timedelta(days=1),
+            'motivo': 'Lista de espera', **extra
+        }
+        return SolicitudEspera.objects.create(**datos)
+
+    def cancelar(self):
+        self.client.force_login(self.reserva.paciente.user)
+        return self.client.post(reverse('citas:reserva_cancelar', args=[self.reserva.pk]))
+
+    def test_cancelar_no_depende_del_largo_de_la_lista(self):
+        for n in range(30):
+            self.esperar(f'espera{n}')
+        self.client.force_login(self.reserva.paciente.user)
+        with CaptureQueriesContext(connection) as consultas:
+            self.cancelar()
+        self.assertEqual(CupoLiberado.objects.filter(estado=EstadoCupo.PENDIENTE).count(), 1)
+        self.assertFalse(OfertaCupo.objects.exists())
+        self.assertFalse(any('citas_solicitudespera' in q['sql'] for q in consultas.captured_queries))
+
+    def test_ofrece_al_mejor_candidato(self):
+        self.esperar('antiguo')
+        prioritario = self.esperar('prioritario', prioridad=5, medico=None, especialidad=self.especialidad)
+        self.esperar('fuera_de_rango', fecha_desde=self.fecha + timedelta(days=5), fecha_hasta=self.fecha + timedelta(days=9))
+        self.cancelar()
+
+        self.assertEqual(procesar_pendientes()['ofrecidas'], 1)
+        oferta = OfertaCupo.objects.get()
+        self.assertEqual(oferta.solicitud, prioritario)
+        self.assertEqual(SolicitudEspera.objects.get(pk=prioritario.pk).estado, EstadoEspera.OFRECIDA)
+
+    def test_una_sola_oferta_pendiente_por_cupo(self):
+        self.esperar('a')
+        self.esperar('b')
+        self.cancelar()
+        cupo = CupoLiberado.objects.select_related('medico').get()
+        self.assertIsNotNone(ofrecer_cupo(cupo))
+        # Un segundo procesador con la misma fila no logra reclamar el cupo
+        self.assertIsNone(ofrecer_cupo(cupo))
+        with self.assertRaises(IntegrityError):
+            OfertaCupo.objects.create(
+                cupo=cupo, solicitud=SolicitudEspera.objects.get(paciente__user__username='b'),
+                vence_en=timezone.now() + timedelta(minutes=5)
+            )
+
+    def test_fallo_al_ofrecer_deja_el_cupo_pendiente(self):
+        solicitud = self.esperar('espera')
+        self.cancelar()
+        cupo = CupoLiberado.objects.select_related('medico').get()
+        with mock.patch.object(OfertaCupo.objects, 'create', side_effect=RuntimeError('caída')):
+            with self.assertRaises(RuntimeError):
+                ofrecer_cupo(cupo)
+        self.assertEqual(CupoLiberado.objects.get().estado, EstadoCupo.PENDIENTE)
+        self.assertEqual(SolicitudEspera.objects.get(pk=solicitud.pk).estado, EstadoEspera.ESPERANDO)
+        # La siguiente pasada lo ofrece normalmente
+        self.assertEqual(procesar_pendientes()['ofrecidas'], 1)
+
+    def test_la_oferta_retiene_el_bloque_hasta_que_vence(self):
+        solicitud = self.esperar('espera')
+        self.cancelar()
+        procesar_pendientes()
+        oferta = OfertaCupo.objects.get()
+        otra = Reserva(
+            paciente=crear_paciente('otro'), medico=self.medico, fecha=self.fecha,
+            hora_inicio=time(10, 15), hora_fin=time(10, 45), motivo='Directo'
+        )
+        with self.assertRaises(ConflictoAgenda):
+            crear_reserva(otra)
+        resultado = crear_reservas_lote([{
+            'medico': self.medico.id, 'paciente': otra.paciente_id, 'fecha': self.fecha,
+            'hora_inicio': time(10, 0), 'hora_fin': time(10, 30), 'motivo': 'Lote', 'monto': 0
+        }])
+        self.assertFalse(resultado[0]['creada'])
+        agenda = calcular_disponibilidad(self.medico, self.fecha, self.fecha)[self.medico.id][self.fecha]
+        self.assertNotIn((time(10, 0), time(10, 30)), agenda)
+
+        reserva = aceptar_oferta(oferta)
+        self.assertEqual(reserva.paciente_id, solicitud.paciente_id)
+
+    def test_oferta_vencida_libera_el_bloque(self):
+        self.esperar('espera')
+        self.cancelar()
+        procesar_pendientes()
+        OfertaCupo.objects.update(vence_en=timezone.now() - timedelta(seconds=1))
+        crear_reserva(Reserva(
+            paciente=crear_paciente('otro'), medico=self.medico, fecha=self.fecha,
+            hora_inicio=time(10, 0), hora_fin=time(10, 30), motivo='Directo'
+        ))
+
+    def test_descarta_cupos_que_ya_empezaron(self):
+        self.esperar('espera', fecha_desde=date.today())
+        cupo = CupoLiberado.objects.create(
+            medico=self.medico, fecha=timezone.localdate(), hora_inicio=time(0, 0), hora_fin=time(0, 30)
+        )
+        self.assertIsNone(ofrecer_cupo(cupo))
+        self.assertEqual(CupoLiberado.objects.get(pk=cupo.pk).estado, EstadoCupo.DESCARTADO)
+
+    def test_aceptar_crea_la_reserva(self):
+        solicitud = self.esperar('espera')
+        self.cancelar()
+        procesar_pendientes()
+        oferta = OfertaCupo.objects.get()
+
+        self.client.force_login(solicitud.paciente.user)
+        response = self.client.post(reverse('citas:oferta_responder', args=[oferta.pk]), {'accion': 'aceptar'})
+        reserva = Reserva.objects.get(paciente=solicitud.paciente)
+        self.assertRedirects(response, reverse('citas:reserva_detalle', args=[reserva.pk]))
+        self.assertEqual(reserva.hora_inicio, time(10, 0))
+        self.assertTrue(Cobro.objects.filter(reserva=reserva).exists())
+        self.assertEqual(CupoLiberado.objects.get().estado, EstadoCupo.ASIGNADO)
+        with self.assertRaises(OfertaNoDisponible):
+            aceptar_oferta(oferta)
+
+    def test_oferta_vencida_pasa_al_siguiente(self):
+        primero = self.esperar('primero')
+        segundo = self.esperar('segundo')
+        self.cancelar()
+        procesar_pendientes()
+        OfertaCupo.objects.update(vence_en=timezone.now() - timedelta(seconds=1))
+
+        with self.assertRaises(OfertaNoDisponible):
+            aceptar_oferta(OfertaCupo.objects.get())
+        resumen = procesar_pendientes()
+        self.assertEqual((resumen['vencidas'], resumen['ofrecidas']), (1, 1))
+        self.assertEqual(SolicitudEspera.objects.get(pk=primero.pk).estado, EstadoEspera.ESPERANDO)
+        self.assertEqual(OfertaCupo.objects.get(estado=EstadoOferta.PENDIENTE).solicitud, segundo)
+
+    def test_rechazar_y_cupo_tomado(self):
+        self.esperar('primero')
+        segundo = self.esperar('segundo')
+        self.cancelar()
+        procesar_pendientes()
+        rechazar_oferta(OfertaCupo.objects.get())
+        procesar_pendientes()
+        oferta = OfertaCupo.objects.get(estado=EstadoOferta.PENDIENTE)
+        self.assertEqual(oferta.solicitud, segundo)
+
+        # El bloque se ocupa sin pasar por los servicios (p. ej. desde el admin) antes de que el paciente acepte
+        Reserva.objects.create(
+            paciente=crear_paciente('directo'), medico=self.medico, fecha=self.fecha,
+            hora_inicio=time(10, 0), hora_fin=time(10, 30), motivo='Directo'
+        )
+        with self.assertRaises(OfertaNoDisponible):
+            aceptar_oferta(oferta)
+        self.assertEqual(SolicitudEspera.objects.get(pk=segundo.pk).estado, EstadoEspera.ESPERANDO)
+        self.assertEqual(CupoLiberado.objects.get().estado, EstadoCupo.DESCARTADO)
+
+
+class RecordatoriosTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.manana = timezone.localdate() + timedelta(days=1)
+        for n in range(5):
+            paciente = crear_paciente(f'paciente{n}')
+            paciente.user.email = f'paciente{n}@example.com'
+            paciente.user.save()
+            crear_reserva(Reserva(
+                paciente=paciente, medico=self.medico, fecha=self.manana,
+                hora_inicio=time(9 + n, 0), hora_fin=time(9 + n, 30), motivo='Control'
+            ))
+        # Ninguna de estas recibe recordatorio
+        Reserva.objects.filter(hora_inicio=time(13, 0)).update(estado=EstadoReserva.CANCELADA)
+        crear_reserva(Reserva(
+            paciente=crear_paciente('sin_correo'), medico=self.medico, fecha=self.manana,
+            hora_inicio=time(15, 0), hora_fin=time(15, 30), motivo='Control'
+        ))
+        crear_reserva(Reserva(
+            paciente=Paciente.objects.get(user__username='paciente0'), medico=self.medico,
+            fecha=self.manana + timedelta(days=10), hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+        ))
+
+    def enviar(self, *args):
+        salida = StringIO()
+        call_command('enviar_recordatorios', '--lote', '2', *args, stdout=salida)
+        return salida.getvalue()
+
+    def test_envia_por_lotes_y_marca(self):
+        salida = self.enviar()
+        self.assertIn('4 recordatorios enviados', salida)
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(
+            sorted(m.to[0] for m in mail.outbox),
+            [f'paciente{n}@example.com' for n in range(4)]
+        )
+        self.assertIn(self.manana.strftime('%d/%m/%Y'), mail.outbox[0].subject)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertEqual(Reserva.objects.filter(recordatorio_enviado__isnull=False).count(), 4)
+
+    def test_reejecutar_no_repite(self):
+        self.enviar()
+        mail.outbox.clear()
+        self.assertIn('0 recordatorios enviados', self.enviar())
+        self.assertEqual(mail.outbox, [])
+
+    def test_simular_no_envia(self):
+        self.assertIn('4 recordatorios simulados', self.enviar('--simular'))
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(Reserva.objects.filter(recordatorio_enviado__isnull=False).exists())
+
+
+@override_settings(LISTA_ESPERA_EN_SEGUNDO_PLANO=False, RESERVA_PENDIENTE_VENCE_HORAS=24)
+class ExpiracionPendientesTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.paciente.user.email = 'paciente@example.com'
+        self.paciente.user.save()
+        self.hoy = timezone.localdate()
+
+    def reservar(self, dias, hora=9, estado=EstadoReserva.PENDIENTE):
+        reserva = crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=self.hoy + timedelta(days=dias),
+            hora_inicio=time(hora, 0), hora_fin=time(hora, 30), motivo='Control'
+        ))
+        Reserva.objects.filter(pk=reserva.pk).update(estado=estado)
+        return reserva
+
+    def test_expira_solo_pendientes_vencidas_por_lotes(self):
+        vencidas = [self.reservar(-dias) for dias in range(2, 7)]
+        confirmada = self.reservar(-3, hora=11, estado=EstadoReserva.CONFIRMADA)
+        futura = self.reservar(2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            resumen = expirar_pendientes(tamano_lote=2)
+        self.assertEqual((resumen.expiradas, resumen.lotes), (5, 3))
+        self.assertEqual(
+            set(ReservaExpirada.objects.values_list('reserva_id', flat=True)),
+            {reserva.id for reserva in vencidas}
+        )
+        self.assertEqual(Reserva.objects.get(pk=confirmada.pk).estado, EstadoReserva.CONFIRMADA)
+        self.assertEqual(Reserva.objects.get(pk=futura.pk).estado, EstadoReserva.PENDIENTE)
+        self.assertGreater(
+            Reserva.objects.get(pk=vencidas[0].pk).fecha_modificacion, vencidas[0].fecha_modificacion
+        )
+        # Una segunda pasada no encuentra nada
+        self.assertEqual(expirar_pendientes().expiradas, 0)
+
+    def test_invalida_agenda_y_libera_cupos_futuros(self):
+        with override_settings(RESERVA_PENDIENTE_CONFIRMAR_HORAS_ANTES=72):
+            reserva = self.reservar(1)
+            self.assertEqual(len(obtener_agenda(self.medico.id, reserva.fecha)['reservas']), 1)
+            with self.captureOnCommitCallbacks(execute=True):
+                expirar_pendientes(limite_expiracion())
+        agenda = obtener_agenda(self.medico.id, reserva.fecha)
+        self.assertEqual(agenda['reservas'][0]['estado'], EstadoReserva.CANCELADA)
+        self.assertTrue(CupoLiberado.objects.filter(reserva_cancelada=reserva).exists())
+
+    def test_comando_avisa_una_vez(self):
+        self.reservar(-2)
+        salida = StringIO()
+        call_command('expirar_reservas', stdout=salida)
+        self.assertIn('1 reservas expiradas', salida.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('cancelada', mail.outbox[0].subject)
+
+        call_command('expirar_reservas', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(ReservaExpirada.objects.filter(notificada__isnull=True).exists())
+
+
+@override_settings(ARCHIVO_RESERVAS_DIAS=365)
+class ArchivoTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.hoy = timezone.localdate()
+        self.antiguas = [
+            self.reservar(-400 - n, EstadoReserva.COMPLETADA if n % 2 else EstadoReserva.CANCELADA)
+            for n in range(5)
+        ]
+        Cobro.objects.create(reserva=self.antiguas[1], monto=20000, pagado=True)
+        self.historial = HistorialMedico.objects.create(
+            paciente=self.paciente, medico=self.medico, reserva=self.antiguas[1],
+            diagnostico='Sano', tratamiento='Ninguno'
+        )
+        # Ninguna de estas se archiva: reciente o aún vigente
+        self.reciente = self.reservar(-10, EstadoReserva.COMPLETADA)
+        self.vigente = self.reservar(-500, EstadoReserva.CONFIRMADA)
+
+    def reservar(self, dias, estado):
+        return Reserva.objects.create(
+            paciente=self.paciente, medico=self.medico, fecha=self.hoy + timedelta(days=dias),
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control', estado=estado
+        )
+
+    def test_mueve_por_lotes_conservando_ids_y_historial(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resumen = archivar(tamano_lote=2)
+        self.assertEqual((resumen.archivadas, resumen.lotes), (5, 3))
+        self.assertEqual(
+            set(ReservaArchivada.objects.values_list('id', flat=True)),
+            {reserva.id for reserva in self.antiguas}
+        )
+        self.assertEqual(
+            set(Reserva.objects.values_list('id', flat=True)), {self.reciente.id, self.vigente.id}
+        )
+        self.assertFalse(Cobro.objects.exists())
+        self.assertEqual(CobroArchivado.objects.get().reserva_id, self.antiguas[1].id)
+
+        self.historial.refresh_from_db()
+        self.assertIsNone(self.historial.reserva_id)
+        self.assertEqual(self.historial.reserva_archivada.motivo, 'Control')
+        self.assertEqual(archivar().archivadas, 0)
+
+    def test_conserva_expiraciones_y_solicitudes_de_pago(self):
+        cobro = Cobro.objects.get(reserva=self.antiguas[1])
+        solicitud = SolicitudPago.objects.create(clave='pago-1', cobro=cobro, resultado=ResultadoPago.PAGADO)
+        avisada = ReservaExpirada.objects.create(
+            reserva=self.antiguas[0], fecha_expiracion=timezone.now(), notificada=timezone.now()
+        )
+        sin_aviso = ReservaExpirada.objects.create(reserva=self.antiguas[2], fecha_expiracion=timezone.now())
+
+        self.assertEqual(archivar().archivadas, 4)
+        solicitud.refresh_from_db()
+        self.assertEqual((solicitud.cobro_id, solicitud.cobro_archivado_id), (None, cobro.id))
+        avisada.refresh_from_db()
+        self.assertEqual((avisada.reserva_id, avisada.reserva_archivada_id), (None, self.antiguas[0].id))
+        # El aviso pendiente necesita la reserva viva: se archiva cuando se envía
+        self.assertTrue(Reserva.objects.filter(pk=self.antiguas[2].pk).exists())
+
+        ReservaExpirada.objects.filter(pk=sin_aviso.pk).update(notificada=timezone.now())
+        self.assertEqual(archivar().archivadas, 1)
+        self.assertEqual(ReservaExpirada.objects.get(pk=sin_aviso.pk).reserva_archivada_id, self.antiguas[2].id)
+
+    def test_detalle_y_lista_incluyen_archivo(self):
+        archivar()
+        self.client.force_login(self.medico.user)
+        response = self.client.get(reverse('citas:reserva_detalle', args=[self.antiguas[1].pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Archivada')
+        self.assertEqual(response.context['cobro'].monto, 20000)
+
+        response = self.client.get(reverse('citas:reserva_lista'))
+        self.assertEqual(len(response.context['reservas']), 2)
+        response = self.client.get(reverse('citas:reserva_lista'), {'archivadas': 'on'})
+        fechas = [reserva.fecha for reserva in response.context['reservas']]
+        self.assertEqual(len(fechas), 7)
+        self.assertEqual(fechas, sorted(fechas))
+
+    def test_api_consulta_archivo(self):
+        archivar()
+        cliente = APIClient()
+        cliente.force_authenticate(self.paciente.user)
+        response = cliente.get(f'/citas/api/reservas/{self.antiguas[0].pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('fecha_archivado', response.data)
+
+        response = cliente.get('/citas/api/reservas/archivadas/')
+        self.assertEqual(response.data['count'], 5)
+
+        cliente.force_authenticate(crear_paciente('otro').user)
+        response = cliente.get(f'/citas/api/reservas/{self.antiguas[0].pk}/')
+        self.assertEqual(response.status_code, 404)
+
+
+class IngresosApiTests(TestCase):
+    url = '/citas/api/ingresos/'
+
+    def setUp(self):
+        cache.clear()
+        cardiologia = Especialidad.objects.create(nombre='Cardiología')
+        self.cardiologo = crear_medico('cardiologo')
+        Medico.objects.filter(pk=self.cardiologo.pk).update(especialidad=cardiologia)
+        self.general = crear_medico('general')
+        self.paciente = crear_paciente()
+        self.mes = timezone.localdate().replace(day=1)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def cobrar(self, medico, monto, meses_atras=0, pagado=True):
+        fecha = self.mes - timedelta(days=1) if meses_atras else self.mes
+        reserva = Reserva.objects.create(
+            paciente=self.paciente, medico=medico, fecha=fecha,
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control', estado=EstadoReserva.COMPLETADA
+        )
+        pago = timezone.make_aware(datetime.combine(fecha, time(12, 0)))
+        return Cobro.objects.create(reserva=reserva, monto=monto, pagado=pagado, fecha_pago=pago if pagado else None)
+
+    def consultar(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_agrega_por_medico_especialidad_y_mes(self):
+        self.cobrar(self.cardiologo, 30000)
+        self.cobrar(self.cardiologo, 20000, meses_atras=1)
+        self.cobrar(self.general, 15000)
+        self.cobrar(self.general, 99999, pagado=False)
+
+        datos = self.consultar()
+        self.assertEqual(datos['total'], {'monto': Decimal('65000.00'), 'cobros': 3})
+        self.assertEqual(len(datos['por_mes']), 12)
+        self.assertEqual(datos['por_mes'][-1]['monto'], Decimal('45000.00'))
+        self.assertEqual(
+            [(fila['medico_id'], fila['monto']) for fila in datos['por_medico']],
+            [(self.cardiologo.id, Decimal('50000.00')), (self.general.id, Decimal('15000.00'))]
+        )
+        self.assertEqual(
+            [(fila['especialidad'], fila['cobros']) for fila in datos['por_especialidad']],
+            [('Cardiología', 2), ('Sin especialidad', 1)]
+        )
+        fila = datos['medico_por_mes']['filas'][0]
+        self.assertEqual(fila['montos'][-2:], [Decimal('20000.00'), Decimal('30000.00')])
+
+    def test_instantaneas_mensuales_en_cache(self):
+        self.cobrar(self.general, 10000, meses_atras=1)
+        self.consultar()
+        # Todos los meses salen de la cache: solo se consultan nombres
+        with self.assertNumQueries(2):
+            self.consultar()
+        # Un pago nuevo invalida solo el mes en curso
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cobrar(self.general, 5000)
+        self.assertEqual(self.consultar()['total']['monto'], Decimal('15000.00'))
+
+    def test_incluye_cobros_archivados(self):
+        cobro = self.cobrar(self.general, 10000, meses_atras=1)
+        archivar(dias=0)
+        self.assertFalse(Cobro.objects.filter(pk=cobro.pk).exists())
+        self.assertEqual(self.consultar()['total']['monto'], Decimal('10000.00'))
+
+    def test_valida_periodo_y_permisos(self):
+        response = self.client.get(self.url, {'desde': '2020-01', 'hasta': '2025-01'})
+        self.assertEqual(response.status_code, 400)
+        datos = self.consultar(desde='2024-02', hasta='2024-03')
+        self.assertEqual([fila['mes'] for fila in datos['por_mes']], ['2024-02', '2024-03'])
+        self.assertEqual(datos['total']['cobros'], 0)
+
+        self.client.force_authenticate(self.general.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+@override_settings(COMPROBANTES_EN_SEGUNDO_PLANO=False)
+class PagoCobroTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.reserva = crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=date.today(),
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+        ), monto=25000)
+        self.cobro = self.reserva.cobro
+        self.url = f'/citas/api/cobros/{self.cobro.pk}/pagar/'
+        self.api = APIClient()
+        self.api.force_authenticate(self.paciente.user)
+
+    def test_paga_una_vez_e_invalida_agenda(self):
+        self.assertFalse(obtener_agenda(self.medico.id, self.reserva.fecha)['reservas'][0]['pagado'])
+        with self.captureOnCommitCallbacks(execute=True):
+            solicitud, repetida = pagar_cobro(self.cobro, 'Efectivo')
+        self.assertEqual((solicitud.resultado, repetida), (ResultadoPago.PAGADO, False))
+        self.assertTrue(obtener_agenda(self.medico.id, self.reserva.fecha)['reservas'][0]['pagado'])
+
+        solicitud, _ = pagar_cobro(Cobro.objects.get(pk=self.cobro.pk), 'Tarjeta')
+        self.assertEqual(solicitud.resultado, ResultadoPago.YA_PAGADO)
+        self.assertEqual(Cobro.objects.get(pk=self.cobro.pk).metodo_pago, 'Efectivo')
+        self.assertFalse(SolicitudPago.objects.exists())
+
+    def test_reintento_con_clave_repite_resultado(self):
+        response = self.api.post(self.url, {'metodo_pago': 'Débito'}, HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['resultado'], ResultadoPago.PAGADO)
+
+        repetida = self.api.post(self.url, {'metodo_pago': 'Débito'}, HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(repetida.status_code, 200)
+        self.assertEqual(repetida['Idempotent-Replayed'], 'true')
+        self.assertEqual(repetida.data, response.data)
+
+        otra = self.api.post(self.url, HTTP_IDEMPOTENCY_KEY='k2')
+        self.assertEqual(otra.status_code, 409)
+        self.assertEqual(otra.data['resultado'], ResultadoPago.YA_PAGADO)
+        self.assertEqual(SolicitudPago.objects.count(), 2)
+
+    def test_clave_de_otro_cobro_y_permisos(self):
+        pagar_cobro(self.cobro, 'Débito', clave='k1')
+        otra = crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=date.today(),
+            hora_inicio=time(10, 0), hora_fin=time(10, 30), motivo='Control'
+        ))
+        with self.assertRaises(ClaveReutilizada):
+            pagar_cobro(otra.cobro, 'Débito', clave='k1')
+
+        self.api.force_authenticate(self.medico.user)
+        self.assertEqual(self.api.post(self.url).status_code, 403)
+
+    def test_vista_web_idempotente(self):
+        self.client.force_login(self.paciente.user)
+        url = reverse('citas:cobro_pagar', args=[self.reserva.pk])
+        # Un enlace GET (prefetch, rastreador) no paga
+        self.assertEqual(self.client.get(url, {'clave': 'web-1'}).status_code, 405)
+        cliente_csrf = Client(enforce_csrf_checks=True)
+        cliente_csrf.force_login(self.paciente.user)
+        self.assertEqual(cliente_csrf.post(url, {'clave': 'web-1'}).status_code, 403)
+        self.assertFalse(Cobro.objects.get(pk=self.cobro.pk).pagado)
+        detalle = self.client.get(reverse('citas:reserva_detalle', args=[self.reserva.pk]))
+        self.assertContains(detalle, f'action="{url}"')
+        for _ in range(2):
+            response = self.client.post(url, {'clave': 'web-1'}, follow=True)
+            mensajes = [str(m) for m in response.context['messages']]
+            self.assertEqual(mensajes, ['Pago realizado con éxito.'])
+        self.assertTrue(Cobro.objects.get(pk=self.cobro.pk).pagado)
+        self.assertEqual(SolicitudPago.objects.get().resultado, ResultadoPago.PAGADO)
+
+
+@override_settings(COMPROBANTES_EN_SEGUNDO_PLANO=False)
+class PagoConcurrenteTests(TransactionTestCase):
+    """Muchos hilos pagando el mismo cobro: solo uno lo paga."""
+    HILOS = 16
+    INTENTOS = 64
+
+    def setUp(self):
+        self.reserva = crear_reserva(Reserva(
+            paciente=crear_paciente(), medico=crear_medico(), fecha=date.today(),
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+        ), monto=25000)
+
+    def pagar(self, n):
+        # La mitad de los intentos son reintentos de la misma solicitud
+        clave = 'reintento' if n % 2 else f'clave-{n}'
+        try:
+            solicitud, repetida = pagar_cobro(Cobro.objects.get(reserva=self.reserva), f'Método {n}', clave=clave)
+            return clave, solicitud.resultado, solicitud.metodo_pago
+        finally:
+            connection.close()
+
+    def test_un_solo_pago(self):
+        with ThreadPoolExecutor(max_workers=self.HILOS) as executor:
+            resultados = list(executor.map(self.pagar, range(self.INTENTOS)))
+
+        pagos = [r for r in resultados if r[1] == ResultadoPago.PAGADO]
+        cobro = Cobro.objects.get(reserva=self.reserva)
+        self.assertTrue(cobro.pagado)
+        self.assertEqual(len({r[2] for r in pagos}), 1)
+        self.assertEqual(pagos[0][2], cobro.metodo_pago)
+        # Todos los reintentos con la misma clave recibieron el mismo resultado
+        self.assertEqual(len({r for r in resultados if r[0] == 'reintento'}), 1)
+        self.assertEqual(SolicitudPago.objects.filter(resultado=ResultadoPago.PAGADO).count(), 1)
+        self.assertEqual(SolicitudPago.objects.count(), self.INTENTOS // 2 + 1)
+
+
+class ExportacionTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.otro = crear_medico('otro')
+        self.paciente = crear_paciente()
+        hoy = timezone.localdate()
+        self.reservas = [
+            Reserva.objects.create(
+                paciente=self.paciente, medico=self.otro if n == 4 else self.medico,
+                fecha=hoy - timedelta(days=400 if n < 2 else n), hora_inicio=time(9, 0), hora_fin=time(9, 30),
+                motivo='Control, "anual"', estado=EstadoReserva.COMPLETADA
+            )
+            for n in range(6)
+        ]
+        Cobro.objects.bulk_create([Cobro(reserva=reserva, monto=1000) for reserva in self.reservas])
+        # Las dos primeras quedan en el archivo
+        archivar()
+        self.api = APIClient()
+        self.api.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def descargar(self, url, **params):
+        response = self.api.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_mezcla_archivo_en_orden_de_id(self):
+        filas = list(csv.DictReader(self.descargar('/citas/api/exportar/reservas/').splitlines()))
+        self.assertEqual([int(fila['id']) for fila in filas], [reserva.id for reserva in self.reservas])
+        self.assertEqual([fila['archivada'] for fila in filas], ['True'] * 2 + ['False'] * 4)
+        self.assertEqual(filas[0]['motivo'], 'Control, "anual"')
+
+    def test_ndjson_con_filtros_y_cursor(self):
+        lineas = self.descargar(
+            '/citas/api/exportar/cobros/', formato='ndjson', medico=self.medico.id, despues=self.reservas[0].cobro.id
+        ).splitlines()
+        cobros = [json.loads(linea) for linea in lineas]
+        self.assertEqual(len(cobros), 4)
+        self.assertEqual({cobro['medico_id'] for cobro in cobros}, {self.medico.id})
+        self.assertEqual(cobros[0]['monto'], '1000.00')
+
+    def test_solo_personal(self):
+        self.api.force_authenticate(self.medico.user)
+        self.assertEqual(self.api.get('/citas/api/exportar/reservas/').status_code, 403)
+
+    def test_comando_retoma_exportacion(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'reservas.csv')
+            # Exportación interrumpida después de la tercera fila
+            with open(ruta, 'w', encoding='utf-8') as archivo:
+                archivo.write('id,fecha\n' + ''.join(f'{reserva.id},x\n' for reserva in self.reservas[:3]))
+            call_command('exportar', 'reservas', '--salida', ruta, '--continuar', stderr=StringIO())
+            with open(ruta, encoding='utf-8') as archivo:
+                ids = [int(fila[0]) for fila in list(csv.reader(archivo))[1:]]
+        self.assertEqual(ids, [reserva.id for reserva in self.reservas])
+
+    def test_comando_descarta_la_fila_incompleta(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'reservas.csv')
+            # Cortada a mitad de la cuarta fila, después de su id
+            with open(ruta, 'w', encoding='utf-8') as archivo:
+                archivo.write(
+                    'id,fecha\n' + ''.join(f'{reserva.id},x\n' for reserva in self.reservas[:3])
+                    + f'{self.reservas[3].id},20'
+                )
+            call_command('exportar', 'reservas', '--salida', ruta, '--continuar', stderr=StringIO())
+            with open(ruta, encoding='utf-8') as archivo:
+                ids = [int(fila[0]) for fila in list(csv.reader(archivo))[1:]]
+        self.assertEqual(ids, [reserva.id for reserva in self.reservas])
+
+
+class ArchivosGeneradosMixin:
+    """MEDIA_ROOT temporario y espera de archivos generados en segundo plano."""
+
+    def setUp(self):
+        super().setUp()
+        self.media = tempfile.TemporaryDirectory()
+        self.enterContext(override_settings(MEDIA_ROOT=self.media.name))
+        self.addCleanup(self.media.cleanup)
+
+    def esperar_descarga(self, cliente, url):
+        """Repite la descarga mientras responda 202 y retorna la última respuesta."""
+        for _ in range(100):
+            response = cliente.get(url)
+            if response.status_code != 202:
+                break
+            reloj.sleep(0.05)
+        return response
+
+
+@override_settings(COMPROBANTES_EN_SEGUNDO_PLANO=False)
+class ComprobantesTests(ArchivosGeneradosMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.reserva = crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=date.today(),
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+        ), monto=25000)
+        self.url = reverse('citas:cobro_comprobante', args=[self.reserva.pk])
+        self.client.force_login(self.paciente.user)
+
+    def test_genera_una_vez_y_sirve_el_archivo(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        ruta = ruta_comprobante(datos_comprobante(self.reserva.cobro.pk))
+        modificado = ruta.stat().st_mtime_ns
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.client.get(self.url)
+        self.assertEqual(ruta.stat().st_mtime_ns, modificado)
+
+    def test_el_pago_cambia_la_huella(self):
+        antes = ruta_comprobante(datos_comprobante(self.reserva.cobro.pk))
+        self.client.get(self.url)
+        pagar_cobro(self.reserva.cobro, 'Débito')
+        despues = ruta_comprobante(datos_comprobante(self.reserva.cobro.pk))
+        self.assertNotEqual(antes, despues)
+        self.client.get(self.url)
+        self.assertTrue(antes.exists() and despues.exists())
+
+    def test_en_segundo_plano_responde_202(self):
+        api = APIClient()
+        api.force_authenticate(self.paciente.user)
+        url = f'/citas/api/cobros/{self.reserva.cobro.pk}/comprobante/'
+        with override_settings(COMPROBANTES_EN_SEGUNDO_PLANO=True):
+            self.assertEqual(api.get(url).status_code, 202)
+            self.assertEqual(self.esperar_descarga(api, url).status_code, 200)
+
+    def test_comando_genera_el_mes_en_paralelo(self):
+        for hora in range(10, 13):
+            crear_reserva(Reserva(
+                paciente=self.paciente, medico=self.medico, fecha=date.today(),
+                hora_inicio=time(hora, 0), hora_fin=time(hora, 30), motivo='Control'
+            ))
+        mes = date.today().strftime('%Y-%m')
+        salida = StringIO()
+        call_command('generar_comprobantes', '--mes', mes, '--procesos', '2', stdout=salida)
+        self.assertIn('4 generados, 0 ya existían', salida.getvalue())
+        salida = StringIO()
+        call_command('generar_comprobantes', '--mes', mes, stdout=salida)
+        self.assertIn('0 generados, 4 ya existían', salida.getvalue())
+
+
+class BusquedaHistorialTests(TestCase):
+    url = '/citas/api/historial/buscar/'
+
+    def setUp(self):
+        self.medico = crear_medico()
+        self.otro = crear_medico('otro_medico')
+        self.paciente = crear_paciente()
+        self.hipertension = self.registrar('Hipertensión arterial', 'Enalapril 10 mg', 'Control de presión')
+        self.diabetes = self.registrar('Diabetes tipo 2', 'Metformina y dieta hiposódica por hipertensión')
+        self.ajeno = self.registrar('Hipertensión secundaria', 'Losartán', medico=self.otro)
+        self.client = APIClient()
+        self.client.force_authenticate(self.medico.user)
+
+    def registrar(self, diagnostico, tratamiento, observaciones='', medico=None):
+        return HistorialMedico.objects.create(
+            paciente=self.paciente, medico=medico or self.medico,
+            diagnostico=diagnostico, tratamiento=tratamiento, observaciones=observaciones
+        )
+
+    def buscar(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, 200)
+        return [fila['id'] for fila in response.data]
+
+    def test_ordena_por_relevancia_y_solo_del_medico(self):
+        # Sin acentos y en otra forma: coincide en el diagnóstico y, con menos peso, en el tratamiento
+        self.assertEqual(self.buscar('hipertensa'), [self.hipertension.id, self.diabetes.id])
+        self.assertEqual(self.buscar('hipertension', limite=1), [self.hipertension.id])
+
+    def test_todos_los_terminos_deben_coincidir(self):
+        self.assertEqual(self.buscar('diabetes metformina'), [self.diabetes.id])
+        self.assertEqual(self.buscar('diabetes enalapril'), [])
+        self.assertEqual(self.buscar('de la'), [])
+
+    def test_indice_sigue_las_escrituras(self):
+        HistorialMedico.objects.filter(pk=self.diabetes.pk).update(tratamiento='Insulina')
+        self.assertEqual(self.buscar('hipertension'), [self.hipertension.id])
+        self.hipertension.delete()
+        self.assertEqual(self.buscar('hipertension'), [])
+        nuevo = self.registrar('Asma bronquial', 'Salbutamol')
+        self.assertEqual(self.buscar('bronquiales'), [nuevo.id])
+
+    def test_solo_medicos(self):
+        self.client.force_authenticate(self.paciente.user)
+        self.assertEqual(self.client.get(self.url, {'q': 'diabetes'}).status_code, 403)
+        self.client.force_authenticate(self.medico.user)
+        self.assertEqual(self.client.get(self.url, {'q': 'd'}).status_code, 400)
+
+    def test_admin_busca_con_el_indice(self):
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:citas_historialmedico_changelist'), {'q': 'hipertensión'})
+        self.assertEqual(
+            {historial.id for historial in response.context['cl'].result_list},
+            {self.hipertension.id, self.diabetes.id, self.ajeno.id}
+        )
+
+
+class LineaTiempoTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.otro = crear_medico('otro_medico')
+        self.paciente = crear_paciente()
+        self.url = f'/pacientes/api/pacientes/{self.paciente.pk}/historial_medico/'
+        self.hoy = timezone.localdate()
+        self.client = APIClient()
+        self.client.force_authenticate(self.paciente.user)
+
+    def reservar(self, dias, medico=None, hora=9, estado=EstadoReserva.COMPLETADA):
+        return Reserva.objects.create(
+            paciente=self.paciente, medico=medico or self.medico, fecha=self.hoy + timedelta(days=dias),
+            hora_inicio=time(hora, 0), hora_fin=time(hora, 30), motivo='Control', estado=estado
+        )
+
+    def momento(self, reserva, minutos):
+        return timezone.make_aware(datetime.combine(reserva.fecha, reserva.hora_inicio)) + timedelta(minutes=minutos)
+
+    def atender(self, dias, medico=None):
+        """Reserva completada con su consulta y su pago, en ese orden."""
+        reserva = self.reservar(dias, medico)
+        HistorialMedico.objects.create(
+            paciente=self.paciente, medico=reserva.medico, reserva=reserva,
+            fecha=self.momento(reserva, 20), diagnostico='Control', tratamiento='Reposo'
+        )
+        Cobro.objects.create(reserva=reserva, monto=20000, pagado=True, fecha_pago=self.momento(reserva, 40))
+        return reserva
+
+    def recorrer(self, tamano, **params):
+        eventos, despues, paginas = [], None, 0
+        while True:
+            consulta = {'tamano': tamano, **params, **({'despues': despues} if despues else {})}
+            response = self.client.get(self.url, consulta)
+            self.assertEqual(response.status_code, 200)
+            eventos += [(evento['tipo'], evento['id'], evento['archivada']) for evento in response.data['eventos']]
+            paginas += 1
+            despues = response.data['siguiente']
+            if not despues:
+                return eventos, paginas
+
+    def test_mezcla_fuentes_en_orden_y_pagina_sin_repetir(self):
+        antigua = self.atender(-400)
+        reciente = self.atender(-3)
+        futura = self.reservar(5, estado=EstadoReserva.CONFIRMADA)
+        Cobro.objects.create(reserva=futura, monto=20000)
+        cobro_antiguo, historial_antiguo = antigua.cobro.id, antigua.historial.id
+        with override_settings(ARCHIVO_RESERVAS_DIAS=365):
+            archivar()
+
+        eventos, paginas = self.recorrer(tamano=2)
+        self.assertEqual(paginas, 4)
+        self.assertEqual(eventos, [
+            ('reserva', futura.id, False),
+            ('cobro', reciente.cobro.id, False),
+            ('historial', reciente.historial.id, False),
+            ('reserva', reciente.id, False),
+            ('cobro', cobro_antiguo, True),
+            ('historial', historial_antiguo, False),
+            ('reserva', antigua.id, True),
+        ])
+
+    def test_cantidad_de_consultas_no_depende_de_la_historia(self):
+        for dias in range(1, 4):
+            self.atender(-dias)
+        with self.assertNumQueries(6):
+            self.client.get(self.url, {'tamano': 5})
+        for dias in range(4, 40):
+            self.atender(-dias)
+        with self.assertNumQueries(6):
+            response = self.client.get(self.url, {'tamano': 5})
+        with self.assertNumQueries(6):
+            self.client.get(self.url, {'tamano': 5, 'despues': response.data['siguiente']})
+
+    def test_medico_solo_ve_sus_eventos(self):
+        propia = self.atender(-2)
+        self.atender(-1, medico=self.otro)
+        self.client.force_authenticate(self.medico.user)
+        eventos, _ = self.recorrer(tamano=10)
+        self.assertEqual(
+            [(tipo, id) for tipo, id, _ in eventos],
+            [('cobro', propia.cobro.id), ('historial', propia.historial.id), ('reserva', propia.id)]
+        )
+        self.client.force_authenticate(crear_paciente('otro_paciente').user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_cursor_invalido(self):
+        response = self.client.get(self.url, {'despues': 'no-es-un-cursor'})
+        self.assertEqual(response.status_code, 400)
+        for valores in ([1, 'reserva', 1], ['2024-01-01T00:00:00', 'reserva', 1], ['2024-01-01T00:00:00+00:00', 'reserva', 'x']):
+            cursor = base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip('=')
+            response = self.client.get(self.url, {'despues': cursor})
+            self.assertEqual(response.status_code, 400, valores)
+
+
+@override_settings(RESUMENES_EN_SEGUNDO_PLANO=False)
+class ResumenClinicoTests(ArchivosGeneradosMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        especialidad = Especialidad.objects.create(nombre='Cardiología')
+        self.medico = crear_medico()
+        Medico.objects.filter(pk=self.medico.pk).update(especialidad=especialidad)
+        self.paciente = crear_paciente()
+        self.historial = self.registrar('Hipertensión arterial', 'Enalapril 10 mg')
+        self.url = f'/pacientes/api/pacientes/{self.paciente.pk}/resumen_clinico/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.paciente.user)
+
+    def registrar(self, diagnostico, tratamiento):
+        return HistorialMedico.objects.create(
+            paciente=self.paciente, medico=self.medico, diagnostico=diagnostico, tratamiento=tratamiento
+        )
+
+    def descargar(self, **encabezados):
+        response = self.client.get(self.url, **encabezados)
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def textos(self, response):
+        documento = Document(BytesIO(b''.join(response.streaming_content)))
+        return [parrafo.text for parrafo in documento.paragraphs]
+
+    def test_incluye_consultas_y_se_reutiliza_hasta_que_cambia_el_historial(self):
+        response = self.descargar()
+        etag = response['ETag']
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        textos = self.textos(response)
+        self.assertIn('Diagnóstico: Hipertensión arterial', textos)
+        self.assertTrue(any('(Cardiología)' in texto for texto in textos))
+        self.assertEqual(self.descargar(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.historial.tratamiento = 'Losartán 50 mg'
+        self.historial.save()
+        response = self.descargar(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Tratamiento: Losartán 50 mg', self.textos(response))
+        # Solo queda la versión vigente
+        archivos = list((Path(self.media.name) / 'resumenes' / str(self.paciente.pk)).iterdir())
+        self.assertEqual([archivo.name for archivo in archivos], [f"{response['ETag'].strip(chr(34))}.docx"])
+
+    def test_solo_paciente_o_personal(self):
+        self.client.force_authenticate(self.medico.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_en_segundo_plano_responde_202(self):
+        with override_settings(RESUMENES_EN_SEGUNDO_PLANO=True):
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response['Retry-After'], '2')
+            self.assertEqual(self.esperar_descarga(self.client, self.url).status_code, 200)
+
+
+class TransicionReservaTests(TestCase):
+    url = '/citas/api/reservas/transicion/'
+
+    def setUp(self):
+        self.medico = crear_medico()
+        self.fecha = date.today() + timedelta(days=1)
+        self.reservas = [
+            crear_reserva(Reserva(
+                paciente=crear_paciente(f'paciente{n}'), medico=self.medico, fecha=self.fecha,
+                hora_inicio=time(9 + n, 0), hora_fin=time(9 + n, 30), motivo='Control'
+            ))
+            for n in range(5)
+        ]
+
+    def test_transicion_invalida(self):
+        reserva = self.reservas[0]
+        transicionar(reserva, EstadoReserva.CANCELADA, OrigenTransicion.WEB)
+        with self.assertRaises(TransicionInvalida):
+            transicionar(reserva, EstadoReserva.CONFIRMADA, OrigenTransicion.WEB)
+        # Una copia desactualizada no pisa el estado que otro proceso ya cambió
+        copia = Reserva.objects.get(pk=self.reservas[1].pk)
+        transicionar(self.reservas[1], EstadoReserva.CONFIRMADA, OrigenTransicion.WEB)
+        transicionar(self.reservas[1], EstadoReserva.CANCELADA, OrigenTransicion.WEB)
+        with self.assertRaises(TransicionInvalida):
+            transicionar(copia, EstadoReserva.CONFIRMADA, OrigenTransicion.WEB)
+        self.assertEqual(Reserva.objects.get(pk=copia.pk).estado, EstadoReserva.CANCELADA)
+        self.assertEqual(TransicionReserva.objects.count(), 3)
+
+    def test_lote_con_consultas_acotadas(self):
+        Reserva.objects.filter(pk=self.reservas[0].pk).update(estado=EstadoReserva.CONFIRMADA)
+        Reserva.objects.filter(pk=self.reservas[1].pk).update(estado=EstadoReserva.CANCELADA)
+        dia = Reserva.objects.filter(medico=self.medico, fecha=self.fecha)
+        with CaptureQueriesContext(connection) as pocas:
+            filas = transicionar_en_lote(dia, EstadoReserva.CONFIRMADA, OrigenTransicion.ADMIN)
+        self.assertEqual([fila[0] for fila in filas], [reserva.pk for reserva in self.reservas[2:]])
+
+        paciente = self.reservas[0].paciente
+        Reserva.objects.bulk_create([
+            Reserva(
+                paciente=paciente, medico=self.medico, fecha=self.fecha,
+                hora_inicio=time(15, n), hora_fin=time(15, n + 1), motivo='Control'
+            )
+            for n in range(50)
+        ])
+        with CaptureQueriesContext(connection) as muchas:
+            filas = transicionar_en_lote(dia, EstadoReserva.CONFIRMADA, OrigenTransicion.ADMIN)
+        self.assertEqual(len(filas), 50)
+        self.assertEqual(len(muchas.captured_queries), len(pocas.captured_queries))
+
+        registro = TransicionReserva.objects.get(reserva=self.reservas[2])
+        self.assertEqual(
+            (registro.estado_anterior, registro.estado_nuevo, registro.origen),
+            (EstadoReserva.PENDIENTE, EstadoReserva.CONFIRMADA, OrigenTransicion.ADMIN)
+        )
+        self.assertEqual(TransicionReserva.objects.count(), 53)
+
+    def test_cancelar_en_lote_libera_cupos(self):
+        Reserva.objects.filter(pk=self.reservas[0].pk).update(estado=EstadoReserva.COMPLETADA)
+        filas = transicionar_en_lote(
+            Reserva.objects.filter(medico=self.medico), EstadoReserva.CANCELADA, OrigenTransicion.ADMIN
+        )
+        self.assertEqual(len(filas), 4)
+        self.assertEqual(CupoLiberado.objects.count(), 4)
+        self.assertEqual(Reserva.objects.get(pk=self.reservas[0].pk).estado, EstadoReserva.COMPLETADA)
+
+    def test_accion_del_admin(self):
+        staff = User.objects.create_user('admin', is_staff=True, is_superuser=True)
+        self.client.force_login(staff)
+        response = self.client.post(reverse('admin:citas_reserva_changelist'), {
+            'action': 'confirmar_reservas',
+            '_selected_action': [reserva.pk for reserva in self.reservas[:3]],
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Reserva.objects.filter(estado=EstadoReserva.CONFIRMADA).count(), 3)
+        self.assertEqual(TransicionReserva.objects.filter(usuario=staff, origen=OrigenTransicion.ADMIN).count(), 3)
+
+    def test_api_medico_confirma_su_dia(self):
+        Reserva.objects.filter(pk=self.reservas[4].pk).update(estado=EstadoReserva.CANCELADA)
+        client = APIClient()
+        client.force_authenticate(self.medico.user)
+        response = client.post(self.url, {
+            'estado': 'confirmada', 'fecha': self.fecha.isoformat()
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['actualizadas'], 4)
+        self.assertEqual(sorted(response.data['reservas']), [reserva.pk for reserva in self.reservas[:4]])
+
+        otro = crear_medico('otro')
+        response = client.post(self.url, {
+            'estado': 'confirmada', 'fecha': self.fecha.isoformat(), 'medico': otro.id
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+        client.force_authenticate(self.reservas[0].paciente.user)
+        response = client.post(self.url, {'estado': 'cancelada', 'fecha': self.fecha.isoformat()}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_historial_completa_la_reserva(self):
+        reserva = self.reservas[0]
+        self.client.force_login(self.medico.user)
+        self.client.post(reverse('citas:historial_crear', args=[reserva.pk]), {
+            'diagnostico': 'Sano', 'tratamiento': 'Ninguno', 'observaciones': ''
+        })
+        self.assertEqual(Reserva.objects.get(pk=reserva.pk).estado, EstadoReserva.COMPLETADA)
+        self.assertEqual(TransicionReserva.objects.get(reserva=reserva).origen, OrigenTransicion.WEB)
+        # Una reserva ya completada no admite otra consulta
+        response = self.client.post(reverse('citas:historial_crear', args=[reserva.pk]), {
+            'diagnostico': 'Otro', 'tratamiento': 'Ninguno', 'observaciones': ''
+        })
+        self.assertRedirects(response, reverse('citas:reserva_detalle', args=[reserva.pk]))
+        self.assertEqual(HistorialMedico.objects.filter(reserva=reserva).count(), 1)
+
+
+class ListadosAdminTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.medicos = [crear_medico(f'medico{n}') for n in range(3)]
+        self.paciente = crear_paciente()
+        self.client.force_login(User.objects.create_user('admin', is_staff=True, is_superuser=True))
+
+    def crear_reservas(self, cantidad, desde=None):
+        desde = desde or date.today()
+        Reserva.objects.bulk_create([
+            Reserva(
+                paciente=self.paciente, medico=self.medicos[n % 3], fecha=desde + timedelta(days=7 * n),
+                hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+            )
+            for n in range(cantidad)
+        ])
+
+    def consultas_del_listado(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(consultas.captured_queries)
+
+    def test_consultas_no_crecen_con_las_filas(self):
+        url = reverse('admin:citas_reserva_changelist')
+        self.crear_reservas(5)
+        self.client.get(url)
+        pocas = self.consultas_del_listado(url)
+        self.crear_reservas(60, desde=date.today() + timedelta(days=1))
+        self.assertEqual(self.consultas_del_listado(url), pocas)
+
+    def test_filtro_de_medicos_en_cache(self):
+        url = reverse('admin:citas_historialmedico_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(url)
+        self.assertFalse(any('FROM "medicos_medico"' in q['sql'] for q in consultas.captured_queries))
+        self.assertEqual(len(opciones_medicos()), 3)
+
+        # Un médico nuevo aparece tras el commit
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_medico('nuevo')
+        self.assertEqual(len(opciones_medicos()), 4)
+
+        reserva = Reserva.objects.create(
+            paciente=self.paciente, medico=self.medicos[1], fecha=date.today(),
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+        )
+        response = self.client.get(reverse('admin:citas_reserva_changelist'), {'medico__id__exact': self.medicos[1].id})
+        self.assertEqual(list(response.context['cl'].result_list), [reserva])
+
+    def test_jerarquia_de_fechas_igual_a_distinct(self):
+        self.crear_reservas(80, desde=date(2023, 11, 28))
+        base = Reserva.objects.filter(estado=EstadoReserva.PENDIENTE)
+        listado = QuerySetListado(Reserva, query=base.query)
+        for tipo in ('year', 'month', 'day'):
+            self.assertEqual(listado.dates('fecha', tipo), list(base.dates('fecha', tipo)))
+        self.assertEqual(listado.dates('fecha', 'year', 'DESC'), [date(2025, 1, 1), date(2024, 1, 1), date(2023, 1, 1)])
+
+        for dias in (0, 40, 400):
+            HistorialMedico.objects.create(
+                paciente=self.paciente, medico=self.medicos[0], diagnostico='Control', tratamiento='Ninguno',
+                fecha=timezone.now() - timedelta(days=dias)
+            )
+        historial = HistorialMedico.objects.all()
+        listado = QuerySetListado(HistorialMedico, query=historial.query)
+        for tipo in ('year', 'month', 'day'):
+            self.assertEqual(listado.datetimes('fecha', tipo), list(historial.datetimes('fecha', tipo)))
+
+        response = self.client.get(reverse('admin:citas_reserva_changelist'), {'fecha__year': 2024})
+        self.assertEqual(response.context['cl'].result_count, Reserva.objects.filter(fecha__year=2024).count())
+
+    def test_conteo_estimado(self):
+        self.crear_reservas(30)
+        todas = Reserva.objects.all()
+        self.assertEqual(conteo_estimado(todas), 30)
+        self.assertEqual(conteo_estimado(todas, maximo=10), 10)
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            Reserva.objects.filter(pk__in=todas.values('pk')[:5]).delete()
+            # La estimación es la de ANALYZE; con filtros el conteo es exacto
+            self.assertEqual(conteo_estimado(todas, exacto_hasta=0), 30)
+            self.assertEqual(conteo_estimado(todas.filter(medico=self.medicos[0]), exacto_hasta=0), 8)
+
+
+@override_settings(ELIMINACIONES_EN_SEGUNDO_PLANO=False)
+class EliminacionTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico()
+        self.paciente = crear_paciente()
+        self.otro = crear_paciente('otro')
+        self.reservas = []
+        for n in range(7):
+            reserva = crear_reserva(Reserva(
+                paciente=self.otro if n == 6 else self.paciente, medico=self.medico,
+                fecha=date.today() + timedelta(days=n - 400 if n < 2 else n),
+                hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+            ), monto=Decimal('10000'))
+            HistorialMedico.objects.create(
+                paciente=reserva.paciente, medico=self.medico, reserva=reserva,
+                diagnostico='Control', tratamiento='Ninguno'
+            )
+            self.reservas.append(reserva)
+        Reserva.objects.filter(pk__in=[r.pk for r in self.reservas[:2]]).update(estado=EstadoReserva.COMPLETADA)
+        archivar()
+        self.staff = User.objects.create_user('admin', is_staff=True, is_superuser=True)
+
+    def test_eliminar_cuenta_por_lotes(self):
+        self.client.force_login(self.medico.user)
+        response = self.client.post(reverse('accounts:user_delete'))
+        self.assertRedirects(response, reverse('core:index'), fetch_redirect_response=False)
+
+        # La cuenta queda inactiva al instante y los datos siguen ahí
+        usuario = User.objects.get(pk=self.medico.user_id)
+        self.assertFalse(usuario.is_active)
+        self.assertFalse(Medico.objects.get(pk=self.medico.pk).disponible)
+        self.assertEqual(Reserva.objects.count(), 5)
+        eliminacion = Eliminacion.objects.get()
+        self.assertEqual(eliminacion.estado, EstadoEliminacion.PENDIENTE)
+        self.assertEqual(self.client.get(reverse('accounts:profile')).status_code, 302)
+
+        lotes = []
+        self.assertEqual(procesar_eliminaciones(tamano_lote=2, al_terminar_lote=lambda e: lotes.append(e.avance)), 1)
+        eliminacion.refresh_from_db()
+        self.assertEqual(eliminacion.estado, EstadoEliminacion.COMPLETADA)
+        # 5 reservas, 2 archivadas, 7 historiales y 7 agendas del día
+        self.assertEqual((eliminacion.avance, eliminacion.total), (21, 21))
+        self.assertGreater(len(lotes), 5)
+        self.assertFalse(User.objects.filter(pk=self.medico.user_id).exists())
+        for modelo in (Reserva, ReservaArchivada, Cobro, CobroArchivado, HistorialMedico):
+            self.assertFalse(modelo.objects.exists(), modelo)
+        # Los pacientes no se tocan
+        self.assertEqual(Paciente.objects.count(), 2)
+
+    def test_accion_del_admin_y_reanudacion(self):
+        self.client.force_login(self.staff)
+        seleccion = self.reservas[2:5]
+        self.client.post(reverse('admin:citas_reserva_changelist'), {
+            'action': 'eliminar_reservas_seleccionadas',
+            '_selected_action': [reserva.pk for reserva in seleccion],
+        })
+        eliminacion = Eliminacion.objects.get()
+        # La selección no se lee en la solicitud: el total lo cuenta el proceso de fondo
+        self.assertIsNone(eliminacion.total)
+        self.assertEqual(Reserva.objects.count(), 5)
+
+        def interrumpir(eliminacion):
+            raise RuntimeError('Proceso interrumpido')
+        with self.assertLogs('citas.eliminacion', 'ERROR'):
+            procesar_eliminacion(eliminacion, tamano_lote=2, al_terminar_lote=interrumpir)
+        eliminacion.refresh_from_db()
+        self.assertEqual((eliminacion.estado, eliminacion.avance), (EstadoEliminacion.FALLIDA, 2))
+        self.assertEqual(Reserva.objects.count(), 3)
+
+        response = self.client.get(reverse('admin:citas_eliminacion_changelist'))
+        self.assertContains(response, '2 / 3 (67%)')
+        self.client.post(reverse('admin:citas_eliminacion_changelist'), {
+            'action': 'reintentar', '_selected_action': [eliminacion.pk],
+        })
+        procesar_eliminaciones(tamano_lote=2)
+        eliminacion.refresh_from_db()
+        self.assertEqual((eliminacion.estado, eliminacion.avance), (EstadoEliminacion.COMPLETADA, 3))
+        self.assertEqual(set(Reserva.objects.values_list('pk', flat=True)), {self.reservas[5].pk, self.reservas[6].pk})
+        self.assertFalse(Cobro.objects.filter(reserva_id__in=[reserva.pk for reserva in seleccion]).exists())
+        # El historial se conserva sin la reserva
+        self.assertEqual(HistorialMedico.objects.filter(reserva__isnull=True, reserva_archivada__isnull=True).count(), 3)
+
+    def test_seleccion_completa_sin_leer_ids(self):
+        self.client.force_login(self.staff)
+        url = reverse('admin:citas_reserva_changelist')
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.post(f'{url}?paciente__id__exact={self.paciente.pk}', {
+                'action': 'eliminar_reservas_seleccionadas', 'select_across': '1',
+                '_selected_action': [self.reservas[2].pk],
+            })
+        # Fuera del conteo acotado del listado, ninguna consulta lee la selección durante la solicitud
+        self.assertFalse(any(
+            f'"citas_reserva"."paciente_id" = {self.paciente.pk}' in q['sql'] and 'COUNT(*)' not in q['sql']
+            for q in consultas.captured_queries
+        ))
+        # Una reserva creada después de pedir el borrado no entra en la selección
+        nueva = crear_reserva(Reserva(
+            paciente=self.paciente, medico=self.medico, fecha=date.today() + timedelta(days=30),
+            hora_inicio=time(9, 0), hora_fin=time(9, 30), motivo='Control'
+        ))
+        procesar_eliminaciones(tamano_lote=2)
+        eliminacion = Eliminacion.objects.get()
+        self.assertEqual((eliminacion.estado, eliminacion.avance, eliminacion.total), (EstadoEliminacion.COMPLETADA, 4, 4))
+        self.assertEqual(set(Reserva.objects.values_list('pk', flat=True)), {self.reservas[6].pk, nueva.pk})
+
+    def test_una_sola_ejecucion_por_eliminacion(self):
+        seleccion = self.reservas[2:5]
+        eliminacion = eliminar_reservas(Reserva.objects.filter(pk__in=[r.pk for r in seleccion]))
+        # Otro proceso la tiene y su plazo sigue vigente
+        Eliminacion.objects.filter(pk=eliminacion.pk).update(
+            estado=EstadoEliminacion.EN_CURSO, reclamada_por='otro',
+            reclamada_hasta=timezone.now() + timedelta(minutes=1),
+        )
+        self.assertEqual(procesar_eliminaciones(), 0)
+        self.assertEqual(procesar_eliminacion(eliminacion).reclamada_por, 'otro')
+        self.assertEqual(Reserva.objects.count(), 5)
+
+        # El proceso murió: al vencer el plazo se retoma. Una reserva ya no existía
+        seleccion[0].delete()
+        Eliminacion.objects.filter(pk=eliminacion.pk).update(reclamada_hasta=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(procesar_eliminaciones(tamano_lote=2), 1)
+        eliminacion.refresh_from_db()
+        self.assertEqual((eliminacion.avance, eliminacion.total, eliminacion.porcentaje), (2, 2, 100))
+        self.assertEqual((eliminacion.reclamada_por, eliminacion.reclamada_hasta), ('', None))
+        self.assertEqual(Reserva.objects.count(), 2)
+
+    def test_plazo_perdido_revierte_el_lote(self):
+        seleccion = self.reservas[2:5]
+        eliminacion = eliminar_reservas(Reserva.objects.filter(pk__in=[r.pk for r in seleccion]))
+
+        def tomada_por_otro(eliminacion):
+            Eliminacion.objects.filter(pk=eliminacion.pk).update(reclamada_por='otro')
+        with self.assertLogs('citas.eliminacion', 'WARNING'):
+            procesar_eliminacion(eliminacion, tamano_lote=2, al_terminar_lote=tomada_por_otro)
+        # Solo el primer lote se aplicó; la fila sigue en curso para el otro proceso
+        self.assertEqual((eliminacion.estado, eliminacion.avance), (EstadoEliminacion.EN_CURSO, 2))
+        self.assertEqual(eliminacion.ultimo_id, seleccion[1].pk)
+        self.assertEqual(list(Reserva.objects.filter(pk__in=[r.pk for r in seleccion])), [seleccion[2]])
+
+    def test_conserva_las_solicitudes_de_pago_sin_el_usuario(self):
+        pagar_cobro(self.reservas[2].cobro, 'Tarjeta', clave='pago-1', usuario=self.paciente.user)
+        procesar_eliminacion(eliminar_usuario(self.paciente.user, despertar=False))
+
+        solicitud = SolicitudPago.objects.get()
+        self.assertEqual((solicitud.clave, solicitud.cobro_id, solicitud.usuario_id), ('pago-1', None, None))
+        # La clave sigue usada: no sirve para pagar otro cobro
+        with self.assertRaises(ClaveReutilizada):
+            pagar_cobro(self.reservas[6].cobro, 'Tarjeta', clave='pago-1')
+
+    def test_admin_de_usuarios_programa_la_eliminacion(self):
+        self.client.force_login(self.staff)
+        response = self.client.post(
+            reverse('admin:auth_user_delete', args=[self.paciente.user_id]), {'post': 'yes'}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(User.objects.get(pk=self.paciente.user_id).is_active)
+        self.assertEqual(Eliminacion.objects.get().usuario_id, self.paciente.user_id)
+        procesar_eliminaciones()
+        self.assertFalse(User.objects.filter(pk=self.paciente.user_id).exists())
+        self.assertEqual(Reserva.objects.filter(paciente=self.otro).count(), 1)
+
+
+class OcupacionTests(TestCase):
+    url = '/citas/api/ocupacion/'
+    # Dos semanas completas: lunes 1 a domingo 14 de enero de 2024
+    periodo = {'desde': '2024-01-01', 'hasta': '2024-01-14'}
+
+    def setUp(self):
+        cache.clear()
+        self.medico = crear_medico(inicio=time(8, 0), fin=time(12, 0))
+        self.paciente = crear_paciente()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def reservar(self, fecha, inicio, fin, estado=EstadoReserva.CONFIRMADA):
+        return Reserva.objects.create(
+            paciente=self.paciente, medico=self.medico, fecha=fecha,
+            hora_inicio=inicio, hora_fin=fin, motivo='Control', estado=estado
+        )
+
+    def consultar(self, **params):
+        response = self.client.get(self.url, {**self.periodo, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_minutos_por_hora_y_dias_de_la_semana(self):
+        minutos = minutos_por_hora(np.array([9 * 60 + 30, 23 * 60]), np.array([11 * 60, 24 * 60]))
+        self.assertEqual(minutos[0, 9:12].tolist(), [30, 60, 0])
+        self.assertEqual(minutos[1, 23], 60)
+        self.assertEqual(minutos.sum(), 150)
+        self.assertEqual(dias_de_la_semana(date(2024, 1, 1), date(2024, 1, 14)).tolist(), [2] * 7)
+        self.assertEqual(dias_de_la_semana(date(2024, 1, 6), date(2024, 1, 8)).tolist(), [1, 0, 0, 0, 0, 1, 1])
+
+    def test_ocupacion_por_dia_y_hora(self):
+        self.reservar(date(2024, 1, 1), time(9, 30), time(10, 30))
+        self.reservar(date(2024, 1, 8), time(9, 0), time(10, 0), EstadoReserva.COMPLETADA)
+        self.reservar(date(2024, 1, 8), time(11, 0), time(12, 0), EstadoReserva.CANCELADA)
+        self.reservar(date(2024, 1, 9), time(13, 0), time(13, 30))
+        # Las completadas archivadas siguen contando
+        archivar(dias=0)
+
+        medico = self.consultar()['medicos'][0]
+        # Lunes: 90 de 120 minutos a las 9, 30 de 120 a las 10
+        self.assertEqual(medico['tabla'][0][8:12], [0.0, 0.75, 0.25, 0.0])
+        self.assertIsNone(medico['tabla'][0][12])
+        self.assertEqual(medico['minutos_reservados'], 150)
+        self.assertEqual(medico['minutos_disponibles'], 4 * 60 * 14)
+        self.assertEqual(medico['minutos_fuera_de_horario'], 30)
+        self.assertEqual(medico['sobrecargadas'], [])
+        self.assertIn({'dia': 'lunes', 'hora': 10, 'ocupacion': 0.25}, medico['subutilizadas'])
+        self.assertNotIn(9, [celda['hora'] for celda in medico['subutilizadas'] if celda['dia'] == 'lunes'])
+
+    def test_filtros_y_total(self):
+        otro = crear_medico('otro', inicio=time(9, 0), fin=time(10, 0))
+        self.reservar(date(2024, 1, 1), time(9, 0), time(10, 0))
+        for fecha in (date(2024, 1, 1), date(2024, 1, 8)):
+            Reserva.objects.create(
+                paciente=self.paciente, medico=otro, fecha=fecha,
+                hora_inicio=time(9, 0), hora_fin=time(10, 0), motivo='Control'
+            )
+        datos = self.consultar()
+        # Lunes a las 9: 180 minutos reservados de 240 disponibles entre ambos
+        self.assertEqual(datos['total'][0][9], 0.75)
+        self.assertEqual(len(datos['medicos']), 2)
+        self.assertEqual(self.consultar(medico=otro.id)['medicos'][0]['sobrecargadas'], [
+            {'dia': 'lunes', 'hora': 9, 'ocupacion': 1.0}
+        ])
+
+    def test_reservas_del_periodo_en_cache(self):
+        self.reservar(date(2024, 1, 1), time(9, 0), time(10, 0))
+        self.consultar()
+        # Las reservas salen de la cache: solo se consultan los médicos
+        with self.assertNumQueries(1):
+            self.consultar()
+        self.assertEqual(self.consultar(desde='2024-01-02')['medicos'][0]['minutos_reservados'], 0)
+
+    def test_valida_periodo_y_permisos(self):
+        response = self.client.get(self.url, {'desde': '2023-01-01', 'hasta': '2024-06-01'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(self.url, {'desde': '2024-01-02', 'hasta': '2024-01-01'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(self.client.get(self.url).data['medicos']), 1)
+
+        self.client.force_authenticate(self.medico.user)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class DisponibilidadTests(TestCase):
+    def setUp(self):
+        self.medico = crear_medico(inicio=time(8, 0), fin=time(10, 0))
+        self.paciente = crear_paciente()
+        self.fecha = date.today() + timedelta(days=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.paciente.user)
+
+    def reservar(self, inicio, fin, estado=EstadoReserva.PENDIENTE):
+        return Reserva.objects.create(
+            paciente=self.paciente, medico=self.medico, fecha=self.fecha,
+            hora_inicio=inicio, hora_fin=fin, motivo='Control', estado=estado
+        )
+
+    def test_bloques_con_solapamientos(self):
+        # Reservas que se solapan entre sí y una que empieza antes de la jornada
+        ocupados = [(470, 490), (510, 540), (530, 560)]
+        self.assertEqual(bloques_libres(480, 600, ocupados, 30), [(560, 590)])
+        self.assertEqual(bloques_libres(480, 600, [(500, 510), (505, 520)], 20), [(480, 500), (520, 540), (540, 560), (560, 580), (580, 600)])
+
+    def test_bloques_en_los_bordes_de_la_jornada(self):
+        self.assertEqual(bloques_libres(480, 600, [(480, 510), (570, 600)], 30), [(510, 540), (540, 570)])
+        # Una reserva que pasa del fin de la jornada corta el barrido
+        self.assertEqual(bloques_libres(480, 600, [(540, 620)], 30), [(480, 510), (510, 540)])
+        self.assertEqual(bloques_libres(480, 600, [(400, 700)], 30), [])
+        self.assertEqual(bloques_libres(480, 600, [], 90), [(480, 570)])
+
+    def test_ignora_reservas_canceladas(self):
+        self.reservar(time(8, 0), time(8, 30))
+        self.reservar(time(9, 0), time(9, 30), estado=EstadoReserva.CANCELADA)
+        agenda = calcular_disponibilidad(self.medico, self.fecha, self.fecha)[self.medico.id]
+        self.assertEqual(agenda[self.fecha], [(time(8, 30), time(9, 0)), (time(9, 0), time(9, 30)), (time(9, 30), time(10, 0))])
+
+    def test_hoy_solo_bloques_que_no_empezaron(self):
+        hoy = date.today()
+        ahora = datetime.combine(hoy, time(9, 10))
+        agenda = calcular_disponibilidad(self.medico, hoy - timedelta(days=1), hoy, ahora=ahora)[self.medico.id]
+        self.assertEqual(agenda[hoy - timedelta(days=1)], [])
+        self.assertEqual(agenda[hoy], [(time(9, 30), time(10, 0))])
+
+    def test_medicos_sin_horario_o_no_disponibles(self):
+        sin_horario = crear_medico('sin_horario', inicio=None, fin=None)
+        ausente = crear_medico('ausente')
+        ausente.disponible = False
+        ausente.save()
+        resultado = calcular_disponibilidad([self.medico, sin_horario, ausente], self.fecha, self.fecha)
+        self.assertEqual(list(resultado), [self.medico.id])
+
+    def test_parsear_parametros(self):
+        hoy = date(2025, 3, 10)
+        self.assertEqual(parsear_parametros({}, hoy), (hoy, date(2025, 3, 16), 30))
+        self.assertEqual(
+            parsear_parametros({'desde': '2025-03-12', 'hasta': '2025-03-12', 'duracion': '45'}, hoy),
+            (date(2025, 3, 12), date(2025, 3, 12), 45)
+        )
+        for params in (
+            {'desde': '10/03/2025'}, {'desde': '2025-03-09'}, {'desde': '2025-03-10', 'hasta': '2025-03-09'},
+            {'hasta': (hoy + timedelta(days=MAX_DIAS_RANGO)).isoformat()},
+            {'duracion': 'media hora'}, {'duracion': '4'}, {'duracion': '481'},
+        ):
+            with self.assertRaises(ValueError):
+                parsear_parametros(params, hoy)
+
+    def test_api_de_un_medico(self):
+        self.reservar(time(8, 30), time(9, 30))
+        response = self.client.get(f'/medicos/api/medicos/{self.medico.pk}/disponibilidad/', {
+            'desde': self.fecha.isoformat(), 'hasta': self.fecha.isoformat(), 'duracion': 30
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['dias'], [{
+            'fecha': self.fecha.isoformat(),
+            'bloques': [{'hora_inicio': '08:00', 'hora_fin': '08:30'}, {'hora_inicio': '09:30', 'hora_fin': '10:00'}],
+        }])
+
+    def test_api_general_solo_medicos_disponibles(self):
+        ausente = crear_medico('ausente')
+        ausente.disponible = False
+        ausente.save()
+        response = self.client.get('/medicos/api/medicos/disponibilidad/', {
+            'desde': self.fecha.isoformat(), 'hasta': self.fecha.isoformat(), 'duracion': 60
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([fila['medico']['id'] for fila in response.data['results']], [self.medico.id])
+        self.assertEqual(len(response.data['results'][0]['dias'][0]['bloques']), 2)
+
+    def test_api_parametros_invalidos(self):
+        for url in (f'/medicos/api/medicos/{self.medico.pk}/disponibilidad/', '/medicos/api/medicos/disponibilidad/'):
+            for params in ({'desde': 'mañana'}, {'desde': '2020-01-01'}, {'duracion': 'x'}, {'hasta': '2020-01-01'}):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400, (url, params))
+                self.assertIn('error', response.data)
+
+
+class ReservaConcurrenteTests(TransactionTestCase):
+    """
+    Prueba de estrés: cientos de reservas simultáneas sobre bloques que se
+    solapan no deben producir ningún cruce en la agenda.
+    """
+    HILOS = 16
+    INTENTOS = 300
+
+    def setUp(self):
+        self.medicos = [crear_medico(f'medico{n}') for n in range(3)]
+        self.pacientes = [crear_paciente(f'paciente{n}') for n in range(10)]
+        self.fecha = date.today() + timedelta(days=1)
+
+    def reservar(self, n):
+        generador = random.Random(n)
+        inicio = generador.randrange(8 * 60, 12 * 60, 15)
+        duracion = generador.choice([15, 30, 45])
+        reserva = Reserva(
+            paciente=generador.choice(self.pacientes),
+            medico=generador.choice(self.medicos),
+            fecha=self.fecha,
+            hora_inicio=time(inicio // 60, inicio % 60),
+            hora_fin=time((inicio + duracion) // 60, (inicio + duracion) % 60),
+            motivo='Prueba de concurrencia',
+        )
+        try:
+            crear_reserva(reserva)
+            return True
+        except ConflictoAgenda:
+            return False
+        finally:
+            connection.close()
+
+    def test_reservas_concurrentes_sin_solapamientos(self):
+        inicio = reloj.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.HILOS) as executor:
+            resultados = list(executor.map(self.reservar, range(self.INTENTOS)))
+        transcurrido = reloj.perf_counter() - inicio
+
+        creadas = sum(resultados)
+        logger.info(
+            '%s reservas concurrentes (%s hilos): %s creadas en %.2fs (%.0f reservas/s)',
+            self.INTENTOS, self.HILOS, creadas, transcurrido, self.INTENTOS / transcurrido,
+        )
+        self.assertGreater(creadas, 0)
+        self.assertEqual(Reserva.objects.count(), creadas)
+        self.assertEqual(Cobro.objects.count(), creadas)
+        for medico in self.medicos:
+            self.assertEqual(solapamientos(medico), [])
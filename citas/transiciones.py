@@ -0,0 +1,141 @@
+"""
+Máquina de estados de las reservas.
+
+Todo cambio de estado pasa por aquí: se valida contra TRANSICIONES, se
+aplica con un UPDATE condicional sobre el estado de origen (nunca con un
+save() de la fila completa) y se registra en TransicionReserva. Los cambios
+por conjunto (confirmar el día de un médico, acciones del admin, vencimiento
+de pendientes, cancelar una serie) se hacen por lotes: un UPDATE por estado
+de origen y un bulk_create del registro por lote, sin importar cuántas
+reservas haya en él.
+
+Como QuerySet.update no emite señales, se invalidan aquí las agendas
+afectadas, y los bloques cancelados que aún no ocurren se ofrecen a la
+lista de espera.
+"""
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .agenda import invalidar_agendas
+from .lista_espera import liberar_cupos
+from .models import Reserva, TransicionReserva, EstadoReserva, ESTADOS_VIGENTES
+
+TAMANO_LOTE = 1000
+
+TRANSICIONES = {
+    EstadoReserva.PENDIENTE: {EstadoReserva.CONFIRMADA, EstadoReserva.COMPLETADA, EstadoReserva.CANCELADA},
+    EstadoReserva.CONFIRMADA: {EstadoReserva.COMPLETADA, EstadoReserva.CANCELADA},
+    EstadoReserva.COMPLETADA: set(),
+    EstadoReserva.CANCELADA: set(),
+}
+
+
+class TransicionInvalida(Exception):
+    """El cambio de estado no está permitido o la reserva ya cambió de estado."""
+
+
+def permitida(desde, hacia):
+    return hacia in TRANSICIONES.get(desde, set())
+
+
+def origenes(hacia):
+    """Estados desde los que se puede llegar a `hacia`."""
+    return [estado for estado, destinos in TRANSICIONES.items() if hacia in destinos]
+
+
+def _efectos(filas, hacia):
+    """Agendas a invalidar y cupos liberados para filas (id, medico_id, fecha, hora_inicio, hora_fin, anterior)."""
+    if hacia == EstadoReserva.CANCELADA:
+        liberados = defaultdict(list)
+        for reserva_id, medico_id, fecha, hora_inicio, hora_fin, anterior in filas:
+            if anterior in ESTADOS_VIGENTES:
+                liberados[medico_id].append((reserva_id, fecha, hora_inicio, hora_fin))
+        for medico_id, bloques in liberados.items():
+            liberar_cupos(medico_id, bloques)
+    agendas = {(medico_id, fecha) for _, medico_id, fecha, _, _, _ in filas}
+    if agendas:
+        transaction.on_commit(lambda: invalidar_agendas(agendas))
+
+
+def _registrar(filas, hacia, usuario, origen, marca):
+    TransicionReserva.objects.bulk_create([
+        TransicionReserva(
+            reserva_id=fila[0], estado_anterior=fila[-1], estado_nuevo=hacia,
+            origen=origen, usuario=usuario, fecha=marca,
+        )
+        for fila in filas
+    ], batch_size=TAMANO_LOTE)
+
+
+def transicionar(reserva, hacia, origen, usuario=None):
+    """
+    Cambia el estado de una reserva. Lanza TransicionInvalida si el cambio
+    no está permitido desde su estado o si otro proceso la cambió antes.
+    """
+    anterior = reserva.estado
+    if not permitida(anterior, hacia):
+        raise TransicionInvalida(
+            f'Una reserva {EstadoReserva(anterior).label.lower()} no puede pasar a {EstadoReserva(hacia).label.lower()}.'
+        )
+    with transaction.atomic():
+        marca = timezone.now()
+        if not Reserva.objects.filter(pk=reserva.pk, estado=anterior).update(estado=hacia, fecha_modificacion=marca):
+            raise TransicionInvalida('La reserva cambió de estado; vuelve a cargarla.')
+        filas = [(reserva.pk, reserva.medico_id, reserva.fecha, reserva.hora_inicio, reserva.hora_fin, anterior)]
+        _registrar(filas, hacia, usuario, origen, marca)
+        _efectos(filas, hacia)
+    reserva.estado = hacia
+    reserva.fecha_modificacion = marca
+    return reserva
+
+
+def _transicionar_lote(queryset, ids, hacia, usuario, origen):
+    """
+    Un UPDATE condicional por estado de origen sobre `ids`. Cada estado usa
+    su propia marca de fecha_modificacion, de modo que las filas cambiadas
+    (y su estado anterior) se leen después sin contar las que otro proceso
+    movió entre la selección y el UPDATE.
+    """
+    marca = timezone.now()
+    filas = []
+    for n, anterior in enumerate(origenes(hacia)):
+        marca_estado = marca + timedelta(microseconds=n)
+        if queryset.filter(id__in=ids, estado=anterior).update(estado=hacia, fecha_modificacion=marca_estado):
+            filas += [
+                (*fila, anterior)
+                for fila in Reserva.objects
+                .filter(id__in=ids, estado=hacia, fecha_modificacion=marca_estado)
+                .order_by('id')
+                .values_list('id', 'medico_id', 'fecha', 'hora_inicio', 'hora_fin')
+            ]
+    _registrar(filas, hacia, usuario, origen, marca)
+    _efectos(filas, hacia)
+    return filas
+
+
+def transicionar_en_lote(queryset, hacia, origen, usuario=None, tamano_lote=TAMANO_LOTE, atomico=True):
+    """
+    Lleva a `hacia` todas las reservas de `queryset` que puedan pasar a ese
+    estado; las demás se omiten. Retorna las filas cambiadas como
+    (id, medico_id, fecha, hora_inicio, hora_fin, estado_anterior).
+
+    Con atomico=True todo ocurre en una transacción; con False cada lote de
+    `tamano_lote` reservas confirma por separado, para no retener bloqueos
+    largos en procesos masivos.
+    """
+    candidatas = queryset.filter(estado__in=origenes(hacia)).order_by('id').values_list('id', flat=True)
+    filas = []
+    with transaction.atomic() if atomico else nullcontext():
+        ultimo = 0
+        while True:
+            ids = list(candidatas.filter(id__gt=ultimo)[:tamano_lote])
+            if not ids:
+                return filas
+            with transaction.atomic():
+                filas += _transicionar_lote(queryset, ids, hacia, usuario, origen)
+            ultimo = ids[-1]
+
@@ -10,4 +10,10 @@ urlpatterns = [
     path("reservas/<int:reserva_pk>/historial/crear/", views.historial_crear, name="historial_crear"),
     path("reservas/<int:reserva_pk>/cobro/actualizar/", views.cobro_actualizar, name="cobro_actualizar"),
     path("reservas/<int:reserva_pk>/cobro/pagar/", views.cobro_pagar, name="cobro_pagar"),
+    path("reservas/<int:reserva_pk>/cobro/comprobante/", views.cobro_comprobante, name="cobro_comprobante"),
+    path("lista-espera/", views.lista_espera, name="lista_espera"),
+    path("lista-espera/<int:pk>/retirar/", views.lista_espera_retirar, name="lista_espera_retirar"),
+    path("ofertas/<int:pk>/responder/", views.oferta_responder, name="oferta_responder"),
+    path("calendario/", views.calendario_suscripcion, name="calendario_suscripcion"),
+    path("calendario/<str:token>.ics", views.calendario_feed, name="calendario_feed"),
 ]
@@ -1,11 +1,32 @@
+import uuid
+
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import require_GET, require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
-from .models import Reserva, HistorialMedico, Cobro, EstadoReserva
-from .forms import ReservaForm, HistorialMedicoForm, CobroForm
+from django.db import transaction
+from .models import (
+    Reserva, EstadoReserva, SuscripcionCalendario,
+    SolicitudEspera, OfertaCupo, EstadoEspera, EstadoOferta, ReservaArchivada, ResultadoPago,
+    OrigenTransicion,
+)
+from .forms import ReservaForm, HistorialMedicoForm, CobroForm, FiltroReservasForm, SolicitudEsperaForm
+from .services import crear_reserva, pagar_cobro, ConflictoAgenda, ClaveReutilizada
+from .paginacion import paginar_keyset
+from .calendario import generar_feed, version_del_feed
+from .archivo import reserva_archivada
+from .comprobantes import datos_comprobante, obtener_comprobante, respuesta_comprobante
+from .transiciones import transicionar, permitida, TransicionInvalida
+from .lista_espera import aceptar_oferta, rechazar_oferta, OfertaNoDisponible
 from pacientes.models import Paciente
-from medicos.models import Medico
+
+RESERVAS_POR_PAGINA = 20
+ORDEN_RESERVAS = ('fecha', 'hora_inicio', 'id')
 
 @login_required
 def reserva_crear(request):
@@ -15,13 +36,15 @@ def reserva_crear(request):
             reserva = form.save(commit=False)
             paciente, _ = Paciente.objects.get_or_create(user=request.user)
             reserva.paciente = paciente
-            reserva.save()
             
-            # Crear cobro automáticamente
-            Cobro.objects.create(reserva=reserva, monto=0)
-            
-            messages.success(request, "Reserva creada con éxito.")
-            return redirect('citas:reserva_lista')
+            # Guardar la reserva y su cobro sin solaparse con otras del médico
+            try:
+                crear_reserva(reserva, monto=0)
+            except ConflictoAgenda as e:
+                form.add_error(None, str(e))
+            else:
+                messages.success(request, "Reserva creada con éxito.")
+                return redirect('citas:reserva_lista')
     else:
         form = ReservaForm()
     
@@ -32,42 +55,106 @@ def reserva_crear(request):
 
 @login_required
 def reserva_lista(request):
-    if hasattr(request.user, 'paciente'):
-        reservas = Reserva.objects.filter(paciente=request.user.paciente)
+    es_paciente = hasattr(request.user, 'paciente')
+    if es_paciente:
+        filtro_usuario = {'paciente': request.user.paciente}
     elif hasattr(request.user, 'medico'):
-        reservas = Reserva.objects.filter(medico=request.user.medico)
+        filtro_usuario = {'medico': request.user.medico}
     else:
-        reservas = Reserva.objects.none()
+        filtro_usuario = None
+    
+    # Las citas antiguas cerradas viven en el archivo y se consultan a pedido
+    filtros = FiltroReservasForm(request.GET)
+    incluir_archivo = filtros.is_valid() and filtros.cleaned_data['archivadas']
+    modelos = [Reserva, ReservaArchivada] if incluir_archivo else [Reserva]
+    
+    querysets = []
+    for modelo in modelos:
+        reservas = modelo.objects.filter(**filtro_usuario) if filtro_usuario else modelo.objects.none()
+        if filtros.is_valid():
+            if filtros.cleaned_data['estado']:
+                reservas = reservas.filter(estado=filtros.cleaned_data['estado'])
+            if filtros.cleaned_data['desde']:
+                reservas = reservas.filter(fecha__gte=filtros.cleaned_data['desde'])
+            if filtros.cleaned_data['hasta']:
+                reservas = reservas.filter(fecha__lte=filtros.cleaned_data['hasta'])
+        querysets.append(reservas.select_related('medico__user', 'paciente__user'))
+    
+    # Paginación por cursor: cada página cuesta lo mismo sin importar el historial
+    try:
+        pagina = paginar_keyset(
+            querysets, ORDEN_RESERVAS, RESERVAS_POR_PAGINA,
+            despues=request.GET.get('despues'), antes=request.GET.get('antes')
+        )
+    except ValueError:
+        messages.error(request, "El enlace de paginación no es válido.")
+        pagina = paginar_keyset(querysets, ORDEN_RESERVAS, RESERVAS_POR_PAGINA)
+    
+    # Parámetros de filtro para conservarlos en los enlaces de paginación
+    parametros = request.GET.copy()
+    parametros.pop('despues', None)
+    parametros.pop('antes', None)
     
     return render(request, 'citas/reserva_lista.html', {
-        'reservas': reservas
+        'reservas': pagina.items,
+        'pagina': pagina,
+        'filtros': filtros,
+        'filtros_query': parametros.urlencode(),
+        'es_paciente': es_paciente
     })
 
+def _reserva_con_relaciones(pk, incluir_archivo=False):
+    """
+    Obtiene la reserva junto a médico, paciente, sus usuarios, cobro e
+    historial en una sola consulta. Con incluir_archivo, si la reserva ya
+    no está en la tabla principal se busca en el archivo.
+    """
+    reserva = (
+        Reserva.objects
+        .select_related('medico__user', 'paciente__user', 'cobro', 'historial')
+        .filter(pk=pk)
+        .first()
+    )
+    if reserva is None and incluir_archivo:
+        reserva = reserva_archivada(pk)
+    if reserva is None:
+        raise Http404("No existe la reserva.")
+    return reserva
+
+def _es_paciente_de(user, reserva):
+    # Se comparan ids de usuario ya cargados con la reserva, sin consultar perfiles
+    return reserva.paciente.user_id == user.id
+
+def _es_medico_de(user, reserva):
+    return reserva.medico.user_id == user.id
+
 @login_required
 def reserva_detalle(request, pk):
-    reserva = get_object_or_404(Reserva, pk=pk)
+    reserva = _reserva_con_relaciones(pk, incluir_archivo=True)
+    es_paciente = _es_paciente_de(request.user, reserva)
+    es_medico = _es_medico_de(request.user, reserva)
     
     # Verificar que el usuario sea el paciente o el médico de la reserva
-    if not (hasattr(request.user, 'paciente') and request.user.paciente == reserva.paciente) and \
-       not (hasattr(request.user, 'medico') and request.user.medico == reserva.medico):
+    if not es_paciente and not es_medico:
         messages.error(request, "No tienes permiso para ver esta reserva.")
         return redirect('citas:reserva_lista')
     
-    historial = HistorialMedico.objects.filter(reserva=reserva).first()
-    cobro = Cobro.objects.filter(reserva=reserva).first()
-    
     return render(request, 'citas/reserva_detalle.html', {
         'reserva': reserva,
-        'historial': historial,
-        'cobro': cobro
+        'historial': getattr(reserva, 'historial', None),
+        'cobro': getattr(reserva, 'cobro', None),
+        # Repetir el enlace de pago (doble clic, recarga) reutiliza la clave
+        'clave_pago': uuid.uuid4().hex,
+        'es_paciente': es_paciente,
+        'es_medico': es_medico
     })
 
 @login_required
 def reserva_cancelar(request, pk):
-    reserva = get_object_or_404(Reserva, pk=pk)
+    reserva = _reserva_con_relaciones(pk)
     
     # Verificar que el usuario sea el paciente de la reserva
-    if not hasattr(request.user, 'paciente') or request.user.paciente != reserva.paciente:
+    if not _es_paciente_de(request.user, reserva):
         messages.error(request, "No tienes permiso para cancelar esta reserva.")
         return redirect('citas:reserva_lista')
     
@@ -75,33 +162,43 @@ def reserva_cancelar(request, pk):
         messages.error(request, "No se puede cancelar esta reserva.")
         return redirect('citas:reserva_detalle', pk=reserva.pk)
     
-    reserva.estado = EstadoReserva.CANCELADA
-    reserva.save()
+    try:
+        # El bloque se ofrece a la lista de espera fuera de esta solicitud
+        transicionar(reserva, EstadoReserva.CANCELADA, OrigenTransicion.WEB, usuario=request.user)
+    except TransicionInvalida as e:
+        messages.error(request, str(e))
+        return redirect('citas:reserva_detalle', pk=reserva.pk)
     messages.success(request, "Reserva cancelada con éxito.")
     
     return redirect('citas:reserva_lista')
 
 @login_required
 def historial_crear(request, reserva_pk):
-    reserva = get_object_or_404(Reserva, pk=reserva_pk)
+    reserva = _reserva_con_relaciones(reserva_pk)
     
     # Verificar que el usuario sea el médico de la reserva
-    if not hasattr(request.user, 'medico') or request.user.medico != reserva.medico:
+    if not _es_medico_de(request.user, reserva):
         messages.error(request, "No tienes permiso para crear un historial médico.")
         return redirect('citas:reserva_lista')
     
+    if not permitida(reserva.estado, EstadoReserva.COMPLETADA):
+        messages.error(request, "Solo se puede registrar la consulta de una reserva vigente.")
+        return redirect('citas:reserva_detalle', pk=reserva.pk)
+    
     if request.method == "POST":
         form = HistorialMedicoForm(request.POST)
         if form.is_valid():
-            historial = form.save(commit=False)
-            historial.paciente = reserva.paciente
-            historial.medico = reserva.medico
-            historial.reserva = reserva
-            historial.save()
-            
-            # Actualizar estado de la reserva
-            reserva.estado = EstadoReserva.COMPLETADA
-            reserva.save()
+            try:
+                with transaction.atomic():
+                    historial = form.save(commit=False)
+                    historial.paciente_id = reserva.paciente_id
+                    historial.medico_id = reserva.medico_id
+                    historial.reserva = reserva
+                    historial.save()
+                    transicionar(reserva, EstadoReserva.COMPLETADA, OrigenTransicion.WEB, usuario=request.user)
+            except TransicionInvalida as e:
+                messages.error(request, str(e))
+                return redirect('citas:reserva_detalle', pk=reserva.pk)
             
             messages.success(request, "Historial médico creado con éxito.")
             return redirect('citas:reserva_detalle', pk=reserva.pk)
@@ -115,11 +212,13 @@ def historial_crear(request, reserva_pk):
 
 @login_required
 def cobro_actualizar(request, reserva_pk):
-    reserva = get_object_or_404(Reserva, pk=reserva_pk)
-    cobro = get_object_or_404(Cobro, reserva=reserva)
+    reserva = _reserva_con_relaciones(reserva_pk)
+    cobro = getattr(reserva, 'cobro', None)
+    if cobro is None:
+        raise Http404("La reserva no tiene cobro.")
     
     # Verificar que el usuario sea el médico de la reserva
-    if not hasattr(request.user, 'medico') or request.user.medico != reserva.medico:
+    if not _es_medico_de(request.user, reserva):
         messages.error(request, "No tienes permiso para actualizar el cobro.")
         return redirect('citas:reserva_lista')
     
@@ -138,21 +237,156 @@ def cobro_actualizar(request, reserva_pk):
     })
 
 @login_required
+@require_POST
 def cobro_pagar(request, reserva_pk):
-    reserva = get_object_or_404(Reserva, pk=reserva_pk)
-    cobro = get_object_or_404(Cobro, reserva=reserva)
+    reserva = _reserva_con_relaciones(reserva_pk)
+    cobro = getattr(reserva, 'cobro', None)
+    if cobro is None:
+        raise Http404("La reserva no tiene cobro.")
     
     # Verificar que el usuario sea el paciente de la reserva
-    if not hasattr(request.user, 'paciente') or request.user.paciente != reserva.paciente:
+    if not _es_paciente_de(request.user, reserva):
         messages.error(request, "No tienes permiso para pagar este cobro.")
         return redirect('citas:reserva_lista')
     
-    if cobro.pagado:
+    # Simulación de pago
+    clave = request.POST.get('clave', '')[:100] or None
+    try:
+        solicitud, _ = pagar_cobro(cobro, "Tarjeta de crédito", clave=clave, usuario=request.user)
+    except ClaveReutilizada:
+        messages.error(request, "No se pudo procesar el pago. Inténtalo nuevamente.")
+        return redirect('citas:reserva_detalle', pk=reserva.pk)
+    
+    if solicitud.resultado == ResultadoPago.YA_PAGADO:
         messages.info(request, "Este cobro ya ha sido pagado.")
+    else:
+        messages.success(request, "Pago realizado con éxito.")
+    
+    return redirect('citas:reserva_detalle', pk=reserva.pk)
+
+@login_required
+def cobro_comprobante(request, reserva_pk):
+    """Descarga el PDF del cobro; si aún no está generado se encola y se avisa."""
+    reserva = _reserva_con_relaciones(reserva_pk, incluir_archivo=True)
+    cobro = getattr(reserva, 'cobro', None)
+    if cobro is None:
+        raise Http404("La reserva no tiene cobro.")
+    
+    if not _es_paciente_de(request.user, reserva) and not _es_medico_de(request.user, reserva):
+        messages.error(request, "No tienes permiso para ver este cobro.")
+        return redirect('citas:reserva_lista')
+    
+    datos = datos_comprobante(cobro.pk)
+    ruta = obtener_comprobante(datos)
+    if ruta is None:
+        messages.info(request, "Estamos generando tu comprobante. Vuelve a descargarlo en unos segundos.")
         return redirect('citas:reserva_detalle', pk=reserva.pk)
+    return respuesta_comprobante(request, datos, ruta)
+
+@login_required
+def calendario_suscripcion(request):
+    """Muestra (y permite regenerar) el enlace del feed iCalendar del usuario."""
+    if hasattr(request.user, 'medico'):
+        suscripcion, _ = SuscripcionCalendario.objects.get_or_create(medico=request.user.medico)
+    elif hasattr(request.user, 'paciente'):
+        suscripcion, _ = SuscripcionCalendario.objects.get_or_create(paciente=request.user.paciente)
+    else:
+        messages.error(request, "Solo médicos y pacientes tienen calendario de citas.")
+        return redirect('citas:reserva_lista')
     
-    # Simulación de pago
-    cobro.marcar_como_pagado("Tarjeta de crédito")
-    messages.success(request, "Pago realizado con éxito.")
+    if request.method == "POST":
+        suscripcion.regenerar_token()
+        messages.success(request, "Se generó un nuevo enlace. El anterior dejó de funcionar.")
+        return redirect('citas:calendario_suscripcion')
+    
+    url_feed = request.build_absolute_uri(
+        reverse('citas:calendario_feed', args=[suscripcion.token])
+    )
+    return render(request, 'citas/calendario.html', {
+        'url_feed': url_feed,
+        'url_webcal': url_feed.replace('https://', 'webcal://').replace('http://', 'webcal://')
+    })
+
+@require_GET
+def calendario_feed(request, token):
+    """
+    Feed iCalendar autenticado por token. Los clientes que consultan
+    periódicamente reciben 304 mientras la agenda no cambie.
+    """
+    suscripcion = get_object_or_404(SuscripcionCalendario, token=token)
+    etag, ultima = version_del_feed(suscripcion)
+    etag = quote_etag(etag)
+    
+    respuesta = get_conditional_response(request, etag=etag, last_modified=int(ultima.timestamp()))
+    if respuesta is None:
+        respuesta = StreamingHttpResponse(generar_feed(suscripcion), content_type='text/calendar; charset=utf-8')
+        respuesta['Content-Disposition'] = 'inline; filename="mediconecta.ics"'
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = http_date(ultima.timestamp())
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
+
+@login_required
+def lista_espera(request):
+    """Solicitudes de lista de espera del paciente y sus ofertas pendientes."""
+    paciente, _ = Paciente.objects.get_or_create(user=request.user)
     
-    return redirect('citas:reserva_detalle', pk=reserva.pk)
\ No newline at end of file
+    if request.method == "POST":
+        form = SolicitudEsperaForm(request.POST)
+        if form.is_valid():
+            solicitud = form.save(commit=False)
+            solicitud.paciente = paciente
+            solicitud.save()
+            messages.success(request, "Quedaste en la lista de espera. Te ofreceremos el primer cupo que se libere.")
+            return redirect('citas:lista_espera')
+    else:
+        form = SolicitudEsperaForm()
+    
+    solicitudes = (
+        SolicitudEspera.objects
+        .filter(paciente=paciente)
+        .exclude(estado=EstadoEspera.RETIRADA)
+        .select_related('medico__user', 'especialidad')
+        .order_by('-fecha_creacion')
+    )
+    ofertas = (
+        OfertaCupo.objects
+        .filter(solicitud__paciente=paciente, estado=EstadoOferta.PENDIENTE, vence_en__gt=timezone.now())
+        .select_related('cupo__medico__user')
+        .order_by('vence_en')
+    )
+    return render(request, 'citas/lista_espera.html', {
+        'form': form,
+        'solicitudes': solicitudes,
+        'ofertas': ofertas
+    })
+
+@login_required
+@require_POST
+def lista_espera_retirar(request, pk):
+    actualizadas = SolicitudEspera.objects.filter(
+        pk=pk, paciente__user=request.user, estado=EstadoEspera.ESPERANDO
+    ).update(estado=EstadoEspera.RETIRADA)
+    if actualizadas:
+        messages.success(request, "Saliste de la lista de espera.")
+    else:
+        messages.error(request, "No se pudo retirar la solicitud.")
+    return redirect('citas:lista_espera')
+
+@login_required
+@require_POST
+def oferta_responder(request, pk):
+    oferta = get_object_or_404(
+        OfertaCupo.objects.select_related('cupo', 'solicitud'),
+        pk=pk, solicitud__paciente__user=request.user
+    )
+    try:
+        if request.POST.get('accion') == 'aceptar':
+            reserva = aceptar_oferta(oferta)
+            messages.success(request, "Cupo reservado con éxito.")
+            return redirect('citas:reserva_detalle', pk=reserva.pk)
+        rechazar_oferta(oferta)
+        messages.info(request, "Rechazaste el cupo. Sigues en la lista de espera.")
+    except OfertaNoDisponible as e:
+        messages.error(request, str(e))
+    return redirect('citas:lista_espera')
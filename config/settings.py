@@ -129,6 +129,13 @@ else:
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
+            # Esperar el bloqueo de escritura en vez de fallar de inmediato
+            "OPTIONS": {"timeout": 20},
+            # Base de pruebas en archivo: en la base en memoria compartida los
+            # hilos se bloquean por tabla (SQLITE_LOCKED), que no respeta el
+            # timeout, y las pruebas con hilos (reservas y pagos concurrentes,
+            # generación en segundo plano) fallan con "table is locked"
+            "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
         }
     }
 
@@ -148,6 +155,74 @@ else:
 #     }
 # }
 
+# ---------------- Cache ----------------
+# En producción con varios workers la cache debe ser compartida (Redis) para
+# que la invalidación de un proceso la vean los demás
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "mediconecta",
+        }
+    }
+
+# ---------------- Email ----------------
+# Sin EMAIL_HOST los correos se escriben en la consola
+EMAIL_BACKEND = os.getenv(
+    "EMAIL_BACKEND",
+    "django.core.mail.backends.smtp.EmailBackend" if os.getenv("EMAIL_HOST") else "django.core.mail.backends.console.EmailBackend",
+)
+EMAIL_HOST = os.getenv("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
+EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "1") == "1"
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "Mediconecta <no-responder@mediconecta.cl>")
+
+# ---------------- Vencimiento de reservas pendientes ----------------
+# Horas después del inicio de la cita en que una reserva aún pendiente se cancela
+RESERVA_PENDIENTE_VENCE_HORAS = int(os.getenv("RESERVA_PENDIENTE_VENCE_HORAS", "24"))
+# Si se define, también se cancelan las no confirmadas esas horas antes de la cita
+RESERVA_PENDIENTE_CONFIRMAR_HORAS_ANTES = (
+    int(os.getenv("RESERVA_PENDIENTE_CONFIRMAR_HORAS_ANTES"))
+    if os.getenv("RESERVA_PENDIENTE_CONFIRMAR_HORAS_ANTES") else None
+)
+
+# ---------------- Archivo de reservas ----------------
+# Días tras los cuales las reservas completadas o canceladas pasan al archivo
+ARCHIVO_RESERVAS_DIAS = int(os.getenv("ARCHIVO_RESERVAS_DIAS", "365"))
+
+# ---------------- Lista de espera ----------------
+# Minutos que un cupo liberado queda reservado para el paciente al que se ofrece
+LISTA_ESPERA_OFERTA_MINUTOS = int(os.getenv("LISTA_ESPERA_OFERTA_MINUTOS", "30"))
+# Procesar las ofertas en un hilo de fondo tras cada cancelación. Con False
+# solo las procesa el comando `procesar_lista_espera` (cron o worker aparte)
+LISTA_ESPERA_EN_SEGUNDO_PLANO = os.getenv("LISTA_ESPERA_EN_SEGUNDO_PLANO", "1") == "1"
+
+# ---------------- Comprobantes PDF ----------------
+# Generar los comprobantes en hilos de fondo (tras cada pago y en la primera
+# descarga). Con False se generan en la misma solicitud de descarga
+COMPROBANTES_EN_SEGUNDO_PLANO = os.getenv("COMPROBANTES_EN_SEGUNDO_PLANO", "1") == "1"
+COMPROBANTES_HILOS = int(os.getenv("COMPROBANTES_HILOS", "2"))
+
+# ---------------- Resúmenes clínicos ----------------
+# Generar el resumen clínico DOCX en hilos de fondo. Con False se genera en
+# la misma solicitud de descarga
+RESUMENES_EN_SEGUNDO_PLANO = os.getenv("RESUMENES_EN_SEGUNDO_PLANO", "1") == "1"
+RESUMENES_HILOS = int(os.getenv("RESUMENES_HILOS", "1"))
+
+# ---------------- Eliminaciones ----------------
+# Borrar por lotes en un hilo de fondo las cuentas y selecciones de reservas
+# eliminadas. Con False solo las procesa el comando `procesar_eliminaciones`
+ELIMINACIONES_EN_SEGUNDO_PLANO = os.getenv("ELIMINACIONES_EN_SEGUNDO_PLANO", "1") == "1"
+
 # ---------------- Static & Media ----------------
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
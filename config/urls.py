@@ -20,6 +20,7 @@ urlpatterns = [
     # APIs REST
     path("medicos/", include("medicos.api_urls")),
     path("pacientes/", include("pacientes.api_urls")),
+    path("citas/", include("citas.api_urls")),
     # API de Autenticación
     path("api/auth/", include("accounts.api_urls")),
     # Favicon
@@ -0,0 +1,21 @@
+"""
+Utilidades compartidas por los comandos de benchmark y análisis: los datos
+de prueba se generan dentro de una transacción que se revierte al terminar.
+"""
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+
+@contextmanager
+def datos_revertidos():
+    """Ejecuta el bloque en una transacción que siempre se revierte."""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def actualizar_estadisticas():
+    """ANALYZE, para que el planificador conozca los datos recién generados."""
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
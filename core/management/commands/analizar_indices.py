@@ -0,0 +1,195 @@
+"""
+Comando para medir las consultas frecuentes de citas con y sin los índices
+compuestos de la migración 0003. Genera un conjunto de datos grande dentro de
+una transacción que se revierte al terminar, pero durante toda la medición
+mantiene bloqueadas las tablas cuyos índices elimina (en PostgreSQL, con
+ACCESS EXCLUSIVE): es solo para desarrollo o staging, nunca para una base en
+uso. Sin DEBUG exige --confirmar.
+"""
+import random
+import statistics
+import time
+from importlib import import_module
+from datetime import date, timedelta, time as hora
+from decimal import Decimal
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.migrations.operations import AddIndex
+from django.utils import timezone
+
+from medicos.models import Medico
+from pacientes.models import Paciente
+from citas.models import Reserva, HistorialMedico, Cobro, EstadoReserva, ESTADOS_VIGENTES
+from core.management.benchmark import actualizar_estadisticas, datos_revertidos
+
+# Solo se comparan los índices que agregó esta migración
+MIGRACION_INDICES = 'citas.migrations.0003_indices_consultas_frecuentes'
+TAMANO_LOTE = 5000
+
+
+class Command(BaseCommand):
+    help = 'Genera datos de prueba y compara planes EXPLAIN y tiempos con y sin los índices de citas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservas', type=int, default=200000, help='Reservas a generar')
+        parser.add_argument('--medicos', type=int, default=200, help='Médicos a generar')
+        parser.add_argument('--pacientes', type=int, default=5000, help='Pacientes a generar')
+        parser.add_argument('--repeticiones', type=int, default=20, help='Ejecuciones por consulta')
+        parser.add_argument('--sin-planes', action='store_true', help='No mostrar los planes EXPLAIN')
+        parser.add_argument(
+            '--confirmar', action='store_true',
+            help='Ejecutar aunque DEBUG esté desactivado (bloquea las tablas de citas durante la medición)'
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['confirmar']:
+            raise CommandError(
+                'analizar_indices elimina índices y bloquea las tablas de citas mientras mide: '
+                'úsalo solo en desarrollo o staging, con --confirmar si DEBUG está desactivado.'
+            )
+        self.repeticiones = options['repeticiones']
+        self.mostrar_planes = not options['sin_planes']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'=== Análisis de índices de citas ({connection.vendor}) ===\n'
+        ))
+        with datos_revertidos():
+            inicio = time.perf_counter()
+            medico, paciente = self._generar_datos(options['reservas'], options['medicos'], options['pacientes'])
+            self.stdout.write(f'Datos generados en {time.perf_counter() - inicio:.1f}s\n')
+
+            consultas = self._consultas(medico, paciente)
+
+            self._eliminar_indices()
+            actualizar_estadisticas()
+            antes = self._medir('Sin índices compuestos', consultas)
+
+            self._crear_indices()
+            actualizar_estadisticas()
+            despues = self._medir('Con índices compuestos', consultas)
+
+            self._resumen(antes, despues)
+        self.stdout.write(self.style.SUCCESS('\n✓ Datos e índices revertidos'))
+
+    def _generar_datos(self, total_reservas, total_medicos, total_pacientes):
+        """Genera médicos, pacientes, reservas, cobros e historiales con INSERT masivos."""
+        generador = random.Random(42)
+
+        users = User.objects.bulk_create(
+            [User(username=f'idx_medico_{n}') for n in range(total_medicos)]
+            + [User(username=f'idx_paciente_{n}') for n in range(total_pacientes)],
+            batch_size=TAMANO_LOTE,
+        )
+        medicos = Medico.objects.bulk_create(
+            [Medico(user=user, horario_inicio=hora(8), horario_fin=hora(18)) for user in users[:total_medicos]],
+            batch_size=TAMANO_LOTE,
+        )
+        pacientes = Paciente.objects.bulk_create(
+            [Paciente(user=user) for user in users[total_medicos:]],
+            batch_size=TAMANO_LOTE,
+        )
+
+        estados = [EstadoReserva.COMPLETADA] * 6 + [EstadoReserva.CANCELADA] * 2 + list(ESTADOS_VIGENTES)
+        primer_dia = date.today() - timedelta(days=3 * 365)
+        ahora = timezone.now()
+
+        for desde in range(0, total_reservas, TAMANO_LOTE):
+            reservas = []
+            for _ in range(desde, min(desde + TAMANO_LOTE, total_reservas)):
+                bloque = generador.randrange(20)
+                reservas.append(Reserva(
+                    medico=generador.choice(medicos),
+                    paciente=generador.choice(pacientes),
+                    fecha=primer_dia + timedelta(days=generador.randrange(3 * 365 + 60)),
+                    hora_inicio=hora(8 + bloque // 2, 30 * (bloque % 2)),
+                    hora_fin=hora(8 + bloque // 2, 30 * (bloque % 2) + 29),
+                    motivo='Análisis de índices',
+                    estado=generador.choice(estados),
+                ))
+            reservas = Reserva.objects.bulk_create(reservas)
+            Cobro.objects.bulk_create([
+                Cobro(
+                    reserva=reserva,
+                    monto=Decimal(generador.randrange(10000, 60000)),
+                    pagado=reserva.estado == EstadoReserva.COMPLETADA,
+                    fecha_pago=ahora if reserva.estado == EstadoReserva.COMPLETADA else None,
+                )
+                for reserva in reservas
+            ])
+            HistorialMedico.objects.bulk_create([
+                HistorialMedico(
+                    paciente_id=reserva.paciente_id, medico_id=reserva.medico_id, reserva=reserva,
+                    fecha=ahora - timedelta(days=generador.randrange(3 * 365)),
+                    diagnostico='Control', tratamiento='Reposo',
+                )
+                for reserva in reservas if reserva.estado == EstadoReserva.COMPLETADA
+            ])
+
+        return generador.choice(medicos), generador.choice(pacientes)
+
+    def _consultas(self, medico, paciente):
+        """Consultas representativas de las vistas y APIs de citas."""
+        hoy = date.today()
+        return {
+            'Agenda del médico (día)': lambda: Reserva.objects.filter(
+                medico=medico, fecha=hoy).order_by('hora_inicio'),
+            'Vigentes del médico (30 días)': lambda: Reserva.objects.filter(
+                medico=medico, fecha__range=(hoy, hoy + timedelta(days=30)),
+                estado__in=ESTADOS_VIGENTES).order_by('fecha', 'hora_inicio'),
+            'Reservas del paciente (página)': lambda: Reserva.objects.filter(
+                paciente=paciente).order_by('fecha', 'hora_inicio', 'id')[:20],
+            'Reservas del día (todas)': lambda: Reserva.objects.filter(
+                fecha=hoy).order_by('fecha', 'hora_inicio')[:50],
+            'Historial del paciente': lambda: HistorialMedico.objects.filter(
+                paciente=paciente).order_by('-fecha')[:20],
+            'Cobros pendientes': lambda: Cobro.objects.filter(pagado=False).order_by('reserva_id')[:100],
+        }
+
+    def _indices(self):
+        migracion = import_module(MIGRACION_INDICES).Migration
+        for operacion in migracion.operations:
+            if not isinstance(operacion, AddIndex):
+                continue
+            modelo = apps.get_model('citas', operacion.model_name)
+            # Un índice que una migración posterior quitó ya no existe
+            if any(indice.name == operacion.index.name for indice in modelo._meta.indexes):
+                yield modelo, operacion.index
+
+    def _eliminar_indices(self):
+        with connection.cursor() as cursor:
+            for _, indice in self._indices():
+                cursor.execute(f'DROP INDEX {connection.ops.quote_name(indice.name)}')
+
+    def _crear_indices(self):
+        # Se usa el SQL del propio índice sin abrir el editor de esquema, que
+        # en SQLite no puede usarse dentro de una transacción
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for modelo, indice in self._indices():
+                cursor.execute(str(indice.create_sql(modelo, editor)))
+
+    def _medir(self, titulo, consultas):
+        self.stdout.write(self.style.MIGRATE_LABEL(f'\n{titulo}'))
+        tiempos = {}
+        for nombre, consulta in consultas.items():
+            muestras = []
+            for _ in range(self.repeticiones):
+                inicio = time.perf_counter()
+                list(consulta())
+                muestras.append((time.perf_counter() - inicio) * 1000)
+            tiempos[nombre] = statistics.median(muestras)
+            self.stdout.write(f'  {nombre}: {tiempos[nombre]:.2f} ms')
+            if self.mostrar_planes:
+                for linea in consulta().explain().splitlines():
+                    self.stdout.write(f'      {linea}')
+        return tiempos
+
+    def _resumen(self, antes, despues):
+        self.stdout.write(self.style.MIGRATE_LABEL('\nResumen (mediana por consulta)'))
+        for nombre in antes:
+            mejora = antes[nombre] / despues[nombre] if despues[nombre] else float('inf')
+            self.stdout.write(f'  {nombre}: {antes[nombre]:.2f} ms → {despues[nombre]:.2f} ms ({mejora:.1f}x)')
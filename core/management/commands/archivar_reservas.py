@@ -0,0 +1,36 @@
+"""
+Comando para mover al archivo las reservas completadas o canceladas más
+antiguas que ARCHIVO_RESERVAS_DIAS, con sus cobros. Cada lote se mueve en
+su propia transacción, por lo que puede interrumpirse y retomarse.
+"""
+from django.core.management.base import BaseCommand
+
+from citas.archivo import archivar, archivables, fecha_corte, TAMANO_LOTE
+
+
+class Command(BaseCommand):
+    help = 'Mueve las reservas cerradas antiguas y sus cobros a las tablas de archivo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=None, help='Antigüedad mínima en días (por defecto ARCHIVO_RESERVAS_DIAS)')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Reservas por lote (una transacción cada uno)')
+        parser.add_argument('--simular', action='store_true', help='Solo contar las reservas que se archivarían')
+
+    def handle(self, *args, **options):
+        corte = fecha_corte(options['dias'])
+        if options['simular']:
+            total = archivables(corte).count()
+            self.stdout.write(f'{total} reservas cerradas anteriores al {corte:%d/%m/%Y} se archivarían')
+            return
+
+        verbosidad = options['verbosity']
+
+        def progreso(resumen):
+            if verbosidad > 1:
+                self.stdout.write(f'  Lote {resumen.lotes}: {resumen.archivadas} archivadas')
+
+        resumen = archivar(options['dias'], tamano_lote=options['lote'], al_terminar_lote=progreso)
+        self.stdout.write(self.style.SUCCESS(
+            f'{resumen.archivadas} reservas anteriores al {corte:%d/%m/%Y} archivadas '
+            f'en {resumen.lotes} lotes ({resumen.segundos:.2f}s)'
+        ))
@@ -0,0 +1,140 @@
+"""
+Comando para medir el efecto del archivo de reservas: compara las consultas
+de agenda de un médico con la historia en la tabla principal y archivada, y
+al multiplicar la historia por diez. Los datos se generan dentro de una
+transacción que se revierte al terminar.
+"""
+import random
+import statistics
+import time
+from datetime import date, timedelta, time as hora
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from medicos.models import Medico
+from pacientes.models import Paciente
+from citas.agenda import construir_agenda
+from citas.archivo import archivar
+from citas.models import Reserva, Cobro, EstadoReserva
+from core.management.benchmark import actualizar_estadisticas, datos_revertidos
+
+TAMANO_LOTE = 5000
+DIAS_HISTORIA = 5 * 365
+
+
+class Command(BaseCommand):
+    help = 'Mide las consultas de agenda con la historia en caliente y archivada, con historia x1 y x10'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--historia', type=int, default=50000, help='Reservas cerradas iniciales (luego x10)')
+        parser.add_argument('--medicos', type=int, default=20, help='Médicos a generar')
+        parser.add_argument('--repeticiones', type=int, default=30, help='Ejecuciones por consulta')
+
+    def handle(self, *args, **options):
+        self.repeticiones = options['repeticiones']
+        self.generador = random.Random(7)
+        historia = options['historia']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'=== Benchmark de archivo de reservas ({connection.vendor}) ===\n'
+        ))
+        with datos_revertidos():
+            self._generar_base(options['medicos'])
+            resultados = {}
+
+            self._generar_historia(historia)
+            resultados[f'x1 en caliente ({historia})'] = self._medir()
+            archivar(dias=1)
+            resultados[f'x1 archivada ({historia})'] = self._medir()
+
+            self._generar_historia(historia * 9)
+            resultados[f'x10 en caliente ({historia * 9} sin archivar)'] = self._medir()
+            archivar(dias=1)
+            resultados[f'x10 archivada ({historia * 10})'] = self._medir()
+
+            self._resumen(resultados)
+        self.stdout.write(self.style.SUCCESS('\n✓ Datos revertidos'))
+
+    def _generar_base(self, total_medicos):
+        users = User.objects.bulk_create(
+            [User(username=f'arch_medico_{n}') for n in range(total_medicos)]
+            + [User(username=f'arch_paciente_{n}') for n in range(1000)]
+        )
+        self.medicos = Medico.objects.bulk_create(
+            [Medico(user=user, horario_inicio=hora(8), horario_fin=hora(18)) for user in users[:total_medicos]]
+        )
+        self.pacientes = Paciente.objects.bulk_create([Paciente(user=user) for user in users[total_medicos:]])
+        self.medico = self.medicos[0]
+
+        # Agenda de hoy y de los próximos días del médico medido
+        hoy = date.today()
+        Reserva.objects.bulk_create([
+            Reserva(
+                medico=self.medico, paciente=self.generador.choice(self.pacientes),
+                fecha=hoy + timedelta(days=dia), hora_inicio=hora(8 + bloque // 2, 30 * (bloque % 2)),
+                hora_fin=hora(8 + bloque // 2, 30 * (bloque % 2) + 29), motivo='Agenda',
+                estado=EstadoReserva.CONFIRMADA,
+            )
+            for dia in range(14) for bloque in range(20)
+        ])
+
+    def _generar_historia(self, total):
+        """Reservas cerradas de los últimos años, con sus cobros."""
+        hoy = date.today()
+        inicio = time.perf_counter()
+        for desde in range(0, total, TAMANO_LOTE):
+            reservas = []
+            for _ in range(desde, min(desde + TAMANO_LOTE, total)):
+                bloque = self.generador.randrange(20)
+                reservas.append(Reserva(
+                    medico=self.generador.choice(self.medicos),
+                    paciente=self.generador.choice(self.pacientes),
+                    fecha=hoy - timedelta(days=self.generador.randrange(30, DIAS_HISTORIA)),
+                    hora_inicio=hora(8 + bloque // 2, 30 * (bloque % 2)),
+                    hora_fin=hora(8 + bloque // 2, 30 * (bloque % 2) + 29),
+                    motivo='Historia',
+                    estado=self.generador.choice([EstadoReserva.COMPLETADA] * 4 + [EstadoReserva.CANCELADA]),
+                ))
+            reservas = Reserva.objects.bulk_create(reservas)
+            Cobro.objects.bulk_create([
+                Cobro(reserva=reserva, monto=Decimal(self.generador.randrange(10000, 60000)), pagado=True)
+                for reserva in reservas
+            ])
+        self.stdout.write(f'{total} reservas de historia generadas en {time.perf_counter() - inicio:.1f}s')
+
+    def _consultas(self):
+        hoy = date.today()
+        return {
+            'Agenda del día': lambda: construir_agenda(self.medico.id, hoy),
+            'Próximas reservas (página)': lambda: list(
+                Reserva.objects.filter(medico=self.medico, fecha__gte=hoy)
+                .order_by('fecha', 'hora_inicio', 'id')[:20]
+            ),
+            'Reservas por estado del médico': lambda: list(
+                Reserva.objects.filter(medico=self.medico)
+                .order_by().values('estado').annotate(total=Count('id'))
+            ),
+        }
+
+    def _medir(self):
+        actualizar_estadisticas()
+        tiempos = {}
+        for nombre, consulta in self._consultas().items():
+            muestras = []
+            for _ in range(self.repeticiones):
+                inicio = time.perf_counter()
+                consulta()
+                muestras.append((time.perf_counter() - inicio) * 1000)
+            tiempos[nombre] = statistics.median(muestras)
+        return tiempos
+
+    def _resumen(self, resultados):
+        self.stdout.write(self.style.MIGRATE_LABEL('\nMediana por consulta (ms)'))
+        for escenario, tiempos in resultados.items():
+            self.stdout.write(f'  {escenario}')
+            for nombre, ms in tiempos.items():
+                self.stdout.write(f'      {nombre}: {ms:.2f} ms')
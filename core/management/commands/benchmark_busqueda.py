@@ -0,0 +1,131 @@
+"""
+Comando para comparar la búsqueda de texto completo del historial médico
+con el filtro icontains que usaba el admin. Genera historiales con
+diagnósticos y tratamientos variados dentro de una transacción que se
+revierte al terminar.
+"""
+import random
+import statistics
+import time
+from datetime import time as hora, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from medicos.models import Medico
+from pacientes.models import Paciente
+from citas.busqueda import buscar, filtrar
+from citas.models import HistorialMedico
+from core.management.benchmark import actualizar_estadisticas, datos_revertidos
+
+TAMANO_LOTE = 10000
+DIAGNOSTICOS = [
+    'Hipertensión arterial esencial', 'Diabetes mellitus tipo 2', 'Gastritis crónica',
+    'Lumbalgia mecánica', 'Faringitis aguda', 'Migraña sin aura', 'Asma bronquial leve',
+    'Dermatitis atópica', 'Ansiedad generalizada', 'Hipotiroidismo primario',
+    'Infección urinaria baja', 'Esguince de tobillo', 'Otitis media aguda', 'Anemia ferropénica',
+    'Bronquitis aguda', 'Conjuntivitis alérgica', 'Fractura de radio distal', 'Colon irritable',
+]
+TRATAMIENTOS = [
+    'Reposo relativo y control en dos semanas', 'Enalapril 10 mg cada 12 horas',
+    'Metformina 850 mg con las comidas', 'Omeprazol 20 mg en ayunas', 'Ibuprofeno 400 mg cada 8 horas',
+    'Paracetamol 1 g cada 8 horas', 'Salbutamol inhalado según necesidad', 'Levotiroxina 50 mcg diaria',
+    'Sulfato ferroso 300 mg diario', 'Kinesiología tres veces por semana', 'Dieta baja en sodio',
+]
+# Diagnóstico poco frecuente (uno cada ~2000 historiales)
+DIAGNOSTICO_RARO = 'Feocromocitoma suprarrenal'
+OBSERVACIONES = ['', '', 'Paciente refiere mejoría', 'Solicitar exámenes de control', 'Derivar a especialista']
+# (nombre, texto buscado): un término poco frecuente, uno frecuente y dos palabras
+CONSULTAS = [
+    ('Poco frecuente', 'feocromocitoma'),
+    ('Frecuente', 'aguda'),
+    ('Dos términos', 'diabetes metformina'),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compara la búsqueda de texto completo del historial con icontains sobre muchos historiales'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--historiales', type=int, default=200000, help='Historiales a generar')
+        parser.add_argument('--medicos', type=int, default=100, help='Médicos a generar')
+        parser.add_argument('--repeticiones', type=int, default=10, help='Ejecuciones por consulta')
+
+    def handle(self, *args, **options):
+        self.repeticiones = options['repeticiones']
+        self.generador = random.Random(11)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'=== Benchmark de búsqueda en el historial ({connection.vendor}) ===\n'
+        ))
+        with datos_revertidos():
+            self._generar(options['historiales'], options['medicos'])
+            actualizar_estadisticas()
+            self._medir()
+        self.stdout.write(self.style.SUCCESS('\n✓ Datos revertidos'))
+
+    def _generar(self, total, total_medicos):
+        inicio = time.perf_counter()
+        users = User.objects.bulk_create(
+            [User(username=f'busq_medico_{n}') for n in range(total_medicos)]
+            + [User(username=f'busq_paciente_{n}') for n in range(2000)]
+        )
+        medicos = Medico.objects.bulk_create(
+            [Medico(user=user, horario_inicio=hora(8), horario_fin=hora(18)) for user in users[:total_medicos]]
+        )
+        pacientes = Paciente.objects.bulk_create([Paciente(user=user) for user in users[total_medicos:]])
+        self.medico = medicos[0]
+
+        ahora = timezone.now()
+        for desde in range(0, total, TAMANO_LOTE):
+            HistorialMedico.objects.bulk_create([
+                HistorialMedico(
+                    paciente=self.generador.choice(pacientes), medico=self.generador.choice(medicos),
+                    fecha=ahora - timedelta(days=self.generador.randrange(5 * 365)),
+                    diagnostico=(
+                        DIAGNOSTICO_RARO if self.generador.random() < 0.0005
+                        else self.generador.choice(DIAGNOSTICOS)
+                    ),
+                    tratamiento=self.generador.choice(TRATAMIENTOS),
+                    observaciones=self.generador.choice(OBSERVACIONES),
+                )
+                for _ in range(desde, min(desde + TAMANO_LOTE, total))
+            ])
+        self.stdout.write(f'{total} historiales generados en {time.perf_counter() - inicio:.1f}s')
+
+    def _icontains(self, texto):
+        condicion = Q()
+        for palabra in texto.split():
+            condicion &= Q(diagnostico__icontains=palabra) | Q(tratamiento__icontains=palabra)
+        return HistorialMedico.objects.filter(condicion)
+
+    def _tiempo(self, consulta):
+        muestras = []
+        for _ in range(self.repeticiones):
+            inicio = time.perf_counter()
+            resultado = consulta()
+            muestras.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(muestras), resultado
+
+    def _medir(self):
+        todos = HistorialMedico.objects.all()
+        self.stdout.write(self.style.MIGRATE_LABEL('\nMediana por consulta (ms)'))
+        for nombre, texto in CONSULTAS:
+            self.stdout.write(f'  {nombre}: "{texto}"')
+            filas = [
+                ('Médico, top 20 (icontains, por fecha)', lambda: list(
+                    self._icontains(texto).filter(medico=self.medico).order_by('-fecha')[:20]
+                )),
+                ('Médico, top 20 (texto completo, por relevancia)', lambda: buscar(
+                    texto, medico_id=self.medico.id, limite=20
+                )),
+                ('Todos, conteo (icontains)', lambda: self._icontains(texto).count()),
+                ('Todos, conteo (texto completo)', lambda: filtrar(todos, texto).count()),
+            ]
+            for etiqueta, consulta in filas:
+                ms, resultado = self._tiempo(consulta)
+                cantidad = resultado if isinstance(resultado, int) else len(resultado)
+                self.stdout.write(f'      {etiqueta}: {ms:.2f} ms ({cantidad} filas)')
@@ -0,0 +1,101 @@
+"""
+Comando para comparar las estadísticas de pacientes con una consulta
+agregada contra el cálculo anterior, que recorría la tabla en Python
+instanciando cada paciente. Los datos se generan dentro de una transacción
+que se revierte al terminar.
+"""
+import random
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from pacientes.models import Paciente
+from pacientes.estadisticas import calcular_estadisticas
+from core.management.benchmark import actualizar_estadisticas, datos_revertidos
+
+TAMANO_LOTE = 10000
+GRUPOS = ['O+', 'O-', 'A+', 'A-', 'B+', 'B-', 'AB+', 'AB-', '']
+
+
+class Command(BaseCommand):
+    help = 'Mide las estadísticas de pacientes agregadas frente al recorrido en Python (los datos se revierten)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pacientes', type=int, default=1000000, help='Pacientes a generar')
+
+    def handle(self, *args, **options):
+        self.generador = random.Random(7)
+        total = options['pacientes']
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'=== Benchmark de estadísticas de pacientes ({total} pacientes, {connection.vendor}) ===\n'
+        ))
+        with datos_revertidos():
+            self._generar(total)
+            actualizar_estadisticas()
+            queryset = Paciente.objects.select_related('user')
+            hoy = date.today()
+
+            inicio = time.perf_counter()
+            agregado = calcular_estadisticas(queryset, hoy)
+            agregado_s = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            anterior = self._anterior(queryset, hoy)
+            anterior_s = time.perf_counter() - inicio
+
+            self.stdout.write(f'  Consulta agregada:    {agregado_s:.2f}s')
+            self.stdout.write(f'  Recorrido en Python:  {anterior_s:.2f}s ({anterior_s / agregado_s:.1f}x)')
+            if agregado == anterior:
+                self.stdout.write(self.style.SUCCESS('  ✓ Resultados idénticos'))
+            else:
+                self.stdout.write(self.style.ERROR('  ✗ Los resultados difieren'))
+        self.stdout.write(self.style.SUCCESS('\n✓ Datos revertidos'))
+
+    def _generar(self, total):
+        hoy = date.today()
+        inicio = time.perf_counter()
+        for desde in range(0, total, TAMANO_LOTE):
+            hasta = min(desde + TAMANO_LOTE, total)
+            users = User.objects.bulk_create([User(username=f'est_paciente_{n}') for n in range(desde, hasta)])
+            Paciente.objects.bulk_create([
+                Paciente(
+                    user=user,
+                    grupo_sanguineo=self.generador.choice(GRUPOS),
+                    alergias=self.generador.choice(['', '', '', 'Penicilina', 'Polen']),
+                    fecha_nacimiento=(
+                        hoy - timedelta(days=self.generador.randrange(100 * 365))
+                        if self.generador.random() < 0.95 else None
+                    ),
+                )
+                for user in users
+            ])
+        self.stdout.write(f'{total} pacientes generados en {time.perf_counter() - inicio:.1f}s\n')
+
+    def _anterior(self, queryset, hoy):
+        """El cálculo que reemplazó la consulta agregada: cuatro consultas y dos recorridos completos."""
+        total_pacientes = queryset.count()
+        grupos_sanguineos = {}
+        for paciente in queryset:
+            grupo = paciente.grupo_sanguineo or 'No especificado'
+            grupos_sanguineos[grupo] = grupos_sanguineos.get(grupo, 0) + 1
+        pacientes_con_alergias = queryset.exclude(alergias='').count()
+        menores_18 = entre_18_65 = mayores_65 = 0
+        for paciente in queryset:
+            if paciente.fecha_nacimiento:
+                nacimiento = paciente.fecha_nacimiento
+                edad = hoy.year - nacimiento.year - ((hoy.month, hoy.day) < (nacimiento.month, nacimiento.day))
+                if edad < 18:
+                    menores_18 += 1
+                elif edad <= 65:
+                    entre_18_65 += 1
+                else:
+                    mayores_65 += 1
+        return {
+            'total_pacientes': total_pacientes,
+            'grupos_sanguineos': grupos_sanguineos,
+            'pacientes_con_alergias': pacientes_con_alergias,
+            'distribucion_edad': {'menores_18': menores_18, 'entre_18_65': entre_18_65, 'mayores_65': mayores_65},
+        }
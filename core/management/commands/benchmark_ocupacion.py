@@ -0,0 +1,105 @@
+"""
+Comando para medir el cálculo de ocupación: compara el tensor médico × día ×
+hora de citas.ocupacion contra un recorrido fila a fila en Python sobre las
+mismas reservas, y verifica que ambos coinciden. Los datos se generan dentro
+de una transacción que se revierte al terminar.
+"""
+import random
+import time
+from datetime import date, timedelta, time as hora
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from medicos.models import Medico
+from pacientes.models import Paciente
+from citas.models import Reserva, EstadoReserva, ESTADOS_VIGENTES
+from citas.ocupacion import minutos_reservados, HORAS
+from core.management.benchmark import actualizar_estadisticas, datos_revertidos
+
+TAMANO_LOTE = 5000
+DIAS = 364
+
+
+class Command(BaseCommand):
+    help = 'Mide el mapa de ocupación vectorizado frente a un recorrido en Python (los datos se revierten)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reservas', type=int, default=1000000, help='Reservas a generar')
+        parser.add_argument('--medicos', type=int, default=50, help='Médicos entre los que se reparten')
+
+    def handle(self, *args, **options):
+        self.generador = random.Random(7)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"=== Benchmark de ocupación ({options['reservas']} reservas, {connection.vendor}) ===\n"
+        ))
+        with datos_revertidos():
+            self._generar(options['reservas'], options['medicos'])
+            actualizar_estadisticas()
+            hasta = date.today()
+            desde = hasta - timedelta(days=DIAS - 1)
+
+            inicio = time.perf_counter()
+            ids, vectorizado = minutos_reservados(desde, hasta)
+            numpy_s = time.perf_counter() - inicio
+
+            inicio = time.perf_counter()
+            recorrido = self._recorrido(ids, desde, hasta)
+            python_s = time.perf_counter() - inicio
+
+            self.stdout.write(f'  NumPy por lotes: {numpy_s:.2f}s')
+            self.stdout.write(f'  Fila a fila:     {python_s:.2f}s ({python_s / numpy_s:.1f}x)')
+            if np.array_equal(vectorizado, recorrido):
+                self.stdout.write(self.style.SUCCESS('  ✓ Resultados idénticos'))
+            else:
+                self.stdout.write(self.style.ERROR('  ✗ Los resultados difieren'))
+        self.stdout.write(self.style.SUCCESS('\n✓ Datos revertidos'))
+
+    def _generar(self, total, total_medicos):
+        users = User.objects.bulk_create(
+            [User(username=f'ocup_medico_{n}') for n in range(total_medicos)]
+            + [User(username=f'ocup_paciente_{n}') for n in range(1000)]
+        )
+        medicos = Medico.objects.bulk_create(
+            [Medico(user=user, horario_inicio=hora(8), horario_fin=hora(18)) for user in users[:total_medicos]]
+        )
+        pacientes = Paciente.objects.bulk_create([Paciente(user=user) for user in users[total_medicos:]])
+
+        hoy = date.today()
+        estados = ESTADOS_VIGENTES + [EstadoReserva.COMPLETADA] * 3 + [EstadoReserva.CANCELADA]
+        inicio = time.perf_counter()
+        for desde in range(0, total, TAMANO_LOTE):
+            reservas = []
+            for _ in range(desde, min(desde + TAMANO_LOTE, total)):
+                # Bloques de 30 o 60 minutos entre las 7:00 y las 19:00, algunos fuera de horario
+                comienzo = self.generador.randrange(7 * 60, 19 * 60, 30)
+                fin = comienzo + self.generador.choice([30, 30, 30, 60])
+                reservas.append(Reserva(
+                    medico=self.generador.choice(medicos), paciente=self.generador.choice(pacientes),
+                    fecha=hoy - timedelta(days=self.generador.randrange(DIAS)),
+                    hora_inicio=hora(comienzo // 60, comienzo % 60), hora_fin=hora(fin // 60, fin % 60),
+                    motivo='Ocupación', estado=self.generador.choice(estados),
+                ))
+            Reserva.objects.bulk_create(reservas)
+        self.stdout.write(f'{total} reservas generadas en {time.perf_counter() - inicio:.1f}s\n')
+
+    def _recorrido(self, ids, desde, hasta):
+        """El mismo tensor calculado reserva por reserva."""
+        posicion = {medico_id: n for n, medico_id in enumerate(ids.tolist())}
+        tensor = np.zeros((len(ids), 7, HORAS))
+        filas = (
+            Reserva.objects
+            .filter(fecha__range=(desde, hasta), estado__in=ESTADOS_VIGENTES + [EstadoReserva.COMPLETADA])
+            .values_list('medico_id', 'fecha', 'hora_inicio', 'hora_fin')
+            .iterator(chunk_size=TAMANO_LOTE)
+        )
+        for medico_id, fecha, hora_inicio, hora_fin in filas:
+            inicio = hora_inicio.hour * 60 + hora_inicio.minute
+            fin = hora_fin.hour * 60 + hora_fin.minute
+            for hora_del_dia in range(inicio // 60, (fin - 1) // 60 + 1):
+                minutos = min(fin, (hora_del_dia + 1) * 60) - max(inicio, hora_del_dia * 60)
+                if minutos > 0:
+                    tensor[posicion[medico_id], fecha.weekday(), hora_del_dia] += minutos
+        return tensor
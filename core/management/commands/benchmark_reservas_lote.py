@@ -0,0 +1,85 @@
+"""
+Comando para comparar la creación masiva de reservas contra la creación una a una
+"""
+import time
+from datetime import date, timedelta, time as hora
+
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import connection
+
+from medicos.models import Medico
+from pacientes.models import Paciente
+from citas.models import Reserva
+from citas.services import crear_reserva, crear_reservas_lote
+from core.management.benchmark import datos_revertidos
+
+
+class Command(BaseCommand):
+    help = 'Mide la creación de reservas una a una frente a la carga masiva (los datos se revierten)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cantidad', type=int, default=10000, help='Reservas a crear en cada modo')
+        parser.add_argument('--medicos', type=int, default=10, help='Médicos entre los que se reparten')
+
+    def handle(self, *args, **options):
+        cantidad = options['cantidad']
+        total_medicos = options['medicos']
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'=== Benchmark de creación de reservas ({cantidad} ítems, {connection.vendor}) ===\n'
+        ))
+
+        tiempos = {}
+        for modo in ('uno_a_uno', 'lote'):
+            with datos_revertidos():
+                items = self._generar_items(cantidad, total_medicos)
+                inicio = time.perf_counter()
+                if modo == 'lote':
+                    resultados = crear_reservas_lote(items)
+                    creadas = sum(1 for r in resultados if r['creada'])
+                else:
+                    creadas = 0
+                    for item in items:
+                        crear_reserva(Reserva(
+                            medico_id=item['medico'], paciente_id=item['paciente'],
+                            fecha=item['fecha'], hora_inicio=item['hora_inicio'],
+                            hora_fin=item['hora_fin'], motivo=item['motivo'],
+                        ), monto=item['monto'])
+                        creadas += 1
+                tiempos[modo] = time.perf_counter() - inicio
+
+            self.stdout.write(
+                f'{modo:>10}: {creadas} reservas en {tiempos[modo]:.2f}s '
+                f'({creadas / tiempos[modo]:.0f} reservas/s)'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'\n✓ Aceleración de la carga masiva: {tiempos["uno_a_uno"] / tiempos["lote"]:.1f}x'
+        ))
+
+    def _generar_items(self, cantidad, total_medicos):
+        """Genera reservas sin solapamientos repartidas en bloques de 30 minutos."""
+        medicos = [
+            Medico.objects.create(user=User.objects.create(username=f'bench_medico_{n}'))
+            for n in range(total_medicos)
+        ]
+        paciente = Paciente.objects.create(user=User.objects.create(username='bench_paciente'))
+
+        bloques_por_dia = 20
+        inicio = date.today() + timedelta(days=1)
+        items = []
+        for n in range(cantidad):
+            medico = medicos[n % total_medicos]
+            dia, bloque = divmod(n // total_medicos, bloques_por_dia)
+            minutos = 8 * 60 + bloque * 30
+            items.append({
+                'medico': medico.id,
+                'paciente': paciente.id,
+                'fecha': inicio + timedelta(days=dia),
+                'hora_inicio': hora(minutos // 60, minutos % 60),
+                'hora_fin': hora((minutos + 30) // 60, (minutos + 30) % 60),
+                'motivo': 'Benchmark',
+                'monto': 0,
+            })
+        return items
@@ -1,9 +1,13 @@
 """
-Comando para eliminar usuarios desde la línea de comandos
+Comando para eliminar usuarios desde la línea de comandos. Los datos del
+usuario se borran por lotes (ver citas.eliminacion), mostrando el avance.
 """
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 
+from citas.eliminacion import eliminar_usuario, procesar
+from citas.models import EstadoEliminacion
+
 User = get_user_model()
 
 class Command(BaseCommand):
@@ -56,11 +60,22 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.WARNING('✗ Eliminación cancelada'))
                 return
         
-        # Eliminar usuario
+        # Eliminar usuario por lotes
         username = user.username
-        user.delete()
+        eliminacion = procesar(eliminar_usuario(user, despertar=False), al_terminar_lote=self._avance)
         
+        if eliminacion.estado == EstadoEliminacion.EN_CURSO:
+            self.stdout.write(self.style.WARNING(
+                f'\n… Otro proceso ya está eliminando "{username}"; el avance está en el admin, en Eliminaciones.'
+            ))
+            return
+        if eliminacion.estado != EstadoEliminacion.COMPLETADA:
+            self.stdout.write(self.style.ERROR(f'\n✗ Error eliminando "{username}": {eliminacion.error}'))
+            return
         self.stdout.write(
             self.style.SUCCESS(f'\n✓ Usuario "{username}" eliminado exitosamente')
         )
+    
+    def _avance(self, eliminacion):
+        self.stdout.write(f'  {eliminacion.paso}: {eliminacion.avance}/{eliminacion.total} ({eliminacion.porcentaje}%)')
 
@@ -0,0 +1,45 @@
+"""
+Comando para enviar recordatorios de las próximas citas por correo.
+Pensado para ejecutarse desde cron (p. ej. cada hora): las reservas ya
+recordadas quedan marcadas y no se vuelven a enviar.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from citas.recordatorios import enviar_recordatorios, TAMANO_LOTE
+
+
+class Command(BaseCommand):
+    help = 'Envía recordatorios por correo de las reservas vigentes de los próximos días'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=1, help='Días hacia adelante a recordar (desde hoy)')
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Reservas por lote')
+        parser.add_argument('--simular', action='store_true', help='Armar los correos sin enviarlos ni marcarlos')
+
+    def handle(self, *args, **options):
+        hoy = timezone.localdate()
+        hasta = hoy + timedelta(days=options['dias'])
+        verbosidad = options['verbosity']
+
+        def progreso(resumen):
+            if verbosidad > 1:
+                self.stdout.write(
+                    f'  Lote {resumen.lotes}: {resumen.enviados} enviados '
+                    f'({resumen.por_segundo:.0f}/s)'
+                )
+
+        resumen = enviar_recordatorios(
+            hoy, hasta, tamano_lote=options['lote'],
+            simular=options['simular'], al_terminar_lote=progreso,
+        )
+
+        accion = 'simulados' if options['simular'] else 'enviados'
+        self.stdout.write(self.style.SUCCESS(
+            f'{resumen.enviados} recordatorios {accion} del {hoy:%d/%m/%Y} al {hasta:%d/%m/%Y} '
+            f'en {resumen.lotes} lotes, {resumen.segundos:.2f}s ({resumen.por_segundo:.0f}/s)'
+        ))
+        if resumen.fallidos:
+            self.stdout.write(self.style.WARNING(f'{resumen.fallidos} recordatorios fallaron y se reintentarán'))
@@ -0,0 +1,41 @@
+"""
+Comando para cancelar las reservas pendientes que nadie confirmó a tiempo
+(según RESERVA_PENDIENTE_VENCE_HORAS / RESERVA_PENDIENTE_CONFIRMAR_HORAS_ANTES)
+y avisar a los pacientes. Pensado para ejecutarse desde cron.
+"""
+from django.core.management.base import BaseCommand
+
+from citas.expiracion import (
+    expirar_pendientes, avisar_expiradas, limite_expiracion, pendientes_vencidas, TAMANO_LOTE
+)
+
+
+class Command(BaseCommand):
+    help = 'Cancela en lotes las reservas pendientes vencidas y avisa a los pacientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Reservas por lote (una transacción cada uno)')
+        parser.add_argument('--sin-avisos', action='store_true', help='No enviar los correos de aviso')
+        parser.add_argument('--simular', action='store_true', help='Solo contar las reservas que vencerían')
+
+    def handle(self, *args, **options):
+        limite = limite_expiracion()
+        if options['simular']:
+            total = pendientes_vencidas(limite).count()
+            self.stdout.write(f'{total} reservas pendientes con inicio anterior a {limite:%d/%m/%Y %H:%M} vencerían')
+            return
+
+        verbosidad = options['verbosity']
+
+        def progreso(resumen):
+            if verbosidad > 1:
+                self.stdout.write(f'  Lote {resumen.lotes}: {resumen.expiradas} expiradas')
+
+        resumen = expirar_pendientes(limite, tamano_lote=options['lote'], al_terminar_lote=progreso)
+        if not options['sin_avisos']:
+            avisar_expiradas(tamano_lote=options['lote'], resumen=resumen)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{resumen.expiradas} reservas expiradas en {resumen.lotes} lotes, '
+            f'{resumen.avisadas} avisos enviados ({resumen.segundos:.2f}s)'
+        ))
@@ -0,0 +1,81 @@
+"""
+Comando para exportar todas las reservas o cobros (incluido el archivo) en
+CSV o NDJSON, con memoria constante. Con --continuar retoma una exportación
+interrumpida a partir del último id escrito en el archivo de salida.
+"""
+import os
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from citas.exportacion import generar, ultimo_id, EXPORTACIONES, FORMATOS
+
+# Bytes leídos del final del archivo para encontrar la última fila
+COLA = 64 * 1024
+
+
+def _ultima_linea(ruta):
+    """
+    Última línea completa del archivo. Si la exportación se cortó a mitad
+    de una fila, el archivo se recorta hasta el último salto de línea para
+    no retomar desde un id truncado ni dejar la fila rota en el medio.
+    """
+    with open(ruta, 'r+b') as archivo:
+        archivo.seek(0, os.SEEK_END)
+        inicio = max(0, archivo.tell() - COLA)
+        archivo.seek(inicio)
+        cola = archivo.read()
+        fin = cola.rfind(b'\n') + 1
+        if fin == 0 and inicio > 0:
+            raise CommandError('No se encontró una fila completa al final de --salida')
+        if fin < len(cola):
+            archivo.truncate(inicio + fin)
+    lineas = cola[:fin].decode('utf-8', errors='ignore').splitlines()
+    return lineas[-1] if lineas else ''
+
+
+class Command(BaseCommand):
+    help = 'Exporta reservas o cobros en CSV o NDJSON por bloques, sin cargar el resultado en memoria'
+
+    def add_arguments(self, parser):
+        parser.add_argument('tipo', choices=list(EXPORTACIONES), help='Qué exportar')
+        parser.add_argument('--formato', choices=list(FORMATOS), default='csv')
+        parser.add_argument('--desde', type=date.fromisoformat, help='Fecha de reserva mínima (AAAA-MM-DD)')
+        parser.add_argument('--hasta', type=date.fromisoformat, help='Fecha de reserva máxima (AAAA-MM-DD)')
+        parser.add_argument('--medico', type=int, help='Id del médico')
+        parser.add_argument('--despues', type=int, help='Exportar solo ids posteriores a este')
+        parser.add_argument('--salida', help='Archivo de salida (por defecto la salida estándar)')
+        parser.add_argument('--continuar', action='store_true', help='Retomar desde el último id de --salida')
+
+    def handle(self, *args, **options):
+        filtros = {clave: options[clave] for clave in ('desde', 'hasta', 'medico', 'despues') if options[clave]}
+        modo = 'w'
+        if options['continuar']:
+            if not options['salida'] or not os.path.exists(options['salida']):
+                raise CommandError('--continuar requiere un archivo --salida existente')
+            despues = ultimo_id(_ultima_linea(options['salida']), options['formato'])
+            if despues is not None:
+                filtros['despues'] = despues
+                modo = 'a'
+
+        fragmentos = generar(
+            options['tipo'], options['formato'], encabezado=modo == 'w' and 'despues' not in filtros, **filtros
+        )
+        inicio = time.perf_counter()
+        bytes_escritos = 0
+        if options['salida']:
+            with open(options['salida'], modo, encoding='utf-8', newline='') as salida:
+                for fragmento in fragmentos:
+                    salida.write(fragmento)
+                    bytes_escritos += len(fragmento.encode())
+        else:
+            for fragmento in fragmentos:
+                self.stdout.write(fragmento, ending='')
+                bytes_escritos += len(fragmento.encode())
+
+        desde = f" desde el id {filtros['despues']}" if 'despues' in filtros else ''
+        self.stderr.write(self.style.SUCCESS(
+            f"Exportación de {options['tipo']}{desde}: {bytes_escritos / 1024 / 1024:.1f} MB "
+            f'en {time.perf_counter() - inicio:.1f}s'
+        ))
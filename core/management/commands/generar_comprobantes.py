@@ -0,0 +1,45 @@
+"""
+Comando para generar en lote los PDF de cobro de todas las reservas de un
+mes, en paralelo con un proceso por núcleo. Los comprobantes ya generados
+(misma huella) se omiten, por lo que puede volver a ejecutarse.
+"""
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from citas.comprobantes import generar_mes
+
+
+def _mes(valor):
+    try:
+        return datetime.strptime(valor, '%Y-%m').date()
+    except ValueError:
+        raise CommandError('El mes debe tener el formato AAAA-MM')
+
+
+class Command(BaseCommand):
+    help = 'Genera los comprobantes PDF de los cobros de un mes en varios procesos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mes', help='Mes a generar (AAAA-MM, por defecto el mes anterior)')
+        parser.add_argument('--procesos', type=int, default=None, help='Procesos en paralelo (por defecto uno por núcleo)')
+
+    def handle(self, *args, **options):
+        if options['mes']:
+            mes = _mes(options['mes'])
+        else:
+            mes = timezone.localdate().replace(day=1) - relativedelta(months=1)
+        verbosidad = options['verbosity']
+
+        def progreso(resumen):
+            if verbosidad > 1:
+                self.stdout.write(f'  {resumen.generados} generados ({resumen.segundos:.1f}s)')
+
+        resumen = generar_mes(mes, procesos=options['procesos'], al_avanzar=progreso)
+        por_segundo = resumen.generados / resumen.segundos if resumen.segundos else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Comprobantes de {mes:%m/%Y}: {resumen.generados} generados, {resumen.existentes} ya existían '
+            f'({resumen.segundos:.1f}s, {por_segundo:.0f}/s)'
+        ))
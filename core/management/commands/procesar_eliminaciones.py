@@ -0,0 +1,38 @@
+"""
+Comando para procesar las eliminaciones en segundo plano (cuentas y
+selecciones de reservas del admin): borra sus filas por lotes y retoma las
+interrumpidas. Puede ejecutarse desde cron o como worker permanente con
+--continuo.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from citas.eliminacion import procesar_pendientes, TAMANO_LOTE
+
+
+class Command(BaseCommand):
+    help = 'Borra por lotes las cuentas y reservas marcadas para eliminación'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help='Filas por transacción')
+        parser.add_argument('--continuo', action='store_true', help='Procesar en bucle hasta interrumpir')
+        parser.add_argument('--intervalo', type=float, default=10, help='Segundos entre pasadas en modo continuo')
+
+    def handle(self, *args, **options):
+        while True:
+            completadas = procesar_pendientes(options['lote'], al_terminar_lote=self._avance)
+            if completadas or not options['continuo']:
+                self.stdout.write(self.style.SUCCESS(f'Eliminaciones completadas: {completadas}'))
+            if not options['continuo']:
+                return
+            # Se cierra la conexión entre pasadas para no retenerla durante la espera
+            connection.close()
+            time.sleep(options['intervalo'])
+
+    def _avance(self, eliminacion):
+        self.stdout.write(
+            f'  #{eliminacion.pk} {eliminacion.descripcion} · {eliminacion.paso}: '
+            f'{eliminacion.avance}/{eliminacion.total} ({eliminacion.porcentaje}%)'
+        )
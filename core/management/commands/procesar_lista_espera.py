@@ -0,0 +1,34 @@
+"""
+Comando para procesar la lista de espera: vence las ofertas cuyo plazo
+terminó y ofrece los cupos liberados por cancelaciones. Puede ejecutarse
+desde cron o como worker permanente con --continuo.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from citas.lista_espera import procesar_pendientes
+
+
+class Command(BaseCommand):
+    help = 'Ofrece los cupos liberados a los pacientes en lista de espera y vence las ofertas expiradas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--continuo', action='store_true', help='Procesar en bucle hasta interrumpir')
+        parser.add_argument('--intervalo', type=float, default=10, help='Segundos entre pasadas en modo continuo')
+
+    def handle(self, *args, **options):
+        while True:
+            resumen = procesar_pendientes()
+            if any(resumen.values()) or not options['continuo']:
+                self.stdout.write(
+                    f"Ofertas enviadas: {resumen['ofrecidas']} · "
+                    f"vencidas: {resumen['vencidas']} · "
+                    f"cupos descartados: {resumen['descartados']}"
+                )
+            if not options['continuo']:
+                return
+            # Se cierra la conexión entre pasadas para no retenerla durante la espera
+            connection.close()
+            time.sleep(options['intervalo'])
@@ -1,9 +1,13 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.db.models import Q
+from datetime import date
+from django.utils import timezone
+from citas.disponibilidad import calcular_disponibilidad, parsear_parametros, serializar_agenda
+from citas.agenda import obtener_agenda, estadisticas_cache
 from .models import Medico, Especialidad
 from .serializers import MedicoSerializer, MedicoListSerializer, EspecialidadSerializer
 
@@ -73,6 +77,79 @@ class MedicoViewSet(viewsets.ModelViewSet):
                 })
         
         return Response(result)
+    
+    @action(detail=True, methods=['get'])
+    def disponibilidad(self, request, pk=None):
+        """
+        Endpoint para obtener los bloques libres de un médico en un rango de fechas.
+        Parámetros: desde, hasta (AAAA-MM-DD) y duracion (minutos).
+        """
+        medico = self.get_object()
+        try:
+            desde, hasta, duracion = parsear_parametros(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        agenda = calcular_disponibilidad([medico], desde, hasta, duracion).get(medico.id, {})
+        return Response({
+            'medico': medico.id,
+            'desde': desde,
+            'hasta': hasta,
+            'duracion': duracion,
+            'dias': serializar_agenda(agenda)
+        })
+    
+    @action(detail=False, methods=['get'], url_path='disponibilidad')
+    def disponibilidad_general(self, request):
+        """
+        Endpoint para obtener los bloques libres de todos los médicos que
+        cumplen los filtros del listado (especialidad, disponible, search).
+        """
+        try:
+            desde, hasta, duracion = parsear_parametros(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        medicos = self.get_queryset().filter(disponible=True).order_by('id')
+        page = self.paginate_queryset(medicos)
+        medicos = page if page is not None else list(medicos)
+        disponibilidad = calcular_disponibilidad(medicos, desde, hasta, duracion)
+        
+        result = [
+            {
+                'medico': MedicoListSerializer(medico).data,
+                'dias': serializar_agenda(disponibilidad.get(medico.id, {}))
+            }
+            for medico in medicos
+        ]
+        if page is not None:
+            return self.get_paginated_response(result)
+        return Response(result)
+    
+    @action(detail=True, methods=['get'])
+    def agenda(self, request, pk=None):
+        """
+        Endpoint para obtener la agenda cacheada de un médico en un día
+        (parámetro fecha AAAA-MM-DD, por defecto hoy). Solo el propio médico
+        o el personal pueden consultarla.
+        """
+        medico = self.get_object()
+        if medico.user_id != request.user.id and not request.user.is_staff:
+            return Response({'error': 'No tienes permiso para ver esta agenda'}, status=status.HTTP_403_FORBIDDEN)
+        
+        try:
+            fecha = date.fromisoformat(request.query_params['fecha']) if request.query_params.get('fecha') else timezone.localdate()
+        except ValueError:
+            return Response({'error': 'La fecha debe tener formato AAAA-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(obtener_agenda(medico.id, fecha))
+    
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def agenda_cache(self, request):
+        """
+        Endpoint para consultar los aciertos y fallos de la cache de agendas
+        """
+        return Response(estadisticas_cache())
 
 class EspecialidadViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -1,6 +1,8 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect
 from django.contrib import messages
+from django.utils import timezone
+from citas.agenda import obtener_agenda
 from .models import Medico
 from .forms import MedicoForm
 
@@ -15,4 +17,7 @@ def dashboard(request):
             return redirect("medicos:dashboard")
     else:
         form = MedicoForm(instance=medico)
-    return render(request, "medicos/dashboard.html", {"form": form})
+    
+    # Agenda del día desde la cache (se invalida al cambiar reservas, cobros o historiales)
+    agenda = obtener_agenda(medico.id, timezone.localdate())
+    return render(request, "medicos/dashboard.html", {"form": form, "agenda": agenda})
@@ -2,9 +2,15 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import PermissionDenied
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.db.models import Q
 from datetime import date
+from citas.generados import respuesta_archivo
+from citas.linea_tiempo import linea_tiempo
+from citas.resumen_clinico import obtener_resumen, CONTENT_TYPE_DOCX
+from citas.serializers import EventoSerializer, LineaTiempoFiltroSerializer
+from .estadisticas import estadisticas_pacientes, nacidos_hasta
 from .models import Paciente
 from .serializers import PacienteSerializer, PacienteListSerializer
 
@@ -46,58 +52,23 @@ class PacienteViewSet(viewsets.ModelViewSet):
             today = date.today()
             if edad_min:
                 # Fecha máxima de nacimiento para tener al menos edad_min años
-                max_birth_date = date(today.year - int(edad_min), today.month, today.day)
+                max_birth_date = nacidos_hasta(today, int(edad_min))
                 queryset = queryset.filter(fecha_nacimiento__lte=max_birth_date)
             
             if edad_max:
-                # Fecha mínima de nacimiento para tener como máximo edad_max años
-                min_birth_date = date(today.year - int(edad_max) - 1, today.month, today.day)
-                queryset = queryset.filter(fecha_nacimiento__gte=min_birth_date)
+                # Quien nació en esta fecha o antes ya tiene edad_max + 1 años
+                min_birth_date = nacidos_hasta(today, int(edad_max) + 1)
+                queryset = queryset.filter(fecha_nacimiento__gt=min_birth_date)
         
         return queryset
     
     @action(detail=False, methods=['get'])
     def estadisticas(self, request):
         """
-        Endpoint para obtener estadísticas de pacientes
+        Endpoint para obtener estadísticas de pacientes, con los mismos
+        filtros del listado. Ver pacientes.estadisticas.
         """
-        total_pacientes = self.get_queryset().count()
-        
-        # Estadísticas por grupo sanguíneo
-        grupos_sanguineos = {}
-        for paciente in self.get_queryset():
-            grupo = paciente.grupo_sanguineo or 'No especificado'
-            grupos_sanguineos[grupo] = grupos_sanguineos.get(grupo, 0) + 1
-        
-        # Pacientes con alergias
-        pacientes_con_alergias = self.get_queryset().exclude(alergias='').count()
-        
-        # Pacientes por rango de edad
-        hoy = date.today()
-        menores_18 = 0
-        entre_18_65 = 0
-        mayores_65 = 0
-        
-        for paciente in self.get_queryset():
-            if paciente.fecha_nacimiento:
-                edad = hoy.year - paciente.fecha_nacimiento.year - ((hoy.month, hoy.day) < (paciente.fecha_nacimiento.month, paciente.fecha_nacimiento.day))
-                if edad < 18:
-                    menores_18 += 1
-                elif edad <= 65:
-                    entre_18_65 += 1
-                else:
-                    mayores_65 += 1
-        
-        return Response({
-            'total_pacientes': total_pacientes,
-            'grupos_sanguineos': grupos_sanguineos,
-            'pacientes_con_alergias': pacientes_con_alergias,
-            'distribucion_edad': {
-                'menores_18': menores_18,
-                'entre_18_65': entre_18_65,
-                'mayores_65': mayores_65
-            }
-        })
+        return Response(estadisticas_pacientes(self.get_queryset()))
     
     @action(detail=False, methods=['get'])
     def con_alergias(self, request):
@@ -116,12 +87,43 @@ class PacienteViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['get'])
     def historial_medico(self, request, pk=None):
         """
-        Endpoint para obtener información médica detallada de un paciente
+        Línea de tiempo clínica del paciente: reservas, consultas y pagos,
+        del más reciente al más antiguo, incluido el archivo. Se pagina con
+        `despues` (el cursor `siguiente` de la página anterior) y `tamano`.
+        El paciente y el personal ven todo; un médico, solo sus eventos.
         """
         paciente = self.get_object()
-        serializer = PacienteSerializer(paciente)
+        user = request.user
+        medico_id = None
+        if not user.is_staff and paciente.user_id != user.id:
+            medico = getattr(user, 'medico', None)
+            if medico is None:
+                raise PermissionDenied('Solo el paciente, sus médicos o el personal pueden ver el historial.')
+            medico_id = medico.id
+        
+        filtro = LineaTiempoFiltroSerializer(data=request.query_params)
+        filtro.is_valid(raise_exception=True)
+        pagina = linea_tiempo(paciente.id, medico_id=medico_id, **filtro.validated_data)
         
         return Response({
-            'paciente': serializer.data,
-            'notas': 'Este endpoint puede expandirse para incluir historial médico completo'
+            'paciente': PacienteSerializer(paciente).data,
+            'eventos': EventoSerializer(pagina.eventos, many=True).data,
+            'siguiente': pagina.siguiente,
         })
+    
+    @action(detail=True, methods=['get'])
+    def resumen_clinico(self, request, pk=None):
+        """
+        Resumen clínico en DOCX con todas las consultas del paciente (solo el
+        paciente o el personal). Mientras se genera responde 202 con
+        Retry-After; luego se descarga el mismo archivo hasta que el
+        historial cambie.
+        """
+        paciente = self.get_object()
+        if not request.user.is_staff and paciente.user_id != request.user.id:
+            raise PermissionDenied('Solo el paciente o el personal pueden descargar el resumen clínico.')
+        
+        ruta = obtener_resumen(paciente)
+        if ruta is None:
+            return Response({'estado': 'generando'}, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '2'})
+        return respuesta_archivo(request, ruta, f'resumen-clinico-{paciente.id}.docx', CONTENT_TYPE_DOCX)
@@ -0,0 +1,77 @@
+"""
+Estadísticas de pacientes (grupo sanguíneo, alergias y rangos de edad).
+
+Se calculan con una sola consulta agregada agrupada por grupo sanguíneo: las
+alergias y los rangos de edad son Count con filtro, y los rangos se expresan
+como límites sobre fecha_nacimiento, de modo que la base no calcula la edad
+fila a fila. Python solo suma las pocas filas de grupos. El resultado se
+guarda en la cache por ESTADISTICAS_TTL segundos, con una clave que depende
+de la consulta filtrada (los mismos parámetros del listado) y del día.
+"""
+import hashlib
+from datetime import date
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+ESTADISTICAS_TTL = 60
+SIN_GRUPO = 'No especificado'
+
+
+def nacidos_hasta(hoy, anios):
+    """Última fecha de nacimiento con la que hoy se tienen al menos `anios` años."""
+    try:
+        return hoy.replace(year=hoy.year - anios)
+    except ValueError:
+        # Hoy es 29/2 y ese año no fue bisiesto: quien nació el 28/2 ya los cumplió
+        return date(hoy.year - anios, 2, 28)
+
+
+def _clave(queryset, hoy):
+    sql, params = queryset.query.sql_with_params()
+    huella = hashlib.sha256(f'{sql}|{params}'.encode()).hexdigest()[:32]
+    return f'pacientes:estadisticas:{hoy:%Y-%m-%d}:{huella}'
+
+
+def calcular_estadisticas(queryset, hoy):
+    """Totales por grupo sanguíneo, con alergias y por rango de edad, en una consulta."""
+    mayor_de_edad = nacidos_hasta(hoy, 18)
+    # Tener más de 65 es tener al menos 66
+    mayor_de_65 = nacidos_hasta(hoy, 66)
+    filas = (
+        queryset
+        .values('grupo_sanguineo')
+        .annotate(
+            total=Count('id'),
+            con_alergias=Count('id', filter=~Q(alergias='')),
+            menores_18=Count('id', filter=Q(fecha_nacimiento__gt=mayor_de_edad)),
+            entre_18_65=Count(
+                'id', filter=Q(fecha_nacimiento__lte=mayor_de_edad, fecha_nacimiento__gt=mayor_de_65)
+            ),
+            mayores_65=Count('id', filter=Q(fecha_nacimiento__lte=mayor_de_65)),
+        )
+        .order_by('grupo_sanguineo')
+    )
+    grupos = {}
+    totales = dict.fromkeys(['total', 'con_alergias', 'menores_18', 'entre_18_65', 'mayores_65'], 0)
+    for fila in filas:
+        grupo = fila['grupo_sanguineo'] or SIN_GRUPO
+        grupos[grupo] = grupos.get(grupo, 0) + fila['total']
+        for campo in totales:
+            totales[campo] += fila[campo]
+    return {
+        'total_pacientes': totales['total'],
+        'grupos_sanguineos': grupos,
+        'pacientes_con_alergias': totales['con_alergias'],
+        'distribucion_edad': {
+            'menores_18': totales['menores_18'],
+            'entre_18_65': totales['entre_18_65'],
+            'mayores_65': totales['mayores_65'],
+        },
+    }
+
+
+def estadisticas_pacientes(queryset):
+    """Estadísticas del queryset de pacientes ya filtrado, desde la cache o calculadas."""
+    hoy = date.today()
+    return cache.get_or_set(_clave(queryset, hoy), lambda: calcular_estadisticas(queryset, hoy), ESTADISTICAS_TTL)
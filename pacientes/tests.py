@@ -0,0 +1,62 @@
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from .estadisticas import nacidos_hasta
+from .models import Paciente
+
+
+def crear_paciente(username='paciente'):
+    user = User.objects.create_user(username=username)
+    return Paciente.objects.create(user=user)
+
+
+class EstadisticasPacientesTests(TestCase):
+    url = '/pacientes/api/pacientes/estadisticas/'
+
+    def setUp(self):
+        cache.clear()
+        hoy = date.today()
+        for n, (grupo, alergias, anios) in enumerate([
+            ('A+', 'Penicilina', 17), ('A+', '', 18), ('O-', '', 65), ('O-', 'Polen', 66), ('', '', None),
+        ]):
+            paciente = crear_paciente(f'paciente{n}')
+            paciente.grupo_sanguineo = grupo
+            paciente.alergias = alergias
+            # 17 años cumple 18 mañana; los demás cumplen justo hoy
+            if anios == 17:
+                paciente.fecha_nacimiento = nacidos_hasta(hoy, 18) + timedelta(days=1)
+            elif anios:
+                paciente.fecha_nacimiento = nacidos_hasta(hoy, anios)
+            paciente.save()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', is_staff=True))
+
+    def test_una_consulta_agregada_y_cache(self):
+        with self.assertNumQueries(1):
+            datos = self.client.get(self.url).data
+        self.assertEqual(datos, {
+            'total_pacientes': 5,
+            'grupos_sanguineos': {'No especificado': 1, 'A+': 2, 'O-': 2},
+            'pacientes_con_alergias': 2,
+            'distribucion_edad': {'menores_18': 1, 'entre_18_65': 2, 'mayores_65': 1},
+        })
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).data, datos)
+
+    def test_respeta_filtros_del_listado(self):
+        datos = self.client.get(self.url, {'grupo_sanguineo': 'O'}).data
+        self.assertEqual(datos['grupos_sanguineos'], {'O-': 2})
+        self.assertEqual(datos['distribucion_edad'], {'menores_18': 0, 'entre_18_65': 1, 'mayores_65': 1})
+
+        datos = self.client.get(self.url, {'edad_min': 18, 'edad_max': 65}).data
+        self.assertEqual(datos['total_pacientes'], 2)
+        self.assertEqual(self.client.get(self.url).data['total_pacientes'], 5)
+
+    def test_nacidos_hasta_en_29_de_febrero(self):
+        self.assertEqual(nacidos_hasta(date(2024, 2, 29), 18), date(2006, 2, 28))
+        self.assertEqual(nacidos_hasta(date(2024, 2, 29), 4), date(2020, 2, 29))
+        self.assertEqual(nacidos_hasta(date(2024, 3, 1), 18), date(2006, 3, 1))